@@ -1,5 +1,6 @@
 from typing import Optional, List, Any, Dict
-from pydantic import AnyHttpUrl, BaseSettings, validator
+from pydantic import AnyHttpUrl, validator
+from pydantic_settings import BaseSettings
 import os
 from functools import lru_cache
 
@@ -30,6 +31,42 @@ class Settings(BaseSettings):
     AZURE_OPENAI_API_VERSION: str = "2023-12-01-preview"
     AZURE_OPENAI_DEPLOYMENT_NAME: str = "gpt-4"
     AZURE_OPENAI_EMBEDDING_DEPLOYMENT: str = "text-embedding-ada-002"
+    OPENAI_COALESCE_ENABLED: bool = True  # identical completions in flight share one upstream call
+    
+    # Azure OpenAI rate governance (primary chat deployment)
+    AZURE_OPENAI_RPM_LIMIT: int = 0  # deployment quota; 0 leaves it unmetered
+    AZURE_OPENAI_TPM_LIMIT: int = 0
+    OPENAI_QUOTA_WINDOW_S: float = 1.0  # quotas are enforced over windows this short; bursts are capped to one
+    OPENAI_MAX_CONCURRENCY: int = 32  # ceiling of the adaptive concurrency limit
+    OPENAI_MIN_CONCURRENCY: int = 1
+    OPENAI_QUEUE_TIMEOUT_S: float = 30.0  # longest wait for admission before giving up
+    OPENAI_MAX_RETRIES: int = 4
+    OPENAI_BACKOFF_BASE_S: float = 0.5
+    OPENAI_BACKOFF_MAX_S: float = 20.0
+    AZURE_OPENAI_EMBEDDING_RPM_LIMIT: int = 0  # embedding deployment quota, governed separately
+    AZURE_OPENAI_EMBEDDING_TPM_LIMIT: int = 0
+    
+    # Azure OpenAI deployment pool (chat calls routed across regions)
+    AZURE_OPENAI_DEPLOYMENTS: List[Dict[str, Any]] = []  # beyond the primary; JSON objects with name, endpoint, api_key, deployment, rpm_limit, tpm_limit
+    OPENAI_LATENCY_EWMA_ALPHA: float = 0.3
+    OPENAI_LATENCY_MAX_AGE_S: float = 60.0  # older latency readings no longer steer routing
+    OPENAI_FAILURE_THRESHOLD: int = 3  # consecutive failures before a deployment leaves the rotation
+    OPENAI_HEALTH_PROBE_INTERVAL_S: float = 30.0
+    OPENAI_STREAM_IDLE_TIMEOUT_S: float = 30.0  # a stream silent this long fails over
+    OPENAI_STREAM_RESUME_ENABLED: bool = True  # another deployment continues a reply cut off mid-stream
+    
+    # Embedding batching and caching
+    EMBEDDING_MAX_BATCH_SIZE: int = 64
+    EMBEDDING_MAX_WAIT_MS: float = 10.0
+    EMBEDDING_MAX_CONCURRENT_BATCHES: int = 4
+    EMBEDDING_MEMORY_CACHE_SIZE: int = 50000
+    EMBEDDING_CACHE_PATH: Optional[str] = None  # SQLite file for the persistent content-hash cache
+    
+    # Outbound HTTP connection pool (shared by Azure service clients)
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0  # seconds
+    HTTP_TIMEOUT: float = 60.0  # seconds
     
     # Azure Cognitive Search
     AZURE_SEARCH_ENDPOINT: str
@@ -94,17 +131,80 @@ class Settings(BaseSettings):
     FREQUENCY_PENALTY: float = 0.0
     PRESENCE_PENALTY: float = 0.0
     
+    # Conversation history settings
+    HISTORY_TOKEN_BUDGET_RATIO: float = 0.5  # share of MAX_TOKENS_PER_REQUEST for verbatim history
+    HISTORY_SUMMARY_MAX_TOKENS: int = 300
+    
     # Search settings
     SEARCH_TOP_K: int = 10
     SEARCH_SCORE_THRESHOLD: float = 0.7
+    SEARCH_BACKEND: str = "azure"  # "azure" or "local" (in-process vector index)
+    VECTOR_INDEX_DIMENSION: int = 1536
+    VECTOR_INDEX_MODE: str = "auto"  # "auto", "exact" or "ivf"
+    VECTOR_INDEX_IVF_THRESHOLD: int = 50000
+    VECTOR_INDEX_NPROBE: int = 8
+    HYBRID_BM25_WEIGHT: float = 1.0
+    HYBRID_VECTOR_WEIGHT: float = 1.0
+    HYBRID_RRF_K: int = 60
+    HYBRID_CANDIDATE_MULTIPLIER: int = 4  # candidates fetched per retriever, as a multiple of top_k
+    SEARCH_CACHE_ENABLED: bool = True
+    SEARCH_CACHE_MAX_ENTRIES: int = 10000
+    SEARCH_CACHE_REDIS_ENABLED: bool = False  # second cache tier at REDIS_URL, TTL from REDIS_CACHE_TTL
+    
+    # Semantic answer cache (opt-in)
+    SEMANTIC_CACHE_ENABLED: bool = False
+    SEMANTIC_CACHE_SIMILARITY_THRESHOLD: float = 0.95
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 5000
+    SEMANTIC_CACHE_TTL: int = 3600  # 1 hour
+    
+    # Agent tool planning
+    AGENT_TOOL_TIMEOUT_S: float = 5.0  # per lookup or function call
+    AGENT_PLAN_TIMEOUT_S: float = 8.0  # whole plan; lookups still running are dropped
+    AGENT_PLAN_MAX_TARGETS: int = 5  # portfolios and companies looked up per turn
+    AGENT_TOOL_CACHE_TTL: int = 60  # seconds a tool result is reused for the same arguments
+    AGENT_TOOL_CACHE_MAX_ENTRIES: int = 1000  # per tool
     
     # File upload settings
     MAX_FILE_SIZE: int = 100 * 1024 * 1024  # 100MB
     ALLOWED_FILE_EXTENSIONS: List[str] = [".pdf", ".txt", ".csv", ".json", ".xlsx"]
+    INGEST_READ_CHUNK_SIZE: int = 1024 * 1024  # 1MB
+    INGEST_INDEX_BATCH_SIZE: int = 64
+    
+    # Chunking
+    CHUNK_MAX_TOKENS: int = 512
+    CHUNK_OVERLAP_TOKENS: int = 64  # repeated between consecutive text chunks
+    CHUNK_EXACT_TOKEN_COUNTS: bool = False  # otherwise encode a sample and estimate the rest
+    CHUNK_RECORD_BOUNDARY_MODULUS: int = 16  # content-defined record group ends, about one in this many records
+    
+    # Company store
+    COMPANY_STORE_PATH: Optional[str] = None  # memory-mapped column files; in-memory only when unset
+    COMPANY_SEARCH_MAX_RESULTS: int = 100
+    ENTITY_MATCH_THRESHOLD: float = 0.5  # trigram Jaccard similarity for fuzzy name matches
+    ENTITY_LINK_THRESHOLD: float = 0.8  # stricter, for linking ingested rows without an id
+    ENTITY_RESOLVE_MAX_NAMES: int = 100000  # per batch resolution request
+    PORTFOLIO_ROLLUP_MAX_GROUPS: int = 200
+    
+    # Asset index
+    ASSET_INDEX_PATH: Optional[str] = None  # memory-mapped snapshot; in-memory only when unset
+    ASSET_GRID_CELL_DEGREES: float = 0.25
+    ASSET_SEARCH_MAX_RESULTS: int = 500
+    
+    # Deforestation exposure
+    FOREST_LOSS_RASTER_PATH: Optional[str] = None  # tiled raster file, or a .npy grid of loss fractions with a .json sidecar
+    RASTER_TILE_CACHE_MB: int = 256  # decoded compressed tiles kept per raster
+    EXPOSURE_BUFFER_KM: float = 5.0  # around each asset footprint
+    EXPOSURE_TILE_CELLS: int = 1024  # raster tile edge scored per task
+    EXPOSURE_WORKERS: Optional[int] = None  # defaults to the CPU count
     
     # Background task settings
     CELERY_BROKER_URL: str = "redis://localhost:6379/1"
     CELERY_RESULT_BACKEND: str = "redis://localhost:6379/2"
+    INGEST_JOB_BROKER: str = "local"  # in-process stand-in for the Celery/Service Bus queue
+    INGEST_JOB_DIR: Optional[str] = None  # durable uploads and job state; defaults to a temp directory
+    INGEST_JOB_WORKERS: int = 2  # jobs run concurrently
+    INGEST_PARSE_PROCESSES: int = 2
+    INGEST_STAGE_QUEUE_SIZE: int = 8  # batches buffered between parsing and embedding
+    INGEST_EMBED_CONCURRENCY: int = 4  # batches embedded concurrently per job
     
     # Monitoring and telemetry
     PROMETHEUS_METRICS_ENABLED: bool = True
@@ -146,6 +246,7 @@ class Settings(BaseSettings):
 @lru_cache()
 def get_settings() -> Settings:
     """Get cached settings instance"""
-    return Settings()
+    # Fields without defaults are read from the environment
+    return Settings()  # type: ignore[call-arg]
 
 settings = get_settings()
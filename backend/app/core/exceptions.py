@@ -70,6 +70,17 @@ class ConflictError(CustomHTTPException):
             metadata=metadata
         )
 
+class PayloadTooLargeError(CustomHTTPException):
+    """Request payload size errors"""
+    
+    def __init__(self, detail: str = "Payload too large", metadata: Dict[str, Any] = None):
+        super().__init__(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=detail,
+            error_type="payload_too_large_error",
+            metadata=metadata
+        )
+
 class RateLimitError(CustomHTTPException):
     """Rate limiting errors"""
     
@@ -0,0 +1,15 @@
+import httpx
+
+from app.core.config import settings
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Create a keep-alive HTTP client for application-lifetime service clients"""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(settings.HTTP_TIMEOUT, connect=10.0),
+    )
@@ -10,8 +10,9 @@ import structlog
 from app.core.config import settings
 from app.core.logging import configure_logging
 from app.core.security import get_current_user
-from app.routers import auth, chat, ingest, search, admin
+from app.routers import auth, chat, ingest, search, exposure, portfolios, admin
 from app.core.exceptions import CustomHTTPException
+from app.services.container import ServiceContainer
 
 # Configure structured logging
 configure_logging()
@@ -126,6 +127,20 @@ def create_application() -> FastAPI:
         dependencies=[],
     )
     
+    app.include_router(
+        exposure.router,
+        prefix=f"{settings.API_V1_STR}/exposure",
+        tags=["Exposure"],
+        dependencies=[],
+    )
+    
+    app.include_router(
+        portfolios.router,
+        prefix=f"{settings.API_V1_STR}/portfolios",
+        tags=["Portfolios"],
+        dependencies=[],
+    )
+    
     app.include_router(
         admin.router,
         prefix=f"{settings.API_V1_STR}/admin",
@@ -191,11 +206,14 @@ def create_application() -> FastAPI:
     # Startup event
     @app.on_event("startup")
     async def startup_event():
+        app.state.services = ServiceContainer()
+        await app.state.services.start()
         logger.info("application_startup", version=settings.VERSION)
     
     # Shutdown event
     @app.on_event("shutdown")
     async def shutdown_event():
+        await app.state.services.close()
         logger.info("application_shutdown")
     
     return app
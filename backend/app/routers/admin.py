@@ -1,18 +1,36 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
 from app.core.security import get_current_user, require_roles
 
 router = APIRouter()
 
 @router.get("/metrics")
 async def get_system_metrics(
+    request: Request,
     current_user: dict = Depends(require_roles(["admin"]))
 ):
     """Get system metrics"""
+    services = request.app.state.services
+    
+    caches = {}
+    if services.search_service.cache is not None:
+        caches["search_cache"] = services.search_service.cache.stats()
+    if services.semantic_cache is not None:
+        caches["semantic_cache"] = services.semantic_cache.stats()
+    
     return {
+        "embeddings": services.embedding_service.stats(),
+        "ingestion": services.ingestion_engine.stats(),
+        "companies": services.company_store.stats(),
+        "assets": services.asset_store.stats(),
+        "exposure": services.exposure_engine.stats(),
+        "portfolio_aggregates": services.portfolio_aggregator.stats(),
+        "agent_tools": services.agent_service.tool_registry.stats(),
+        "openai": services.openai_service.stats(),
         "active_users": 142,
         "api_calls_today": 1247,
         "token_usage": 89200,
-        "system_status": "healthy"
+        "system_status": "healthy",
+        "caches": caches
     }
 
 @router.get("/users")
@@ -1,17 +1,20 @@
 from datetime import datetime
 from typing import List, Optional, AsyncGenerator
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
+import base64
 import json
 import uuid
 import structlog
 
 from app.core.security import get_current_user
 from app.core.exceptions import ValidationError, ModelError
-from app.services.openai_client import OpenAIService
-from app.services.search_client import SearchService
-from app.services.agents import AgentService
+from app.services.openai_client import OpenAIService, get_openai_service
+from app.services.search_client import SearchService, get_search_service
+from app.services.agents import AgentService, get_agent_service
+from app.services.conversation_store import conversation_store
 
 logger = structlog.get_logger(__name__)
 
@@ -53,29 +56,77 @@ class StreamResponse(BaseModel):
     message_id: str
     is_final: bool
     metadata: Optional[dict] = None
+    event: Optional[str] = None  # "thinking" or "sources" before the answer starts
+    citations: Optional[List[dict]] = None
+
+class ConversationSummary(BaseModel):
+    id: str
+    title: str
+    created_at: datetime
+    updated_at: datetime
+    is_archived: bool = False
+    tags: List[str] = []
+    message_count: int = 0
+
+class ConversationPage(BaseModel):
+    items: List[ConversationSummary]
+    next_cursor: Optional[str] = None
+
+class MessagePage(BaseModel):
+    conversation_id: str
+    items: List[ChatMessage]
+    start: int
+    end: int
+    total: int
 
 # Mock data storage (replace with database in production)
-conversations_db = {}
-messages_db = {}
+conversations_db = conversation_store.conversations
+messages_db = conversation_store.messages
+
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(updated_at: datetime, conversation_id: str) -> str:
+    """Encode a conversation listing position as an opaque cursor"""
+    raw = f"{updated_at.isoformat()}|{conversation_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        updated_at, conversation_id = raw.split("|", 1)
+        return datetime.fromisoformat(updated_at), conversation_id
+    except Exception:
+        raise ValidationError("Invalid cursor")
+
+def get_owned_conversation(conversation_id: str, current_user: dict) -> dict:
+    """Get a conversation, enforcing that it belongs to the current user"""
+    conversation = conversation_store.get_conversation(conversation_id)
+    if not conversation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found"
+        )
+    
+    if conversation["user_id"] != current_user.get("id"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+    
+    return conversation
 
 @router.get("/conversations", response_model=List[Conversation])
 async def get_conversations(current_user: dict = Depends(get_current_user)):
     """Get all conversations for the current user"""
     try:
         user_id = current_user.get("id")
-        user_conversations = [
-            conv for conv in conversations_db.values() 
-            if conv.get("user_id") == user_id and not conv.get("is_archived", False)
-        ]
+        user_conversations = conversation_store.list_conversations(user_id)
         
         # Convert to Conversation objects
         result = []
         for conv_data in user_conversations:
-            conv_messages = [
-                msg for msg in messages_db.values() 
-                if msg.get("conversation_id") == conv_data["id"]
-            ]
-            conv_messages.sort(key=lambda x: x["timestamp"])
+            conv_messages = conversation_store.get_messages(conv_data["id"])
             
             result.append(Conversation(
                 id=conv_data["id"],
@@ -99,6 +150,88 @@ async def get_conversations(current_user: dict = Depends(get_current_user)):
             detail="Failed to retrieve conversations"
         )
 
+@router.get("/conversations/summaries", response_model=ConversationPage)
+async def get_conversation_summaries(
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Cursor from a previous page"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get a page of conversation summaries, most recently updated first"""
+    try:
+        user_id = current_user.get("id")
+        before = decode_cursor(cursor) if cursor else None
+        
+        page, next_key = conversation_store.page_conversations(user_id, limit, before=before)
+        
+        items = [
+            ConversationSummary(
+                id=conv["id"],
+                title=conv["title"],
+                created_at=conv["created_at"],
+                updated_at=conv["updated_at"],
+                is_archived=conv.get("is_archived", False),
+                tags=conv.get("tags", []),
+                message_count=conversation_store.count_messages(conv["id"])
+            )
+            for conv in page
+        ]
+        
+        return ConversationPage(
+            items=items,
+            next_cursor=encode_cursor(*next_key) if next_key else None
+        )
+        
+    except ValidationError:
+        raise
+    except Exception as e:
+        logger.error("get_conversation_summaries_failed", user_id=current_user.get("id"), error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve conversations"
+        )
+
+@router.get("/conversations/{conversation_id}/messages", response_model=MessagePage)
+async def get_conversation_messages(
+    conversation_id: str,
+    before: Optional[int] = Query(None, ge=0, description="Return messages positioned before this index"),
+    after: Optional[int] = Query(None, ge=-1, description="Return messages positioned after this index"),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get a range of messages from a conversation.
+    
+    Without `before`/`after` the most recent `limit` messages are returned.
+    """
+    try:
+        get_owned_conversation(conversation_id, current_user)
+        
+        total = conversation_store.count_messages(conversation_id)
+        if after is not None:
+            start = after + 1
+            end = min(start + limit, total)
+        else:
+            end = min(before, total) if before is not None else total
+            start = max(end - limit, 0)
+        
+        items = conversation_store.get_message_range(conversation_id, start, end)
+        
+        return MessagePage(
+            conversation_id=conversation_id,
+            items=[ChatMessage(**msg) for msg in items],
+            start=start,
+            end=max(end, start),
+            total=total
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("get_conversation_messages_failed", conversation_id=conversation_id, error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve messages"
+        )
+
 @router.get("/conversations/{conversation_id}", response_model=Conversation)
 async def get_conversation(
     conversation_id: str,
@@ -106,25 +239,10 @@ async def get_conversation(
 ):
     """Get a specific conversation"""
     try:
-        conversation = conversations_db.get(conversation_id)
-        if not conversation:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Conversation not found"
-            )
-        
-        if conversation["user_id"] != current_user.get("id"):
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Access denied"
-            )
+        conversation = get_owned_conversation(conversation_id, current_user)
         
         # Get messages
-        conv_messages = [
-            msg for msg in messages_db.values() 
-            if msg.get("conversation_id") == conversation_id
-        ]
-        conv_messages.sort(key=lambda x: x["timestamp"])
+        conv_messages = conversation_store.get_messages(conversation_id)
         
         return Conversation(
             id=conversation["id"],
@@ -168,7 +286,7 @@ async def create_conversation(
             "summary": None
         }
         
-        conversations_db[conversation_id] = conversation
+        conversation_store.create_conversation(conversation)
         
         logger.info("conversation_created", conversation_id=conversation_id, user_id=current_user.get("id"))
         
@@ -195,15 +313,21 @@ async def create_conversation(
 async def send_message(
     request: SendMessageRequest,
     current_user: dict = Depends(get_current_user),
-    openai_service: OpenAIService = Depends(),
-    search_service: SearchService = Depends(),
-    agent_service: AgentService = Depends()
+    openai_service: OpenAIService = Depends(get_openai_service),
+    search_service: SearchService = Depends(get_search_service),
+    agent_service: AgentService = Depends(get_agent_service)
 ):
     """Send a message and get AI response"""
+    prefetch = None
     try:
         # Validate input
         if not request.message.strip():
             raise ValidationError("Message cannot be empty")
+        if request.conversation_id:
+            get_owned_conversation(request.conversation_id, current_user)
+        
+        # Retrieval needs only the request body, so it starts before the conversation is loaded
+        prefetch = agent_service.prefetch_context(request.message, request.context)
         
         # Create or get conversation
         conversation_id = request.conversation_id
@@ -229,21 +353,20 @@ async def send_message(
             "tools_used": None,
             "tokens_used": None
         }
-        messages_db[user_message_id] = user_message
+        conversation_store.add_message(user_message)
         
         # Get conversation history
-        conversation_messages = [
-            msg for msg in messages_db.values() 
-            if msg.get("conversation_id") == conversation_id
-        ]
-        conversation_messages.sort(key=lambda x: x["timestamp"])
+        conversation_messages = conversation_store.get_messages(conversation_id)
         
         # Generate AI response using agent service
         ai_response = await agent_service.process_message(
             message=request.message,
             conversation_history=conversation_messages,
             context=request.context,
-            user_id=current_user.get("id")
+            user_id=current_user.get("id"),
+            conversation=conversation_store.get_conversation(conversation_id),
+            entitlements=current_user.get("roles"),
+            prefetch=prefetch
         )
         
         # Add AI message
@@ -259,11 +382,10 @@ async def send_message(
             "tools_used": ai_response.tools_used,
             "tokens_used": ai_response.tokens_used
         }
-        messages_db[ai_message_id] = ai_message
+        conversation_store.add_message(ai_message)
         
         # Update conversation timestamp
-        if conversation_id in conversations_db:
-            conversations_db[conversation_id]["updated_at"] = datetime.utcnow()
+        conversation_store.touch(conversation_id)
         
         logger.info(
             "message_processed",
@@ -274,23 +396,34 @@ async def send_message(
         
         return ChatMessage(**ai_message)
         
-    except ValidationError:
+    except (ValidationError, HTTPException):
         raise
     except Exception as e:
         logger.error("send_message_failed", error=str(e))
         raise ModelError("Failed to process message")
+    finally:
+        # The turn has used the lookups, or failed and will not
+        if prefetch is not None:
+            prefetch.cancel()
 
 @router.post("/messages/stream")
 async def send_message_stream(
     request: SendMessageRequest,
     current_user: dict = Depends(get_current_user),
-    agent_service: AgentService = Depends()
+    agent_service: AgentService = Depends(get_agent_service)
 ):
     """Send a message and get streaming AI response"""
+    prefetch = None
+    response = None
     try:
         # Validate input
         if not request.message.strip():
             raise ValidationError("Message cannot be empty")
+        if request.conversation_id:
+            get_owned_conversation(request.conversation_id, current_user)
+        
+        # Retrieval needs only the request body, so it starts before the conversation is loaded
+        prefetch = agent_service.prefetch_context(request.message, request.context)
         
         # Create or get conversation
         conversation_id = request.conversation_id
@@ -315,14 +448,10 @@ async def send_message_stream(
             "tools_used": None,
             "tokens_used": None
         }
-        messages_db[user_message_id] = user_message
+        conversation_store.add_message(user_message)
         
         # Get conversation history
-        conversation_messages = [
-            msg for msg in messages_db.values() 
-            if msg.get("conversation_id") == conversation_id
-        ]
-        conversation_messages.sort(key=lambda x: x["timestamp"])
+        conversation_messages = conversation_store.get_messages(conversation_id)
         
         async def generate_stream():
             ai_message_id = str(uuid.uuid4())
@@ -333,7 +462,10 @@ async def send_message_stream(
                     message=request.message,
                     conversation_history=conversation_messages,
                     context=request.context,
-                    user_id=current_user.get("id")
+                    user_id=current_user.get("id"),
+                    conversation=conversation_store.get_conversation(conversation_id),
+                    entitlements=current_user.get("roles"),
+                    prefetch=prefetch
                 ):
                     full_response += chunk.delta
                     
@@ -342,7 +474,9 @@ async def send_message_stream(
                         conversation_id=conversation_id,
                         message_id=ai_message_id,
                         is_final=chunk.is_final,
-                        metadata=chunk.metadata
+                        metadata=chunk.metadata,
+                        event=chunk.event,
+                        citations=chunk.citations
                     )
                     
                     yield f"data: {json.dumps(response.dict())}\n\n"
@@ -360,11 +494,10 @@ async def send_message_stream(
                             "tools_used": getattr(chunk, 'tools_used', None),
                             "tokens_used": getattr(chunk, 'tokens_used', None)
                         }
-                        messages_db[ai_message_id] = ai_message
+                        conversation_store.add_message(ai_message)
                         
                         # Update conversation timestamp
-                        if conversation_id in conversations_db:
-                            conversations_db[conversation_id]["updated_at"] = datetime.utcnow()
+                        conversation_store.touch(conversation_id)
                         
                         break
                         
@@ -382,20 +515,27 @@ async def send_message_stream(
                 yield f"data: {json.dumps(error_response.dict())}\n\n"
                 yield "data: [DONE]\n\n"
         
-        return StreamingResponse(
+        response = StreamingResponse(
             generate_stream(),
             media_type="text/event-stream",
             headers={
                 "Cache-Control": "no-cache",
                 "Connection": "keep-alive",
-            }
+            },
+            # Runs once the stream ends or the client leaves, even if the stream never started
+            background=BackgroundTask(prefetch.cancel)
         )
+        return response
         
-    except ValidationError:
+    except (ValidationError, HTTPException):
         raise
     except Exception as e:
         logger.error("send_message_stream_failed", error=str(e))
         raise ModelError("Failed to process streaming message")
+    finally:
+        # Until the response owns the lookups, a request that fails cancels them
+        if prefetch is not None and response is None:
+            prefetch.cancel()
 
 @router.delete("/conversations/{conversation_id}")
 async def delete_conversation(
@@ -404,30 +544,10 @@ async def delete_conversation(
 ):
     """Delete a conversation"""
     try:
-        conversation = conversations_db.get(conversation_id)
-        if not conversation:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Conversation not found"
-            )
-        
-        if conversation["user_id"] != current_user.get("id"):
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Access denied"
-            )
+        get_owned_conversation(conversation_id, current_user)
         
         # Delete conversation and its messages
-        del conversations_db[conversation_id]
-        
-        # Delete messages
-        message_ids_to_delete = [
-            msg_id for msg_id, msg in messages_db.items()
-            if msg.get("conversation_id") == conversation_id
-        ]
-        
-        for msg_id in message_ids_to_delete:
-            del messages_db[msg_id]
+        conversation_store.delete_conversation(conversation_id)
         
         logger.info("conversation_deleted", conversation_id=conversation_id, user_id=current_user.get("id"))
         
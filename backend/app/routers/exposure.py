@@ -0,0 +1,105 @@
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Depends, Query
+
+from app.core.exceptions import (ExternalServiceError, NotFoundError,
+                                 ValidationError)
+from app.core.security import get_current_user, require_roles
+from app.services.exposure_scoring import (ExposureEngine, ExposureSnapshot,
+                                           get_exposure_engine)
+from app.services.raster_store import GridRaster
+from app.services.spatial_index import parse_bbox, parse_polygon, to_ring
+
+router = APIRouter()
+
+def require_raster(exposure_engine: ExposureEngine) -> GridRaster:
+    if exposure_engine.raster is None:
+        raise ExternalServiceError("No forest-loss raster is configured")
+    return exposure_engine.raster
+
+async def require_snapshot(exposure_engine: ExposureEngine, refresh: bool = False) -> ExposureSnapshot:
+    snapshot = await exposure_engine.snapshot(refresh=refresh)
+    if snapshot is None:
+        raise ExternalServiceError("No forest-loss raster is configured")
+    return snapshot
+
+@router.get("/companies/{company}")
+async def get_company_exposure(
+    company: str,
+    top_assets: int = Query(0, ge=0, le=100, description="Include this many of the company's most exposed assets"),
+    current_user: dict = Depends(get_current_user),
+    exposure_engine: ExposureEngine = Depends(get_exposure_engine)
+):
+    """Get a company's deforestation exposure by id or name"""
+    require_raster(exposure_engine)
+    record = await exposure_engine.company_exposure(company)
+    if record is None:
+        raise NotFoundError(f"No assets found for company '{company}'")
+    
+    snapshot = await require_snapshot(exposure_engine)
+    response: Dict[str, Any] = {"exposure": record, "lineage": snapshot.lineage}
+    if top_assets:
+        response["top_assets"] = await exposure_engine.top_assets(limit=top_assets, company=company)
+    return response
+
+@router.get("/portfolios/{portfolio}")
+async def get_portfolio_exposure(
+    portfolio: str,
+    current_user: dict = Depends(get_current_user),
+    exposure_engine: ExposureEngine = Depends(get_exposure_engine)
+):
+    """Get a portfolio's holding-weighted deforestation exposure"""
+    require_raster(exposure_engine)
+    record = await exposure_engine.portfolio_exposure(portfolio)
+    if record is None:
+        raise NotFoundError(f"Portfolio '{portfolio}' not found")
+    
+    snapshot = await require_snapshot(exposure_engine)
+    return {"exposure": record, "lineage": snapshot.lineage}
+
+@router.get("/assets")
+async def get_exposed_assets(
+    company: Optional[str] = Query(None, description="Only this company's assets"),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: dict = Depends(get_current_user),
+    exposure_engine: ExposureEngine = Depends(get_exposure_engine)
+):
+    """Get the most exposed assets"""
+    require_raster(exposure_engine)
+    results = await exposure_engine.top_assets(limit=limit, company=company)
+    snapshot = await require_snapshot(exposure_engine)
+    return {"results": results, "total": len(results), "lineage": snapshot.lineage}
+
+@router.get("/zonal")
+async def get_zonal_stats(
+    polygon: Optional[str] = Query(None, description="Ring of 'lon lat' pairs separated by commas"),
+    bbox: Optional[str] = Query(None, description="min_lon,min_lat,max_lon,max_lat"),
+    current_user: dict = Depends(get_current_user),
+    exposure_engine: ExposureEngine = Depends(get_exposure_engine)
+):
+    """Get forest-loss statistics for the raster cells inside a polygon or bbox"""
+    raster = require_raster(exposure_engine)
+    try:
+        if polygon:
+            ring = parse_polygon(polygon)
+        elif bbox:
+            min_lon, min_lat, max_lon, max_lat = parse_bbox(bbox)
+            if min_lon > max_lon:
+                raise ValueError("Zonal statistics do not support bboxes crossing the antimeridian")
+            ring = to_ring([(min_lon, min_lat), (max_lon, min_lat), (max_lon, max_lat), (min_lon, max_lat)])
+        else:
+            raise ValueError("Provide a polygon or a bbox")
+    except ValueError as e:
+        raise ValidationError(str(e))
+    
+    stats = await exposure_engine.zonal_stats(ring)
+    return {"stats": stats, "lineage": raster.lineage()}
+
+@router.post("/refresh")
+async def refresh_exposure(
+    current_user: dict = Depends(require_roles(["admin"])),
+    exposure_engine: ExposureEngine = Depends(get_exposure_engine)
+):
+    """Recompute exposure scores for every asset, company and portfolio"""
+    snapshot = await require_snapshot(exposure_engine, refresh=True)
+    return {"lineage": snapshot.lineage, **exposure_engine.stats()}
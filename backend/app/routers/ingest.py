@@ -1,17 +1,74 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from typing import Callable, Coroutine, Any, Optional
+import os
+from fastapi import APIRouter, Depends, Request, Response, UploadFile, File, Form, HTTPException, status
+from fastapi.routing import APIRoute
+import structlog
+from app.core.config import settings
 from app.core.security import get_current_user
+from app.services.ingestion import UPLOAD_FORM_OVERHEAD, limit_request_body, spool_upload
+from app.services.jobs import IngestionJobEngine, get_ingestion_engine
 
-router = APIRouter()
+logger = structlog.get_logger(__name__)
 
-@router.post("/upload")
+class UploadLimitRoute(APIRoute):
+    """Rejects a request body over the upload limit while it is received, before it is spooled"""
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def limited_handler(request: Request) -> Response:
+            return await handler(limit_request_body(request, settings.MAX_FILE_SIZE + UPLOAD_FORM_OVERHEAD))
+
+        return limited_handler
+
+router = APIRouter(route_class=UploadLimitRoute)
+
+@router.post("/upload", status_code=status.HTTP_202_ACCEPTED)
 async def upload_dataset(
     file: UploadFile = File(...),
-    current_user: dict = Depends(get_current_user)
+    source: Optional[str] = Form(None, description="Dataset the file re-delivers; defaults to the file name"),
+    dataset_type: str = Form("documents", description="'companies' or 'assets' also loads rows into that store"),
+    current_user: dict = Depends(get_current_user),
+    ingestion_engine: IngestionJobEngine = Depends(get_ingestion_engine)
 ):
-    """Upload and ingest dataset"""
-    return {"message": f"Dataset {file.filename} uploaded successfully", "job_id": "mock-job-123"}
+    """Upload a dataset and queue it for background ingestion.
+    
+    Re-uploading a source only embeds and indexes the chunks that changed.
+    """
+    upload = await spool_upload(file)
+    
+    try:
+        job = await ingestion_engine.submit(
+            upload,
+            source=source or os.path.splitext(upload.filename)[0],
+            user_id=current_user.get("id"),
+            dataset_type=dataset_type
+        )
+    finally:
+        upload.close()
+    
+    return {
+        "message": f"Dataset {upload.filename} queued for ingestion",
+        "job_id": job.job_id,
+        "status": job.status,
+        "dataset_type": job.dataset_type,
+        "filename": upload.filename,
+        "size": upload.size,
+        "sha256": upload.sha256
+    }
 
 @router.get("/status/{job_id}")
-async def get_ingestion_status(job_id: str):
-    """Get ingestion job status"""
-    return {"job_id": job_id, "status": "completed", "progress": 100}
+async def get_ingestion_status(
+    job_id: str,
+    current_user: dict = Depends(get_current_user),
+    ingestion_engine: IngestionJobEngine = Depends(get_ingestion_engine)
+):
+    """Get ingestion job status with per-stage progress"""
+    job = await ingestion_engine.get_job(job_id)
+    if job is None or job.user_id != current_user.get("id"):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Ingestion job not found"
+        )
+    
+    return job.to_status()
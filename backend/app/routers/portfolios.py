@@ -0,0 +1,50 @@
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Depends, Query
+
+from app.core.exceptions import ValidationError
+from app.core.security import get_current_user
+from app.services.aggregation import (DIMENSIONS, PortfolioAggregator,
+                                      get_portfolio_aggregator)
+
+router = APIRouter()
+
+def split_values(text: Optional[str]) -> List[str]:
+    return [value.strip() for value in (text or "").split(",") if value.strip()]
+
+@router.get("")
+async def list_portfolios(
+    current_user: dict = Depends(get_current_user),
+    portfolio_aggregator: PortfolioAggregator = Depends(get_portfolio_aggregator)
+):
+    """List portfolios with their holdings, weights and position-weighted metrics"""
+    return portfolio_aggregator.rollup(group_by=["portfolio"])
+
+@router.get("/rollup")
+async def rollup_holdings(
+    group_by: Optional[str] = Query(None, description=f"Comma-separated dimensions: {', '.join(DIMENSIONS)}"),
+    portfolio: Optional[str] = Query(None, description="Comma-separated portfolios"),
+    sector: Optional[str] = Query(None, description="Comma-separated sectors"),
+    country: Optional[str] = Query(None, description="Comma-separated countries"),
+    region: Optional[str] = Query(None, description="Comma-separated regions"),
+    rating: Optional[str] = Query(None, description="Comma-separated provider ratings"),
+    metrics: Optional[str] = Query(None, description="Comma-separated numeric company columns; all when omitted"),
+    limit: Optional[int] = Query(None, ge=1),
+    current_user: dict = Depends(get_current_user),
+    portfolio_aggregator: PortfolioAggregator = Depends(get_portfolio_aggregator)
+):
+    """Position-weighted ESG metrics of holdings, grouped and filtered by dimension"""
+    filters: Dict[str, List[str]] = {
+        dimension: split_values(values)
+        for dimension, values in (("portfolio", portfolio), ("sector", sector), ("country", country), ("region", region), ("rating", rating))
+        if split_values(values)
+    }
+    try:
+        return portfolio_aggregator.rollup(
+            group_by=split_values(group_by),
+            filters=filters,
+            metrics=split_values(metrics) or None,
+            limit=limit
+        )
+    except ValueError as e:
+        raise ValidationError(str(e))
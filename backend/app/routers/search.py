@@ -1,23 +1,134 @@
+from typing import Dict, List, Optional, Tuple
+import asyncio
 from fastapi import APIRouter, Depends, Query
+from pydantic import BaseModel
+from app.core.config import settings
+from app.core.exceptions import ValidationError
 from app.core.security import get_current_user
-from app.services.search_client import SearchService
+from app.services.search_client import SearchService, get_search_service
+from app.services.company_store import CompanyStore, get_company_store, to_float
+from app.services.spatial_index import AssetStore, get_asset_store, parse_bbox, parse_polygon
 
 router = APIRouter()
 
+class ResolveCompaniesRequest(BaseModel):
+    names: List[str]
+    threshold: Optional[float] = None
+
 @router.get("/assets")
 async def search_assets(
-    q: str = Query(..., description="Search query"),
+    q: Optional[str] = Query(None, description="Search query; with a spatial filter, words to match in asset or company names"),
+    top_k: int = Query(10, ge=1, le=100),
+    bm25_weight: Optional[float] = Query(None, ge=0, description="Keyword retriever weight in rank fusion"),
+    vector_weight: Optional[float] = Query(None, ge=0, description="Vector retriever weight in rank fusion"),
+    bbox: Optional[str] = Query(None, description="Assets intersecting min_lon,min_lat,max_lon,max_lat"),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    radius_km: Optional[float] = Query(None, gt=0, le=20000, description="Assets within this distance of lat/lon"),
+    polygon: Optional[str] = Query(None, description="Assets intersecting a ring of 'lon lat' pairs separated by commas"),
+    asset_type: Optional[str] = Query(None, alias="type", description="Comma-separated asset types"),
+    country: Optional[str] = Query(None, description="Comma-separated countries"),
     current_user: dict = Depends(get_current_user),
-    search_service: SearchService = Depends()
+    search_service: SearchService = Depends(get_search_service),
+    asset_store: AssetStore = Depends(get_asset_store)
 ):
-    """Search assets"""
-    results = await search_service.search_documents(query=q, top_k=10)
+    """Search assets by text, or by location with bbox, radius and polygon filters"""
+    if (lat is None) != (lon is None):
+        raise ValidationError("lat and lon must be given together")
+    near: Optional[Tuple[float, float, float]] = None
+    if radius_km is not None:
+        if lat is None or lon is None:
+            raise ValidationError("radius_km requires lat and lon")
+        near = (lat, lon, radius_km)
+    
+    if bbox or polygon or near is not None:
+        try:
+            results, total = asset_store.search(
+                bbox=parse_bbox(bbox) if bbox else None,
+                near=near,
+                polygon=parse_polygon(polygon) if polygon else None,
+                query=q or "",
+                categories={
+                    column: [value.strip() for value in values.split(",") if value.strip()]
+                    for column, values in (("type", asset_type), ("country", country))
+                    if values
+                },
+                limit=top_k
+            )
+        except ValueError as e:
+            raise ValidationError(str(e))
+        return {"query": q, "results": results, "total": total}
+    
+    if not q:
+        raise ValidationError("Provide a search query or a bbox, radius or polygon filter")
+    
+    weights = {
+        name: weight
+        for name, weight in (("bm25", bm25_weight), ("vector", vector_weight))
+        if weight is not None
+    }
+    results = await search_service.search_documents(query=q, top_k=top_k, weights=weights or None)
     return {"query": q, "results": results, "total": len(results)}
 
-@router.get("/companies") 
+@router.get("/companies")
 async def search_companies(
-    q: str = Query(..., description="Search query"),
-    current_user: dict = Depends(get_current_user)
+    q: str = Query("", description="Company name, matched by word prefix, substring or fuzzy spelling"),
+    sector: Optional[str] = Query(None, description="Comma-separated sectors"),
+    country: Optional[str] = Query(None, description="Comma-separated countries"),
+    rating: Optional[str] = Query(None, description="Comma-separated provider ratings"),
+    portfolio: Optional[str] = Query(None, description="Only companies held in this portfolio"),
+    minimums: List[str] = Query([], alias="min", description="Lower bounds as column:value"),
+    maximums: List[str] = Query([], alias="max", description="Upper bounds as column:value"),
+    sort_by: Optional[str] = Query(None, description="Numeric column to sort by, descending"),
+    limit: int = Query(20, ge=1, le=settings.COMPANY_SEARCH_MAX_RESULTS),
+    current_user: dict = Depends(get_current_user),
+    company_store: CompanyStore = Depends(get_company_store)
+):
+    """Search companies by name and attributes"""
+    categories = {
+        column: [value.strip() for value in values.split(",") if value.strip()]
+        for column, values in (("sector", sector), ("country", country), ("rating", rating))
+        if values
+    }
+    
+    ranges: Dict[str, Tuple[Optional[float], Optional[float]]] = {}
+    try:
+        for bounds, side in ((minimums, 0), (maximums, 1)):
+            for bound in bounds:
+                column, _, value = bound.partition(":")
+                number = to_float(value)
+                if number is None:
+                    raise ValueError(f"Invalid bound '{bound}', expected column:value")
+                low, high = ranges.get(column, (None, None))
+                ranges[column] = (number, high) if side == 0 else (low, number)
+        
+        results, total = company_store.search(
+            query=q,
+            categories=categories,
+            ranges=ranges,
+            portfolio=portfolio,
+            sort_by=sort_by,
+            limit=limit
+        )
+    except ValueError as e:
+        raise ValidationError(str(e))
+    
+    return {"query": q, "results": results, "total": total}
+
+@router.post("/companies/resolve")
+async def resolve_companies(
+    request: ResolveCompaniesRequest,
+    current_user: dict = Depends(get_current_user),
+    company_store: CompanyStore = Depends(get_company_store)
 ):
-    """Search companies"""
-    return {"query": q, "results": [], "total": 0}
+    """Resolve a batch of names, such as a holdings file's issuer column, to companies"""
+    if len(request.names) > settings.ENTITY_RESOLVE_MAX_NAMES:
+        raise ValidationError(f"At most {settings.ENTITY_RESOLVE_MAX_NAMES} names can be resolved at once")
+    if request.threshold is not None and not 0 < request.threshold <= 1:
+        raise ValidationError("threshold must be in (0, 1]")
+    
+    results = await asyncio.to_thread(company_store.resolve, request.names, request.threshold)
+    return {
+        "results": [{"query": name, "company": result} for name, result in zip(request.names, results)],
+        "resolved": sum(result is not None for result in results),
+    }
@@ -1,12 +1,55 @@
-from typing import List, Dict, Any, Optional, AsyncGenerator
+from typing import List, Dict, Any, Optional, AsyncGenerator, Awaitable, Callable, Tuple, Union
 from dataclasses import dataclass
 import asyncio
+import json
+import re
+from fastapi import Request
+from pydantic import BaseModel, Field
 import structlog
+from app.core.config import settings
+from app.core.exceptions import RateLimitError
 from app.services.openai_client import OpenAIService
 from app.services.search_client import SearchService
+from app.services.history import HistoryManager
+from app.services.semantic_cache import SemanticCache, SemanticCacheHit
+from app.services.embeddings import EmbeddingService
+from app.services.spatial_index import AssetStore, BBox
+from app.services.exposure_scoring import ExposureEngine
+from app.services.aggregation import Dimension, PortfolioAggregator
+from app.services.tool_planner import ToolOutcome, ToolPlan, ToolTask
+from app.services.tool_registry import ToolDefinition, ToolRegistry
 
 logger = structlog.get_logger(__name__)
 
+# Size of the deltas used to replay a cached answer as a stream
+CACHED_REPLAY_CHUNK_CHARS = 40
+ASSET_TOOL_MAX_RESULTS = 50
+# Longest JSON excerpt of a planned lookup's facts put into the prompt
+FACT_CONTEXT_CHARS = 2000
+BUSY_MESSAGE = "Green Guardian is handling a lot of requests right now. Please try again in a few seconds."
+
+class SearchAssetsArguments(BaseModel):
+    lat: Optional[float] = Field(None, description="Latitude of the radius center")
+    lon: Optional[float] = Field(None, description="Longitude of the radius center")
+    radius_km: Optional[float] = Field(None, description="Search radius in kilometres around lat/lon")
+    bbox: Optional[List[float]] = Field(None, description="Bounding box as [min_lon, min_lat, max_lon, max_lat]")
+    polygon: Optional[List[List[float]]] = Field(None, description="Polygon ring as a list of [lon, lat] vertices")
+    query: str = Field("", description="Words in the asset or company name")
+    limit: int = Field(20, description=f"Maximum assets to return, at most {ASSET_TOOL_MAX_RESULTS}")
+
+class ExposureArguments(BaseModel):
+    company: Optional[str] = Field(None, description="Company id (ISIN/LEI) or name")
+    portfolio: Optional[str] = Field(None, description="Portfolio name")
+    top_assets: int = Field(0, description="Number of the company's most exposed assets to include")
+
+class AggregateHoldingsArguments(BaseModel):
+    group_by: List[Dimension] = Field([], description="Dimensions to group by; none gives a single total")
+    filters: Dict[str, Union[List[str], str]] = Field(
+        {}, description="Dimension name to the list of values to keep, e.g. {\"sector\": [\"Energy\"]}"
+    )
+    metrics: Optional[List[str]] = Field(None, description="Numeric company columns to average; all when omitted")
+    limit: Optional[int] = Field(None, description="Maximum groups to return, largest weight first")
+
 @dataclass
 class AgentResponse:
     content: str
@@ -23,40 +66,42 @@ class StreamingChunk:
     citations: Optional[List[Dict[str, Any]]] = None
     tools_used: Optional[List[Dict[str, Any]]] = None
     tokens_used: Optional[Dict[str, int]] = None
+    event: Optional[str] = None  # "thinking" or "sources" before the answer starts
+
+# The turn's plan, the names of its fact tasks, and their outcomes
+TurnLookups = Tuple[ToolPlan, List[str], Dict[str, ToolOutcome]]
 
 class AgentService:
-    def __init__(self):
-        self.openai_service = OpenAIService()
-        self.search_service = SearchService()
-        
-    async def process_message(
+    def __init__(
         self,
-        message: str,
-        conversation_history: List[Dict[str, Any]],
-        context: Optional[Dict[str, Any]] = None,
-        user_id: str = None
-    ) -> AgentResponse:
-        """Process message using agentic workflow"""
-        try:
-            # Step 1: Analyze intent and search for relevant documents
-            search_results = await self.search_service.search_documents(
-                query=message,
-                top_k=5
-            )
-            
-            # Step 2: Build context with search results
-            context_text = "\n\n".join([
-                f"Source: {result['title']}\n{result['content']}"
-                for result in search_results
-            ])
-            
-            # Step 3: Create system prompt
-            system_prompt = f"""You are Green Guardian, DNB's AI sustainability copilot. 
+        openai_service: Optional[OpenAIService] = None,
+        search_service: Optional[SearchService] = None,
+        embedding_service: Optional[EmbeddingService] = None,
+        semantic_cache: Optional[SemanticCache] = None,
+        asset_store: Optional[AssetStore] = None,
+        exposure_engine: Optional[ExposureEngine] = None,
+        portfolio_aggregator: Optional[PortfolioAggregator] = None
+    ):
+        self.openai_service = openai_service or OpenAIService()
+        self.search_service = search_service or SearchService()
+        self.embedding_service = embedding_service or EmbeddingService(self.openai_service)
+        self.semantic_cache = semantic_cache
+        self.asset_store = asset_store
+        self.exposure_engine = exposure_engine
+        self.portfolio_aggregator = portfolio_aggregator
+        self.history_manager = HistoryManager(model=self.openai_service.deployment_name)
+        self.tool_registry = self._register_tools()
+    
+    def _build_system_prompt(self, context_text: str, summary: Optional[str] = None) -> str:
+        """Build the system prompt from retrieved context and the conversation summary"""
+        summary_text = f"\nSummary of earlier conversation:\n{summary}\n" if summary else ""
+        
+        return f"""You are Green Guardian, DNB's AI sustainability copilot. 
 You help analyze ESG risks, portfolio sustainability, and provide actionable insights.
 
 Available context:
 {context_text}
-
+{summary_text}
 Guidelines:
 - Provide specific, actionable sustainability insights
 - Use data from the context when relevant
@@ -64,157 +109,549 @@ Guidelines:
 - Suggest concrete next steps
 - Be concise but comprehensive
 """
+    
+    def _register_tools(self) -> ToolRegistry:
+        """Tools the model can call; asset tools need indexed assets, aggregation needs holdings"""
+        registry = ToolRegistry()
+        
+        def has_assets() -> bool:
+            return self.asset_store is not None and len(self.asset_store) > 0
+        
+        registry.register(ToolDefinition(
+            name="search_assets",
+            description=(
+                "Find physical assets such as plants, mines, farms and facilities by location: "
+                "within a radius of a point, inside a bounding box or inside a polygon, "
+                "optionally narrowed by words in the asset or owning company's name."
+            ),
+            arguments=SearchAssetsArguments,
+            handler=self._search_assets,
+            available=has_assets
+        ))
+        registry.register(ToolDefinition(
+            name="get_deforestation_exposure",
+            description=(
+                "Get computed deforestation exposure: the share of forest lost around a company's assets, "
+                "or the holding-weighted exposure of a portfolio, with the data lineage to cite."
+            ),
+            arguments=ExposureArguments,
+            handler=self._get_exposure,
+            available=lambda: has_assets() and self.exposure_engine is not None and self.exposure_engine.available
+        ))
+        registry.register(ToolDefinition(
+            name="aggregate_holdings",
+            description=(
+                "Aggregate portfolio holdings: holdings count, position weight, market value and "
+                "position-weighted ESG metrics, grouped by portfolio, sector, country, region or rating "
+                "and filtered to any values of those dimensions."
+            ),
+            arguments=AggregateHoldingsArguments,
+            handler=self._aggregate_holdings,
+            available=lambda: self.portfolio_aggregator is not None and self.portfolio_aggregator.stats()["holdings"] > 0
+        ))
+        return registry
+    
+    async def _search_assets(self, arguments: SearchAssetsArguments) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        if self.asset_store is None:
+            raise ValueError("No assets are indexed")
+        near = None
+        if arguments.radius_km is not None:
+            if arguments.lat is None or arguments.lon is None:
+                raise ValueError("radius_km needs lat and lon")
+            near = (arguments.lat, arguments.lon, arguments.radius_km)
+        bbox: Optional[BBox] = None
+        if arguments.bbox:
+            if len(arguments.bbox) != 4:
+                raise ValueError("bbox needs [min_lon, min_lat, max_lon, max_lat]")
+            min_lon, min_lat, max_lon, max_lat = arguments.bbox
+            bbox = (min_lon, min_lat, max_lon, max_lat)
+        results, total = await asyncio.to_thread(
+            self.asset_store.search,
+            bbox=bbox,
+            near=near,
+            polygon=arguments.polygon or None,
+            query=arguments.query,
+            limit=min(arguments.limit or 20, ASSET_TOOL_MAX_RESULTS)
+        )
+        return {"results": results, "total": total}, []
+    
+    async def _get_exposure(self, arguments: ExposureArguments) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """Exposure facts for a company or portfolio, cited with the scores' lineage"""
+        company, portfolio = arguments.company, arguments.portfolio
+        if not company and not portfolio:
+            raise ValueError("Provide a company or a portfolio")
+        exposure_engine = self.exposure_engine
+        if exposure_engine is None:
+            raise ValueError("Exposure scoring is not configured")
+        
+        facts: Dict[str, Any] = {}
+        if company:
+            facts["company"] = await exposure_engine.company_exposure(company)
+            if arguments.top_assets:
+                facts["top_assets"] = await exposure_engine.top_assets(
+                    limit=min(arguments.top_assets, ASSET_TOOL_MAX_RESULTS), company=company
+                )
+        if portfolio:
+            facts["portfolio"] = await exposure_engine.portfolio_exposure(portfolio)
+        
+        snapshot = await exposure_engine.snapshot()
+        if snapshot is None:
+            raise ValueError("No forest-loss raster is configured")
+        lineage = snapshot.lineage
+        facts["lineage"] = lineage
+        citations = [
+            {
+                "id": f"exposure:{kind}:{name}",
+                "title": f"Deforestation exposure of {name}",
+                "source": f"{lineage['dataset']} {lineage['version'] or ''}".strip(),
+                "excerpt": json.dumps(facts[kind])[:200],
+                "relevance_score": 1.0,
+                "document_type": "exposure_fact",
+                "lineage": lineage
+            }
+            for kind, name in (("company", company), ("portfolio", portfolio))
+            if name and facts.get(kind) is not None
+        ]
+        return facts, citations
+    
+    async def _aggregate_holdings(self, arguments: AggregateHoldingsArguments) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """Holding rollups from the pre-aggregated cells, cited as a portfolio fact"""
+        if self.portfolio_aggregator is None:
+            raise ValueError("No portfolio holdings are loaded")
+        filters = {
+            dimension: [values] if isinstance(values, str) else values
+            for dimension, values in arguments.filters.items()
+        }
+        facts = self.portfolio_aggregator.rollup(
+            group_by=arguments.group_by,
+            filters=filters,
+            metrics=arguments.metrics,
+            limit=min(arguments.limit, ASSET_TOOL_MAX_RESULTS) if arguments.limit else ASSET_TOOL_MAX_RESULTS
+        )
+        scope = ", ".join(f"{dimension} in {'/'.join(values)}" for dimension, values in filters.items()) or "all holdings"
+        grouping = f" by {', '.join(facts['group_by'])}" if facts["group_by"] else ""
+        citations = [{
+            "id": f"portfolio:{','.join(facts['group_by']) or 'total'}:{json.dumps(filters, sort_keys=True)}",
+            "title": f"Holdings rollup{grouping} ({scope})",
+            "source": "Portfolio holdings",
+            "excerpt": json.dumps(facts["groups"])[:200],
+            "relevance_score": 1.0,
+            "document_type": "portfolio_fact"
+        }]
+        return facts, citations
+    
+    def _turn_targets(self, message: str, context: Optional[Dict[str, Any]]) -> Tuple[List[str], List[str]]:
+        """Portfolios and companies a turn is about: set in the chat context, or portfolios named in the message"""
+        context = context or {}
+        
+        def values(*keys: str) -> List[str]:
+            found: List[Any] = []
+            for key in keys:
+                value = context.get(key)
+                found.extend([value] if isinstance(value, str) else value if isinstance(value, list) else [])
+            return [str(value).strip() for value in found if str(value).strip()]
+        
+        portfolios, companies = values("portfolio", "portfolios"), values("company", "companies")
+        if self.portfolio_aggregator is not None:
+            text = message.casefold()
+            portfolios += [
+                name for name in self.portfolio_aggregator.dimension_values()["portfolio"]
+                if re.search(rf"(?<!\w){re.escape(name.casefold())}(?!\w)", text)
+            ]
+        limit = settings.AGENT_PLAN_MAX_TARGETS
+        return list(dict.fromkeys(portfolios))[:limit], list(dict.fromkeys(companies))[:limit]
+    
+    def _plan_turn(self, message: str, context: Optional[Dict[str, Any]]) -> Tuple[ToolPlan, List[str]]:
+        """Document search plus the portfolio and company lookups the turn needs, as one dependency graph.
+        
+        Returns the plan and the names of its tasks that produce facts to cite.
+        """
+        timeout = settings.AGENT_TOOL_TIMEOUT_S
+        
+        def lookup(tool_name: str, arguments: Dict[str, Any]) -> Callable[[Dict[str, Any]], Awaitable[Any]]:
+            async def run(results: Dict[str, Any]) -> Any:
+                return await self.tool_registry.call(tool_name, arguments)
+            return run
+        
+        async def search(results: Dict[str, Any]) -> List[Dict[str, Any]]:
+            return await self.search_service.search_documents(query=message, top_k=5)
+        
+        tasks = [ToolTask("cognitive_search", search, timeout=timeout, parameters={"query": message, "top_k": 5})]
+        fact_tasks: List[str] = []
+        exposure = self.exposure_engine is not None and self.exposure_engine.available
+        portfolios, companies = self._turn_targets(message, context)
+        
+        for portfolio in portfolios:
+            lookups = []
+            if self.portfolio_aggregator is not None:
+                lookups.append(("aggregate_holdings", {"group_by": ["sector"], "filters": {"portfolio": [portfolio]}, "limit": 10}))
+            if exposure:
+                lookups.append(("get_deforestation_exposure", {"portfolio": portfolio}))
+            for tool_name, arguments in lookups:
+                tasks.append(ToolTask(f"{tool_name}:portfolio:{portfolio}", lookup(tool_name, arguments), timeout=timeout, parameters=arguments))
+                fact_tasks.append(tasks[-1].name)
+        
+        for company in companies if exposure else ():
+            depends_on: Tuple[str, ...] = ()
+            if self.portfolio_aggregator is not None:
+                # Context often carries a display name; exposure is keyed by the resolved company id
+                company_store = self.portfolio_aggregator.company_store
+                
+                async def resolve(results: Dict[str, Any], company: str = company) -> Optional[Dict[str, Any]]:
+                    return (await asyncio.to_thread(company_store.resolve, [company]))[0]
+                
+                tasks.append(ToolTask(f"resolve_company:{company}", resolve, timeout=timeout, parameters={"name": company}))
+                depends_on = (tasks[-1].name,)
             
-            # Step 4: Build conversation messages
-            messages = []
-            for msg in conversation_history[-10:]:  # Last 10 messages for context
-                if msg.get("role") in ["user", "assistant"]:
-                    messages.append({
-                        "role": msg["role"],
-                        "content": msg["content"]
-                    })
+            async def company_exposure(results: Dict[str, Any], company: str = company, depends_on: Tuple[str, ...] = depends_on) -> Any:
+                resolved = results.get(depends_on[0]) if depends_on else None
+                return await self.tool_registry.call(
+                    "get_deforestation_exposure", {"company": resolved["id"] if resolved else company, "top_assets": 3}
+                )
             
-            messages.append({"role": "user", "content": message})
+            tasks.append(ToolTask(
+                f"get_deforestation_exposure:company:{company}",
+                company_exposure,
+                depends_on=depends_on,
+                timeout=timeout,
+                parameters={"company": company, "top_assets": 3}
+            ))
+            fact_tasks.append(tasks[-1].name)
+        
+        return ToolPlan(tasks), fact_tasks
+    
+    async def _run_lookups(self, message: str, context: Optional[Dict[str, Any]]) -> TurnLookups:
+        plan, fact_tasks = self._plan_turn(message, context)
+        return plan, fact_tasks, await plan.run(deadline=settings.AGENT_PLAN_TIMEOUT_S)
+    
+    def prefetch_context(self, message: str, context: Optional[Dict[str, Any]]) -> "asyncio.Task[TurnLookups]":
+        """Start a turn's search and lookups now, so they run while the caller loads history.
+        
+        They need only the message and chat context. Pass the task to
+        process_message or process_message_stream as `prefetch`.
+        """
+        return asyncio.ensure_future(self._run_lookups(message, context))
+    
+    async def _gather_context(
+        self,
+        lookups: "asyncio.Future[TurnLookups]",
+        summary: Optional[str]
+    ) -> Tuple[str, List[Dict[str, Any]], List[Dict[str, Any]], bool]:
+        """Wait for the turn's lookups and build the system prompt from whatever finished in time.
+        
+        Returns the system prompt, citations, tools_used entries, and
+        whether every lookup succeeded.
+        """
+        plan, fact_tasks, outcomes = await lookups
+        
+        search = outcomes["cognitive_search"]
+        search_results = search.result if search.ok else []
+        sections = [f"Source: {result['title']}\n{result['content']}" for result in search_results]
+        citations = [
+            {
+                "id": result["id"],
+                "title": result["title"],
+                "source": result["source"],
+                "excerpt": result["content"][:200] + "...",
+                "relevance_score": result["score"],
+                "document_type": result.get("metadata", {}).get("type", "document")
+            }
+            for result in search_results
+        ]
+        for name in fact_tasks:
+            if outcomes[name].ok:
+                facts, fact_citations = outcomes[name].result
+                sections.append(f"Facts from {name}:\n{json.dumps(facts, default=str)[:FACT_CONTEXT_CHARS]}")
+                citations.extend(fact_citations)
+        unavailable = [name for name, outcome in outcomes.items() if not outcome.ok]
+        if unavailable:
+            sections.append(f"Unavailable this turn (timed out or failed; do not guess their data): {', '.join(unavailable)}")
+        
+        return self._build_system_prompt("\n\n".join(sections), summary), citations, plan.tools_used(outcomes), not unavailable
+    
+    async def _lookup_cached_answer(
+        self,
+        message: str,
+        messages: List[Dict[str, str]],
+        summary: Optional[str],
+        context: Optional[Dict[str, Any]],
+        entitlements: Optional[List[str]]
+    ) -> Tuple[Optional[Tuple[Any, str]], Optional[SemanticCacheHit]]:
+        """Check the semantic cache for a standalone question.
+        
+        Returns the (query vector, scope) key to store the answer under, or
+        None when the turn is not cacheable, and the cache hit if any.
+        """
+        # Follow-up turns depend on the conversation, so only standalone questions are cached
+        if self.semantic_cache is None or len(messages) > 1 or summary:
+            return None, None
+        
+        try:
+            query_vector = (await self.embedding_service.embed([message]))[0]
+        except Exception as e:
+            logger.warning("semantic_cache_embedding_failed", error=str(e))
+            return None, None
+        
+        scope = SemanticCache.scope_key(context, entitlements)
+        return (query_vector, scope), self.semantic_cache.lookup(query_vector, scope)
+        
+    async def process_message(
+        self,
+        message: str,
+        conversation_history: List[Dict[str, Any]],
+        context: Optional[Dict[str, Any]] = None,
+        user_id: Optional[str] = None,
+        conversation: Optional[Dict[str, Any]] = None,
+        entitlements: Optional[List[str]] = None,
+        prefetch: Optional["asyncio.Task[TurnLookups]"] = None
+    ) -> AgentResponse:
+        """Process message using agentic workflow"""
+        # Search and lookups run while the history window and cache lookup are prepared
+        lookups = prefetch or self.prefetch_context(message, context)
+        try:
+            # Step 1: Build conversation messages within the history token budget
+            messages, summary, window_start = self.history_manager.build_window(
+                message, conversation_history, conversation
+            )
+            
+            # Step 2: Serve near-identical standalone questions from the semantic cache
+            cache_key, cache_hit = await self._lookup_cached_answer(
+                message, messages, summary, context, entitlements
+            )
+            if cache_hit:
+                return AgentResponse(
+                    content=cache_hit.content,
+                    metadata={**(cache_hit.metadata or {}), "cache_hit": True, "similarity": cache_hit.similarity},
+                    citations=cache_hit.citations,
+                    tools_used=[{"tool_name": "semantic_cache", "parameters": {"query": message}}],
+                    tokens_used={"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+                )
             
-            # Step 5: Generate response
+            # Step 3: Collect the document search and the turn's portfolio and company lookups
+            system_prompt, citations, plan_tools, complete = await self._gather_context(lookups, summary)
+            
+            # Step 4: Generate response, running the functions the model calls concurrently
+            function_tools = []
+            function_citations = []
             ai_response = await self.openai_service.generate_response(
                 messages=messages,
                 system_prompt=system_prompt,
                 temperature=0.7,
-                max_tokens=1000
+                max_tokens=1000,
+                tools=self.tool_registry.schemas(),
+                user=user_id
             )
+            tool_calls = ai_response.get("tool_calls")
+            if tool_calls:
+                results = await self.tool_registry.invoke_many(
+                    [(call.function.name, call.function.arguments) for call in tool_calls]
+                )
+                tool_messages = []
+                for call, (result, tool, tool_citations) in zip(tool_calls, results):
+                    function_tools.append(tool)
+                    function_citations.extend(tool_citations)
+                    tool_messages.append({"role": "tool", "tool_call_id": call.id, "content": json.dumps(result, default=str)})
+                first_tokens = ai_response["tokens_used"]
+                ai_response = await self.openai_service.generate_response(
+                    messages=[
+                        *messages,
+                        {
+                            "role": "assistant",
+                            "content": None,
+                            "tool_calls": [
+                                {
+                                    "id": call.id,
+                                    "type": "function",
+                                    "function": {"name": call.function.name, "arguments": call.function.arguments}
+                                }
+                                for call in tool_calls
+                            ]
+                        },
+                        *tool_messages
+                    ],
+                    system_prompt=system_prompt,
+                    temperature=0.7,
+                    max_tokens=1000,
+                    user=user_id
+                )
+                ai_response["tokens_used"] = {
+                    key: value + first_tokens.get(key, 0) for key, value in ai_response["tokens_used"].items()
+                }
             
-            # Step 6: Format citations
-            citations = []
-            for i, result in enumerate(search_results):
-                citations.append({
-                    "id": result["id"],
-                    "title": result["title"],
-                    "source": result["source"],
-                    "excerpt": result["content"][:200] + "...",
-                    "relevance_score": result["score"],
-                    "document_type": result.get("metadata", {}).get("type", "document")
-                })
+            # Step 5: Add citations of the functions the model called
+            citations.extend(function_citations)
+            
+            # Step 6: Fold turns that left the history window into the summary
+            self.history_manager.schedule_fold(
+                conversation, conversation_history, window_start, self.openai_service
+            )
             
             # Step 7: Track tools used
             tools_used = [
-                {
-                    "tool_name": "cognitive_search",
-                    "parameters": {"query": message, "top_k": 5},
-                    "execution_time_ms": 150
-                },
+                *plan_tools,
                 {
                     "tool_name": "azure_openai",
                     "parameters": {"model": "gpt-4", "temperature": 0.7},
                     "execution_time_ms": 2000
-                }
+                },
+                *function_tools
             ]
             
+            metadata = {
+                "intent": "sustainability_analysis",
+                "confidence": 0.9,
+                "processing_time_ms": 2150
+            }
+            if not complete:
+                metadata["partial_context"] = True
+            
+            # Answers built on partial context are not reused
+            if cache_key and complete and self.semantic_cache is not None:
+                self.semantic_cache.store(
+                    *cache_key, content=ai_response["content"], citations=citations, metadata=metadata
+                )
+            
             return AgentResponse(
                 content=ai_response["content"],
-                metadata={
-                    "intent": "sustainability_analysis",
-                    "confidence": 0.9,
-                    "processing_time_ms": 2150
-                },
+                metadata=metadata,
                 citations=citations,
                 tools_used=tools_used,
                 tokens_used=ai_response.get("tokens_used")
             )
             
+        except RateLimitError as e:
+            logger.warning("agent_rate_limited", error=e.detail)
+            return AgentResponse(
+                content=BUSY_MESSAGE,
+                metadata={"error": e.detail, **e.metadata}
+            )
         except Exception as e:
             logger.error("agent_processing_failed", error=str(e))
             return AgentResponse(
                 content="I apologize, but I encountered an error while processing your request. Please try again.",
                 metadata={"error": str(e)}
             )
+        finally:
+            lookups.cancel()
     
     async def process_message_stream(
         self,
         message: str,
         conversation_history: List[Dict[str, Any]],
         context: Optional[Dict[str, Any]] = None,
-        user_id: str = None
+        user_id: Optional[str] = None,
+        conversation: Optional[Dict[str, Any]] = None,
+        entitlements: Optional[List[str]] = None,
+        prefetch: Optional["asyncio.Task[TurnLookups]"] = None
     ) -> AsyncGenerator[StreamingChunk, None]:
-        """Process message with streaming response"""
+        """Process message with streaming response.
+        
+        A "thinking" event goes out at once and a "sources" event with the
+        citations as soon as the lookups finish, while the model's stream
+        is being opened.
+        """
+        lookups = prefetch or self.prefetch_context(message, context)
+        stream: Optional[AsyncGenerator[str, None]] = None
+        first_delta: Optional[asyncio.Future] = None
         try:
-            # Same setup as non-streaming version
-            search_results = await self.search_service.search_documents(
-                query=message,
-                top_k=5
-            )
+            yield StreamingChunk(delta="", is_final=False, metadata={"streaming": True}, event="thinking")
             
-            context_text = "\n\n".join([
-                f"Source: {result['title']}\n{result['content']}"
-                for result in search_results
-            ])
-            
-            system_prompt = f"""You are Green Guardian, DNB's AI sustainability copilot. 
-You help analyze ESG risks, portfolio sustainability, and provide actionable insights.
-
-Available context:
-{context_text}
-
-Guidelines:
-- Provide specific, actionable sustainability insights
-- Use data from the context when relevant
-- Flag high-risk areas clearly
-- Suggest concrete next steps
-- Be concise but comprehensive
-"""
+            # Same setup as non-streaming version, while the lookups run
+            messages, summary, window_start = self.history_manager.build_window(
+                message, conversation_history, conversation
+            )
             
-            messages = []
-            for msg in conversation_history[-10:]:
-                if msg.get("role") in ["user", "assistant"]:
-                    messages.append({
-                        "role": msg["role"],
-                        "content": msg["content"]
-                    })
+            cache_key, cache_hit = await self._lookup_cached_answer(
+                message, messages, summary, context, entitlements
+            )
+            if cache_hit:
+                lookups.cancel()
+                # Replay the cached answer as chunks so clients see the same stream shape
+                for start in range(0, len(cache_hit.content), CACHED_REPLAY_CHUNK_CHARS):
+                    yield StreamingChunk(
+                        delta=cache_hit.content[start:start + CACHED_REPLAY_CHUNK_CHARS],
+                        is_final=False,
+                        metadata={"streaming": True, "cache_hit": True}
+                    )
+                yield StreamingChunk(
+                    delta="",
+                    is_final=True,
+                    metadata={**(cache_hit.metadata or {}), "cache_hit": True, "similarity": cache_hit.similarity},
+                    citations=cache_hit.citations,
+                    tools_used=[{"tool_name": "semantic_cache", "parameters": {"query": message}}]
+                )
+                return
             
-            messages.append({"role": "user", "content": message})
+            system_prompt, citations, plan_tools, complete = await self._gather_context(lookups, summary)
             
-            # Stream the response
-            full_content = ""
-            async for chunk in self.openai_service.generate_response_stream(
+            # Open the model's stream, and send the sources while it connects
+            stream = self.openai_service.generate_response_stream(
                 messages=messages,
                 system_prompt=system_prompt,
                 temperature=0.7,
-                max_tokens=1000
-            ):
-                full_content += chunk
-                yield StreamingChunk(
-                    delta=chunk,
-                    is_final=False,
-                    metadata={"streaming": True}
-                )
+                max_tokens=1000,
+                user=user_id
+            )
+            first_delta = asyncio.ensure_future(stream.__anext__())
+            yield StreamingChunk(
+                delta="",
+                is_final=False,
+                metadata={"streaming": True},
+                citations=citations,
+                tools_used=plan_tools,
+                event="sources"
+            )
+            
+            full_content = ""
+            try:
+                chunk = await first_delta
+                while True:
+                    full_content += chunk
+                    yield StreamingChunk(
+                        delta=chunk,
+                        is_final=False,
+                        metadata={"streaming": True}
+                    )
+                    chunk = await stream.__anext__()
+            except StopAsyncIteration:
+                pass
             
             # Final chunk with metadata
-            citations = []
-            for i, result in enumerate(search_results):
-                citations.append({
-                    "id": result["id"],
-                    "title": result["title"],
-                    "source": result["source"],
-                    "excerpt": result["content"][:200] + "...",
-                    "relevance_score": result["score"],
-                    "document_type": result.get("metadata", {}).get("type", "document")
-                })
+            self.history_manager.schedule_fold(
+                conversation, conversation_history, window_start, self.openai_service
+            )
+            
+            metadata = {
+                "intent": "sustainability_analysis",
+                "confidence": 0.9,
+                "processing_time_ms": 2150
+            }
+            if not complete:
+                metadata["partial_context"] = True
+            
+            if cache_key and complete and self.semantic_cache is not None:
+                self.semantic_cache.store(
+                    *cache_key, content=full_content, citations=citations, metadata=metadata
+                )
             
             yield StreamingChunk(
                 delta="",
                 is_final=True,
-                metadata={
-                    "intent": "sustainability_analysis",
-                    "confidence": 0.9,
-                    "processing_time_ms": 2150
-                },
+                metadata=metadata,
                 citations=citations,
                 tools_used=[
-                    {"tool_name": "cognitive_search", "parameters": {"query": message}},
+                    *plan_tools,
                     {"tool_name": "azure_openai", "parameters": {"model": "gpt-4"}}
                 ]
             )
             
+        except RateLimitError as e:
+            logger.warning("agent_rate_limited", error=e.detail)
+            yield StreamingChunk(
+                delta=BUSY_MESSAGE,
+                is_final=True,
+                metadata={"error": e.detail, **e.metadata}
+            )
         except Exception as e:
             logger.error("agent_streaming_failed", error=str(e))
             yield StreamingChunk(
@@ -222,6 +659,15 @@ Guidelines:
                 is_final=True,
                 metadata={"error": str(e)}
             )
+        finally:
+            # A client that disconnects early leaves nothing running
+            lookups.cancel()
+            if first_delta is not None and not first_delta.done():
+                first_delta.cancel()
+                await asyncio.wait([first_delta])
+            if stream is not None:
+                # Closed now rather than when collected, so the upstream request stops at once
+                await stream.aclose()
 
-def get_agent_service() -> AgentService:
-    return AgentService()
+def get_agent_service(request: Request) -> AgentService:
+    return request.app.state.services.agent_service
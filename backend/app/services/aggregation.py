@@ -0,0 +1,215 @@
+import threading
+import time
+from typing import (Any, Dict, Iterable, List, Literal, Optional, Set, Tuple,
+                    get_args)
+
+import numpy as np
+import structlog
+from fastapi import Request
+
+from app.core.config import settings
+from app.services.company_store import CompanyStore, CompanyTable
+
+logger = structlog.get_logger(__name__)
+
+# Cell dimensions: the holding's portfolio, then categorical company columns
+Dimension = Literal["portfolio", "sector", "country", "region", "rating"]
+DIMENSIONS: Tuple[str, ...] = get_args(Dimension)
+# Leading sum columns of every cell; each metric adds a weighted sum and the weight that has it
+COUNT, WEIGHT, VALUE = 0, 1, 2
+BASE_COLUMNS = 3
+
+def position_weights(holdings: Dict[str, Any], positions: np.ndarray) -> np.ndarray:
+    """Portfolio weight of each holding, falling back to market value, then to 1"""
+    weights = np.asarray(holdings["weight"])[positions]
+    weights = np.where(weights > 0, weights, np.asarray(holdings["value"])[positions])
+    return np.where(weights > 0, weights, 1.0)
+
+class PortfolioAggregator:
+    """Position-weighted company metrics over portfolio holdings, pre-aggregated by dimension.
+
+    Holdings are summed into cells, one per combination of portfolio,
+    sector, country, region and rating. A cell keeps its holdings count,
+    position weight and market value, and for every numeric company metric
+    the position-weighted sum and the weight of holdings that have it.
+    Rollups group and filter cells rather than holdings. The company store
+    reports the companies each upsert touched, and only their holdings are
+    subtracted under the old table and added back under the new one.
+    """
+
+    def __init__(self, company_store: CompanyStore):
+        self.company_store = company_store
+        self._lock = threading.Lock()
+        self._stats = {"rebuilds": 0, "updates": 0, "holdings_updated": 0}
+        self._last_update_ms: Optional[float] = None
+        self._rebuild(company_store.table)
+        company_store.add_listener(self.apply)
+
+    def _reset(self) -> None:
+        self.table: Optional[CompanyTable] = None
+        self.values: Dict[str, List[Optional[str]]] = {dimension: [] for dimension in DIMENSIONS}
+        self.value_codes: Dict[str, Dict[Optional[str], int]] = {dimension: {} for dimension in DIMENSIONS}
+        self.cells: Dict[Tuple[int, ...], int] = {}
+        self.cell_codes = np.zeros((0, len(DIMENSIONS)), dtype=np.int32)
+        self.metrics: Dict[str, int] = {}
+        self.sums = np.zeros((0, BASE_COLUMNS), dtype=np.float64)
+
+    def apply(self, old_table: CompanyTable, new_table: CompanyTable, changed: Optional[Set[str]] = None):
+        """Move the aggregates from old_table to new_table; without the changed company ids, rebuild"""
+        start = time.perf_counter()
+        with self._lock:
+            if changed is None or self.table is not old_table:
+                self._rebuild(new_table)
+            else:
+                for table, sign in ((old_table, -1.0), (new_table, 1.0)):
+                    rows = [table.row_of[company_id] for company_id in changed if company_id in table.row_of]
+                    positions = np.flatnonzero(np.isin(table.holdings["company"], rows))
+                    self._add(table, positions, sign)
+                    self._stats["holdings_updated"] += len(positions)
+                self.table = new_table
+                self._stats["updates"] += 1
+            self._last_update_ms = round((time.perf_counter() - start) * 1000, 2)
+
+    def _rebuild(self, table: CompanyTable):
+        self._reset()
+        self._add(table, np.arange(len(table.holdings["company"])), 1.0)
+        self.table = table
+        self._stats["rebuilds"] += 1
+
+    def _add(self, table: CompanyTable, positions: np.ndarray, sign: float):
+        """Add (or with sign -1, subtract) the given holdings of a table into their cells"""
+        if not len(positions):
+            return
+        holdings = table.holdings
+        companies = np.asarray(holdings["company"])[positions]
+
+        # Each holding's value code per dimension, through the distinct combinations present
+        columns = [np.asarray(holdings["portfolio"].codes)[positions]]
+        categories = [holdings["portfolio"].categories]
+        for dimension in DIMENSIONS[1:]:
+            column = table.categoricals.get(dimension)
+            columns.append(np.asarray(column.codes)[companies] if column is not None else np.full(len(positions), -1))
+            categories.append(column.categories if column is not None else [])
+        combinations, inverse = np.unique(np.stack(columns, axis=1), axis=0, return_inverse=True)
+        keys = [
+            tuple(
+                self._value_code(dimension, names[code] if code >= 0 else None)
+                for dimension, names, code in zip(DIMENSIONS, categories, combination.tolist())
+            )
+            for combination in combinations
+        ]
+        new_keys = [key for key in keys if key not in self.cells]
+        if new_keys:
+            for key in new_keys:
+                self.cells[key] = len(self.cells)
+            self.cell_codes = np.vstack((self.cell_codes, np.array(new_keys, dtype=np.int32)))
+            self.sums = np.vstack((self.sums, np.zeros((len(new_keys), self.sums.shape[1]))))
+        cells = np.array([self.cells[key] for key in keys], dtype=np.int64)[inverse.reshape(-1)]
+
+        for name in table.numerics:
+            if name not in self.metrics:
+                self.metrics[name] = self.sums.shape[1]
+                self.sums = np.hstack((self.sums, np.zeros((len(self.sums), 2))))
+
+        weights = position_weights(holdings, positions)
+        count = len(self.cells)
+        self.sums[:, COUNT] += sign * np.bincount(cells, minlength=count)
+        self.sums[:, WEIGHT] += sign * np.bincount(cells, weights=weights, minlength=count)
+        self.sums[:, VALUE] += sign * np.bincount(cells, weights=np.asarray(holdings["value"])[positions], minlength=count)
+        for name, offset in self.metrics.items():
+            if name not in table.numerics:
+                continue
+            values = np.asarray(table.numerics[name])[companies]
+            known = ~np.isnan(values)
+            self.sums[:, offset] += sign * np.bincount(cells, weights=np.where(known, weights * values, 0.0), minlength=count)
+            self.sums[:, offset + 1] += sign * np.bincount(cells, weights=np.where(known, weights, 0.0), minlength=count)
+
+    def _value_code(self, dimension: str, value: Optional[str]) -> int:
+        codes = self.value_codes[dimension]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self.values[dimension])
+            self.values[dimension].append(value)
+        return code
+
+    def rollup(
+        self,
+        group_by: Iterable[str] = (),
+        filters: Optional[Dict[str, List[str]]] = None,
+        metrics: Optional[List[str]] = None,
+        limit: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Position-weighted metrics grouped by any dimensions, over the holdings matching filters.
+
+        Filter values match case-insensitively. Groups are ordered by
+        position weight, largest first.
+        """
+        group_by = list(dict.fromkeys(group_by))
+        for dimension in [*group_by, *(filters or {})]:
+            if dimension not in DIMENSIONS:
+                raise ValueError(f"Unknown dimension: {dimension}, expected one of {', '.join(DIMENSIONS)}")
+        limit = min(limit or settings.PORTFOLIO_ROLLUP_MAX_GROUPS, settings.PORTFOLIO_ROLLUP_MAX_GROUPS)
+
+        with self._lock:
+            unknown = [name for name in metrics or () if name not in self.metrics]
+            if unknown:
+                raise ValueError(f"Unknown metric: {', '.join(unknown)}")
+            metric_columns = {name: self.metrics[name] for name in (metrics or self.metrics)}
+            cell_codes = self.cell_codes
+            sums = self.sums.copy()
+            values = {dimension: list(self.values[dimension]) for dimension in DIMENSIONS}
+
+        # Cells emptied by incremental updates keep float residue; they hold no holdings
+        mask = sums[:, COUNT] > 0.5
+        for dimension, wanted in (filters or {}).items():
+            wanted_values = {value.casefold() for value in wanted}
+            codes = [code for code, value in enumerate(values[dimension]) if value is not None and value.casefold() in wanted_values]
+            mask &= np.isin(cell_codes[:, DIMENSIONS.index(dimension)], codes)
+        sums = sums[mask]
+
+        if group_by:
+            keys, groups = np.unique(cell_codes[mask][:, [DIMENSIONS.index(dimension) for dimension in group_by]], axis=0, return_inverse=True)
+            groups = groups.reshape(-1)
+        else:
+            keys, groups = np.zeros((1, 0), dtype=np.int32), np.zeros(len(sums), dtype=np.int64)
+        totals = np.zeros((len(keys), sums.shape[1]))
+        for column in range(sums.shape[1]):
+            totals[:, column] = np.bincount(groups, weights=sums[:, column], minlength=len(keys))
+
+        total_weight = totals[:, WEIGHT].sum()
+        results = []
+        for group in np.argsort(-totals[:, WEIGHT], kind="stable")[:limit].tolist():
+            row = totals[group]
+            result: Dict[str, Any] = {dimension: values[dimension][code] for dimension, code in zip(group_by, keys[group].tolist())}
+            result.update({
+                "holdings": int(round(row[COUNT])),
+                "weight": round(float(row[WEIGHT]), 6),
+                "weight_share": round(float(row[WEIGHT] / total_weight), 4) if total_weight > 0 else None,
+                "value": round(float(row[VALUE]), 2),
+                "metrics": {
+                    name: {
+                        "weighted_mean": round(float(row[column] / row[column + 1]), 6) if row[column + 1] > 1e-12 else None,
+                        "coverage": round(float(row[column + 1] / row[WEIGHT]), 4) if row[WEIGHT] > 0 else 0.0,
+                    }
+                    for name, column in metric_columns.items()
+                },
+            })
+            results.append(result)
+        return {"group_by": group_by, "filters": filters or {}, "groups": results, "total_groups": len(keys) if group_by else 1}
+
+    def dimension_values(self) -> Dict[str, List[str]]:
+        with self._lock:
+            return {dimension: [value for value in values if value is not None] for dimension, values in self.values.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "cells": int((self.sums[:, COUNT] > 0.5).sum()),
+                "metrics": len(self.metrics),
+                "holdings": int(round(self.sums[:, COUNT].sum())),
+                "last_update_ms": self._last_update_ms,
+            }
+
+def get_portfolio_aggregator(request: Request) -> PortfolioAggregator:
+    return request.app.state.services.portfolio_aggregator
@@ -0,0 +1,146 @@
+import math
+import re
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+# Keeps identifiers such as ISINs, tickers ("EQNR.OL") and concession ids ("MT-0231") whole
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase and split text into terms, adding the parts of compound identifiers"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r"[-_./]", token) if part)
+    return tokens
+
+class BM25Index:
+    """Okapi BM25 over an inverted index with array-backed postings.
+
+    Each term's postings are two compact arrays, document rows (uint32) and
+    term frequencies (uint16), instead of per-posting Python objects.
+    Deleted documents are tombstoned and purged from the postings once they
+    make up a quarter of the rows.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._terms: Dict[str, int] = {}
+        self._posting_rows: List[array] = []
+        self._posting_freqs: List[array] = []
+        self._doc_lengths = array("I")
+        self._alive = bytearray()
+        self._ids: List[Optional[str]] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._id_to_row)
+
+    def add(self, doc_id: str, text: str):
+        """Add or replace a document"""
+        self.delete([doc_id])
+
+        row = len(self._ids)
+        counts: Dict[str, int] = {}
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+
+        for term, count in counts.items():
+            term_id = self._terms.get(term)
+            if term_id is None:
+                term_id = len(self._posting_rows)
+                self._terms[term] = term_id
+                self._posting_rows.append(array("I"))
+                self._posting_freqs.append(array("H"))
+            self._posting_rows[term_id].append(row)
+            self._posting_freqs[term_id].append(min(count, 65535))
+
+        length = sum(counts.values())
+        self._ids.append(doc_id)
+        self._id_to_row[doc_id] = row
+        self._doc_lengths.append(length)
+        self._alive.append(1)
+        self._total_length += length
+
+    def delete(self, ids: List[str]) -> int:
+        """Delete documents by id, returning how many were removed"""
+        removed = 0
+        for doc_id in ids:
+            row = self._id_to_row.pop(doc_id, None)
+            if row is None:
+                continue
+            self._alive[row] = 0
+            self._ids[row] = None
+            self._total_length -= self._doc_lengths[row]
+            removed += 1
+
+        if removed and len(self._ids) - len(self._id_to_row) > max(len(self._ids) // 4, 1024):
+            self._compact()
+        return removed
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        """Rank documents for a query by BM25 score.
+
+        Not thread-safe with concurrent add(): the postings are read through
+        zero-copy NumPy views, so call it from the same thread as writers.
+        """
+        live_docs = len(self._id_to_row)
+        if not live_docs:
+            return []
+
+        doc_lengths = np.frombuffer(self._doc_lengths, dtype=np.uint32)
+        alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+        has_deletions = live_docs < len(self._ids)
+        average_length = self._total_length / live_docs
+        scores = np.zeros(len(self._ids), dtype=np.float32)
+        matched = False
+
+        for term in set(tokenize(query)):
+            term_id = self._terms.get(term)
+            if term_id is None:
+                continue
+            rows = np.frombuffer(self._posting_rows[term_id], dtype=np.uint32)
+            doc_freq = int(np.count_nonzero(alive[rows])) if has_deletions else len(rows)
+            if not doc_freq:
+                continue
+            matched = True
+            idf = math.log(1 + (live_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+            freqs = np.frombuffer(self._posting_freqs[term_id], dtype=np.uint16).astype(np.float32)
+            norm = self.k1 * (1 - self.b + self.b * doc_lengths[rows] / average_length)
+            scores[rows] += idf * freqs * (self.k1 + 1) / (freqs + norm)
+
+        if not matched:
+            return []
+
+        scores[~alive] = 0
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [(self._ids[row], float(scores[row])) for row in candidates]
+
+    def _compact(self):
+        live_rows = [row for row, alive in enumerate(self._alive) if alive]
+        remap = np.full(len(self._ids), -1, dtype=np.int64)
+        remap[live_rows] = np.arange(len(live_rows))
+
+        for term_id in range(len(self._posting_rows)):
+            rows = np.frombuffer(self._posting_rows[term_id], dtype=np.uint32)
+            freqs = np.frombuffer(self._posting_freqs[term_id], dtype=np.uint16)
+            keep = remap[rows] >= 0
+            self._posting_rows[term_id] = array("I", remap[rows][keep].astype(np.uint32).tobytes())
+            self._posting_freqs[term_id] = array("H", freqs[keep].tobytes())
+
+        self._ids = [self._ids[row] for row in live_rows]
+        self._doc_lengths = array("I", [self._doc_lengths[row] for row in live_rows])
+        self._alive = bytearray([1]) * len(live_rows)
+        self._id_to_row = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        logger.debug("bm25_index_compacted", documents=len(live_rows))
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+class AsyncTTLCache:
+    """Async result cache with TTL, LRU eviction and single-flight loading.
+
+    Values live in an in-process LRU and, optionally, in a Redis-protocol
+    second tier (any client exposing async `get(key)` and `set(key, value,
+    ex=seconds)`, such as `redis.asyncio.Redis`). Remote values are stored as
+    JSON. Concurrent misses on the same key share one in-flight load.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: int,
+        remote: Optional[Any] = None,
+        namespace: str = "cache"
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.remote = remote
+        self.namespace = namespace
+        # key -> (expires_at, value, load_time_seconds)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._stats = {"hits": 0, "remote_hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+        self._latency_saved = 0.0
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Get a cached value, loading it at most once across concurrent callers"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value, load_time = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                self._latency_saved += load_time
+                return value
+            del self._entries[key]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self._stats["coalesced"] += 1
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(self._load(key, loader))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        if self.remote is not None:
+            try:
+                raw = await self.remote.get(f"{self.namespace}:{key}")
+                if raw is not None:
+                    self._stats["remote_hits"] += 1
+                    value = json.loads(raw)
+                    self._put(key, value, load_time=0.0)
+                    return value
+            except Exception as e:
+                logger.warning("cache_remote_get_failed", namespace=self.namespace, error=str(e))
+
+        self._stats["misses"] += 1
+        start_time = time.perf_counter()
+        value = await loader()
+        load_time = time.perf_counter() - start_time
+        self._put(key, value, load_time)
+
+        if self.remote is not None:
+            try:
+                await self.remote.set(f"{self.namespace}:{key}", json.dumps(value), ex=self.ttl_seconds)
+            except Exception as e:
+                logger.warning("cache_remote_set_failed", namespace=self.namespace, error=str(e))
+
+        return value
+
+    def _put(self, key: str, value: Any, load_time: float):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value, load_time)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def clear(self):
+        """Drop all local entries; remote entries age out through their TTL"""
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get hit ratio and latency saved"""
+        hits = self._stats["hits"] + self._stats["remote_hits"] + self._stats["coalesced"]
+        lookups = hits + self._stats["misses"]
+        return {
+            **self._stats,
+            "entries": len(self._entries),
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "latency_saved_ms": round(self._latency_saved * 1000, 1),
+        }
@@ -0,0 +1,247 @@
+import re
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.history import get_encoding
+from app.services.parsers import ParsedItem
+
+# Items counted exactly before the sampled ratio is trusted
+WARMUP_ITEMS = 32
+HEADING_MAX_CHARS = 100
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+TABLE_SEPARATOR = re.compile(r"^\|?\s*:?-{3,}")
+ITEM_SEPARATOR = "\n\n"
+
+# A unit is an item or a piece of one, its token count, and the separator joining it to the unit before
+Unit = Tuple[ParsedItem, int, str]
+
+class TokenCounter:
+    """Counts tokens with a cached tiktoken encoder.
+
+    Encoding runs at around 10 MB/s per core, so unless `exact` is set only
+    the first items and every `sample_every`-th item are encoded; the rest
+    are estimated from the characters-per-token ratio of that sample.
+    """
+
+    def __init__(self, model: Optional[str] = None, exact: Optional[bool] = None, sample_every: int = 64):
+        self.encoding = get_encoding(model or settings.AZURE_OPENAI_EMBEDDING_DEPLOYMENT)
+        self.exact = settings.CHUNK_EXACT_TOKEN_COUNTS if exact is None else exact
+        self.sample_every = sample_every
+        self._counted = 0
+        self._chars = 0
+        self._tokens = 0
+        self._ratio = 0.25
+
+    def count(self, text: str) -> int:
+        self._counted += 1
+        if self.exact or self._counted <= WARMUP_ITEMS or self._counted % self.sample_every == 0:
+            tokens = len(self.encoding.encode_ordinary(text))
+            self._chars += len(text)
+            self._tokens += tokens
+            if self._chars:
+                self._ratio = self._tokens / self._chars
+            return tokens
+        # Rounds up, and never estimates zero tokens
+        return int(len(text) * self._ratio) + 1
+
+    def split(self, text: str, max_tokens: int, overlap_tokens: int = 0) -> List[str]:
+        """Split text into windows of at most max_tokens exact tokens"""
+        tokens = self.encoding.encode_ordinary(text)
+        step = max(max_tokens - overlap_tokens, 1)
+        return [self.encoding.decode(tokens[start:start + max_tokens]) for start in range(0, len(tokens), step)]
+
+def is_heading(text: str) -> bool:
+    """A markdown heading, or a short single line without closing punctuation"""
+    if "\n" in text or len(text) > HEADING_MAX_CHARS:
+        return False
+    return text.startswith("#") or not text.endswith((".", "!", "?", ":", ";", ",", ")"))
+
+class Chunker:
+    """Packs parsed items into chunks under a token budget, following document structure.
+
+    Records (CSV, JSON and worksheet rows) are grouped until the budget is
+    reached, or until a record whose content hash marks a group boundary.
+    Content-defined boundaries keep groups stable when rows are inserted or
+    removed, so a re-upload only changes the groups around an edit.
+
+    Text is packed by paragraph. A heading starts a new chunk and labels the
+    chunks of its section, and consecutive text chunks overlap by whole
+    paragraphs or sentences up to `overlap_tokens`. An item over the budget
+    is split by table row, sentence or line, and as a last resort by
+    token window.
+    """
+
+    def __init__(
+        self,
+        max_tokens: Optional[int] = None,
+        overlap_tokens: Optional[int] = None,
+        boundary_modulus: Optional[int] = None,
+        counter: Optional[TokenCounter] = None
+    ):
+        self.max_tokens = max_tokens or settings.CHUNK_MAX_TOKENS
+        self.overlap_tokens = settings.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+        self.boundary_modulus = boundary_modulus or settings.CHUNK_RECORD_BOUNDARY_MODULUS
+        self.counter = counter or TokenCounter()
+
+    def chunk(self, items: Iterator[ParsedItem]) -> Iterator[ParsedItem]:
+        """Stream chunks; only the chunk being packed is held in memory"""
+        pending: List[Unit] = []
+        pending_tokens = 0
+        has_body = False
+        section: Optional[str] = None
+        max_tokens = self.max_tokens
+        count = self.counter.count
+        boundary_modulus = self.boundary_modulus
+
+        for item in items:
+            content = item.content.strip()
+            if not content:
+                continue
+            is_record = item.kind == "record"
+
+            if is_record and pending and pending[-1][0].kind == "record" and content is item.content:
+                # Fast path for the common case: a record that fits, joining a group from the same sheet
+                if item.location.get("sheet") == pending[-1][0].location.get("sheet"):
+                    tokens = count(content)
+                    if tokens <= max_tokens:
+                        if pending_tokens + tokens + 1 > max_tokens:
+                            yield self._build(pending, section)
+                            pending, pending_tokens = [], 0
+                        pending.append((item, tokens, ITEM_SEPARATOR))
+                        pending_tokens += tokens + 1
+                        if zlib.crc32(content.encode("utf-8")) % boundary_modulus == 0:
+                            yield self._build(pending, section)
+                            pending, pending_tokens, has_body = [], 0, False
+                        continue
+
+            heading = not is_record and is_heading(content)
+
+            if pending and (
+                pending[-1][0].kind != item.kind
+                or (is_record and pending[-1][0].location.get("sheet") != item.location.get("sheet"))
+                or (heading and has_body)
+            ):
+                yield self._build(pending, section)
+                pending, pending_tokens, has_body = [], 0, False
+
+            if heading:
+                section = content.lstrip("#").strip()
+
+            tokens = count(content)
+            if tokens <= max_tokens:
+                if content is not item.content:
+                    item = ParsedItem(kind=item.kind, content=content, location=item.location, fields=item.fields)
+                units = [(item, tokens, ITEM_SEPARATOR)]
+            else:
+                units = self._split(item, content)
+
+            for unit in units:
+                # Every unit is charged one extra token for the separator joining it
+                tokens = unit[1] + 1
+                if pending and pending_tokens + tokens > max_tokens:
+                    yield self._build(pending, section)
+                    pending = [] if is_record else self._overlap(pending, max_tokens - tokens)
+                    pending_tokens = sum(unit_tokens + 1 for _, unit_tokens, _ in pending)
+
+                pending.append(unit)
+                pending_tokens += tokens
+                has_body = has_body or not heading
+
+                if is_record and zlib.crc32(unit[0].content.encode("utf-8")) % boundary_modulus == 0:
+                    yield self._build(pending, section)
+                    pending, pending_tokens, has_body = [], 0, False
+
+        if pending:
+            yield self._build(pending, section)
+
+    def _split(self, item: ParsedItem, text: str) -> List[Unit]:
+        """Split an oversized item along the finest structure that fits the budget"""
+        lines = text.split("\n")
+        if len(lines) > 2 and lines[0].lstrip().startswith("|"):
+            parts, separator = self._table_pieces(lines), ITEM_SEPARATOR
+        else:
+            sentences = SENTENCE_BREAK.split(text)
+            if len(sentences) > 1:
+                parts, separator = sentences, " "
+            elif len(lines) > 1:
+                parts, separator = lines, "\n"
+            else:
+                # Token windows decode back to consecutive slices of the text
+                parts, separator = self.counter.split(text, self.max_tokens), ""
+
+        units: List[Unit] = []
+        for part in parts:
+            if not part.strip():
+                continue
+            tokens = self.counter.count(part)
+            if tokens > self.max_tokens and separator:
+                first, *rest = self._split(item, part)
+                units.append((first[0], first[1], separator))
+                units.extend(rest)
+            else:
+                units.append((ParsedItem(kind=item.kind, content=part, location=item.location), tokens, separator))
+
+        if units:
+            units[0] = (units[0][0], units[0][1], ITEM_SEPARATOR)
+        return units
+
+    def _table_pieces(self, lines: List[str]) -> List[str]:
+        """Pack table rows into pieces that each repeat the header"""
+        header_size = 2 if TABLE_SEPARATOR.match(lines[1].strip()) else 1
+        header = "\n".join(lines[:header_size])
+        budget = max(self.max_tokens - self.counter.count(header) - 1, 1)
+        pieces: List[str] = []
+        rows: List[str] = []
+        rows_tokens = 0
+
+        for row in lines[header_size:]:
+            if not row.strip():
+                continue
+            tokens = self.counter.count(row) + 1
+            if rows and rows_tokens + tokens > budget:
+                pieces.append("\n".join([header, *rows]))
+                rows, rows_tokens = [], 0
+            if tokens > budget:
+                pieces.extend(f"{header}\n{window}" for window in self.counter.split(row, budget))
+                continue
+            rows.append(row)
+            rows_tokens += tokens
+
+        if rows:
+            pieces.append("\n".join([header, *rows]))
+        return pieces
+
+    def _overlap(self, units: List[Unit], room: int) -> List[Unit]:
+        """Trailing units of a chunk to repeat at the start of the next one"""
+        limit = min(self.overlap_tokens, room)
+        overlap, tokens = [], 0
+        for unit in reversed(units):
+            tokens += unit[1] + 1
+            if tokens > limit:
+                break
+            overlap.append(unit)
+        overlap.reverse()
+        return overlap
+
+    @staticmethod
+    def _build(units: List[Unit], section: Optional[str]) -> ParsedItem:
+        first, last = units[0][0], units[-1][0]
+        location: Dict[str, Any] = dict(first.location)
+        for key, value in last.location.items():
+            if location.get(key) != value:
+                location[f"{key}_end"] = value
+        if section and first.kind == "text":
+            location["section"] = section
+
+        parts = [first.content]
+        for unit, _, separator in units[1:]:
+            parts.append(separator)
+            parts.append(unit.content)
+
+        return ParsedItem(
+            kind=first.kind,
+            content="".join(parts),
+            location=location,
+            fields=first.fields if len(units) == 1 else None
+        )
@@ -0,0 +1,618 @@
+import difflib
+import json
+import os
+import re
+import shutil
+import threading
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+import structlog
+from fastapi import Request
+
+from app.core.config import settings
+from app.services.entity_resolution import (EntityIndex, core_name,
+                                            normalize_name)
+
+logger = structlog.get_logger(__name__)
+
+STRING_COLUMNS = ("id", "name", "ticker", "parent_id", "aliases")
+CATEGORICAL_COLUMNS = ("sector", "country", "region", "rating")
+HOLDING_COLUMNS = ("portfolio", "weight", "value", "shares")
+
+# Header spellings accepted for each known column, after normalize_column()
+COLUMN_ALIASES = {
+    "id": ("id", "company_id", "isin", "lei", "entity_id"),
+    "name": ("name", "company", "company_name", "issuer", "issuer_name", "entity_name"),
+    "ticker": ("ticker", "symbol"),
+    "parent_id": ("parent_id", "parent_company_id", "ultimate_parent_id"),
+    "aliases": ("aliases", "alias", "other_names", "also_known_as", "aka"),
+    "sector": ("sector", "industry", "gics_sector"),
+    "country": ("country", "country_code", "domicile", "hq_country", "country_of_domicile"),
+    "region": ("region", "geography", "geographic_region", "market_region"),
+    "rating": ("rating", "esg_rating", "provider_rating"),
+    "portfolio": ("portfolio", "portfolio_name", "fund"),
+    "weight": ("weight", "portfolio_weight"),
+    "value": ("value", "market_value", "position_value"),
+    "shares": ("shares", "quantity", "units"),
+}
+CANONICAL_COLUMNS = {alias: name for name, aliases in COLUMN_ALIASES.items() for alias in aliases}
+
+@lru_cache(maxsize=1024)
+def normalize_column(header: Any) -> str:
+    """Normalize a header to snake_case"""
+    return re.sub(r"[^a-z0-9]+", "_", str(header).strip().lower()).strip("_")
+
+def to_float(value: Any) -> Optional[float]:
+    """Parse a number such as 1234.5, "1,234.5" or "12%"; None if it is not one"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().replace(",", "").rstrip("%")
+    try:
+        return float(text) if text else None
+    except ValueError:
+        return None
+
+class StringColumn:
+    """Strings packed into one UTF-8 buffer with int64 offsets, Arrow-style.
+
+    Every value is followed by a newline in the buffer, so a regex over the
+    whole buffer never matches across two values.
+    """
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, values: Iterable[str]) -> "StringColumn":
+        encoded = [value.replace("\n", " ").encode("utf-8") + b"\n" for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        return self.data[self.offsets[row]:self.offsets[row + 1] - 1].tobytes().decode("utf-8")
+
+    def to_list(self) -> List[str]:
+        return self.data.tobytes().decode("utf-8").split("\n")[:len(self)]
+
+    def find(self, pattern: bytes, candidates: Optional[np.ndarray] = None) -> np.ndarray:
+        """Byte positions where pattern occurs, optionally only among candidate positions"""
+        if candidates is None:
+            candidates = np.flatnonzero(self.data == pattern[0])
+        positions = candidates[candidates <= len(self.data) - len(pattern)]
+        # Narrow the candidates one byte at a time; each step is a single vectorized comparison
+        for offset, byte in enumerate(pattern):
+            positions = positions[self.data[positions + offset] == byte]
+        return positions
+
+    def rows_of(self, positions: np.ndarray) -> np.ndarray:
+        """Sorted unique rows holding the given byte positions"""
+        return np.unique(np.searchsorted(self.offsets, positions, side="right") - 1)
+
+    def rows_containing(self, pattern: bytes, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Rows with pattern as a substring, optionally scanning only the given rows"""
+        if rows is None:
+            return self.rows_of(self.find(pattern))
+        starts = self.offsets[rows]
+        lengths = self.offsets[rows + 1] - starts
+        # Every byte position of the given rows
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return self.rows_of(self.find(pattern, positions[self.data[positions] == pattern[0]]))
+
+class CategoricalColumn:
+    """Dictionary-encoded strings: integer codes into a list of categories, -1 for missing"""
+
+    def __init__(self, codes: np.ndarray, categories: List[str]):
+        self.codes = codes
+        self.categories = categories
+
+    @classmethod
+    def from_values(cls, values: Iterable[Optional[str]]) -> "CategoricalColumn":
+        lookup: Dict[str, int] = {}
+        codes = [lookup.setdefault(value, len(lookup)) if value else -1 for value in values]
+        dtype = np.int16 if len(lookup) < np.iinfo(np.int16).max else np.int32
+        return cls(np.array(codes, dtype=dtype), list(lookup))
+
+    def __getitem__(self, row: int) -> Optional[str]:
+        code = self.codes[row]
+        return self.categories[code] if code >= 0 else None
+
+    def to_list(self) -> List[Optional[str]]:
+        return [self.categories[code] if code >= 0 else None for code in self.codes.tolist()]
+
+    def codes_for(self, values: Iterable[str]) -> List[int]:
+        """Codes of the categories matching any of the values, case-insensitively"""
+        wanted = {value.casefold() for value in values}
+        return [code for code, category in enumerate(self.categories) if category.casefold() in wanted]
+
+class CompanyTable:
+    """Immutable columnar snapshot of companies and their portfolio holdings"""
+
+    def __init__(
+        self,
+        strings: Dict[str, StringColumn],
+        categoricals: Dict[str, CategoricalColumn],
+        numerics: Dict[str, np.ndarray],
+        holdings: Dict[str, Any]
+    ):
+        self.strings = strings
+        self.categoricals = categoricals
+        self.numerics = numerics
+        self.holdings = holdings
+        self.row_of = {company_id: row for row, company_id in enumerate(strings["id"].to_list())}
+        self._vocabulary: Optional[Dict[int, List[str]]] = None
+        self._word_starts: Optional[np.ndarray] = None
+        self._entity_index: Optional[EntityIndex] = None
+
+    @classmethod
+    def empty(cls) -> "CompanyTable":
+        return cls.build([], [])
+
+    @classmethod
+    def build(cls, companies: List[Dict[str, Any]], holdings: List[Tuple[str, int, float, float, float]]) -> "CompanyTable":
+        """Build columns from company dicts and (portfolio, row, weight, value, shares) tuples"""
+        numeric_names = sorted({
+            key for company in companies for key in company
+            if key not in STRING_COLUMNS and key not in CATEGORICAL_COLUMNS
+        })
+        strings = {name: StringColumn.from_strings(company.get(name) or "" for company in companies) for name in STRING_COLUMNS}
+        strings["name_key"] = StringColumn.from_strings(normalize_name(company.get("name") or "") for company in companies)
+        numerics = {
+            name: np.array([company.get(name, np.nan) for company in companies], dtype=np.float64)
+            for name in numeric_names
+        }
+        return cls(
+            strings=strings,
+            categoricals={name: CategoricalColumn.from_values(company.get(name) for company in companies) for name in CATEGORICAL_COLUMNS},
+            numerics=numerics,
+            holdings={
+                "portfolio": CategoricalColumn.from_values(holding[0] for holding in holdings),
+                "company": np.array([holding[1] for holding in holdings], dtype=np.int32),
+                "weight": np.array([holding[2] for holding in holdings], dtype=np.float64),
+                "value": np.array([holding[3] for holding in holdings], dtype=np.float64),
+                "shares": np.array([holding[4] for holding in holdings], dtype=np.float64),
+            }
+        )
+
+    def __len__(self) -> int:
+        return len(self.strings["id"])
+
+    def company(self, row: int) -> Dict[str, Any]:
+        """Materialize one company as a dict"""
+        record: Dict[str, Any] = {name: self.strings[name][row] or None for name in STRING_COLUMNS}
+        for name, categorical in self.categoricals.items():
+            record[name] = categorical[row]
+        for name, numbers in self.numerics.items():
+            value = numbers[row]
+            if not np.isnan(value):
+                record[name] = float(value)
+        return record
+
+    def to_records(self) -> Tuple[List[Dict[str, Any]], List[Tuple[str, int, float, float, float]]]:
+        """Decode every column, for rebuilding with changes"""
+        columns: Dict[str, List[Any]] = {name: self.strings[name].to_list() for name in STRING_COLUMNS}
+        columns.update({name: column.to_list() for name, column in self.categoricals.items()})
+        columns.update({name: column.tolist() for name, column in self.numerics.items()})
+        companies = []
+        for row in range(len(self)):
+            # NaN is the only value that differs from itself
+            companies.append({name: values[row] for name, values in columns.items() if values[row] and values[row] == values[row]})
+
+        holdings = list(zip(
+            self.holdings["portfolio"].to_list(),
+            self.holdings["company"].tolist(),
+            self.holdings["weight"].tolist(),
+            self.holdings["value"].tolist(),
+            self.holdings["shares"].tolist()
+        ))
+        return companies, holdings
+
+    def filter_mask(
+        self,
+        categories: Dict[str, List[str]],
+        ranges: Dict[str, Tuple[Optional[float], Optional[float]]],
+        portfolio: Optional[str] = None
+    ) -> np.ndarray:
+        """Vectorized attribute filters over all companies"""
+        mask = np.ones(len(self), dtype=bool)
+        for name, values in categories.items():
+            if name not in self.categoricals:
+                raise ValueError(f"Unknown categorical column: {name}")
+            column = self.categoricals[name]
+            mask &= np.isin(column.codes, column.codes_for(values))
+
+        for name, (low, high) in ranges.items():
+            if name not in self.numerics:
+                raise ValueError(f"Unknown numeric column: {name}")
+            numbers = self.numerics[name]
+            if low is not None:
+                mask &= numbers >= low
+            if high is not None:
+                mask &= numbers <= high
+
+        if portfolio is not None:
+            held = np.zeros(len(self), dtype=bool)
+            portfolios = self.holdings["portfolio"]
+            in_portfolio = np.isin(portfolios.codes, portfolios.codes_for([portfolio]))
+            held[self.holdings["company"][in_portfolio]] = True
+            mask &= held
+        return mask
+
+    @property
+    def entity_index(self) -> EntityIndex:
+        """Name, alias and ticker resolution index, built on first use"""
+        if self._entity_index is None:
+            self._entity_index = EntityIndex.build(
+                self.strings["name"].to_list(),
+                self.strings["aliases"].to_list(),
+                self.strings["ticker"].to_list()
+            )
+        return self._entity_index
+
+    def match_names(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Find companies by name, returning (rows, scores).
+
+        Legal forms such as "Inc." are ignored. Names, aliases and tickers
+        resolving exactly to the query rank first. Otherwise every query
+        word must start a word of the name; a name that starts with the
+        query and is close to it in length scores highest. Without word
+        matches the words are tried as substrings, then as their closest
+        spellings, and finally the entity index's trigram and leading-word
+        matches are used.
+        """
+        words = core_name(query).split()
+        if not words:
+            return np.arange(len(self)), np.zeros(len(self), dtype=np.float32)
+
+        for mode in ("prefix", "substring", "fuzzy"):
+            rows, starts_name = self._match_words(words, mode)
+            if len(rows):
+                break
+        offsets = self.strings["name_key"].offsets
+        lengths = (offsets[rows + 1] - offsets[rows] - 1).astype(np.float32)
+        closeness = np.minimum(len(" ".join(words)) / np.maximum(lengths, 1), 1.0)
+        scores = {"prefix": 1.0, "substring": 0.5, "fuzzy": 0.25}[mode] + starts_name + closeness
+
+        candidates = self.entity_index.candidates(query, settings.ENTITY_MATCH_THRESHOLD, limit=settings.COMPANY_SEARCH_MAX_RESULTS)
+        exact = [(row, score + 3.0) for row, score, kind in candidates if kind not in ("fuzzy", "partial")]
+        if exact and mode == "fuzzy":
+            # Misspelled words are noise next to an exact name or alias
+            rows, scores = rows[:0], scores[:0]
+        resolved = exact if exact or len(rows) else [(row, score) for row, score, _ in candidates]
+        if resolved:
+            rows = np.concatenate((np.array([row for row, _ in resolved], dtype=rows.dtype), rows))
+            scores = np.concatenate((np.array([score for _, score in resolved], dtype=np.float32), scores.astype(np.float32)))
+            # Keep each row once, with its best score
+            order = np.argsort(-scores, kind="stable")
+            rows, first = np.unique(rows[order], return_index=True)
+            scores = scores[order][first]
+        return rows, scores.astype(np.float32)
+
+    def _match_words(self, words: List[str], mode: str) -> Tuple[np.ndarray, np.ndarray]:
+        column = self.strings["name_key"]
+        rows = first_positions = np.zeros(0, dtype=np.int64)
+
+        for index, word in enumerate(words):
+            # Fuzzy matching keeps the word itself, so exact words such as numbers still match
+            spellings = [word, *self._close_words(word)] if mode == "fuzzy" else [word]
+            positions = np.concatenate([
+                self._find(spelling.encode("utf-8"), substring=mode == "substring") for spelling in spellings
+            ])
+            word_rows = column.rows_of(positions)
+            rows = word_rows if index == 0 else np.intersect1d(rows, word_rows, assume_unique=True)
+            if index == 0:
+                first_positions = positions
+            if not len(rows):
+                break
+
+        starts_name = np.isin(column.offsets[rows], first_positions).astype(np.float32)
+        return rows, starts_name
+
+    def _find(self, pattern: bytes, substring: bool = False) -> np.ndarray:
+        """Byte positions in the name buffer where pattern occurs, at word starts unless substring"""
+        column = self.strings["name_key"]
+        if substring:
+            return column.find(pattern)
+        if self._word_starts is None:
+            data = column.data
+            self._word_starts = np.concatenate((np.zeros(1, dtype=np.int64), np.flatnonzero((data == ord(" ")) | (data == ord("\n"))) + 1))
+        return column.find(pattern, self._word_starts)
+
+    def _close_words(self, word: str) -> List[str]:
+        if self._vocabulary is None:
+            vocabulary: Dict[int, List[str]] = {}
+            for name_word in set(self.strings["name_key"].data.tobytes().decode("utf-8").split()):
+                if not name_word.isdigit():
+                    vocabulary.setdefault(len(name_word), []).append(name_word)
+            self._vocabulary = vocabulary
+        # A close spelling is at most two characters longer or shorter
+        candidates = [
+            candidate
+            for length in range(len(word) - 2, len(word) + 3)
+            for candidate in self._vocabulary.get(length, ())
+        ]
+        return difflib.get_close_matches(word, candidates, n=3, cutoff=0.75)
+
+    def nbytes(self) -> int:
+        arrays = [column.data for column in self.strings.values()] + [column.offsets for column in self.strings.values()]
+        arrays += [column.codes for column in self.categoricals.values()] + list(self.numerics.values())
+        arrays += [self.holdings[name] for name in ("company", "weight", "value", "shares")] + [self.holdings["portfolio"].codes]
+        return sum(array.nbytes for array in arrays)
+
+    def save(self, path: str):
+        """Write every column as a .npy file, replacing the directory at path"""
+        staging = f"{path}.new"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+
+        for name, strings in self.strings.items():
+            np.save(os.path.join(staging, f"{name}.data.npy"), strings.data)
+            np.save(os.path.join(staging, f"{name}.offsets.npy"), strings.offsets)
+        for name, categorical in self.categoricals.items():
+            np.save(os.path.join(staging, f"{name}.codes.npy"), categorical.codes)
+        for name, numbers in self.numerics.items():
+            np.save(os.path.join(staging, f"numeric.{name}.npy"), numbers)
+        for name in ("company", "weight", "value", "shares"):
+            np.save(os.path.join(staging, f"holdings.{name}.npy"), self.holdings[name])
+        np.save(os.path.join(staging, "holdings.portfolio.codes.npy"), self.holdings["portfolio"].codes)
+
+        with open(os.path.join(staging, "meta.json"), "w") as meta:
+            json.dump({
+                "categories": {name: column.categories for name, column in self.categoricals.items()},
+                "numerics": list(self.numerics),
+                "portfolios": self.holdings["portfolio"].categories,
+            }, meta)
+
+        # Swap directories; readers of the old files keep their mappings until released
+        retired = f"{path}.old"
+        shutil.rmtree(retired, ignore_errors=True)
+        if os.path.exists(path):
+            os.rename(path, retired)
+        os.rename(staging, path)
+        shutil.rmtree(retired, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: str) -> "CompanyTable":
+        """Open a saved table with every column memory-mapped"""
+        def column(name: str) -> np.ndarray:
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        def string_column(name: str) -> StringColumn:
+            if os.path.exists(os.path.join(path, f"{name}.data.npy")):
+                return StringColumn(column(f"{name}.data.npy"), column(f"{name}.offsets.npy"))
+            # Snapshots saved before a column existed get it empty
+            return StringColumn.from_strings([""] * (len(column("id.offsets.npy")) - 1))
+
+        with open(os.path.join(path, "meta.json")) as meta_file:
+            meta = json.load(meta_file)
+
+        return cls(
+            strings={
+                name: string_column(name)
+                for name in (*STRING_COLUMNS, "name_key")
+            },
+            categoricals={
+                name: CategoricalColumn(column(f"{name}.codes.npy"), meta["categories"][name])
+                if name in meta["categories"]
+                else CategoricalColumn(np.full(len(column("id.offsets.npy")) - 1, -1, dtype=np.int16), [])
+                for name in CATEGORICAL_COLUMNS
+            },
+            numerics={name: column(f"numeric.{name}.npy") for name in meta["numerics"]},
+            holdings={
+                "portfolio": CategoricalColumn(column("holdings.portfolio.codes.npy"), meta["portfolios"]),
+                **{name: column(f"holdings.{name}.npy") for name in ("company", "weight", "value", "shares")},
+            }
+        )
+
+class CompanyStore:
+    """Columnar company and holdings store loaded from ingested CSV/XLSX tables.
+
+    Strings are packed into UTF-8 buffers, sector, country and rating are
+    dictionary-encoded, and numeric attributes are float64 columns, so a
+    company costs roughly a tenth of a dict per row. With a `path`, columns
+    are persisted as .npy files and memory-mapped on start. Writers build a
+    new CompanyTable and swap it in, so searches never see a partial update.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.table = CompanyTable.empty()
+        self._write_lock = threading.Lock()
+        self._listeners: List[Callable[[CompanyTable, CompanyTable, Set[str]], None]] = []
+        if path and os.path.exists(os.path.join(path, "meta.json")):
+            self.table = CompanyTable.load(path)
+            logger.info("company_store_loaded", companies=len(self.table), path=path)
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def add_listener(self, listener: Callable[[CompanyTable, CompanyTable, Set[str]], None]):
+        """Call listener(old_table, new_table, changed_company_ids) after every upsert"""
+        self._listeners.append(listener)
+
+    def upsert(self, rows: List[Dict[str, Any]]) -> int:
+        """Add or update companies, and holdings for rows with a portfolio column.
+
+        Companies are keyed by id (or ISIN/LEI). Rows without one are
+        linked to an existing company whose name, alias or ticker resolves
+        to theirs, unambiguously and at least ENTITY_LINK_THRESHOLD similar,
+        and otherwise keyed by their name without legal forms. A holding
+        replaces an earlier one for the same portfolio and company.
+        """
+        with self._write_lock:
+            table = self.table
+            companies, holdings = table.to_records()
+            row_of = dict(table.row_of)
+            holding_of = {(portfolio, row): index for index, (portfolio, row, *_) in enumerate(holdings)}
+            numeric_columns = set(table.numerics)
+            changed = linked = 0
+            changed_ids: Set[str] = set()
+
+            records = [
+                {CANONICAL_COLUMNS.get(normalize_column(key), normalize_column(key)): value for key, value in raw.items() if key}
+                for raw in rows
+            ]
+            unkeyed = [str(fields.get("name") or "").strip() if not str(fields.get("id") or "").strip() else "" for fields in records]
+            links = table.entity_index.resolve_many(unkeyed, settings.ENTITY_LINK_THRESHOLD) if len(table) and any(unkeyed) else [None] * len(records)
+
+            for fields, link in zip(records, links):
+                name = str(fields.get("name") or "").strip()
+                company_id = str(fields.get("id") or "").strip()
+                if not company_id and link is not None and not link["ambiguous"] and link["match"] != "partial":
+                    company_id = table.strings["id"][link["row"]]
+                    linked += 1
+                company_id = company_id or core_name(name)
+                if not company_id:
+                    continue
+
+                company: Dict[str, Any] = {"id": company_id}
+                if name:
+                    company["name"] = name
+                for key, value in fields.items():
+                    if key in ("id", "name") or key in HOLDING_COLUMNS or value in (None, ""):
+                        continue
+                    if key in STRING_COLUMNS or key in CATEGORICAL_COLUMNS:
+                        company[key] = str(value).strip()
+                        continue
+                    number = to_float(value)
+                    if number is not None:
+                        company[key] = number
+                        numeric_columns.add(key)
+
+                row = row_of.get(company_id)
+                if row is None:
+                    row = row_of[company_id] = len(companies)
+                    companies.append(company)
+                else:
+                    companies[row].update(company)
+                changed += 1
+                changed_ids.add(company_id)
+
+                portfolio = str(fields.get("portfolio") or "").strip()
+                if portfolio:
+                    holding = (
+                        portfolio,
+                        row,
+                        to_float(fields.get("weight")) or 0.0,
+                        to_float(fields.get("value")) or 0.0,
+                        to_float(fields.get("shares")) or 0.0,
+                    )
+                    index = holding_of.get((portfolio, row))
+                    if index is None:
+                        holding_of[(portfolio, row)] = len(holdings)
+                        holdings.append(holding)
+                    else:
+                        holdings[index] = holding
+
+            for company in companies:
+                for key in list(company):
+                    if key not in STRING_COLUMNS and key not in CATEGORICAL_COLUMNS and key not in numeric_columns:
+                        del company[key]
+
+            table = CompanyTable.build(companies, holdings)
+            if self.path:
+                table.save(self.path)
+                table = CompanyTable.load(self.path)
+            # Build the resolution index here, off the request path
+            table.entity_index
+            previous, self.table = self.table, table
+            for listener in self._listeners:
+                try:
+                    listener(previous, table, changed_ids)
+                except Exception as e:
+                    logger.error("company_store_listener_failed", error=str(e))
+
+        logger.info("company_store_updated", rows=changed, linked=linked, companies=len(table), holdings=len(holdings))
+        return changed
+
+    def get(self, company_id: str) -> Optional[Dict[str, Any]]:
+        table = self.table
+        row = table.row_of.get(company_id)
+        return table.company(row) if row is not None else None
+
+    def search(
+        self,
+        query: str = "",
+        categories: Optional[Dict[str, List[str]]] = None,
+        ranges: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+        portfolio: Optional[str] = None,
+        sort_by: Optional[str] = None,
+        limit: int = 20
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """Name search combined with attribute filters, returning (page, total matches).
+
+        Results are ranked by name match, or by `sort_by` (descending) when
+        given or when there is no query.
+        """
+        table = self.table
+        if not len(table):
+            return [], 0
+
+        rows, scores = table.match_names(query)
+        mask = table.filter_mask(categories or {}, ranges or {}, portfolio)
+        keep = mask[rows]
+        rows, scores = rows[keep], scores[keep]
+
+        if sort_by:
+            if sort_by not in table.numerics:
+                raise ValueError(f"Unknown numeric column: {sort_by}")
+            # NaN sorts last
+            order = np.argsort(-np.nan_to_num(table.numerics[sort_by][rows], nan=-np.inf), kind="stable")
+        else:
+            order = np.argsort(-scores, kind="stable")
+
+        top = order[:limit]
+        results = []
+        for row, score in zip(rows[top].tolist(), scores[top].tolist()):
+            company = table.company(row)
+            if query:
+                company["score"] = round(score, 4)
+            results.append(company)
+        return results, len(rows)
+
+    def resolve(self, names: List[str], threshold: Optional[float] = None) -> List[Optional[Dict[str, Any]]]:
+        """Resolve many names, such as a holdings file's issuer column, to their best company"""
+        table = self.table
+        if not len(table):
+            return [None] * len(names)
+        # Holdings files repeat names, and resolve_many shares one match between repeats
+        converted: Dict[int, Dict[str, Any]] = {}
+        results: List[Optional[Dict[str, Any]]] = []
+        for match in table.entity_index.resolve_many(names, settings.ENTITY_MATCH_THRESHOLD if threshold is None else threshold):
+            if match is None:
+                results.append(None)
+                continue
+            result = converted.get(id(match))
+            if result is None:
+                row = match["row"]
+                result = converted[id(match)] = {
+                    "id": table.strings["id"][row],
+                    "name": table.strings["name"][row] or None,
+                    "parent_id": table.strings["parent_id"][row] or None,
+                    "match": match["match"],
+                    "matched": match["matched"],
+                    "score": match["score"],
+                    "ambiguous": match["ambiguous"],
+                }
+            results.append(result)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        table = self.table
+        return {
+            "companies": len(table),
+            "holdings": len(table.holdings["company"]),
+            "portfolios": len(table.holdings["portfolio"].categories),
+            "bytes": table.nbytes(),
+        }
+
+def get_company_store(request: Request) -> CompanyStore:
+    return request.app.state.services.company_store
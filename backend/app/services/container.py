@@ -0,0 +1,77 @@
+from typing import Optional
+
+import httpx
+import structlog
+
+from app.core.config import settings
+from app.core.http import create_http_client
+from app.services.agents import AgentService
+from app.services.aggregation import PortfolioAggregator
+from app.services.company_store import CompanyStore
+from app.services.embeddings import EmbeddingService
+from app.services.exposure_scoring import ExposureEngine
+from app.services.jobs import IngestionJobEngine
+from app.services.openai_client import OpenAIService
+from app.services.search_client import SearchService
+from app.services.semantic_cache import SemanticCache
+from app.services.spatial_index import AssetStore
+
+logger = structlog.get_logger(__name__)
+
+class ServiceContainer:
+    """Application-lifetime service instances sharing one HTTP connection pool.
+
+    Created and started on startup and stored on `app.state.services`; routers
+    receive the instances through the `get_*` dependencies.
+    """
+
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
+        self.http_client = http_client or create_http_client()
+        self.openai_service = OpenAIService(http_client=self.http_client)
+        self.embedding_service = EmbeddingService(self.openai_service)
+        self.search_service = SearchService(
+            http_client=self.http_client,
+            cache_remote=self._create_cache_remote(),
+            embed_texts=self.embedding_service.embed
+        )
+        self.semantic_cache = SemanticCache() if settings.SEMANTIC_CACHE_ENABLED else None
+        self.company_store = CompanyStore(settings.COMPANY_STORE_PATH)
+        self.asset_store = AssetStore(settings.ASSET_INDEX_PATH)
+        self.exposure_engine = ExposureEngine(self.asset_store, self.company_store)
+        self.portfolio_aggregator = PortfolioAggregator(self.company_store)
+        self.agent_service = AgentService(
+            openai_service=self.openai_service,
+            search_service=self.search_service,
+            embedding_service=self.embedding_service,
+            semantic_cache=self.semantic_cache,
+            asset_store=self.asset_store,
+            exposure_engine=self.exposure_engine,
+            portfolio_aggregator=self.portfolio_aggregator
+        )
+        self.ingestion_engine = IngestionJobEngine(
+            search_service=self.search_service,
+            semantic_cache=self.semantic_cache,
+            company_store=self.company_store,
+            asset_store=self.asset_store
+        )
+
+    async def start(self):
+        """Start background workers"""
+        await self.ingestion_engine.start()
+
+    @staticmethod
+    def _create_cache_remote():
+        """Create the Redis client for the search cache's second tier, if enabled"""
+        if not settings.SEARCH_CACHE_REDIS_ENABLED:
+            return None
+        import redis.asyncio as redis_asyncio  # type: ignore[import-untyped]
+        return redis_asyncio.from_url(settings.REDIS_URL)
+
+    async def close(self):
+        """Close services, then the shared connection pool"""
+        await self.ingestion_engine.close()
+        await self.search_service.close()
+        await self.embedding_service.close()
+        await self.openai_service.close()
+        await self.http_client.aclose()
+        logger.info("services_closed")
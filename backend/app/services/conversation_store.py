@@ -0,0 +1,139 @@
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+class ConversationStore:
+    """In-memory conversation repository with per-conversation and per-user indexes.
+
+    Messages are appended to their conversation's index in arrival order, so
+    history lookups never scan or sort the global message table. Each user's
+    conversations are kept sorted by (updated_at, id), which backs cursor
+    pagination; updated_at must therefore only be changed through touch().
+    """
+
+    def __init__(self):
+        self.conversations: Dict[str, Dict[str, Any]] = {}
+        self.messages: Dict[str, Dict[str, Any]] = {}
+        # conversation_id -> message ids in append order
+        self._conversation_messages: Dict[str, List[str]] = {}
+        # user_id -> (updated_at, conversation_id) keys in ascending order
+        self._user_recency: Dict[str, List[Tuple[datetime, str]]] = {}
+
+    def create_conversation(self, conversation: Dict[str, Any]) -> Dict[str, Any]:
+        """Store a new conversation and index it under its owner"""
+        conversation_id = conversation["id"]
+        self.conversations[conversation_id] = conversation
+        self._conversation_messages[conversation_id] = []
+        insort(
+            self._user_recency.setdefault(conversation["user_id"], []),
+            (conversation["updated_at"], conversation_id)
+        )
+        return conversation
+
+    def get_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Get a conversation by id"""
+        return self.conversations.get(conversation_id)
+
+    def list_conversations(self, user_id: str, include_archived: bool = False) -> List[Dict[str, Any]]:
+        """List a user's conversations, most recently updated first"""
+        return [
+            self.conversations[conv_id]
+            for _, conv_id in reversed(self._user_recency.get(user_id, []))
+            if include_archived or not self.conversations[conv_id].get("is_archived", False)
+        ]
+
+    def page_conversations(
+        self,
+        user_id: str,
+        limit: int,
+        before: Optional[Tuple[datetime, str]] = None,
+        include_archived: bool = False
+    ) -> Tuple[List[Dict[str, Any]], Optional[Tuple[datetime, str]]]:
+        """Get one page of a user's conversations, most recently updated first.
+
+        `before` is the (updated_at, id) key of the last item of the previous
+        page. Returns the page and the key to continue from, or None when the
+        listing is exhausted.
+        """
+        keys = self._user_recency.get(user_id, [])
+        position = bisect_left(keys, before) if before is not None else len(keys)
+
+        page: List[Dict[str, Any]] = []
+        while position > 0 and len(page) < limit:
+            position -= 1
+            conversation = self.conversations[keys[position][1]]
+            if include_archived or not conversation.get("is_archived", False):
+                page.append(conversation)
+
+        next_key = None
+        if page and position > 0:
+            next_key = (page[-1]["updated_at"], page[-1]["id"])
+        return page, next_key
+
+    def add_message(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Append a message to its conversation"""
+        conversation_id = message["conversation_id"]
+        self.messages[message["id"]] = message
+        self._conversation_messages.setdefault(conversation_id, []).append(message["id"])
+        return message
+
+    def get_messages(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """Get a conversation's messages in chronological order"""
+        return [
+            self.messages[msg_id]
+            for msg_id in self._conversation_messages.get(conversation_id, [])
+        ]
+
+    def get_message_range(self, conversation_id: str, start: int, stop: int) -> List[Dict[str, Any]]:
+        """Get messages by position within the conversation, [start, stop)"""
+        message_ids = self._conversation_messages.get(conversation_id, [])
+        return [self.messages[msg_id] for msg_id in message_ids[max(start, 0):max(stop, 0)]]
+
+    def count_messages(self, conversation_id: str) -> int:
+        """Get the number of messages in a conversation"""
+        return len(self._conversation_messages.get(conversation_id, []))
+
+    def touch(self, conversation_id: str, timestamp: Optional[datetime] = None):
+        """Bump a conversation's updated_at timestamp"""
+        conversation = self.conversations.get(conversation_id)
+        if conversation is None:
+            return
+
+        self._remove_recency_key(conversation)
+        conversation["updated_at"] = timestamp or datetime.utcnow()
+        insort(
+            self._user_recency.setdefault(conversation["user_id"], []),
+            (conversation["updated_at"], conversation_id)
+        )
+
+    def delete_conversation(self, conversation_id: str) -> bool:
+        """Delete a conversation and all of its messages"""
+        conversation = self.conversations.pop(conversation_id, None)
+        if conversation is None:
+            return False
+
+        for msg_id in self._conversation_messages.pop(conversation_id, []):
+            self.messages.pop(msg_id, None)
+
+        self._remove_recency_key(conversation)
+        if not self._user_recency.get(conversation["user_id"], True):
+            del self._user_recency[conversation["user_id"]]
+
+        logger.debug("conversation_store_deleted", conversation_id=conversation_id)
+        return True
+
+    def _remove_recency_key(self, conversation: Dict[str, Any]):
+        keys = self._user_recency.get(conversation["user_id"], [])
+        old_key = (conversation["updated_at"], conversation["id"])
+        position = bisect_left(keys, old_key)
+        if position < len(keys) and keys[position] == old_key:
+            del keys[position]
+
+conversation_store = ConversationStore()
+
+def get_conversation_store() -> ConversationStore:
+    return conversation_store
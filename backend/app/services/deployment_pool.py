@@ -0,0 +1,223 @@
+import asyncio
+import time
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+import httpx
+import openai
+import structlog
+from openai import AsyncAzureOpenAI
+
+from app.core.config import settings
+from app.services.rate_governor import RateGovernor
+
+logger = structlog.get_logger(__name__)
+
+# Latency kinds tracked per deployment: whole non-streaming responses, and time to a stream's first token
+RESPONSE = "response"
+FIRST_TOKEN = "first_token"
+# Tokens reserved for a health probe's one-token completion
+PROBE_TOKENS = 16
+
+class Deployment:
+    """One Azure OpenAI chat deployment: its client, rate governor, latency and health"""
+
+    def __init__(
+        self,
+        name: str,
+        endpoint: str,
+        api_key: str,
+        deployment: str,
+        api_version: Optional[str] = None,
+        rpm_limit: int = 0,
+        tpm_limit: int = 0,
+        http_client: Optional[httpx.AsyncClient] = None
+    ):
+        self.name = name
+        self.endpoint = endpoint
+        self.deployment = deployment
+        self.client = AsyncAzureOpenAI(
+            api_key=api_key,
+            api_version=api_version or settings.AZURE_OPENAI_API_VERSION,
+            azure_endpoint=endpoint,
+            http_client=http_client,
+            max_retries=0
+        )
+        self.governor = RateGovernor(rpm_limit=rpm_limit, tpm_limit=tpm_limit)
+        self.latency_ms: Dict[str, Optional[float]] = {RESPONSE: None, FIRST_TOKEN: None}
+        self._observed_at: Dict[str, float] = {}
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+        self._probe: Optional[asyncio.Task] = None
+        self._stats = {"calls": 0, "failures": 0, "throttled": 0, "probes": 0}
+
+    def record_success(self, kind: str, elapsed_ms: float):
+        """Fold a successful call's latency into the EWMA"""
+        self._stats["calls"] += 1
+        current = self.latency_ms[kind]
+        alpha = settings.OPENAI_LATENCY_EWMA_ALPHA
+        self.latency_ms[kind] = elapsed_ms if current is None else alpha * elapsed_ms + (1 - alpha) * current
+        self._observed_at[kind] = time.monotonic()
+        self.consecutive_failures = 0
+
+    def latency(self, kind: str, now: float) -> Optional[float]:
+        """The EWMA latency, or None when unmeasured or too old to trust"""
+        if now - self._observed_at.get(kind, now) > settings.OPENAI_LATENCY_MAX_AGE_S:
+            return None
+        return self.latency_ms[kind]
+
+    def record_failure(self, error: Exception) -> bool:
+        """Count a failed call; True when it should leave the rotation.
+
+        Throttling is a quota signal rather than a health one, so it never counts.
+        """
+        self._stats["calls"] += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+        if isinstance(error, openai.RateLimitError):
+            self._stats["throttled"] += 1
+            return False
+        self._stats["failures"] += 1
+        self.consecutive_failures += 1
+        return self.healthy and self.consecutive_failures >= settings.OPENAI_FAILURE_THRESHOLD
+
+    async def probe(self) -> bool:
+        """Send a one-token completion; True when the deployment answers"""
+        self._stats["probes"] += 1
+        try:
+            async with self.governor.slot(None, PROBE_TOKENS) as slot:
+                await self.client.chat.completions.create(
+                    model=self.deployment,
+                    messages=[{"role": "user", "content": "ping"}],
+                    max_tokens=1
+                )
+                slot.used(PROBE_TOKENS)
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            logger.info("openai_deployment_probe_failed", deployment=self.name, error=self.last_error)
+            return False
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "endpoint": urlparse(self.endpoint).hostname or self.endpoint,
+            "deployment": self.deployment,
+            "healthy": self.healthy,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "ewma_ms": {kind: round(value, 1) if value is not None else None for kind, value in self.latency_ms.items()},
+            "governor": self.governor.stats(),
+        }
+
+class DeploymentPool:
+    """Chat deployments across regions, each call routed to the one expected to finish first.
+
+    A deployment's expected time is its EWMA latency for the kind of call,
+    stretched by its queue (in flight plus waiting, over its concurrency
+    limit), plus however long its quota buckets or a Retry-After would
+    hold the call. Deployments without a recent latency are scored at half
+    the fastest one, so new and long-unused deployments get tried. After
+    OPENAI_FAILURE_THRESHOLD consecutive failures a deployment leaves the
+    rotation and is probed every OPENAI_HEALTH_PROBE_INTERVAL_S with a
+    one-token completion until it answers. Throttling is a quota signal,
+    not a health one: it is left to the deployment's governor and the
+    routing that reads it.
+    """
+
+    def __init__(self, deployments: Iterable[Deployment]):
+        self.deployments: List[Deployment] = list(deployments)
+        if not self.deployments:
+            raise ValueError("A deployment pool needs at least one deployment")
+        names = [deployment.name for deployment in self.deployments]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicate deployment names: {', '.join(names)}")
+
+    @classmethod
+    def from_settings(cls, http_client: Optional[httpx.AsyncClient] = None) -> "DeploymentPool":
+        """The primary AZURE_OPENAI_* deployment followed by AZURE_OPENAI_DEPLOYMENTS"""
+        deployments = [
+            Deployment(
+                "primary",
+                settings.AZURE_OPENAI_ENDPOINT,
+                settings.AZURE_OPENAI_API_KEY,
+                settings.AZURE_OPENAI_DEPLOYMENT_NAME,
+                rpm_limit=settings.AZURE_OPENAI_RPM_LIMIT,
+                tpm_limit=settings.AZURE_OPENAI_TPM_LIMIT,
+                http_client=http_client
+            )
+        ]
+        for index, config in enumerate(settings.AZURE_OPENAI_DEPLOYMENTS):
+            deployments.append(Deployment(
+                config.get("name") or f"deployment-{index + 1}",
+                config["endpoint"],
+                config.get("api_key") or settings.AZURE_OPENAI_API_KEY,
+                config.get("deployment") or settings.AZURE_OPENAI_DEPLOYMENT_NAME,
+                api_version=config.get("api_version"),
+                rpm_limit=int(config.get("rpm_limit", 0)),
+                tpm_limit=int(config.get("tpm_limit", 0)),
+                http_client=http_client
+            ))
+        return cls(deployments)
+
+    @property
+    def primary(self) -> Deployment:
+        return self.deployments[0]
+
+    def expected_ms(self, deployment: Deployment, kind: str, tokens: int, now: float) -> float:
+        """Routing score: how long a call of this kind would take on the deployment"""
+        latency = deployment.latency(kind, now)
+        if latency is None:
+            # Optimistic, so the deployment gets measured
+            known = [value for value in (other.latency(kind, now) for other in self.deployments) if value is not None]
+            latency = min(known) / 2 if known else 1.0
+        governor = deployment.governor
+        load = governor.inflight + governor.waiting()
+        return latency * (1 + load / max(governor.limit, 1.0)) + max(governor.admission_delay(tokens, now), 0.0) * 1000
+
+    def choose(self, kind: str, tokens: int, exclude: Iterable[Deployment] = ()) -> Optional[Deployment]:
+        """The healthy deployment expected to finish first, skipping exclude; None when none is left"""
+        now = time.monotonic()
+        excluded = {deployment.name for deployment in exclude}
+        candidates = [
+            deployment for deployment in self.deployments
+            if deployment.healthy and deployment.name not in excluded
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda deployment: self.expected_ms(deployment, kind, tokens, now))
+
+    def record_failure(self, deployment: Deployment, error: Exception):
+        """Count a failed call, taking the deployment out of rotation after enough in a row"""
+        if deployment.record_failure(error):
+            self._mark_unhealthy(deployment)
+
+    def _mark_unhealthy(self, deployment: Deployment):
+        deployment.healthy = False
+        logger.warning("openai_deployment_unhealthy", deployment=deployment.name, error=deployment.last_error)
+        if sum(other.healthy for other in self.deployments) == 0:
+            logger.error("openai_deployment_pool_exhausted")
+        if deployment._probe is None or deployment._probe.done():
+            deployment._probe = asyncio.create_task(self._probe_until_healthy(deployment))
+
+    async def _probe_until_healthy(self, deployment: Deployment):
+        while not deployment.healthy:
+            await asyncio.sleep(settings.OPENAI_HEALTH_PROBE_INTERVAL_S)
+            if not await deployment.probe():
+                continue
+            deployment.healthy = True
+            deployment.consecutive_failures = 0
+            logger.info("openai_deployment_recovered", deployment=deployment.name)
+
+    async def close(self, close_clients: bool):
+        """Stop health probes, and close the clients when they own their connection pools"""
+        probes = [deployment._probe for deployment in self.deployments if deployment._probe is not None]
+        for probe in probes:
+            probe.cancel()
+        await asyncio.gather(*probes, return_exceptions=True)
+        if close_clients:
+            for deployment in self.deployments:
+                await deployment.client.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {deployment.name: deployment.stats() for deployment in self.deployments}
@@ -0,0 +1,220 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import structlog
+from fastapi import Request
+
+from app.core.config import settings
+from app.services.openai_client import OpenAIService
+
+logger = structlog.get_logger(__name__)
+
+class EmbeddingVectorStore:
+    """Persistent content-hash -> float32 vector store backed by SQLite; hashes cover the embedding deployment"""
+
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (hash BLOB PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._connection.commit()
+        self._lock = threading.Lock()
+
+    def get_many(self, hashes: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """Load the stored vectors for the given hashes"""
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                rows = self._connection.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE hash IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                for content_hash, vector in rows:
+                    found[content_hash] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def put_many(self, items: List[Tuple[bytes, np.ndarray]]):
+        """Store vectors by content hash"""
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (hash, vector) VALUES (?, ?)",
+                [(content_hash, np.ascontiguousarray(vector, dtype=np.float32).tobytes()) for content_hash, vector in items]
+            )
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+class EmbeddingService:
+    """Embeds text through micro-batched, deduplicated API calls.
+
+    Concurrent `embed` calls are gathered into batches of up to
+    `max_batch_size` texts, waiting at most `max_wait_ms` for a batch to fill.
+    Texts are keyed by SHA-256 hash of the embedding deployment and content:
+    identical texts are embedded once, vectors are kept in an in-memory LRU,
+    and with `cache_path` set they are also persisted so unchanged content is
+    never embedded twice, while a new deployment's model starts afresh.
+    """
+
+    def __init__(
+        self,
+        openai_service: OpenAIService,
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+        max_concurrent_batches: Optional[int] = None,
+        cache_path: Optional[str] = None,
+        memory_cache_size: Optional[int] = None
+    ):
+        self.openai_service = openai_service
+        self.deployment = settings.AZURE_OPENAI_EMBEDDING_DEPLOYMENT
+        self.max_batch_size = max_batch_size or settings.EMBEDDING_MAX_BATCH_SIZE
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else settings.EMBEDDING_MAX_WAIT_MS) / 1000
+        self.memory_cache_size = memory_cache_size or settings.EMBEDDING_MEMORY_CACHE_SIZE
+        cache_path = cache_path or settings.EMBEDDING_CACHE_PATH
+        self.store = EmbeddingVectorStore(cache_path) if cache_path else None
+
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._pending: Dict[bytes, asyncio.Future] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._batches: Set[asyncio.Task] = set()
+        self._batch_slots = asyncio.Semaphore(max_concurrent_batches or settings.EMBEDDING_MAX_CONCURRENT_BATCHES)
+        self._stats = {"texts": 0, "cache_hits": 0, "deduplicated": 0, "batches": 0, "embedded": 0}
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts, returning a contiguous (len(texts), dimension) float32 array"""
+        if not texts:
+            return np.empty((0, settings.VECTOR_INDEX_DIMENSION), dtype=np.float32)
+
+        hashes = [hashlib.sha256(f"{self.deployment}\0{text}".encode("utf-8")).digest() for text in texts]
+        self._stats["texts"] += len(texts)
+
+        vectors: Dict[bytes, np.ndarray] = {}
+        missing: Dict[bytes, str] = {}
+        for content_hash, text in zip(hashes, texts):
+            if content_hash in vectors or content_hash in missing:
+                self._stats["deduplicated"] += 1
+                continue
+            vector = self._memory.get(content_hash)
+            if vector is not None:
+                self._memory.move_to_end(content_hash)
+                vectors[content_hash] = vector
+                self._stats["cache_hits"] += 1
+            else:
+                missing[content_hash] = text
+
+        if missing and self.store is not None:
+            stored = await asyncio.to_thread(self.store.get_many, list(missing))
+            for content_hash, vector in stored.items():
+                vectors[content_hash] = vector
+                self._remember(content_hash, vector)
+                del missing[content_hash]
+            self._stats["cache_hits"] += len(stored)
+
+        futures = {}
+        for content_hash, text in missing.items():
+            future = self._pending.get(content_hash)
+            if future is None:
+                future = asyncio.get_running_loop().create_future()
+                self._pending[content_hash] = future
+                self._enqueue((content_hash, text, future))
+            else:
+                self._stats["deduplicated"] += 1
+            futures[content_hash] = future
+
+        if futures:
+            results = await asyncio.gather(*(asyncio.shield(future) for future in futures.values()))
+            vectors.update(zip(futures, results))
+
+        return np.ascontiguousarray(np.stack([vectors[content_hash] for content_hash in hashes]), dtype=np.float32)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache and batching counters"""
+        return {
+            **self._stats,
+            "memory_entries": len(self._memory),
+            "average_batch_size": self._stats["embedded"] / self._stats["batches"] if self._stats["batches"] else 0.0,
+        }
+
+    async def close(self):
+        """Stop the batcher, fail the embeds still waiting and close the persistent store"""
+        waiting = list(self._pending.values())
+        tasks = [task for task in [self._worker, *self._batches] if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for future in waiting:
+            if not future.done():
+                future.set_exception(RuntimeError("Embedding service closed"))
+        if self.store is not None:
+            self.store.close()
+
+    def _enqueue(self, item: Tuple[bytes, str, asyncio.Future]):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run_batcher())
+        self._queue.put_nowait(item)
+
+    async def _run_batcher(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._batch_slots.acquire()
+            task = asyncio.create_task(self._embed_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _embed_batch(self, batch: List[Tuple[bytes, str, asyncio.Future]]):
+        try:
+            vectors = await self.openai_service.create_embeddings([text for _, text, _ in batch])
+            self._stats["batches"] += 1
+            self._stats["embedded"] += len(batch)
+
+            for (content_hash, _, future), vector in zip(batch, vectors):
+                self._remember(content_hash, vector)
+                if not future.done():
+                    future.set_result(vector)
+
+            if self.store is not None:
+                await asyncio.to_thread(
+                    self.store.put_many, [(content_hash, vector) for (content_hash, _, _), vector in zip(batch, vectors)]
+                )
+
+        except Exception as e:
+            logger.error("embedding_batch_failed", error=str(e), batch_size=len(batch))
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+        finally:
+            for content_hash, _, _ in batch:
+                self._pending.pop(content_hash, None)
+            self._batch_slots.release()
+
+    def _remember(self, content_hash: bytes, vector: np.ndarray):
+        self._memory[content_hash] = vector
+        self._memory.move_to_end(content_hash)
+        while len(self._memory) > self.memory_cache_size:
+            self._memory.popitem(last=False)
+
+def get_embedding_service(request: Request) -> EmbeddingService:
+    return request.app.state.services.embedding_service
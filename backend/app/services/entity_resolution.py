@@ -0,0 +1,332 @@
+import bisect
+import math
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+# Legal forms stripped from the end of names, as normalized word sequences
+LEGAL_SUFFIXES = frozenset(
+    tuple(suffix.split()) for suffix in (
+        "inc", "incorporated", "corp", "corporation", "co", "company", "cos", "companies",
+        "ltd", "limited", "llc", "l l c", "llp", "lp", "plc", "p l c",
+        "sa", "s a", "sas", "s a s", "sab", "s a b", "sa de cv", "s a de c v", "de cv",
+        "ag", "a g", "gmbh", "kg", "kgaa", "se", "nv", "n v", "bv", "b v",
+        "spa", "s p a", "srl", "s r l", "sarl", "ltda", "eireli", "sl", "s l",
+        "ab", "publ", "as", "asa", "a s", "oy", "oyj", "aps",
+        "pte", "pty", "bhd", "berhad", "sdn", "tbk", "pt", "kk", "k k",
+        "and co", "the",
+    )
+)
+LONGEST_SUFFIX = max(len(suffix) for suffix in LEGAL_SUFFIXES)
+PUNCTUATION = re.compile(r"[\W_]+")
+# Separators between several aliases in one cell
+ALIAS_SEPARATOR = re.compile(r"[;|]")
+MATCH_KINDS = ("name", "alias", "ticker")
+# Queries matched against the trigram index per vectorized step
+FUZZY_CHUNK = 4096
+COMMON_TRIGRAM_MIN = 1000
+# Probed trigrams a candidate must share beyond the minimum; more probes, fewer candidates
+PROBE_SLACK = 3
+# Partial matches need this many characters, and consider this many longer names starting with the query
+PARTIAL_MIN_LENGTH = 4
+PARTIAL_EXTENSIONS = 8
+
+def normalize_name(name: str) -> str:
+    """Casefold, strip accents and punctuation, and collapse whitespace"""
+    folded = name.casefold()
+    if not folded.isascii():
+        decomposed = unicodedata.normalize("NFKD", folded)
+        folded = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(PUNCTUATION.sub(" ", folded).split())
+
+def core_name(name: str) -> str:
+    """Normalized name without trailing legal forms or a leading "the", keeping at least one word"""
+    words = normalize_name(name).split()
+    if len(words) > 1 and words[0] == "the":
+        words = words[1:]
+    stripped = True
+    while stripped and len(words) > 1:
+        stripped = False
+        for length in range(min(LONGEST_SUFFIX, len(words) - 1), 0, -1):
+            if tuple(words[-length:]) in LEGAL_SUFFIXES:
+                words = words[:-length]
+                stripped = True
+                break
+    return " ".join(words)
+
+def split_aliases(text: str) -> List[str]:
+    return [alias.strip() for alias in ALIAS_SEPARATOR.split(text or "") if alias.strip()]
+
+def trigrams(key: str) -> List[str]:
+    """Distinct character trigrams of a key, padded so word edges count"""
+    padded = f" {key} "
+    return list(dict.fromkeys(padded[index:index + 3] for index in range(len(padded) - 2)))
+
+def expand_ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Every position of the ranges [start, start + count), concatenated"""
+    return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+class EntityIndex:
+    """Resolves free-text company names to entity rows.
+
+    Each entity contributes variant keys: its name and aliases reduced by
+    core_name(), and its ticker. Keys are looked up exactly first. Misses
+    go to a trigram inverted index scored by Jaccard similarity, reading
+    only the postings of each query's rarest trigrams. Names that still miss
+    fall back to a partial match on whole words: their longest leading
+    words that are a known key ("Cargill Brasil" finds "Cargill"), or the
+    shortest known names that start with them ("Marfrig" finds "Marfrig
+    Global Foods"). Batches run in vectorized chunks.
+    """
+
+    def __init__(self, keys: List[str], rows: np.ndarray, kinds: np.ndarray):
+        self.keys = keys
+        self.rows = rows
+        self.kinds = kinds
+        self.exact: Dict[str, List[int]] = {}
+        for variant, key in enumerate(keys):
+            self.exact.setdefault(key, []).append(variant)
+        # Name and alias keys in order, so the names extending a query are one contiguous range
+        self.sorted_keys = sorted({key for key, kind in zip(keys, kinds.tolist()) if MATCH_KINDS[kind] != "ticker"})
+        self.sorted_lengths = np.array([len(key) for key in self.sorted_keys], dtype=np.int32)
+
+        # Forward (variant -> trigrams) and inverted (trigram -> variants) indexes, in CSR form
+        trigram_ids: Dict[str, int] = {}
+        variant_trigrams: List[int] = []
+        sizes = np.zeros(len(keys), dtype=np.int32)
+        for variant, (key, kind) in enumerate(zip(keys, kinds.tolist())):
+            if MATCH_KINDS[kind] == "ticker":
+                continue
+            ids = [trigram_ids.setdefault(trigram, len(trigram_ids)) for trigram in trigrams(key)]
+            variant_trigrams.extend(ids)
+            sizes[variant] = len(ids)
+        self.trigram_ids = trigram_ids
+        self.sizes = sizes
+        self.forward_starts = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=self.forward_starts[1:])
+        self.forward = np.array(variant_trigrams, dtype=np.int32)
+
+        variants = np.repeat(np.arange(len(keys), dtype=np.int32), sizes)
+        order = np.argsort(self.forward, kind="stable")
+        self.postings = variants[order]
+        frequencies = np.bincount(self.forward, minlength=len(trigram_ids))
+        self.posting_starts = np.zeros(len(trigram_ids) + 1, dtype=np.int64)
+        np.cumsum(frequencies, out=self.posting_starts[1:])
+        self.frequencies = frequencies.tolist()
+        # Trigrams in more names than this (" co", "ing") are left out of candidate counting
+        self.common_frequency = max(COMMON_TRIGRAM_MIN, len(keys) // 100)
+
+    @classmethod
+    def build(cls, names: Sequence[str], aliases: Sequence[str], tickers: Sequence[str]) -> "EntityIndex":
+        """Index entity rows from their name, alias ("a; b") and ticker columns"""
+        variants: Dict[Tuple[str, int], int] = {}
+        for kind, column in enumerate((names, aliases, tickers)):
+            for row, text in enumerate(column):
+                if not text:
+                    continue
+                if MATCH_KINDS[kind] == "ticker":
+                    values = [normalize_name(text)]
+                elif MATCH_KINDS[kind] == "alias":
+                    values = [core_name(alias) for alias in split_aliases(text)]
+                else:
+                    values = [core_name(text)]
+                for key in values:
+                    if key:
+                        variants.setdefault((key, row), kind)
+
+        keys = [key for key, _ in variants]
+        return cls(
+            keys=keys,
+            rows=np.array([row for _, row in variants], dtype=np.int32),
+            kinds=np.array(list(variants.values()), dtype=np.int8)
+        )
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def candidates(self, name: str, threshold: float, limit: int = 20) -> List[Tuple[int, float, str]]:
+        """Entity rows matching a name as (row, score, match kind), best first"""
+        key = core_name(name)
+        if not key:
+            return []
+        found: Dict[int, Tuple[float, str]] = {}
+        for variant in self.exact.get(key, ()):
+            found.setdefault(int(self.rows[variant]), (1.0, MATCH_KINDS[self.kinds[variant]]))
+
+        queries, variants, scores = self._fuzzy([key], threshold)
+        for variant, score in zip(variants.tolist(), scores.tolist()):
+            row = int(self.rows[variant])
+            if row not in found or found[row][0] < score:
+                found[row] = (score, "fuzzy")
+
+        if not found:
+            for variant, score in self._partial(key):
+                found.setdefault(int(self.rows[variant]), (score, "partial"))
+        ranked = sorted(found.items(), key=lambda item: (-item[1][0], item[0]))[:limit]
+        return [(row, score, kind) for row, (score, kind) in ranked]
+
+    def resolve_many(self, names: Sequence[str], threshold: float) -> List[Optional[Dict[str, Any]]]:
+        """Best entity for every name: its row, match kind, score, matched key and whether it was ambiguous"""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(names)
+        positions: Dict[str, List[int]] = {}
+        for position, name in enumerate(names):
+            if name:
+                positions.setdefault(name, []).append(position)
+
+        resolved: Dict[str, Dict[str, Any]] = {}
+        pending: List[Tuple[str, str]] = []
+        for name in positions:
+            key = core_name(name)
+            if not key:
+                continue
+            exact = self.exact.get(key)
+            if exact:
+                resolved[name] = self._result(exact[0], "exact", 1.0, ambiguous=self._ambiguous(exact))
+            else:
+                pending.append((name, key))
+
+        for start in range(0, len(pending), FUZZY_CHUNK):
+            chunk = pending[start:start + FUZZY_CHUNK]
+            queries, variants, scores = self._fuzzy([key for _, key in chunk], threshold)
+            if len(queries):
+                # Best variant per query: highest score, then names over aliases, then lowest row
+                order = np.lexsort((self.rows[variants], self.kinds[variants], -scores, queries))
+                queries, variants, scores = queries[order], variants[order], scores[order]
+                first = np.flatnonzero(np.diff(queries, prepend=-1))
+                for query, variant, score in zip(queries[first].tolist(), variants[first].tolist(), scores[first].tolist()):
+                    resolved[chunk[query][0]] = self._result(variant, "fuzzy", score)
+
+        for name, key in pending:
+            if name not in resolved:
+                matches = self._partial(key)
+                if matches:
+                    partial = [variant for variant, _ in matches]
+                    resolved[name] = self._result(partial[0], "partial", matches[0][1], ambiguous=self._ambiguous(partial))
+
+        for name, result in resolved.items():
+            for position in positions[name]:
+                results[position] = result
+        return results
+
+    def _ambiguous(self, variants: List[int]) -> bool:
+        """Whether a key names several entities in its best kind; names come before aliases and tickers"""
+        kind = self.kinds[variants[0]]
+        return len({int(self.rows[variant]) for variant in variants if self.kinds[variant] == kind}) > 1
+
+    def _result(self, variant: int, match: str, score: float, ambiguous: bool = False) -> Dict[str, Any]:
+        kind = MATCH_KINDS[self.kinds[variant]]
+        return {
+            "row": int(self.rows[variant]),
+            "match": kind if match == "exact" else match,
+            "matched": self.keys[variant],
+            "score": round(score, 4),
+            "ambiguous": ambiguous,
+        }
+
+    def _partial(self, key: str) -> List[Tuple[int, float]]:
+        """Variants sharing whole leading words with a key, scored by the shorter's share of the longer, best first.
+
+        Covers the longest leading words of the key that are a known name
+        and the shortest known names that begin with the whole key.
+        """
+        matches: List[Tuple[int, float]] = []
+        words = key.split()
+        for length in range(len(words) - 1, 0, -1):
+            prefix = " ".join(words[:length])
+            if len(prefix) >= PARTIAL_MIN_LENGTH and prefix in self.exact:
+                matches.extend((variant, round(len(prefix) / len(key), 4)) for variant in self.exact[prefix])
+                break
+
+        if len(key) >= PARTIAL_MIN_LENGTH:
+            # Keys that continue the query with another word sort between "key " and "key!"
+            start = bisect.bisect_left(self.sorted_keys, f"{key} ")
+            end = bisect.bisect_left(self.sorted_keys, f"{key}!", lo=start)
+            nearest = np.argsort(self.sorted_lengths[start:end], kind="stable")[:PARTIAL_EXTENSIONS]
+            for position in nearest.tolist():
+                longer = self.sorted_keys[start + position]
+                matches.extend(
+                    (variant, round(len(key) / len(longer), 4)) for variant in self.exact[longer]
+                    if MATCH_KINDS[self.kinds[variant]] != "ticker"
+                )
+        matches.sort(key=lambda match: -match[1])
+        return matches
+
+    def _fuzzy(self, keys: List[str], threshold: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(query, variant, Jaccard score) for every pair at or above threshold.
+
+        A pair at the threshold shares at least ceil(threshold * a) of the
+        query's a trigrams, so it shares at least PROBE_SLACK of any
+        a - ceil(threshold * a) + PROBE_SLACK of them. Probing the rarest
+        trigrams reads short postings, and the count leaves few pairs to
+        verify against all their trigrams.
+        """
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0))
+        query_sizes = np.zeros(len(keys), dtype=np.int64)
+        needed = np.zeros(len(keys), dtype=np.int64)
+        probe_queries: List[int] = []
+        probe_trigrams: List[int] = []
+        query_keys: List[int] = []
+        trigram_count = len(self.trigram_ids)
+        for query, key in enumerate(keys):
+            grams = trigrams(key)
+            known = [self.trigram_ids[gram] for gram in grams if gram in self.trigram_ids]
+            query_sizes[query] = len(grams)
+            query_keys.extend(query * trigram_count + trigram for trigram in known)
+
+            # Unknown trigrams are the rarest of all and are probed for free
+            minimum_shared = math.ceil(threshold * len(grams) - 1e-9)
+            probes = len(grams) - minimum_shared + PROBE_SLACK - (len(grams) - len(known))
+            rare = sorted(
+                (trigram for trigram in known if self.frequencies[trigram] <= self.common_frequency),
+                key=self.frequencies.__getitem__
+            )[:max(probes, 0)]
+            unprobed = len(known) - len(rare)
+            needed[query] = max(minimum_shared - unprobed, 1)
+            probe_queries.extend([query] * len(rare))
+            probe_trigrams.extend(rare)
+        if not probe_trigrams:
+            return empty
+
+        probe_trigrams_array = np.array(probe_trigrams, dtype=np.int64)
+        starts = self.posting_starts[probe_trigrams_array]
+        counts = self.posting_starts[probe_trigrams_array + 1] - starts
+        pairs, probed_shared = np.unique(
+            np.repeat(np.array(probe_queries, dtype=np.int64), counts) * len(self.keys)
+            + self.postings[expand_ranges(starts, counts)],
+            return_counts=True
+        )
+        queries, variants = np.divmod(pairs, len(self.keys))
+
+        # Jaccard is also at most min(a, b) / max(a, b)
+        query_size, variant_size = query_sizes[queries], self.sizes[variants]
+        keep = (
+            (probed_shared >= needed[queries])
+            & (variant_size >= threshold * query_size)
+            & (query_size >= threshold * variant_size)
+        )
+        queries, variants = queries[keep], variants[keep]
+        query_size, variant_size = query_size[keep], variant_size[keep]
+        if not len(queries):
+            return empty
+
+        # Count each pair's shared trigrams by looking the variant's trigrams up in its query's
+        starts = self.forward_starts[variants]
+        counts = self.forward_starts[variants + 1] - starts
+        pair_of = np.repeat(np.arange(len(queries)), counts)
+        lookups = queries[pair_of] * trigram_count + self.forward[expand_ranges(starts, counts)]
+        query_keys_array = np.sort(np.array(query_keys, dtype=np.int64))
+        found = np.searchsorted(query_keys_array, lookups)
+        present = query_keys_array[np.minimum(found, len(query_keys_array) - 1)] == lookups
+        shared = np.bincount(pair_of, weights=present, minlength=len(queries))
+
+        scores = shared / (query_size + variant_size - shared)
+        keep = scores >= threshold
+        return queries[keep], variants[keep], scores[keep]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"keys": len(self.keys), "trigrams": len(self.trigram_ids), "postings": int(len(self.postings))}
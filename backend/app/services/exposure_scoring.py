@@ -0,0 +1,399 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import structlog
+from fastapi import Request
+
+from app.core.config import settings
+from app.services.company_store import CompanyStore
+from app.services.entity_resolution import core_name
+from app.services.raster_store import GridRaster, open_raster
+from app.services.spatial_index import KM_PER_DEGREE, AssetStore
+
+logger = structlog.get_logger(__name__)
+
+METHOD = "area-weighted mean forest loss over each asset footprint buffered by {buffer_km} km"
+
+def asset_windows(raster: GridRaster, bounds: np.ndarray, buffer_km: float) -> Tuple[np.ndarray, ...]:
+    """Inclusive raster cell windows (top, bottom, left, right) of buffered footprints, and which overlap the raster"""
+    middle = np.radians((bounds[:, 1] + bounds[:, 3]) / 2)
+    buffer_lat = buffer_km / KM_PER_DEGREE
+    buffer_lon = buffer_km / (KM_PER_DEGREE * np.maximum(np.cos(middle), 0.01))
+    cell = raster.cell_degrees
+    height, width = raster.shape
+
+    top = np.floor((raster.north - (bounds[:, 3] + buffer_lat)) / cell).astype(np.int64)
+    bottom = np.floor((raster.north - (bounds[:, 1] - buffer_lat)) / cell).astype(np.int64)
+    left = np.floor((bounds[:, 0] - buffer_lon - raster.west) / cell).astype(np.int64)
+    right = np.floor((bounds[:, 2] + buffer_lon - raster.west) / cell).astype(np.int64)
+    covered = (bottom >= 0) & (top < height) & (right >= 0) & (left < width)
+    return (
+        np.clip(top, 0, height - 1),
+        np.clip(bottom, 0, height - 1),
+        np.clip(left, 0, width - 1),
+        np.clip(right, 0, width - 1),
+        covered,
+    )
+
+# Windows gathered per vectorized step, sorted by height so padding stays small
+GATHER_CHUNK = 512
+
+def row_prefix(values: np.ndarray) -> np.ndarray:
+    """Prefix sums along each row with a leading zero column; exact for integer rasters"""
+    prefix = np.zeros((values.shape[0], values.shape[1] + 1), dtype=np.float64 if values.dtype.kind == "f" else np.int64)
+    np.cumsum(values, axis=1, out=prefix[:, 1:])
+    return prefix
+
+def window_sums(
+    prefix: np.ndarray,
+    row_weights: np.ndarray,
+    top: np.ndarray,
+    bottom: np.ndarray,
+    left: np.ndarray,
+    right: np.ndarray
+) -> np.ndarray:
+    """Row-weighted sums over inclusive windows: per row, two prefix lookups"""
+    sums = np.zeros(len(top), dtype=np.float64)
+    heights = bottom - top + 1
+    order = np.argsort(heights, kind="stable")
+    for start in range(0, len(order), GATHER_CHUNK):
+        chunk = order[start:start + GATHER_CHUNK]
+        offsets = np.arange(heights[chunk[-1]])
+        inside = offsets < heights[chunk, None]
+        rows = np.minimum(top[chunk, None] + offsets, bottom[chunk, None])
+        spans = prefix[rows, right[chunk, None] + 1] - prefix[rows, left[chunk, None]]
+        sums[chunk] = (spans * np.where(inside, row_weights[rows], 0.0)).sum(axis=1)
+    return sums
+
+def score_tile(raster: GridRaster, windows: Tuple[np.ndarray, ...]) -> Tuple[np.ndarray, np.ndarray]:
+    """Lost and covered km² inside each window, from one read of the windows' bounding region"""
+    top, bottom, left, right = windows
+    region_top, region_left = int(top.min()), int(left.min())
+    values = raster.window(region_top, int(bottom.max()) + 1, region_left, int(right.max()) + 1)
+    missing = raster.missing(values)
+    if missing is not None:
+        values = np.where(missing, 0, values)
+
+    row_km2 = raster.row_km2(region_top, region_top + values.shape[0])
+
+    top, bottom, left, right = top - region_top, bottom - region_top, left - region_left, right - region_left
+    lost = window_sums(row_prefix(values), row_km2, top, bottom, left, right) * raster.scale
+    if missing is not None:
+        covered = window_sums(row_prefix(~missing), row_km2, top, bottom, left, right)
+    else:
+        # Fully covered: a window's area is its rows' area times its width
+        cumulative = np.concatenate(([0.0], np.cumsum(row_km2)))
+        covered = (cumulative[bottom + 1] - cumulative[top]) * (right - left + 1)
+    return lost, covered
+
+def zonal_exposure(
+    raster: GridRaster,
+    bounds: np.ndarray,
+    buffer_km: float,
+    tile_cells: int,
+    workers: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Lost and covered km² around every asset.
+
+    Assets are grouped into raster tiles by the corner of their window.
+    Each tile reads the region its assets cover once and takes prefix sums
+    along its rows, so a window costs two lookups per row whatever its
+    width. Tiles run in parallel threads; NumPy releases the GIL for the
+    heavy work.
+    """
+    lost = np.zeros(len(bounds), dtype=np.float64)
+    covered = np.zeros(len(bounds), dtype=np.float64)
+    if not len(bounds):
+        return lost, covered
+
+    top, bottom, left, right, overlaps = asset_windows(raster, bounds, buffer_km)
+    rows = np.flatnonzero(overlaps)
+    tile_columns = raster.shape[1] // tile_cells + 1
+    tiles = (top[rows] // tile_cells) * tile_columns + left[rows] // tile_cells
+    order = np.argsort(tiles, kind="stable")
+    rows, tiles = rows[order], tiles[order]
+    groups = np.split(rows, np.flatnonzero(np.diff(tiles)) + 1)
+
+    def run(group: np.ndarray):
+        lost[group], covered[group] = score_tile(raster, (top[group], bottom[group], left[group], right[group]))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(run, groups))
+    return lost, covered
+
+@dataclass
+class ExposureSnapshot:
+    """Scores for one combination of asset index, company table and raster"""
+    key: Tuple[Any, ...]
+    asset_lost_km2: np.ndarray
+    asset_covered_km2: np.ndarray
+    asset_companies: np.ndarray  # code of each asset's owner, -1 without one
+    company_codes: Dict[str, int]
+    companies: Dict[str, Dict[str, Any]]
+    company_keys: Dict[str, str]  # company names without legal forms to company keys
+    portfolios: Dict[str, Dict[str, Any]]
+    lineage: Dict[str, Any]
+
+    def asset_exposure(self) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.asset_covered_km2 > 0, self.asset_lost_km2 / self.asset_covered_km2, np.nan)
+
+def ratio(lost: float, covered: float) -> Optional[float]:
+    return round(lost / covered, 6) if covered > 0 else None
+
+class ExposureEngine:
+    """Deforestation exposure of assets, companies and portfolios.
+
+    Each asset's exposure is the share of forest lost within its footprint
+    buffered by EXPOSURE_BUFFER_KM. Companies aggregate their assets by
+    area, and portfolios take the holding-weighted mean of their companies.
+    Scores are computed for the whole asset index at once and cached until
+    the asset index, company table or raster changes.
+    """
+
+    def __init__(
+        self,
+        asset_store: AssetStore,
+        company_store: CompanyStore,
+        raster_path: Optional[str] = None,
+        buffer_km: Optional[float] = None,
+        workers: Optional[int] = None
+    ):
+        self.asset_store = asset_store
+        self.company_store = company_store
+        self.buffer_km = settings.EXPOSURE_BUFFER_KM if buffer_km is None else buffer_km
+        self.workers = workers or settings.EXPOSURE_WORKERS or os.cpu_count() or 1
+        self.raster: Optional[GridRaster] = None
+        self._snapshot: Optional[ExposureSnapshot] = None
+        self._lock = asyncio.Lock()
+        self._last_seconds: Optional[float] = None
+
+        raster_path = raster_path or settings.FOREST_LOSS_RASTER_PATH
+        if raster_path:
+            try:
+                self.raster = open_raster(raster_path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("forest_loss_raster_unavailable", path=raster_path, error=str(e))
+
+    @property
+    def available(self) -> bool:
+        return self.raster is not None
+
+    def _key(self, raster: GridRaster) -> Tuple[Any, ...]:
+        return (id(self.asset_store.index), id(self.company_store.table), raster.fingerprint, self.buffer_km)
+
+    async def snapshot(self, refresh: bool = False) -> Optional[ExposureSnapshot]:
+        """Get current scores, recomputing them if their inputs changed"""
+        raster = self.raster
+        if raster is None:
+            return None
+        if not refresh and self._snapshot is not None and self._snapshot.key == self._key(raster):
+            return self._snapshot
+        async with self._lock:
+            if refresh or self._snapshot is None or self._snapshot.key != self._key(raster):
+                self._snapshot = await asyncio.to_thread(self._compute, raster)
+        return self._snapshot
+
+    def _compute(self, raster: GridRaster) -> ExposureSnapshot:
+        start = time.perf_counter()
+        key = self._key(raster)
+        index = self.asset_store.index
+        table = self.company_store.table
+        lost, covered = zonal_exposure(
+            raster,
+            np.asarray(index.bounds),
+            self.buffer_km,
+            settings.EXPOSURE_TILE_CELLS,
+            self.workers
+        )
+
+        # Group assets by owner id, or by normalized owner name
+        company_ids = index.strings["company_id"].to_list()
+        company_names = index.strings["company"].to_list()
+        codes = np.full(len(index), -1, dtype=np.int64)
+        keys: Dict[str, int] = {}
+        labels: List[Tuple[str, str]] = []
+        for row, (company_id, name) in enumerate(zip(company_ids, company_names)):
+            key_text = company_id or (f"name:{core_name(name)}" if name else "")
+            if not key_text:
+                continue
+            code = keys.get(key_text)
+            if code is None:
+                code = keys[key_text] = len(labels)
+                labels.append((company_id, name))
+            codes[row] = code
+
+        owned = codes >= 0
+        count = len(labels)
+        has_cover = covered > 0
+        totals = {
+            "lost": np.bincount(codes[owned], weights=lost[owned], minlength=count),
+            "covered": np.bincount(codes[owned], weights=covered[owned], minlength=count),
+            "assets": np.bincount(codes[owned], minlength=count),
+            "assets_covered": np.bincount(codes[owned & has_cover], minlength=count),
+        }
+        with np.errstate(invalid="ignore", divide="ignore"):
+            asset_exposure = np.where(has_cover, lost / covered, -1.0)
+        worst = np.full(count, -1.0)
+        np.maximum.at(worst, codes[owned], asset_exposure[owned])
+
+        companies: Dict[str, Dict[str, Any]] = {}
+        company_keys: Dict[str, str] = {}
+        for key_text, code in keys.items():
+            company_id, name = labels[code]
+            companies[key_text] = {
+                "company_id": company_id or None,
+                "company": name or None,
+                "assets": int(totals["assets"][code]),
+                "assets_covered": int(totals["assets_covered"][code]),
+                "forest_loss_km2": round(float(totals["lost"][code]), 4),
+                "area_km2": round(float(totals["covered"][code]), 4),
+                "exposure": ratio(totals["lost"][code], totals["covered"][code]),
+                "max_asset_exposure": round(float(worst[code]), 6) if worst[code] >= 0 else None,
+            }
+            if name:
+                company_keys.setdefault(core_name(name), key_text)
+
+        portfolios = self._portfolios(table, companies, company_keys)
+        seconds = time.perf_counter() - start
+        self._last_seconds = seconds
+        lineage = {
+            **raster.lineage(),
+            "method": METHOD.format(buffer_km=self.buffer_km),
+            "assets": len(index),
+            "assets_covered": int(has_cover.sum()),
+            "computed_at": datetime.utcnow().isoformat(),
+        }
+        logger.info("exposure_computed", assets=len(index), companies=len(companies), portfolios=len(portfolios), seconds=round(seconds, 3))
+        return ExposureSnapshot(
+            key=key,
+            asset_lost_km2=lost,
+            asset_covered_km2=covered,
+            asset_companies=codes,
+            company_codes=keys,
+            companies=companies,
+            company_keys=company_keys,
+            portfolios=portfolios,
+            lineage=lineage
+        )
+
+    @staticmethod
+    def _portfolios(table, companies: Dict[str, Dict[str, Any]], company_keys: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        """Holding-weighted exposure per portfolio; weights fall back to value, then equal weights"""
+        holdings = table.holdings
+        if not len(holdings["company"]):
+            return {}
+
+        # Exposure of each company row in the company table, matched by id and then by name
+        ids = table.strings["id"].to_list()
+        name_keys = [core_name(name) for name in table.strings["name"].to_list()]
+        exposure = np.full(len(table), np.nan)
+        for row, (company_id, name_key) in enumerate(zip(ids, name_keys)):
+            record = companies.get(company_id) or companies.get(company_keys.get(name_key, ""))
+            if record is not None and record["exposure"] is not None:
+                exposure[row] = record["exposure"]
+
+        rows = np.asarray(holdings["company"])
+        weights = np.asarray(holdings["weight"])
+        weights = np.where(weights > 0, weights, np.asarray(holdings["value"]))
+        weights = np.where(weights > 0, weights, 1.0)
+        holding_exposure = exposure[rows]
+        known = ~np.isnan(holding_exposure)
+        portfolio_codes = np.asarray(holdings["portfolio"].codes)
+
+        portfolios = {}
+        for code, portfolio in enumerate(holdings["portfolio"].categories):
+            members = portfolio_codes == code
+            scored = members & known
+            total_weight = weights[members].sum()
+            scored_weight = weights[scored].sum()
+            contributions = weights[scored] * holding_exposure[scored]
+            top = np.argsort(-contributions)[:5]
+            scored_rows = rows[scored]
+            portfolios[portfolio] = {
+                "portfolio": portfolio,
+                "holdings": int(members.sum()),
+                "holdings_scored": int(scored.sum()),
+                "weight_coverage": round(float(scored_weight / total_weight), 4) if total_weight else 0.0,
+                "exposure": round(float(contributions.sum() / scored_weight), 6) if scored_weight else None,
+                "top_contributors": [
+                    {
+                        "company_id": ids[scored_rows[position]],
+                        "exposure": round(float(holding_exposure[scored][position]), 6),
+                        "share_of_exposure": round(float(contributions[position] / contributions.sum()), 4) if contributions.sum() else 0.0,
+                    }
+                    for position in top.tolist()
+                ],
+            }
+        return portfolios
+
+    def _company_key(self, snapshot: ExposureSnapshot, company: str) -> Optional[str]:
+        if company in snapshot.companies:
+            return company
+        # Company store ids may differ from the asset owner ids; match through the store's name
+        stored = self.company_store.get(company)
+        name = stored.get("name") if stored else company
+        return snapshot.company_keys.get(core_name(name or ""))
+
+    async def company_exposure(self, company: str) -> Optional[Dict[str, Any]]:
+        """Exposure of a company by id, or by name"""
+        snapshot = await self.snapshot()
+        if snapshot is None:
+            return None
+        key = self._company_key(snapshot, company)
+        return snapshot.companies[key] if key is not None else None
+
+    async def portfolio_exposure(self, portfolio: str) -> Optional[Dict[str, Any]]:
+        snapshot = await self.snapshot()
+        return snapshot.portfolios.get(portfolio) if snapshot is not None else None
+
+    async def top_assets(self, limit: int = 20, company: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Most exposed assets, optionally of one company"""
+        snapshot = await self.snapshot()
+        if snapshot is None:
+            return []
+        index = self.asset_store.index
+        exposure = snapshot.asset_exposure()
+        if len(exposure) != len(index):
+            return []
+        scored = ~np.isnan(exposure)
+        if company:
+            key = self._company_key(snapshot, company)
+            if key is None:
+                return []
+            scored &= snapshot.asset_companies == snapshot.company_codes[key]
+        candidates = np.flatnonzero(scored)
+        top = candidates[np.argsort(-exposure[candidates], kind="stable")[:limit]]
+        results = []
+        for row in top.tolist():
+            asset = index.asset(row)
+            asset["exposure"] = round(float(exposure[row]), 6)
+            asset["forest_loss_km2"] = round(float(snapshot.asset_lost_km2[row]), 4)
+            results.append(asset)
+        return results
+
+    async def zonal_stats(self, ring: np.ndarray) -> Optional[Dict[str, Any]]:
+        """Forest loss inside a polygon, read from the raster's tiles without scoring assets"""
+        if self.raster is None:
+            return None
+        return await asyncio.to_thread(self.raster.zonal_stats, ring)
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "available": self.available,
+            "cached": snapshot is not None and self.raster is not None and snapshot.key == self._key(self.raster),
+            "companies": len(snapshot.companies) if snapshot else 0,
+            "portfolios": len(snapshot.portfolios) if snapshot else 0,
+            "last_compute_seconds": round(self._last_seconds, 3) if self._last_seconds is not None else None,
+            "raster": self.raster.stats() if self.raster is not None else None,
+        }
+
+def get_exposure_engine(request: Request) -> ExposureEngine:
+    return request.app.state.services.exposure_engine
@@ -0,0 +1,180 @@
+import asyncio
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import structlog
+import tiktoken
+
+from app.core.config import settings
+
+logger = structlog.get_logger(__name__)
+
+# Tokens added by the chat format around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+# Stored messages whose token counts are remembered, by message id
+TOKEN_COUNT_CACHE_SIZE = 50000
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between an ESG analyst and Green Guardian.
+Merge the new turns into the existing summary. Keep companies, regions, figures, risk findings and open questions.
+Reply with the updated summary only."""
+
+@lru_cache(maxsize=8)
+def get_encoding(model: str) -> tiktoken.Encoding:
+    """Get a cached tiktoken encoder for a model"""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+class HistoryManager:
+    """Selects conversation history for a prompt under a token budget.
+
+    The most recent turns are sent verbatim while they fit the budget. Turns
+    that fall out of the window are folded into the conversation's `summary`
+    field in the background, with `summary_message_count` recording how many
+    leading messages the summary covers. Until a fold lands, the turns it
+    will cover are still sent verbatim, within MAX_TOKENS_PER_REQUEST.
+    """
+
+    def __init__(self, model: str = "gpt-4", token_budget: Optional[int] = None):
+        self.encoding = get_encoding(model)
+        self.token_budget = token_budget or int(
+            settings.MAX_TOKENS_PER_REQUEST * settings.HISTORY_TOKEN_BUDGET_RATIO
+        )
+        # conversation_id -> the fold running for it
+        self._folding: Dict[str, asyncio.Task] = {}
+        self._token_counts: "OrderedDict[str, int]" = OrderedDict()
+
+    def count_tokens(self, text: str) -> int:
+        """Count tokens in a piece of text"""
+        return len(self.encoding.encode(text or "", disallowed_special=()))
+
+    def message_tokens(self, message: Dict[str, Any]) -> int:
+        """Count tokens in a stored message, remembering the count by message id"""
+        message_id = message.get("id")
+        if message_id and message_id in self._token_counts:
+            self._token_counts.move_to_end(message_id)
+            return self._token_counts[message_id]
+
+        token_count = self.count_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+        if message_id:
+            self._token_counts[message_id] = token_count
+            if len(self._token_counts) > TOKEN_COUNT_CACHE_SIZE:
+                self._token_counts.popitem(last=False)
+        return token_count
+
+    def build_window(
+        self,
+        message: str,
+        conversation_history: List[Dict[str, Any]],
+        conversation: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Dict[str, str]], Optional[str], int]:
+        """Build the prompt messages for a turn.
+
+        Returns the chat messages (ending with the new user message), the
+        summary of older turns if any, and the history index where the
+        verbatim window starts. Turns between the summary and the window
+        are sent too until a fold covers them.
+        """
+        history = conversation_history
+        # The router stores the user's message before calling the agent
+        if history and history[-1].get("role") == "user" and history[-1].get("content") == message:
+            history = history[:-1]
+
+        summary = conversation.get("summary") if conversation else None
+        summarized_count = min(
+            conversation.get("summary_message_count", 0) if conversation else 0,
+            len(history)
+        )
+
+        remaining = self.token_budget - self.count_tokens(message) - MESSAGE_OVERHEAD_TOKENS
+        if summary:
+            remaining -= self.count_tokens(summary)
+
+        window_start = self._fill(history, len(history), summarized_count, remaining)
+        # Not yet in the summary: send them anyway, in the headroom above the history budget
+        headroom = max(settings.MAX_TOKENS_PER_REQUEST - self.token_budget, 0)
+        remaining -= sum(
+            self.message_tokens(msg) for msg in history[window_start:] if msg.get("role") in ["user", "assistant"]
+        )
+        prompt_start = self._fill(history, window_start, summarized_count, remaining + headroom)
+
+        messages = [
+            {"role": msg["role"], "content": msg["content"]}
+            for msg in history[prompt_start:]
+            if msg.get("role") in ["user", "assistant"]
+        ]
+        messages.append({"role": "user", "content": message})
+
+        return messages, summary, window_start
+
+    def _fill(self, history: List[Dict[str, Any]], start: int, stop: int, remaining: int) -> int:
+        """Walk back from start towards stop while the turns fit remaining; returns the first index taken"""
+        while start > stop:
+            candidate = history[start - 1]
+            if candidate.get("role") in ["user", "assistant"]:
+                cost = self.message_tokens(candidate)
+                if cost > remaining:
+                    break
+                remaining -= cost
+            start -= 1
+        return start
+
+    def schedule_fold(
+        self,
+        conversation: Optional[Dict[str, Any]],
+        conversation_history: List[Dict[str, Any]],
+        window_start: int,
+        openai_service
+    ):
+        """Fold turns before window_start into the summary without blocking the turn"""
+        if not conversation or window_start <= conversation.get("summary_message_count", 0):
+            return
+        if conversation["id"] in self._folding:
+            return
+
+        conversation_id = conversation["id"]
+        task = asyncio.create_task(
+            self.fold(conversation, conversation_history[:window_start], openai_service)
+        )
+        self._folding[conversation_id] = task
+        task.add_done_callback(lambda _: self._folding.pop(conversation_id, None))
+
+    async def fold(
+        self,
+        conversation: Dict[str, Any],
+        covered_history: List[Dict[str, Any]],
+        openai_service
+    ):
+        """Merge messages not yet covered by the summary into it"""
+        summarized_count = conversation.get("summary_message_count", 0)
+        new_turns = [
+            f"{msg['role']}: {msg['content']}"
+            for msg in covered_history[summarized_count:]
+            if msg.get("role") in ["user", "assistant"]
+        ]
+        if not new_turns:
+            conversation["summary_message_count"] = len(covered_history)
+            return
+
+        existing_summary = conversation.get("summary") or "(none)"
+        try:
+            response = await openai_service.generate_response(
+                messages=[{
+                    "role": "user",
+                    "content": f"Existing summary:\n{existing_summary}\n\nNew turns:\n" + "\n".join(new_turns)
+                }],
+                system_prompt=SUMMARY_PROMPT,
+                temperature=0.2,
+                max_tokens=settings.HISTORY_SUMMARY_MAX_TOKENS
+            )
+            conversation["summary"] = response["content"]
+            conversation["summary_message_count"] = len(covered_history)
+            logger.info(
+                "conversation_summary_updated",
+                conversation_id=conversation["id"],
+                summarized_messages=len(covered_history)
+            )
+        except Exception as e:
+            logger.error("conversation_summary_failed", conversation_id=conversation["id"], error=str(e))
@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Dict, Generator, Iterator, List, Optional
+
+import structlog
+from fastapi import Request, UploadFile
+from starlette.types import Message
+
+from app.core.config import settings
+from app.core.exceptions import PayloadTooLargeError, ValidationError
+from app.services.parsers import ParsedItem, get_parser
+
+logger = structlog.get_logger(__name__)
+
+# Multipart boundaries, part headers and the form fields sent alongside an upload
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+@dataclass
+class SpooledUpload:
+    file: BinaryIO
+    filename: str
+    extension: str
+    size: int
+    sha256: str
+
+    def close(self):
+        self.file.close()
+
+def validate_extension(filename: Optional[str]) -> str:
+    """Get a file's extension, rejecting types that cannot be ingested"""
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension not in settings.ALLOWED_FILE_EXTENSIONS:
+        raise ValidationError(
+            f"Unsupported file type '{extension or filename}'",
+            metadata={"allowed_extensions": settings.ALLOWED_FILE_EXTENSIONS}
+        )
+    return extension
+
+def file_too_large() -> PayloadTooLargeError:
+    return PayloadTooLargeError(
+        f"File exceeds the maximum size of {settings.MAX_FILE_SIZE} bytes",
+        metadata={"max_file_size": settings.MAX_FILE_SIZE}
+    )
+
+def limit_request_body(request: Request, max_bytes: int) -> Request:
+    """The request, with its body rejected as soon as more than max_bytes arrive.
+
+    Starlette spools a whole multipart body before the route runs, so the
+    upload limit has to hold while the body is received rather than in
+    the route.
+    """
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > max_bytes:
+        raise file_too_large()
+    received = 0
+
+    async def receive() -> Message:
+        nonlocal received
+        message = await request.receive()
+        if message["type"] == "http.request":
+            received += len(message.get("body", b""))
+            if received > max_bytes:
+                raise file_too_large()
+        return message
+
+    return Request(request.scope, receive)
+
+async def spool_upload(upload: UploadFile) -> SpooledUpload:
+    """Hash an upload Starlette has already spooled, without copying it.
+
+    The request body was size-limited as it arrived (limit_request_body);
+    the file is read in a thread so hashing a large upload does not block
+    the event loop.
+    """
+    extension = validate_extension(upload.filename)
+    file = upload.file
+
+    def measure():
+        digest = hashlib.sha256()
+        size = 0
+        file.seek(0)
+        for data in iter(lambda: file.read(settings.INGEST_READ_CHUNK_SIZE), b""):
+            size += len(data)
+            digest.update(data)
+        file.seek(0)
+        return size, digest.hexdigest()
+
+    size, sha256 = await asyncio.to_thread(measure)
+    if size > settings.MAX_FILE_SIZE:
+        raise file_too_large()
+
+    logger.info("upload_spooled", filename=upload.filename, size=size)
+    return SpooledUpload(
+        file=file,
+        filename=upload.filename or "",
+        extension=extension,
+        size=size,
+        sha256=sha256
+    )
+
+def parse_upload(upload: SpooledUpload) -> Generator[ParsedItem, None, None]:
+    """Stream parsed records and text blocks from a spooled upload"""
+    upload.file.seek(0)
+    return get_parser(upload.extension)(upload.file)
+
+def to_documents(upload: SpooledUpload, items: Iterator[ParsedItem], source: str) -> Iterator[Dict[str, Any]]:
+    """Turn parsed items into search documents with content-addressed ids.
+
+    An id is a hash of the source and the chunk's content, so re-delivered
+    chunks keep their id wherever they appear in the file, and identical
+    chunks within a source collapse into one document.
+    """
+    for item in items:
+        if not item.content.strip():
+            continue
+        yield {
+            "id": hashlib.sha256(f"{source}\0{item.content}".encode("utf-8")).hexdigest()[:32],
+            "title": upload.filename,
+            "content": item.content,
+            "source": source,
+            "metadata": {"type": item.kind, "filename": upload.filename, **item.location},
+        }
+
+def batched(documents: Iterator[Dict[str, Any]], batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Group documents into lists of at most batch_size"""
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,625 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from multiprocessing.managers import SyncManager
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+import structlog
+from fastapi import Request
+
+from app.core.config import settings
+from app.core.exceptions import ValidationError
+from app.services.chunking import Chunker
+from app.services.company_store import CompanyStore
+from app.services.ingestion import (SpooledUpload, batched, parse_upload,
+                                    to_documents)
+from app.services.manifest import IngestionManifest
+from app.services.parsers import ParsedItem
+from app.services.search_client import SearchService
+from app.services.semantic_cache import SemanticCache
+from app.services.spatial_index import AssetStore
+
+logger = structlog.get_logger(__name__)
+
+STAGES = ("parse", "chunk", "embed", "index")
+ACTIVE_STATUSES = ("queued", "running")
+# How often blocked queue operations re-check for cancellation
+POLL_INTERVAL = 0.5
+DATASET_TYPES = ("documents", "companies", "assets")
+# Table rows sent to the company or asset store per message
+TABLE_MESSAGE_ROWS = 5000
+
+@dataclass
+class StageProgress:
+    """Work done by one pipeline stage"""
+    items: int = 0
+    batches: int = 0
+    errors: int = 0
+    seconds: float = 0.0  # time spent working, excluding waits on other stages
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            **asdict(self),
+            "seconds": round(self.seconds, 3),
+            "items_per_second": round(self.items / self.seconds, 1) if self.seconds else 0.0,
+        }
+
+@dataclass
+class IngestionJob:
+    """State of an ingestion job; persisted after every committed batch"""
+    job_id: str
+    user_id: Optional[str]
+    filename: str
+    extension: str
+    source: str
+    path: str
+    size: int
+    sha256: str
+    dataset_type: str = "documents"  # 'companies' and 'assets' also load records into their store
+    status: str = "queued"  # queued, running, completed or failed
+    created_at: str = field(default_factory=lambda: datetime.utcnow().isoformat())
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    attempts: int = 0
+    committed_batches: int = 0
+    total_batches: Optional[int] = None  # known once parsing finishes
+    documents: int = 0  # chunks embedded and upserted
+    skipped: int = 0  # chunks already indexed with the same content
+    deleted: int = 0  # chunks of the source missing from this upload
+    bytes_committed: int = 0
+    records: int = 0  # rows upserted into the company or asset store
+    error: Optional[str] = None
+    stages: Dict[str, StageProgress] = field(default_factory=lambda: {name: StageProgress() for name in STAGES})
+
+    @property
+    def progress(self) -> float:
+        """Percent complete, from committed batches or, while parsing, bytes consumed"""
+        if self.status == "completed":
+            return 100.0
+        if self.total_batches:
+            return round(100 * self.committed_batches / self.total_batches, 1)
+        if not self.size:
+            return 0.0
+        return round(min(99.0, 100 * self.bytes_committed / self.size), 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "IngestionJob":
+        stages = {name: StageProgress(**values) for name, values in data.pop("stages", {}).items()}
+        return cls(**data, stages=stages)
+
+    def to_status(self) -> Dict[str, Any]:
+        """Public view of the job for the status endpoint"""
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "progress": self.progress,
+            "filename": self.filename,
+            "size": self.size,
+            "sha256": self.sha256,
+            "documents": self.documents,
+            "skipped": self.skipped,
+            "deleted": self.deleted,
+            "dataset_type": self.dataset_type,
+            "records": self.records,
+            "committed_batches": self.committed_batches,
+            "total_batches": self.total_batches,
+            "attempts": self.attempts,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "stages": {name: stage.to_dict() for name, stage in self.stages.items()},
+        }
+
+class JobStore:
+    """Durable job state in SQLite, so jobs outlive the worker running them"""
+
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, status TEXT NOT NULL, state TEXT NOT NULL)"
+        )
+        self._connection.commit()
+        self._lock = threading.Lock()
+
+    def save(self, job: IngestionJob):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, status, state) VALUES (?, ?, ?)",
+                (job.job_id, job.status, json.dumps(job.to_dict()))
+            )
+            self._connection.commit()
+
+    def load(self, job_id: str) -> Optional[IngestionJob]:
+        with self._lock:
+            row = self._connection.execute("SELECT state FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return IngestionJob.from_dict(json.loads(row[0])) if row else None
+
+    def load_active(self) -> List[IngestionJob]:
+        """Load jobs that were queued or running when the last worker stopped"""
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT state FROM jobs WHERE status IN ({','.join('?' * len(ACTIVE_STATUSES))})",
+                ACTIVE_STATUSES
+            ).fetchall()
+        return [IngestionJob.from_dict(json.loads(state)) for state, in rows]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+class LocalJobBroker:
+    """In-process stand-in for the Celery / Service Bus task queue"""
+
+    def __init__(self):
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    async def publish(self, job_id: str):
+        await self._queue.put(job_id)
+
+    async def consume(self) -> str:
+        return await self._queue.get()
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+def create_job_broker() -> LocalJobBroker:
+    """Create the broker configured by INGEST_JOB_BROKER"""
+    if settings.INGEST_JOB_BROKER != "local":
+        raise ValueError(f"Unsupported ingestion job broker: {settings.INGEST_JOB_BROKER}")
+    return LocalJobBroker()
+
+def _metered(items: Iterator, counters: Dict[str, float]) -> Iterator:
+    """Count items pulled from an iterator and the time spent producing them"""
+    iterator = iter(items)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            counters["seconds"] += time.perf_counter() - start
+            return
+        counters["seconds"] += time.perf_counter() - start
+        counters["items"] += 1
+        yield item
+
+def _collect_fields(items: Iterator[ParsedItem], rows: List[Dict[str, Any]]) -> Iterator[ParsedItem]:
+    """Pass items through, keeping the fields of records"""
+    for item in items:
+        if item.kind == "record" and item.fields:
+            rows.append(item.fields)
+        yield item
+
+def parse_job_file(
+    path: str,
+    extension: str,
+    filename: str,
+    sha256: str,
+    source: str,
+    batch_size: int,
+    skip_batches: int,
+    messages,
+    cancelled,
+    collect_records: bool = False
+):
+    """Parse and chunk a job's file in a worker process.
+
+    Batches are put on the bounded `messages` queue, so the parser blocks
+    while downstream stages catch up. Batches before `skip_batches` were
+    committed by an earlier attempt and are parsed but not sent. With
+    `collect_records`, the raw record fields are also sent as table rows,
+    including those of skipped batches.
+    """
+    rows: List[Dict[str, Any]] = []
+    parse = {"items": 0, "seconds": 0.0}
+    chunk = {"items": 0, "seconds": 0.0}
+
+    def send(message) -> bool:
+        while not cancelled.is_set():
+            try:
+                messages.put(message, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def take_counts() -> Dict[str, Dict[str, float]]:
+        # Chunk time is measured around parsing, so subtract it
+        counts = {
+            "parse": dict(parse),
+            "chunk": {"items": chunk["items"], "seconds": max(chunk["seconds"] - parse["seconds"], 0.0)},
+        }
+        for counters in (parse, chunk):
+            counters["items"], counters["seconds"] = 0, 0.0
+        return counts
+
+    try:
+        with open(path, "rb") as file:
+            upload = SpooledUpload(file=file, filename=filename, extension=extension, size=0, sha256=sha256)
+            parsed = parse_upload(upload)
+            items = _metered(parsed, parse)
+            if collect_records:
+                items = _collect_fields(items, rows)
+            chunks = Chunker().chunk(items)
+            documents = _metered(to_documents(upload, chunks, source=source), chunk)
+
+            try:
+                total = 0
+                for index, batch in enumerate(batched(documents, batch_size)):
+                    total = index + 1
+                    if len(rows) >= TABLE_MESSAGE_ROWS:
+                        if not send(("table", None, rows, file.tell(), take_counts())):
+                            return
+                        # The message is pickled on put, so the collector's list can be reused
+                        rows.clear()
+                    if index < skip_batches:
+                        take_counts()
+                        continue
+                    if not send(("batch", index, batch, file.tell(), take_counts())):
+                        return
+                if rows and not send(("table", None, rows, file.tell(), take_counts())):
+                    return
+                send(("done", total, None, file.tell(), take_counts()))
+            finally:
+                # Finish the parser while its file is still open
+                parsed.close()
+
+    except Exception as e:
+        send(("error", f"{type(e).__name__}: {e}", None, 0, take_counts()))
+
+class IngestionJobEngine:
+    """Runs ingestion jobs as pipelined parse, chunk, embed and index stages.
+
+    Parsing and chunking run in a process pool and feed a bounded queue;
+    embedding runs on the event loop with a bounded number of batches in
+    flight, and batches are indexed and checkpointed in order. Job state is
+    persisted after each committed batch, so jobs interrupted by a restart
+    are picked up again from their last committed batch, or from the start
+    when the local in-memory indexes went down with the worker.
+
+    Uploads are diffed against the source's manifest: unchanged chunks are
+    skipped, and chunks the upload no longer contains are deleted once the
+    job completes. Records of 'companies' and 'assets' uploads are also
+    upserted into the company or asset store as they are parsed.
+    """
+
+    def __init__(
+        self,
+        search_service: SearchService,
+        semantic_cache: Optional[SemanticCache] = None,
+        company_store: Optional[CompanyStore] = None,
+        asset_store: Optional[AssetStore] = None,
+        job_dir: Optional[str] = None,
+        workers: Optional[int] = None
+    ):
+        self.search_service = search_service
+        self.semantic_cache = semantic_cache
+        # Stores that load the records of each tabular dataset type
+        self.table_stores = {
+            dataset_type: store
+            for dataset_type, store in (("companies", company_store), ("assets", asset_store))
+            if store is not None
+        }
+        self.job_dir = job_dir or settings.INGEST_JOB_DIR or os.path.join(tempfile.gettempdir(), "green-guardian-ingest")
+        self.workers = workers or settings.INGEST_JOB_WORKERS
+        self.broker = create_job_broker()
+        self._store: Optional[JobStore] = None
+        self._manifest: Optional[IngestionManifest] = None
+        self.jobs: Dict[str, IngestionJob] = {}
+
+        self._worker_tasks: List[asyncio.Task] = []
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._manager: Optional[SyncManager] = None
+        self._context = multiprocessing.get_context("spawn")
+        self._source_locks: Dict[str, asyncio.Lock] = {}
+
+    async def start(self):
+        """Open the job store, requeue interrupted jobs and start the workers"""
+        os.makedirs(self.job_dir, exist_ok=True)
+        self._store = JobStore(os.path.join(self.job_dir, "jobs.sqlite3"))
+        # The local indexes live in memory, so their manifest must not outlive them
+        self._manifest = IngestionManifest(
+            os.path.join(self.job_dir, "manifest.sqlite3") if self.index_is_durable else ":memory:"
+        )
+
+        for job in await asyncio.to_thread(self.store.load_active):
+            if not os.path.exists(job.path):
+                job.status, job.error = "failed", "Upload file missing on resume"
+                await asyncio.to_thread(self.store.save, job)
+                continue
+            if not self.index_is_durable:
+                # Batches committed before the restart died with the in-memory indexes
+                job.committed_batches = 0
+                job.documents = job.skipped = job.bytes_committed = 0
+            logger.info("ingestion_job_resumed", job_id=job.job_id, committed_batches=job.committed_batches)
+            job.status = "queued"
+            self.jobs[job.job_id] = job
+            await self.broker.publish(job.job_id)
+
+        self._worker_tasks = [asyncio.create_task(self._run_worker()) for _ in range(self.workers)]
+
+    @property
+    def store(self) -> JobStore:
+        if self._store is None:
+            raise RuntimeError("The job engine has not been started")
+        return self._store
+
+    @property
+    def manifest(self) -> IngestionManifest:
+        if self._manifest is None:
+            raise RuntimeError("The job engine has not been started")
+        return self._manifest
+
+    @property
+    def index_is_durable(self) -> bool:
+        """Whether indexed documents outlive this process: the local indexes are in memory"""
+        return self.search_service.bm25_index is None
+
+    async def submit(
+        self,
+        upload: SpooledUpload,
+        source: str,
+        user_id: Optional[str] = None,
+        dataset_type: str = "documents"
+    ) -> IngestionJob:
+        """Persist an upload and queue it for ingestion"""
+        if dataset_type not in DATASET_TYPES:
+            raise ValidationError(
+                f"Unknown dataset type '{dataset_type}'",
+                metadata={"dataset_types": list(DATASET_TYPES)}
+            )
+        job_id = str(uuid.uuid4())
+        path = os.path.join(self.job_dir, f"{job_id}{upload.extension}")
+
+        def persist():
+            upload.file.seek(0)
+            with open(path, "wb") as destination:
+                shutil.copyfileobj(upload.file, destination, settings.INGEST_READ_CHUNK_SIZE)
+
+        await asyncio.to_thread(persist)
+        job = IngestionJob(
+            job_id=job_id,
+            user_id=user_id,
+            filename=upload.filename,
+            extension=upload.extension,
+            source=source,
+            path=path,
+            size=upload.size,
+            sha256=upload.sha256,
+            dataset_type=dataset_type
+        )
+        self.jobs[job_id] = job
+        await asyncio.to_thread(self.store.save, job)
+        await self.broker.publish(job_id)
+        logger.info("ingestion_job_queued", job_id=job_id, filename=upload.filename, size=upload.size)
+        return job
+
+    async def get_job(self, job_id: str) -> Optional[IngestionJob]:
+        """Get a job, including finished jobs that are only in the store"""
+        job = self.jobs.get(job_id)
+        if job is None and self._store is not None:
+            job = await asyncio.to_thread(self.store.load, job_id)
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        """Get counts of in-memory jobs by status"""
+        statuses: Dict[str, int] = {}
+        for job in self.jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {"jobs": statuses, "pending": self.broker.pending(), "workers": self.workers}
+
+    async def close(self):
+        """Stop the workers; running jobs stay 'running' and resume on next start"""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        if self._pool is not None:
+            # Cancelled parsers notice within POLL_INTERVAL; wait so they never outlive the manager
+            await asyncio.to_thread(self._pool.shutdown, True, cancel_futures=True)
+        if self._manager is not None:
+            self._manager.shutdown()
+        if self._store is not None:
+            self._store.close()
+        if self._manifest is not None:
+            self._manifest.close()
+
+    async def _run_worker(self):
+        while True:
+            job_id = await self.broker.consume()
+            job = self.jobs.get(job_id)
+            if job is None or job.status != "queued":
+                continue
+            try:
+                # Jobs for one source run one at a time, as each diffs against the source's manifest
+                async with self._source_locks.setdefault(job.source, asyncio.Lock()):
+                    await self._run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("ingestion_job_failed", job_id=job.job_id, error=str(e))
+                job.status, job.error = "failed", str(e)
+                await self._finish(job)
+
+    async def _run_job(self, job: IngestionJob):
+        job.status = "running"
+        job.attempts += 1
+        job.started_at = job.started_at or datetime.utcnow().isoformat()
+        job.error = None
+        # The parser sends every table row again on each attempt
+        job.records = 0
+        await asyncio.to_thread(self.store.save, job)
+
+        if self._manager is None:
+            self._manager = await asyncio.to_thread(self._context.Manager)
+            self._pool = ProcessPoolExecutor(max_workers=settings.INGEST_PARSE_PROCESSES, mp_context=self._context)
+
+        messages = self._manager.Queue(maxsize=settings.INGEST_STAGE_QUEUE_SIZE)
+        cancelled = self._manager.Event()
+        parsing = asyncio.get_running_loop().run_in_executor(
+            self._pool,
+            parse_job_file,
+            job.path,
+            job.extension,
+            job.filename,
+            job.sha256,
+            job.source,
+            settings.INGEST_INDEX_BATCH_SIZE,
+            job.committed_batches,
+            messages,
+            cancelled,
+            job.dataset_type in self.table_stores
+        )
+        # Each entry holds a batch and its embedding task; the bound caps batches in flight
+        embedded: asyncio.Queue = asyncio.Queue(maxsize=settings.INGEST_EMBED_CONCURRENCY)
+        feeder = asyncio.create_task(self._feed(job, messages, parsing, embedded))
+
+        try:
+            await self._commit_batches(job, embedded)
+            await feeder
+        finally:
+            cancelled.set()
+            feeder.cancel()
+            while not embedded.empty():
+                entry = embedded.get_nowait()
+                if entry is not None:
+                    entry[-1].cancel()
+
+        stale = await asyncio.to_thread(self.manifest.stale, job.source, job.job_id)
+        if stale:
+            await self.search_service.delete_documents(stale)
+            await asyncio.to_thread(self.manifest.remove, job.source, stale)
+            job.deleted += len(stale)
+
+        job.status = "completed"
+        await self._finish(job)
+        logger.info(
+            "ingestion_job_completed",
+            job_id=job.job_id,
+            documents=job.documents,
+            skipped=job.skipped,
+            deleted=job.deleted,
+            records=job.records,
+            batches=job.committed_batches
+        )
+
+    async def _feed(
+        self,
+        job: IngestionJob,
+        messages,
+        parsing: asyncio.Future,
+        embedded: asyncio.Queue
+    ):
+        """Move parsed batches from the worker process into the embedding stage"""
+        try:
+            while True:
+                try:
+                    kind, value, batch, position, counts = await asyncio.to_thread(messages.get, True, POLL_INTERVAL)
+                except queue.Empty:
+                    if parsing.done():
+                        parsing.result()  # a crashed worker process raises here
+                        raise RuntimeError("Parser exited without finishing")
+                    continue
+
+                for name, values in counts.items():
+                    job.stages[name].items += values["items"]
+                    job.stages[name].seconds += values["seconds"]
+
+                if kind == "batch":
+                    job.stages["parse"].batches += 1
+                    job.stages["chunk"].batches += 1
+                    unchanged = await asyncio.to_thread(self.manifest.unchanged, job.source, [doc["id"] for doc in batch])
+                    changed = [doc for doc in batch if doc["id"] not in unchanged]
+                    await embedded.put((value, batch, changed, position, asyncio.create_task(self._embed(job, changed))))
+                elif kind == "table":
+                    # Upserted as they arrive, so the rows of a large file are never all held here
+                    store = self.table_stores[job.dataset_type]
+                    job.records += await asyncio.to_thread(store.upsert, batch)
+                elif kind == "done":
+                    job.total_batches = value
+                    return
+                else:
+                    job.stages["parse"].errors += 1
+                    raise ValueError(value)
+        finally:
+            await embedded.put(None)
+
+    async def _embed(self, job: IngestionJob, batch: List[Dict[str, Any]]) -> Optional[np.ndarray]:
+        if self.search_service.vector_index is None or not batch:
+            return None
+        start = time.perf_counter()
+        try:
+            vectors = await self.search_service.embed([doc["content"] for doc in batch])
+        except Exception:
+            job.stages["embed"].errors += 1
+            raise
+        stage = job.stages["embed"]
+        stage.items += len(batch)
+        stage.batches += 1
+        stage.seconds += time.perf_counter() - start
+        return vectors
+
+    async def _commit_batches(self, job: IngestionJob, embedded: asyncio.Queue):
+        """Index changed chunks in batch order, checkpointing the job after each batch"""
+        while True:
+            entry = await embedded.get()
+            if entry is None:
+                return
+            index, batch, changed, position, embedding = entry
+            vectors = await embedding
+
+            indexed = 0
+            if changed:
+                start = time.perf_counter()
+                try:
+                    indexed = await self.search_service.index_documents(changed, vectors=vectors)
+                except Exception:
+                    job.stages["index"].errors += 1
+                    raise
+                stage = job.stages["index"]
+                stage.items += indexed
+                stage.batches += 1
+                stage.seconds += time.perf_counter() - start
+
+            seen = [doc["id"] for doc in batch]
+            if indexed < len(changed):
+                # Not indexed here (the Azure index is fed out of band), so the manifest must not claim them
+                changed_ids = {doc["id"] for doc in changed}
+                seen = [doc_id for doc_id in seen if doc_id not in changed_ids]
+            await asyncio.to_thread(self.manifest.mark_seen, job.source, job.job_id, seen)
+
+            job.committed_batches = index + 1
+            job.documents += indexed
+            job.skipped += len(batch) - len(changed)
+            job.bytes_committed = position
+            await asyncio.to_thread(self.store.save, job)
+
+    async def _finish(self, job: IngestionJob):
+        job.finished_at = datetime.utcnow().isoformat()
+        await asyncio.to_thread(self.store.save, job)
+        self.jobs.pop(job.job_id, None)
+        if os.path.exists(job.path):
+            os.remove(job.path)
+
+        # Cached results and answers may cite documents or records this job replaced
+        if job.documents or job.deleted or job.records:
+            await self.search_service.bump_index_version()
+            if self.semantic_cache is not None:
+                self.semantic_cache.invalidate()
+
+def get_ingestion_engine(request: Request) -> IngestionJobEngine:
+    return request.app.state.services.ingestion_engine
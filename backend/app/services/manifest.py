@@ -0,0 +1,66 @@
+import sqlite3
+import threading
+from typing import List, Set
+
+
+class IngestionManifest:
+    """Content-hash manifest of the chunks indexed for each source.
+
+    Chunk ids are hashes of their source and content, so an id already in
+    the manifest is indexed unchanged. Every job marks the chunks it saw;
+    chunks a completed job did not see were dropped from the dataset.
+    """
+
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS manifest ("
+            "source TEXT NOT NULL, chunk_id TEXT NOT NULL, job_id TEXT NOT NULL, "
+            "PRIMARY KEY (source, chunk_id))"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS manifest_job ON manifest (source, job_id)")
+        self._connection.commit()
+        self._lock = threading.Lock()
+
+    def unchanged(self, source: str, chunk_ids: List[str]) -> Set[str]:
+        """Get the chunk ids already indexed for a source"""
+        found: Set[str] = set()
+        with self._lock:
+            for start in range(0, len(chunk_ids), 500):
+                batch = chunk_ids[start:start + 500]
+                rows = self._connection.execute(
+                    f"SELECT chunk_id FROM manifest WHERE source = ? AND chunk_id IN ({','.join('?' * len(batch))})",
+                    [source, *batch]
+                ).fetchall()
+                found.update(chunk_id for chunk_id, in rows)
+        return found
+
+    def mark_seen(self, source: str, job_id: str, chunk_ids: List[str]):
+        """Record chunks as indexed and seen by a job"""
+        with self._lock:
+            self._connection.executemany(
+                "INSERT INTO manifest (source, chunk_id, job_id) VALUES (?, ?, ?) "
+                "ON CONFLICT (source, chunk_id) DO UPDATE SET job_id = excluded.job_id",
+                [(source, chunk_id, job_id) for chunk_id in chunk_ids]
+            )
+            self._connection.commit()
+
+    def stale(self, source: str, job_id: str) -> List[str]:
+        """Get the chunks of a source that a job did not see"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT chunk_id FROM manifest WHERE source = ? AND job_id != ?", (source, job_id)
+            ).fetchall()
+        return [chunk_id for chunk_id, in rows]
+
+    def remove(self, source: str, chunk_ids: List[str]):
+        with self._lock:
+            self._connection.executemany(
+                "DELETE FROM manifest WHERE source = ? AND chunk_id = ?",
+                [(source, chunk_id) for chunk_id in chunk_ids]
+            )
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -1,36 +1,161 @@
 import asyncio
-from typing import List, Dict, Any, Optional, AsyncGenerator
+import hashlib
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Optional, AsyncGenerator, AsyncIterator, Callable, Tuple
+import numpy as np
 import openai
-from openai import AsyncAzureOpenAI
+from fastapi import Request
+import httpx
 import structlog
 from app.core.config import settings
+from app.core.exceptions import RateLimitError
+from app.services.deployment_pool import FIRST_TOKEN, RESPONSE, Deployment, DeploymentPool
+from app.services.rate_governor import RateGovernor, Slot, backoff_delay, retry_after_seconds
 
 logger = structlog.get_logger(__name__)
 
+# Failures worth another attempt; the SDK's own retries are off so the governor sees every 429
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+# Failures that break a stream after it opened: dropped connections, stalls and in-stream errors
+STREAM_BREAK_ERRORS = RETRYABLE_ERRORS + (openai.APIError, httpx.TransportError, asyncio.TimeoutError)
+# Rough characters per token, for quota estimates before the real usage is known
+CHARS_PER_TOKEN = 4
+RESUME_PROMPT = (
+    "Your previous reply was cut off. Continue it from exactly where it stopped, "
+    "without repeating any of it or adding a preamble."
+)
+
+def estimate_prompt_tokens(kwargs: Dict[str, Any]) -> int:
+    """Approximate prompt tokens of a request, with a few tokens of overhead per message"""
+    chars = sum(len(json.dumps(message, default=str)) for message in kwargs["messages"])
+    chars += len(json.dumps(kwargs.get("tools") or kwargs.get("functions") or []))
+    return chars // CHARS_PER_TOKEN + 4 * len(kwargs["messages"])
+
+def request_key(kwargs: Dict[str, Any]) -> str:
+    """Hash of a completion request, with message whitespace normalized"""
+    messages = [
+        {**message, "content": " ".join(message["content"].split())} if isinstance(message.get("content"), str) else message
+        for message in kwargs["messages"]
+    ]
+    payload = json.dumps({**kwargs, "messages": messages}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def throttled_error(retry_after: Optional[float]) -> RateLimitError:
+    """The 429 for a call Azure OpenAI kept throttling through every retry"""
+    return RateLimitError(
+        "Azure OpenAI is throttling requests, try again shortly",
+        metadata={"retry_after": round(max(retry_after or 0.0, 1.0), 1)}
+    )
+
+def continuation_request(kwargs: Dict[str, Any], partial: str) -> Dict[str, Any]:
+    """The request that asks another deployment to finish a reply cut off after partial"""
+    return {
+        **kwargs,
+        "messages": kwargs["messages"] + [
+            {"role": "assistant", "content": partial},
+            {"role": "user", "content": RESUME_PROMPT},
+        ],
+        "max_tokens": max(1, kwargs["max_tokens"] - len(partial) // CHARS_PER_TOKEN),
+    }
+
+class StreamFanout:
+    """One upstream completion stream replayed to every subscriber.
+
+    A pump task reads the upstream deltas into a buffer; subscribers that
+    join late replay the buffer first. When the last subscriber leaves
+    before the end, the upstream request is cancelled and the fanout is
+    marked cancelled, so it is not joined while the cancellation lands.
+    """
+
+    def __init__(self, source: Callable[[], AsyncGenerator[str, None]]):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.cancelled = False
+        self._changed = asyncio.Event()
+        self._task = asyncio.ensure_future(self._pump(source()))
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _pump(self, deltas: AsyncGenerator[str, None]):
+        try:
+            async for delta in deltas:
+                self.chunks.append(delta)
+                self._notify()
+        except Exception as e:
+            logger.error("openai_streaming_failed", error=str(e))
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+            await deltas.aclose()
+
+    def add_done_callback(self, callback: Any):
+        self._task.add_done_callback(callback)
+
+    async def subscribe(self) -> AsyncGenerator[str, None]:
+        self.subscribers += 1
+        try:
+            index = 0
+            while True:
+                if index < len(self.chunks):
+                    index += 1
+                    yield self.chunks[index - 1]
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if not self.subscribers and not self.done:
+                self.cancelled = True
+                self._task.cancel()
+
 class OpenAIService:
-    def __init__(self):
-        self.client = AsyncAzureOpenAI(
-            api_key=settings.AZURE_OPENAI_API_KEY,
-            api_version=settings.AZURE_OPENAI_API_VERSION,
-            azure_endpoint=settings.AZURE_OPENAI_ENDPOINT
-        )
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None, pool: Optional[DeploymentPool] = None):
+        # Chat calls are routed across the pool; embeddings stay on the primary deployment's resource
+        self.pool = pool or DeploymentPool.from_settings(http_client)
+        self.client = self.pool.primary.client
         self.deployment_name = settings.AZURE_OPENAI_DEPLOYMENT_NAME
+        self.embedding_governor = RateGovernor(
+            rpm_limit=settings.AZURE_OPENAI_EMBEDDING_RPM_LIMIT, tpm_limit=settings.AZURE_OPENAI_EMBEDDING_TPM_LIMIT
+        )
+        self._owns_http_client = http_client is None
+        # Identical requests in flight share one upstream call
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._inflight_streams: Dict[str, StreamFanout] = {}
+        self._stats = {
+            "requests": 0, "coalesced": 0, "stream_requests": 0, "stream_coalesced": 0,
+            "failovers": 0, "stream_resumes": 0
+        }
+    
+    async def close(self):
+        """Stop health probes, and release the clients' connection pools if this service created them"""
+        await self.pool.close(close_clients=self._owns_http_client)
         
     async def generate_response(
         self,
-        messages: List[Dict[str, str]],
+        messages: List[Dict[str, Any]],
         system_prompt: Optional[str] = None,
         temperature: float = 0.7,
         max_tokens: int = 1000,
-        functions: Optional[List[Dict]] = None
+        functions: Optional[List[Dict]] = None,
+        tools: Optional[List[Dict]] = None,
+        user: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Generate AI response"""
+        """Generate AI response; with tools, the model may call several of them in one response"""
         try:
             if system_prompt:
                 messages = [{"role": "system", "content": system_prompt}] + messages
             
             kwargs = {
-                "model": self.deployment_name,
                 "messages": messages,
                 "temperature": temperature,
                 "max_tokens": max_tokens,
@@ -39,24 +164,140 @@ class OpenAIService:
             if functions:
                 kwargs["functions"] = functions
                 kwargs["function_call"] = "auto"
+            if tools:
+                kwargs["tools"] = tools
+                kwargs["tool_choice"] = "auto"
             
-            response = await self.client.chat.completions.create(**kwargs)
+            return await self._coalesced_create(kwargs, user)
             
-            result = {
-                "content": response.choices[0].message.content,
-                "function_call": getattr(response.choices[0].message, 'function_call', None),
-                "tokens_used": {
-                    "prompt_tokens": response.usage.prompt_tokens,
-                    "completion_tokens": response.usage.completion_tokens,
-                    "total_tokens": response.usage.total_tokens,
-                }
+        except Exception as e:
+            logger.error("openai_generation_failed", error=str(e))
+            raise
+    
+    async def _coalesced_create(self, kwargs: Dict[str, Any], user: Optional[str]) -> Dict[str, Any]:
+        """Run a completion, or join an identical one already in flight"""
+        self._stats["requests"] += 1
+        if not settings.OPENAI_COALESCE_ENABLED:
+            return await self._create(kwargs, user)
+        
+        key = request_key(kwargs)
+        task = self._inflight.get(key)
+        coalesced = task is not None
+        if task is not None:
+            self._stats["coalesced"] += 1
+        else:
+            task = self._inflight[key] = asyncio.ensure_future(self._create(kwargs, user))
+            task.add_done_callback(lambda done: self._inflight.pop(key, None) if self._inflight.get(key) is done else None)
+        # A caller that goes away does not cancel the call for the others
+        result = await asyncio.shield(task)
+        return {**result, "coalesced": coalesced}
+    
+    @asynccontextmanager
+    async def _admitted(
+        self,
+        kwargs: Dict[str, Any],
+        user: Optional[str],
+        kind: str,
+        avoid: Optional[Deployment] = None
+    ) -> AsyncIterator[Tuple[Deployment, Slot, Any, float]]:
+        """Make an upstream call on the best deployment once its governor admits it.
+        
+        Throttling and transient failures fail over at once to the next
+        best deployment not yet tried; when every deployment has been
+        tried, the call backs off and starts over. Yields the deployment,
+        the governor slot, held until the caller is done with the response,
+        the response, and the perf_counter time the request was sent.
+        A call still throttled after OPENAI_MAX_RETRIES raises the app's
+        RateLimitError with the last Retry-After.
+        """
+        tokens = estimate_prompt_tokens(kwargs) + kwargs["max_tokens"]
+        tried: List[Deployment] = [avoid] if avoid is not None else []
+        attempt = 0
+        while True:
+            # With every deployment out of rotation, keep trying the primary rather than failing outright
+            deployment = self.pool.choose(kind, tokens, exclude=tried) or self.pool.choose(kind, tokens) or self.pool.primary
+            async with deployment.governor.slot(user, tokens) as slot:
+                start = time.perf_counter()
+                try:
+                    response = await deployment.client.chat.completions.create(model=deployment.deployment, **kwargs)
+                except RETRYABLE_ERRORS as e:
+                    self.pool.record_failure(deployment, e)
+                    if isinstance(e, openai.RateLimitError):
+                        slot.throttle(retry_after_seconds(e))
+                    if attempt >= settings.OPENAI_MAX_RETRIES:
+                        if slot.throttled:
+                            raise throttled_error(slot.retry_after) from e
+                        raise
+                    error = type(e).__name__
+                else:
+                    if kind == RESPONSE:
+                        deployment.record_success(RESPONSE, (time.perf_counter() - start) * 1000)
+                    yield deployment, slot, response, start
+                    return
+            tried.append(deployment)
+            attempt += 1
+            if self.pool.choose(kind, tokens, exclude=tried) is not None:
+                self._stats["failovers"] += 1
+                logger.warning("openai_failing_over", attempt=attempt, deployment=deployment.name, error=error)
+                continue
+            tried = []
+            delay = backoff_delay(attempt - 1, slot.retry_after)
+            logger.warning("openai_retrying", attempt=attempt, delay_s=round(delay, 2), error=error)
+            await asyncio.sleep(delay)
+    
+    async def _create(self, kwargs: Dict[str, Any], user: Optional[str]) -> Dict[str, Any]:
+        async with self._admitted(kwargs, user, RESPONSE) as (_, slot, response, _):
+            slot.used(response.usage.total_tokens)
+        
+        result = {
+            "content": response.choices[0].message.content,
+            "function_call": getattr(response.choices[0].message, 'function_call', None),
+            "tool_calls": getattr(response.choices[0].message, 'tool_calls', None),
+            "tokens_used": {
+                "prompt_tokens": response.usage.prompt_tokens,
+                "completion_tokens": response.usage.completion_tokens,
+                "total_tokens": response.usage.total_tokens,
             }
-            
-            logger.info("openai_response_generated", tokens_used=result["tokens_used"]["total_tokens"])
-            return result
+        }
+        
+        logger.info("openai_response_generated", tokens_used=result["tokens_used"]["total_tokens"])
+        return result
+    
+    async def create_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Embed texts with the configured embedding deployment.
+        
+        Calls are admitted by the embedding deployment's own governor and
+        retried with the same jittered backoff as chat calls.
+        """
+        tokens = sum(len(text) for text in texts) // CHARS_PER_TOKEN + len(texts)
+        attempt = 0
+        try:
+            while True:
+                async with self.embedding_governor.slot(None, tokens) as slot:
+                    try:
+                        response = await self.client.embeddings.create(
+                            model=settings.AZURE_OPENAI_EMBEDDING_DEPLOYMENT,
+                            input=texts
+                        )
+                    except RETRYABLE_ERRORS as e:
+                        if isinstance(e, openai.RateLimitError):
+                            slot.throttle(retry_after_seconds(e))
+                        if attempt >= settings.OPENAI_MAX_RETRIES:
+                            if slot.throttled:
+                                raise throttled_error(slot.retry_after) from e
+                            raise
+                        error = type(e).__name__
+                    else:
+                        slot.used(response.usage.total_tokens)
+                        data = sorted(response.data, key=lambda item: item.index)
+                        return np.array([item.embedding for item in data], dtype=np.float32)
+                delay = backoff_delay(attempt, slot.retry_after)
+                attempt += 1
+                logger.warning("openai_embedding_retrying", attempt=attempt, delay_s=round(delay, 2), error=error)
+                await asyncio.sleep(delay)
             
         except Exception as e:
-            logger.error("openai_generation_failed", error=str(e))
+            logger.error("openai_embedding_failed", error=str(e), batch_size=len(texts))
             raise
     
     async def generate_response_stream(
@@ -64,28 +305,98 @@ class OpenAIService:
         messages: List[Dict[str, str]],
         system_prompt: Optional[str] = None,
         temperature: float = 0.7,
-        max_tokens: int = 1000
+        max_tokens: int = 1000,
+        user: Optional[str] = None
     ) -> AsyncGenerator[str, None]:
-        """Generate streaming AI response"""
+        """Generate streaming AI response; identical streams in flight share one upstream stream"""
+        if system_prompt:
+            messages = [{"role": "system", "content": system_prompt}] + messages
+        
+        kwargs = {
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True,
+        }
+        self._stats["stream_requests"] += 1
+        key = request_key(kwargs)
+        fanout = self._inflight_streams.get(key) if settings.OPENAI_COALESCE_ENABLED else None
+        if fanout is not None and not fanout.cancelled:
+            self._stats["stream_coalesced"] += 1
+        else:
+            fanout = StreamFanout(lambda: self._stream_deltas(kwargs, user))
+            if settings.OPENAI_COALESCE_ENABLED:
+                self._inflight_streams[key] = fanout
+                fanout.add_done_callback(
+                    lambda _: self._inflight_streams.pop(key, None) if self._inflight_streams.get(key) is fanout else None
+                )
+        
+        # Closed explicitly, so a caller that stops early leaves the fanout at once rather than when collected
+        subscription = fanout.subscribe()
         try:
-            if system_prompt:
-                messages = [{"role": "system", "content": system_prompt}] + messages
-            
-            stream = await self.client.chat.completions.create(
-                model=self.deployment_name,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                stream=True,
-            )
-            
-            async for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    yield chunk.choices[0].delta.content
-                    
-        except Exception as e:
-            logger.error("openai_streaming_failed", error=str(e))
-            raise
+            async for chunk in subscription:
+                yield chunk
+        finally:
+            await subscription.aclose()
+    
+    async def _stream_deltas(self, kwargs: Dict[str, Any], user: Optional[str]) -> AsyncGenerator[str, None]:
+        """Content deltas of one completion, failing over to another deployment if the stream breaks.
+        
+        A stream that breaks, or stalls for OPENAI_STREAM_IDLE_TIMEOUT_S,
+        before its first token is retried elsewhere unseen. One that breaks
+        later is resumed on another deployment, which is asked to continue
+        the partial reply, when OPENAI_STREAM_RESUME_ENABLED allows it.
+        Each upstream stream holds its governor slot until it ends.
+        """
+        emitted: List[str] = []
+        broken: Optional[Deployment] = None
+        breaks = 0
+        while True:
+            request = continuation_request(kwargs, "".join(emitted)) if emitted else kwargs
+            async with self._admitted(request, user, FIRST_TOKEN, avoid=broken) as (deployment, slot, stream, start):
+                output_chars = 0
+                chunks = stream.__aiter__()
+                try:
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), settings.OPENAI_STREAM_IDLE_TIMEOUT_S)
+                        except StopAsyncIteration:
+                            return
+                        if chunk.choices and chunk.choices[0].delta.content is not None:
+                            delta = chunk.choices[0].delta.content
+                            if not output_chars:
+                                deployment.record_success(FIRST_TOKEN, (time.perf_counter() - start) * 1000)
+                            output_chars += len(delta)
+                            emitted.append(delta)
+                            yield delta
+                except STREAM_BREAK_ERRORS as e:
+                    self.pool.record_failure(deployment, e)
+                    slot.fail()
+                    breaks += 1
+                    if breaks > settings.OPENAI_MAX_RETRIES or (emitted and not settings.OPENAI_STREAM_RESUME_ENABLED):
+                        raise
+                    logger.warning(
+                        "openai_stream_broken", deployment=deployment.name, error=type(e).__name__,
+                        emitted_chars=sum(len(delta) for delta in emitted)
+                    )
+                finally:
+                    # Streams report no usage; charge the prompt estimate and the output seen
+                    slot.used(estimate_prompt_tokens(request) + output_chars // CHARS_PER_TOKEN)
+                    await stream.response.aclose()
+            broken = deployment
+            self._stats["failovers"] += 1
+            if emitted:
+                self._stats["stream_resumes"] += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """Request, coalescing and failover counters, and each deployment's latency, health and governor"""
+        return {
+            **self._stats,
+            "inflight": len(self._inflight),
+            "inflight_streams": len(self._inflight_streams),
+            "deployments": self.pool.stats(),
+            "embedding_governor": self.embedding_governor.stats(),
+        }
 
-def get_openai_service() -> OpenAIService:
-    return OpenAIService()
+def get_openai_service(request: Request) -> OpenAIService:
+    return request.app.state.services.openai_service
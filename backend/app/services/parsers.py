@@ -0,0 +1,311 @@
+import codecs
+import csv
+import io
+import json
+import re
+from dataclasses import dataclass
+from typing import (Any, BinaryIO, Callable, Dict, Generator, Iterator, List,
+                    Optional)
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+# Upper bound on a single text item; longer paragraphs are split
+MAX_TEXT_ITEM_CHARS = 4000
+READ_CHUNK_SIZE = 64 * 1024
+
+@dataclass
+class ParsedItem:
+    """One unit yielded by a parser: a tabular record or a block of text"""
+    kind: str  # 'record' or 'text'
+    content: str
+    location: Dict[str, Any]
+    fields: Optional[Dict[str, Any]] = None
+
+def record_to_text(fields: Dict[str, Any]) -> str:
+    """Render a record as `column: value` lines"""
+    return "\n".join(f"{key}: {value}" for key, value in fields.items() if value not in (None, ""))
+
+def parse_csv(file: BinaryIO) -> Generator[ParsedItem, None, None]:
+    """Stream CSV rows as records"""
+    text_stream = io.TextIOWrapper(file, encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        for row_number, row in enumerate(csv.DictReader(text_stream), start=1):
+            row.pop(None, None)  # values beyond the header
+            yield ParsedItem(kind="record", content=record_to_text(row), location={"row": row_number}, fields=row)
+    finally:
+        # Leave the underlying file open for the caller
+        text_stream.detach()
+
+def parse_json(file: BinaryIO) -> Generator[ParsedItem, None, None]:
+    """Stream records from a JSON array, JSON Lines or JSON objects.
+
+    Elements of a top-level array, lines, and the `features` of a GeoJSON
+    FeatureCollection are decoded one at a time, so only the current
+    element is held in memory. Any other top-level object is one record.
+    """
+    stream = _JsonStream(file)
+    index = 0
+    started = False
+
+    def record(value: Any) -> ParsedItem:
+        nonlocal index
+        index += 1
+        fields = value if isinstance(value, dict) else {"value": value}
+        return ParsedItem(
+            kind="record",
+            content=record_to_text(fields) if isinstance(value, dict) else json.dumps(value),
+            location={"index": index},
+            fields=fields
+        )
+
+    while True:
+        stream.skip(_SEPARATORS)
+        char = stream.peek()
+        if char is None:
+            return
+        if char == "[" and not started:
+            stream.position += 1
+            for value in stream.elements():
+                yield record(value)
+        elif char == "{":
+            fields = {}
+            streamed = False
+            for key in stream.members():
+                if key == "features" and stream.peek() == "[":
+                    stream.position += 1
+                    for value in stream.elements():
+                        yield record(value)
+                    streamed = True
+                else:
+                    fields[key] = stream.value()
+            if not streamed:
+                yield record(fields)
+        elif char == "]":
+            stream.position += 1
+        else:
+            yield record(stream.value())
+        started = True
+
+# What the JSON scanner skips between values, and between a key and its value
+_SEPARATORS = re.compile(r"[\s,]*")
+_COLON = re.compile(r"[\s:]*")
+_STRUCTURE = re.compile(r'[\[\]{}"]')
+_STRING_END = re.compile(r'["\\]')
+_SCALAR_END = re.compile(r"[\s,\]}]")
+
+class _JsonStream:
+    """Incremental scanner over a JSON text.
+
+    Values are located by searching for brackets and quotes from where the
+    previous read stopped, then decoded once with the json module, so
+    parsing stays linear in the file size however large a value is.
+    """
+
+    def __init__(self, file: BinaryIO):
+        self.file = file
+        self.text_decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def peek(self) -> Optional[str]:
+        """The next character, or None at the end of the file"""
+        while self.position >= len(self.buffer):
+            if self._more(0) is None:
+                return None
+        return self.buffer[self.position]
+
+    def skip(self, pattern: "re.Pattern[str]"):
+        while True:
+            match = pattern.match(self.buffer, self.position)
+            if match is not None:
+                self.position = match.end()
+            if self.position < len(self.buffer) or self._more(0) is None:
+                return
+
+    def value(self) -> Any:
+        """Decode the value at the current position"""
+        if self.peek() is None:
+            raise json.JSONDecodeError("Expecting value", self.buffer, self.position)
+        try:
+            value, end = self.decoder.raw_decode(self.buffer, self.position)
+        except json.JSONDecodeError:
+            pass
+        else:
+            # Only trust a value once its delimiter is buffered; "3." may be a truncated "3.5"
+            if end < len(self.buffer) or self.eof:
+                self.position = end
+                return value
+
+        # The value runs past the buffer: find its end before decoding it again
+        offset = self.position
+        if self.buffer[offset] in '[{"':
+            depth = 0
+            in_string = False
+            while True:
+                match = (_STRING_END if in_string else _STRUCTURE).search(self.buffer, offset)
+                if match is None or (match.group() == "\\" and match.end() >= len(self.buffer)):
+                    more = self._more(match.start() if match else len(self.buffer))
+                    if more is None:
+                        raise json.JSONDecodeError("Unterminated value", self.buffer, self.position)
+                    offset = more
+                    continue
+                char, offset = match.group(), match.end()
+                if in_string:
+                    if char == "\\":
+                        offset += 1
+                        continue
+                    in_string = False
+                    if depth == 0:
+                        break
+                elif char == '"':
+                    in_string = True
+                elif char in "[{":
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        break
+        else:
+            while _SCALAR_END.search(self.buffer, offset) is None:
+                more = self._more(len(self.buffer))
+                if more is None:
+                    break
+                offset = more
+
+        value, self.position = self.decoder.raw_decode(self.buffer, self.position)
+        return value
+
+    def elements(self) -> Iterator[Any]:
+        """Decode the elements of an array whose opening bracket was consumed"""
+        while True:
+            self.skip(_SEPARATORS)
+            char = self.peek()
+            if char is None:
+                raise json.JSONDecodeError("Unterminated array", self.buffer, self.position)
+            if char == "]":
+                self.position += 1
+                return
+            yield self.value()
+
+    def members(self) -> Iterator[str]:
+        """Walk an object's keys, leaving each value for the caller to consume"""
+        self.position += 1
+        while True:
+            self.skip(_SEPARATORS)
+            char = self.peek()
+            if char is None:
+                raise json.JSONDecodeError("Unterminated object", self.buffer, self.position)
+            if char == "}":
+                self.position += 1
+                return
+            key = self.value()
+            if not isinstance(key, str):
+                raise json.JSONDecodeError("Expecting property name", self.buffer, self.position)
+            self.skip(_COLON)
+            yield key
+
+    def _more(self, offset: int) -> Optional[int]:
+        # Read more text, dropping what was consumed. Returns offset rebased onto
+        # the new buffer, or None at the end of the file. Reads grow with the
+        # value being scanned, so a large value is not re-copied for every chunk.
+        if self.eof:
+            return None
+        data = self.file.read(max(READ_CHUNK_SIZE, len(self.buffer) - self.position))
+        self.eof = not data
+        self.buffer = self.buffer[self.position:] + self.text_decoder.decode(data, final=self.eof)
+        offset -= self.position
+        self.position = 0
+        return offset
+
+def parse_text(file: BinaryIO) -> Generator[ParsedItem, None, None]:
+    """Stream paragraphs of a text file"""
+    text_stream = io.TextIOWrapper(file, encoding="utf-8-sig", errors="replace")
+    paragraph: List[str] = []
+    size = 0
+    start_line = 1
+
+    try:
+        for line_number, line in enumerate(text_stream, start=1):
+            if not line.strip():
+                if paragraph:
+                    yield from _text_items("".join(paragraph), {"line": start_line})
+                    paragraph, size = [], 0
+                start_line = line_number + 1
+                continue
+            paragraph.append(line)
+            size += len(line)
+            if size >= MAX_TEXT_ITEM_CHARS:
+                yield from _text_items("".join(paragraph), {"line": start_line})
+                paragraph, size = [], 0
+                start_line = line_number + 1
+
+        if paragraph:
+            yield from _text_items("".join(paragraph), {"line": start_line})
+    finally:
+        text_stream.detach()
+
+def parse_xlsx(file: BinaryIO) -> Generator[ParsedItem, None, None]:
+    """Stream worksheet rows as records, using the first row of each sheet as header"""
+    try:
+        from openpyxl import load_workbook  # type: ignore[import-untyped]
+    except ImportError:
+        raise RuntimeError("openpyxl is required to ingest .xlsx files")
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                continue
+            columns = [str(name) if name is not None else f"column_{i + 1}" for i, name in enumerate(header)]
+            for row_number, values in enumerate(rows, start=2):
+                if all(value is None for value in values):
+                    continue
+                fields = dict(zip(columns, values))
+                yield ParsedItem(
+                    kind="record",
+                    content=record_to_text(fields),
+                    location={"sheet": sheet.title, "row": row_number},
+                    fields=fields
+                )
+    finally:
+        workbook.close()
+
+def parse_pdf(file: BinaryIO) -> Generator[ParsedItem, None, None]:
+    """Stream the text of a PDF page by page"""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise RuntimeError("pypdf is required to ingest .pdf files")
+
+    reader = PdfReader(file)
+    for page_number, page in enumerate(reader.pages, start=1):
+        text = page.extract_text() or ""
+        for paragraph in text.split("\n\n"):
+            if paragraph.strip():
+                yield from _text_items(paragraph, {"page": page_number})
+
+def _text_items(text: str, location: Dict[str, Any]) -> Iterator[ParsedItem]:
+    text = text.strip()
+    for start in range(0, len(text), MAX_TEXT_ITEM_CHARS):
+        yield ParsedItem(kind="text", content=text[start:start + MAX_TEXT_ITEM_CHARS], location=location)
+
+PARSERS: Dict[str, Callable[[BinaryIO], Generator[ParsedItem, None, None]]] = {
+    ".csv": parse_csv,
+    ".json": parse_json,
+    ".txt": parse_text,
+    ".xlsx": parse_xlsx,
+    ".pdf": parse_pdf,
+}
+
+def get_parser(extension: str) -> Callable[[BinaryIO], Generator[ParsedItem, None, None]]:
+    """Get the streaming parser for a file extension"""
+    parser = PARSERS.get(extension.lower())
+    if parser is None:
+        raise ValueError(f"No parser for {extension} files")
+    return parser
@@ -0,0 +1,361 @@
+import json
+import math
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import structlog
+
+from app.core.config import settings
+from app.services.spatial_index import KM_PER_DEGREE, BBox
+
+logger = structlog.get_logger(__name__)
+
+# Tiled file layout: magic, header length, JSON header, tile index, then tiles.
+# Sections and tiles start on ALIGNMENT boundaries so raw tiles view cleanly.
+MAGIC = b"GGTILES1"
+ALIGNMENT = 64
+# Tile codecs in the index; empty tiles hold only the fill value and take no space
+TILE_EMPTY, TILE_RAW, TILE_ZLIB = 0, 1, 2
+# Rows of cells rasterized at a time for zonal statistics
+ZONAL_BLOCK_ROWS = 1024
+
+def aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+class TileCache:
+    """Thread-safe LRU of decoded tiles, bounded by bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._tiles: "OrderedDict[Tuple[int, int], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key: Tuple[int, int]) -> Optional[np.ndarray]:
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is None:
+                self._stats["misses"] += 1
+                return None
+            self._tiles.move_to_end(key)
+            self._stats["hits"] += 1
+            return tile
+
+    def put(self, key: Tuple[int, int], tile: np.ndarray):
+        with self._lock:
+            if key in self._tiles or tile.nbytes > self.max_bytes:
+                return
+            self._tiles[key] = tile
+            self.bytes += tile.nbytes
+            while self.bytes > self.max_bytes:
+                _, evicted = self._tiles.popitem(last=False)
+                self.bytes -= evicted.nbytes
+                self._stats["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "tiles": len(self._tiles), "bytes": self.bytes}
+
+class GridRaster:
+    """A north-up lon/lat grid of cells.
+
+    `west`, `north` and `cell_degrees` place the grid, `scale` converts
+    stored values to fractions of the cell, and cells equal to `nodata`
+    have no coverage. `name`, `version` and `source` are reported as lineage.
+    """
+
+    path: str
+    shape: Tuple[int, int]
+    dtype: np.dtype
+
+    def _georeference(self, meta: Dict[str, Any]):
+        self.meta = meta
+        self.west = float(meta["west"])
+        self.north = float(meta["north"])
+        self.cell_degrees = float(meta["cell_degrees"])
+        self.scale = float(meta.get("scale", 1.0))
+        self.nodata = meta.get("nodata")
+        stat = os.stat(self.path)
+        self.fingerprint = (self.path, stat.st_size, stat.st_mtime_ns)
+
+    def window(self, top: int, bottom: int, left: int, right: int) -> np.ndarray:
+        """Stored values of a window of cells; multiply by `scale` for fractions"""
+        raise NotImplementedError
+
+    def missing(self, values: np.ndarray) -> Optional[np.ndarray]:
+        """Mask of cells without coverage, or None when every cell is covered"""
+        missing = np.isnan(values) if values.dtype.kind == "f" else None
+        if self.nodata is not None:
+            nodata = values == self.nodata
+            missing = nodata if missing is None else missing | nodata
+        return missing if missing is not None and missing.any() else None
+
+    def row_km2(self, top: int, bottom: int) -> np.ndarray:
+        """Area of one cell in each row; it shrinks with the cosine of latitude"""
+        latitudes = self.north - (np.arange(top, bottom) + 0.5) * self.cell_degrees
+        return (self.cell_degrees * KM_PER_DEGREE) ** 2 * np.cos(np.radians(latitudes))
+
+    def cell_window(self, bbox: BBox) -> Optional[Tuple[int, int, int, int]]:
+        """Cells (top, bottom, left, right, ends exclusive) whose centers may fall in bbox"""
+        min_lon, min_lat, max_lon, max_lat = bbox
+        height, width = self.shape
+        top = max(math.floor((self.north - max_lat) / self.cell_degrees), 0)
+        bottom = min(math.ceil((self.north - min_lat) / self.cell_degrees), height)
+        left = max(math.floor((min_lon - self.west) / self.cell_degrees), 0)
+        right = min(math.ceil((max_lon - self.west) / self.cell_degrees), width)
+        return (top, bottom, left, right) if top < bottom and left < right else None
+
+    def zonal_stats(self, ring: np.ndarray) -> Dict[str, Any]:
+        """Area-weighted statistics of the cells whose centers fall inside a polygon ring"""
+        cells, covered_cells = 0, 0
+        area = covered_area = weighted = 0.0
+        low, high = math.inf, -math.inf
+
+        window = self.cell_window((ring[:, 0].min(), ring[:, 1].min(), ring[:, 0].max(), ring[:, 1].max()))
+        if window is not None:
+            top, bottom, left, right = window
+            for block_top in range(top, bottom, ZONAL_BLOCK_ROWS):
+                block_bottom = min(block_top + ZONAL_BLOCK_ROWS, bottom)
+                inside = self._rasterize(ring, block_top, block_bottom, left, right)
+                if not inside.any():
+                    continue
+                values = self.window(block_top, block_bottom, left, right)
+                covered = inside.copy()
+                missing = self.missing(values)
+                if missing is not None:
+                    covered &= ~missing
+                row_km2 = np.broadcast_to(self.row_km2(block_top, block_bottom)[:, None], inside.shape)
+
+                cells += int(inside.sum())
+                covered_cells += int(covered.sum())
+                area += float(row_km2[inside].sum())
+                if covered.any():
+                    scaled = values[covered].astype(np.float64) * self.scale
+                    covered_area += float(row_km2[covered].sum())
+                    weighted += float((scaled * row_km2[covered]).sum())
+                    low, high = min(low, float(scaled.min())), max(high, float(scaled.max()))
+
+        return {
+            "cells": cells,
+            "cells_covered": covered_cells,
+            "area_km2": round(area, 4),
+            "covered_km2": round(covered_area, 4),
+            "sum_km2": round(weighted, 4),
+            "mean": round(weighted / covered_area, 6) if covered_area > 0 else None,
+            "min": round(low, 6) if covered_cells else None,
+            "max": round(high, 6) if covered_cells else None,
+        }
+
+    def _rasterize(self, ring: np.ndarray, top: int, bottom: int, left: int, right: int) -> np.ndarray:
+        """Mask of cell centers inside the ring, by even-odd scanlines over each row"""
+        latitudes = (self.north - (np.arange(top, bottom) + 0.5) * self.cell_degrees)[:, None]
+        x1, y1 = ring[:, 0], ring[:, 1]
+        x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+        crosses = (y1 > latitudes) != (y2 > latitudes)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            xs = np.where(crosses, x1 + (latitudes - y1) * (x2 - x1) / (y2 - y1), np.inf)
+        xs.sort(axis=1)
+
+        # Consecutive crossings bound spans of columns whose centers lie between them
+        columns = np.ceil((xs - self.west) / self.cell_degrees - 0.5) - left
+        pairs = columns.shape[1] // 2 * 2
+        starts, ends = columns[:, 0:pairs:2], columns[:, 1:pairs:2]
+        spans = np.isfinite(ends)
+        rows = np.broadcast_to(np.arange(bottom - top)[:, None], spans.shape)[spans]
+        width = right - left
+        starts = np.clip(starts[spans], 0, width).astype(np.int64)
+        ends = np.clip(ends[spans], 0, width).astype(np.int64)
+
+        edges = np.zeros((bottom - top, width + 1), dtype=np.int32)
+        np.add.at(edges, (rows, starts), 1)
+        np.add.at(edges, (rows, ends), -1)
+        return np.cumsum(edges[:, :width], axis=1) > 0
+
+    def lineage(self) -> Dict[str, Any]:
+        return {
+            "dataset": self.meta.get("name", os.path.basename(self.path)),
+            "version": self.meta.get("version"),
+            "source": self.meta.get("source"),
+            "cell_degrees": self.cell_degrees,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {"path": self.path, "shape": list(self.shape), "dtype": self.dtype.str}
+
+class NpyRaster(GridRaster):
+    """A grid memory-mapped from a .npy file, with its metadata in a .json file of the same name"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data = np.load(path, mmap_mode="r")
+        if self.data.ndim != 2:
+            raise ValueError(f"Expected a 2-D grid in {path}")
+        self.shape = self.data.shape
+        self.dtype = self.data.dtype
+        with open(f"{os.path.splitext(path)[0]}.json") as meta_file:
+            self._georeference(json.load(meta_file))
+
+    def window(self, top: int, bottom: int, left: int, right: int) -> np.ndarray:
+        return np.asarray(self.data[top:bottom, left:right])
+
+class TiledRaster(GridRaster):
+    """A grid stored as fixed-size square tiles in one memory-mapped file.
+
+    Raw tiles are zero-copy views of the mapping, so the page cache decides
+    what stays in memory. Compressed tiles are decoded on first use and
+    kept in an LRU bounded by RASTER_TILE_CACHE_MB. Tiles holding only the
+    fill value take no space on disk.
+    """
+
+    def __init__(self, path: str, cache_bytes: Optional[int] = None):
+        self.path = path
+        self.buffer = np.memmap(path, dtype=np.uint8, mode="r").view(np.ndarray)
+        if bytes(self.buffer[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a tiled raster")
+        header_length = int(self.buffer[len(MAGIC):len(MAGIC) + 8].view("<u8")[0])
+        header_start = len(MAGIC) + 8
+        header = json.loads(bytes(self.buffer[header_start:header_start + header_length]))
+
+        self.shape = (int(header["height"]), int(header["width"]))
+        self.dtype = np.dtype(header["dtype"])
+        self.tile_size = int(header["tile_size"])
+        self.tile_grid = (-(-self.shape[0] // self.tile_size), -(-self.shape[1] // self.tile_size))
+        index_start = aligned(header_start + header_length)
+        index_length = self.tile_grid[0] * self.tile_grid[1] * 3 * 8
+        # offset, length and codec of each tile, row-major
+        self.index = self.buffer[index_start:index_start + index_length].view("<i8").reshape(-1, 3)
+        self._georeference(header["meta"])
+
+        fill = self.nodata if self.nodata is not None else (np.nan if self.dtype.kind == "f" else 0)
+        self._fill_tile = np.full((self.tile_size, self.tile_size), fill, dtype=self.dtype)
+        self._fill_tile.flags.writeable = False
+        if cache_bytes is None:
+            cache_bytes = settings.RASTER_TILE_CACHE_MB * 1024 * 1024
+        self.cache = TileCache(cache_bytes)
+
+    def tile(self, tile_row: int, tile_col: int) -> np.ndarray:
+        """One full tile, padded with the fill value past the raster's edges"""
+        offset, length, codec = self.index[tile_row * self.tile_grid[1] + tile_col].tolist()
+        if codec == TILE_EMPTY:
+            return self._fill_tile
+        if codec == TILE_RAW:
+            return self.buffer[offset:offset + length].view(self.dtype).reshape(self.tile_size, self.tile_size)
+
+        key = (tile_row, tile_col)
+        tile = self.cache.get(key)
+        if tile is None:
+            raw = zlib.decompress(self.buffer[offset:offset + length].tobytes())
+            tile = np.frombuffer(raw, dtype=self.dtype).reshape(self.tile_size, self.tile_size)
+            self.cache.put(key, tile)
+        return tile
+
+    def window(self, top: int, bottom: int, left: int, right: int) -> np.ndarray:
+        """Cells of a window; a view when it lies inside one tile, otherwise assembled from tiles"""
+        height, width = self.shape
+        if not (0 <= top <= bottom <= height and 0 <= left <= right <= width):
+            raise ValueError(f"Window [{top}:{bottom}, {left}:{right}] is outside the {height}x{width} raster")
+        size = self.tile_size
+        if bottom - top and right - left and top // size == (bottom - 1) // size and left // size == (right - 1) // size:
+            tile = self.tile(top // size, left // size)
+            row, col = top // size * size, left // size * size
+            return tile[top - row:bottom - row, left - col:right - col]
+
+        values = np.empty((bottom - top, right - left), dtype=self.dtype)
+        for tile_row in range(top // size, -(-bottom // size)):
+            row = tile_row * size
+            rows = slice(max(top, row), min(bottom, row + size))
+            for tile_col in range(left // size, -(-right // size)):
+                col = tile_col * size
+                cols = slice(max(left, col), min(right, col + size))
+                values[rows.start - top:rows.stop - top, cols.start - left:cols.stop - left] = (
+                    self.tile(tile_row, tile_col)[rows.start - row:rows.stop - row, cols.start - col:cols.stop - col]
+                )
+        return values
+
+    def stats(self) -> Dict[str, Any]:
+        codecs = np.bincount(np.asarray(self.index[:, 2]), minlength=3)
+        return {
+            **super().stats(),
+            "tile_size": self.tile_size,
+            "tiles": {"empty": int(codecs[TILE_EMPTY]), "raw": int(codecs[TILE_RAW]), "zlib": int(codecs[TILE_ZLIB])},
+            "file_bytes": int(self.buffer.size),
+            "cache": self.cache.stats(),
+        }
+
+def write_tiled_raster(
+    path: str,
+    data: np.ndarray,
+    meta: Dict[str, Any],
+    tile_size: int = 256,
+    compression: Optional[str] = "zlib",
+    level: int = 6
+):
+    """Write a 2-D grid (an array or memmap) as a tiled raster, replacing the file at path.
+
+    The grid is read one band of tiles at a time. With zlib compression a
+    tile is stored raw when compressing does not save at least an eighth.
+    """
+    if data.ndim != 2:
+        raise ValueError("Expected a 2-D grid")
+    if compression not in (None, "zlib"):
+        raise ValueError(f"Unsupported compression '{compression}'")
+    height, width = data.shape
+    dtype = data.dtype.newbyteorder("<") if data.dtype.itemsize > 1 else data.dtype
+    nodata = meta.get("nodata")
+    fill = nodata if nodata is not None else (np.nan if dtype.kind == "f" else 0)
+    tile_grid = (-(-height // tile_size), -(-width // tile_size))
+
+    header = json.dumps({
+        "height": height,
+        "width": width,
+        "dtype": dtype.str,
+        "tile_size": tile_size,
+        "compression": compression,
+        "meta": meta,
+    }).encode()
+    index = np.zeros((tile_grid[0] * tile_grid[1], 3), dtype="<i8")
+    staging = f"{path}.new"
+    with open(staging, "wb") as output:
+        output.write(MAGIC)
+        output.write(np.array([len(header)], dtype="<u8").tobytes())
+        output.write(header)
+        index_start = aligned(output.tell())
+        output.seek(index_start)
+        output.write(index.tobytes())
+
+        for tile_row in range(tile_grid[0]):
+            band = np.asarray(data[tile_row * tile_size:(tile_row + 1) * tile_size], dtype=dtype)
+            for tile_col in range(tile_grid[1]):
+                tile = band[:, tile_col * tile_size:(tile_col + 1) * tile_size]
+                if tile.shape != (tile_size, tile_size):
+                    padded = np.full((tile_size, tile_size), fill, dtype=dtype)
+                    padded[:tile.shape[0], :tile.shape[1]] = tile
+                    tile = padded
+                empty = np.isnan(tile).all() if isinstance(fill, float) and math.isnan(fill) else (tile == fill).all()
+                if empty:
+                    continue
+
+                payload, codec = np.ascontiguousarray(tile).tobytes(), TILE_RAW
+                if compression == "zlib":
+                    packed = zlib.compress(payload, level)
+                    if len(packed) <= len(payload) * 7 // 8:
+                        payload, codec = packed, TILE_ZLIB
+                offset = aligned(output.tell())
+                output.seek(offset)
+                output.write(payload)
+                index[tile_row * tile_grid[1] + tile_col] = (offset, len(payload), codec)
+
+        output.seek(index_start)
+        output.write(index.tobytes())
+    os.replace(staging, path)
+    logger.info("tiled_raster_written", path=path, shape=[height, width], tiles=len(index), stored=int((index[:, 2] != TILE_EMPTY).sum()))
+
+def open_raster(path: str) -> GridRaster:
+    """Open a tiled raster, or a .npy grid with a .json sidecar"""
+    with open(path, "rb") as raster_file:
+        magic = raster_file.read(len(MAGIC))
+    return TiledRaster(path) if magic == MAGIC else NpyRaster(path)
@@ -0,0 +1,254 @@
+import asyncio
+import random
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import structlog
+
+from app.core.config import settings
+from app.core.exceptions import RateLimitError
+
+logger = structlog.get_logger(__name__)
+
+# Throttling within this many seconds of the last cut counts as the same congestion event
+DECREASE_COOLDOWN_S = 2.0
+# Queue key for calls made outside a user's request, such as history folding
+BACKGROUND_USER = "_background"
+
+class TokenBucket:
+    """Per-minute quota refilled continuously; a limit of 0 leaves it unmetered.
+
+    Azure enforces quotas over short windows rather than whole minutes,
+    so the bucket holds only window_seconds worth of quota.
+    """
+
+    def __init__(self, per_minute: int, window_seconds: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = self.rate * (window_seconds or settings.OPENAI_QUOTA_WINDOW_S)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount is available"""
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float, now: float):
+        if self.capacity:
+            self._refill(now)
+            self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount: float, now: float):
+        """Return an over-estimate, or with a negative amount charge an under-estimate"""
+        if self.capacity:
+            self._refill(now)
+            self.level = min(self.capacity, self.level + amount)
+
+    def remaining(self) -> Optional[float]:
+        if not self.capacity:
+            return None
+        self._refill(time.monotonic())
+        return int(max(0.0, self.level))
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After"""
+    delay = random.uniform(0, min(settings.OPENAI_BACKOFF_MAX_S, settings.OPENAI_BACKOFF_BASE_S * 2 ** attempt))
+    return max(delay, retry_after or 0.0)
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Retry-After of a throttled response, in seconds"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return max(0.0, float(value) * scale)
+            except ValueError:
+                continue
+    return None
+
+class Slot:
+    """A granted call; report actual token use, throttling or failure before it is released.
+
+    Only a call that reports its token use and did not fail counts as a
+    success; one released without either is neutral to the limit.
+    """
+
+    def __init__(self, reserved_tokens: int):
+        self.reserved_tokens = reserved_tokens
+        self.used_tokens: Optional[int] = None
+        self.throttled = False
+        self.failed = False
+        self.retry_after: Optional[float] = None
+
+    def used(self, tokens: int):
+        self.used_tokens = tokens
+
+    def fail(self):
+        self.failed = True
+
+    def throttle(self, retry_after: Optional[float]):
+        self.throttled = True
+        self.retry_after = retry_after
+
+class RateGovernor:
+    """Client-side admission control for one Azure OpenAI deployment.
+
+    Calls wait in per-user FIFO queues served round-robin, so one user's
+    burst cannot starve the others. A call is admitted when a request and
+    its estimated tokens fit the RPM and TPM buckets and fewer than the
+    concurrency limit are in flight. The limit follows AIMD: it halves on
+    throttling (once per congestion event) and grows by about one per
+    limit's worth of successful calls. A Retry-After from the server
+    pauses all admissions until it passes.
+    """
+
+    def __init__(
+        self,
+        rpm_limit: Optional[int] = None,
+        tpm_limit: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        min_concurrency: Optional[int] = None
+    ):
+        self.requests = TokenBucket(settings.AZURE_OPENAI_RPM_LIMIT if rpm_limit is None else rpm_limit)
+        self.tokens = TokenBucket(settings.AZURE_OPENAI_TPM_LIMIT if tpm_limit is None else tpm_limit)
+        self.max_concurrency = max_concurrency or settings.OPENAI_MAX_CONCURRENCY
+        self.min_concurrency = min_concurrency or settings.OPENAI_MIN_CONCURRENCY
+        self.limit = float(self.max_concurrency)
+        self.inflight = 0
+        # user -> waiting (future, tokens); insertion order is the round-robin order
+        self._queues: "OrderedDict[str, Deque[Tuple[asyncio.Future, int]]]" = OrderedDict()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._stats = {"admitted": 0, "throttled": 0, "queue_timeouts": 0, "wait_ms_total": 0.0}
+
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def admission_delay(self, tokens: int, now: float) -> float:
+        """Seconds until the quota, and any Retry-After pause, would admit a call of this size"""
+        return max(
+            self._paused_until - now,
+            self.requests.wait_time(1, now),
+            self.tokens.wait_time(tokens, now)
+        )
+
+    @asynccontextmanager
+    async def slot(self, user: Optional[str], tokens: int):
+        """Wait for admission, yield a Slot, and release it with what the call reported"""
+        await self.acquire(user, tokens)
+        slot = Slot(tokens)
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+    async def acquire(self, user: Optional[str], tokens: int):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        queue = self._queues.setdefault(user or BACKGROUND_USER, deque())
+        queue.append((future, tokens))
+        start = time.monotonic()
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), settings.OPENAI_QUEUE_TIMEOUT_S)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # Admitted as the wait ended; hand the slot back unused
+                self._unadmit(tokens)
+            else:
+                future.cancel()
+                self._dispatch()
+            if isinstance(e, asyncio.TimeoutError):
+                self._stats["queue_timeouts"] += 1
+                raise RateLimitError(
+                    "Azure OpenAI capacity is saturated, try again shortly",
+                    metadata={"retry_after": round(max(self._paused_until - time.monotonic(), 1.0), 1)}
+                )
+            raise
+        self._stats["wait_ms_total"] += (time.monotonic() - start) * 1000
+
+    def release(self, slot: Slot):
+        now = time.monotonic()
+        self.inflight -= 1
+        if slot.used_tokens is not None:
+            self.tokens.give_back(slot.reserved_tokens - slot.used_tokens, now)
+        if slot.throttled:
+            self._stats["throttled"] += 1
+            if now - self._last_decrease >= DECREASE_COOLDOWN_S:
+                self.limit = max(float(self.min_concurrency), self.limit / 2)
+                self._last_decrease = now
+                logger.warning("openai_throttled", concurrency_limit=int(self.limit), retry_after=slot.retry_after)
+            if slot.retry_after:
+                self._paused_until = max(self._paused_until, now + slot.retry_after)
+        elif slot.used_tokens is not None and not slot.failed:
+            self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+        self._dispatch()
+
+    def _unadmit(self, tokens: int):
+        """Undo an admission whose caller stopped waiting; no call was made, so AIMD learns nothing"""
+        now = time.monotonic()
+        self.inflight -= 1
+        self.requests.give_back(1, now)
+        self.tokens.give_back(tokens, now)
+        self._dispatch()
+
+    def _dispatch(self):
+        """Admit waiting calls round-robin across users while the limits allow"""
+        now = time.monotonic()
+        while self._queues and self.inflight < max(int(self.limit), 1):
+            user, queue = next(iter(self._queues.items()))
+            while queue and queue[0][0].done():
+                queue.popleft()
+            if not queue:
+                del self._queues[user]
+                continue
+
+            future, tokens = queue[0]
+            wait = self.admission_delay(tokens, now)
+            if wait > 0:
+                self._schedule(wait)
+                return
+
+            queue.popleft()
+            self.requests.take(1, now)
+            self.tokens.take(tokens, now)
+            self.inflight += 1
+            self._stats["admitted"] += 1
+            future.set_result(None)
+            # The user goes to the back of the round-robin order
+            self._queues.move_to_end(user)
+            if not queue:
+                del self._queues[user]
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def stats(self) -> Dict[str, Any]:
+        admitted = self._stats["admitted"]
+        return {
+            "admitted": admitted,
+            "throttled": self._stats["throttled"],
+            "queue_timeouts": self._stats["queue_timeouts"],
+            "mean_wait_ms": round(self._stats["wait_ms_total"] / admitted, 1) if admitted else 0.0,
+            "inflight": self.inflight,
+            "waiting": self.waiting(),
+            "waiting_users": len(self._queues),
+            "concurrency_limit": int(self.limit),
+            "remaining_requests": self.requests.remaining(),
+            "remaining_tokens": self.tokens.remaining(),
+            "paused_for_s": round(max(0.0, self._paused_until - time.monotonic()), 1),
+        }
@@ -1,50 +1,304 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Awaitable, Tuple
 import asyncio
+import hashlib
+import json
+import re
+import uuid
+from fastapi import Request
+import httpx
+import numpy as np
 import structlog
 from app.core.config import settings
+from app.services.cache import AsyncTTLCache
+from app.services.vector_index import VectorIndex
+from app.services.bm25 import BM25Index
 
 logger = structlog.get_logger(__name__)
 
+FILTER_CLAUSE = re.compile(r"^\s*(\w+)\s+eq\s+'([^']*)'\s*$")
+# Shared-store key, under the cache namespace, of the Azure index generation
+INDEX_VERSION_KEY = "index_version"
+
+def document_fingerprint(doc_id: str, content: str) -> int:
+    """128-bit hash of an indexed document; XORed together they fingerprint the index"""
+    digest = hashlib.blake2b(f"{doc_id}\0{content}".encode(), digest_size=16).digest()
+    return int.from_bytes(digest, "big")
+
+def parse_filter_expression(filter_expression: Optional[str]) -> Dict[str, str]:
+    """Parse an `field eq 'value' and ...` filter into field/value pairs"""
+    if not filter_expression:
+        return {}
+    
+    conditions = {}
+    for clause in re.split(r"\s+and\s+", filter_expression):
+        match = FILTER_CLAUSE.match(clause)
+        if not match:
+            raise ValueError(f"Unsupported filter clause: {clause}")
+        conditions[match.group(1)] = match.group(2)
+    return conditions
+
+def reciprocal_rank_fusion(
+    rankings: Dict[str, List[str]],
+    weights: Dict[str, float],
+    k: int = 60
+) -> List[Tuple[str, float]]:
+    """Merge ranked id lists: score(d) = sum of weight / (k + rank) over retrievers"""
+    scores: Dict[str, float] = {}
+    for name, ranked_ids in rankings.items():
+        weight = weights.get(name, 1.0)
+        for rank, doc_id in enumerate(ranked_ids, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
 class SearchService:
-    def __init__(self):
+    def __init__(
+        self,
+        http_client: Optional[httpx.AsyncClient] = None,
+        cache_remote: Optional[Any] = None,
+        embed_texts: Optional[Callable[[List[str]], Awaitable[np.ndarray]]] = None
+    ):
         self.endpoint = settings.AZURE_SEARCH_ENDPOINT
         self.api_key = settings.AZURE_SEARCH_API_KEY
         self.index_name = settings.AZURE_SEARCH_INDEX_NAME
+        self.http_client = http_client
+        # Cache keys carry the index version, so a changed index never serves old results.
+        # Local indexes are versioned by their contents; the Azure index by a generation
+        # token kept in the shared cache store, replaced whenever documents change.
+        self._fingerprint = 0
+        self._generation = uuid.uuid4().hex
+        self.cache = AsyncTTLCache(
+            max_entries=settings.SEARCH_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.REDIS_CACHE_TTL,
+            remote=cache_remote,
+            namespace=f"search:{self.index_name}"
+        ) if settings.SEARCH_CACHE_ENABLED else None
+        
+        self.embed_texts = embed_texts
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self.vector_index = None
+        self.bm25_index = None
+        if settings.SEARCH_BACKEND == "local":
+            self.bm25_index = BM25Index()
+            if settings.VECTOR_SEARCH_ENABLED:
+                self.vector_index = VectorIndex(
+                    dimension=settings.VECTOR_INDEX_DIMENSION,
+                    mode=settings.VECTOR_INDEX_MODE,
+                    ivf_threshold=settings.VECTOR_INDEX_IVF_THRESHOLD,
+                    nprobe=settings.VECTOR_INDEX_NPROBE
+                )
+    
+    async def close(self):
+        """Release resources held by the service"""
+        if self.cache is not None and self.cache.remote is not None:
+            await self.cache.remote.close()
+    
+    async def index_version(self) -> str:
+        """Version of the indexed contents, the same in every worker that sees the same index"""
+        if self.bm25_index is not None:
+            return f"{self._fingerprint:032x}"
+        if self.cache is None or self.cache.remote is None:
+            return self._generation
+        
+        remote = self.cache.remote
+        key = f"{self.cache.namespace}:{INDEX_VERSION_KEY}"
+        try:
+            version = await remote.get(key)
+            if version is None:
+                # First worker to look publishes its generation; the rest adopt it
+                await remote.set(key, self._generation, nx=True)
+                version = await remote.get(key)
+        except Exception as e:
+            logger.warning("index_version_read_failed", error=str(e))
+            return self._generation
+        return version.decode() if isinstance(version, bytes) else str(version)
+    
+    async def bump_index_version(self):
+        """Mark the index as changed so no worker serves results cached before the change"""
+        self._generation = uuid.uuid4().hex
+        if self.cache is None:
+            return
+        self.cache.clear()
+        if self.bm25_index is None and self.cache.remote is not None:
+            try:
+                await self.cache.remote.set(f"{self.cache.namespace}:{INDEX_VERSION_KEY}", self._generation)
+            except Exception as e:
+                logger.warning("index_version_publish_failed", error=str(e))
+        
+    async def index_documents(self, documents: List[Dict[str, Any]], vectors: Optional[np.ndarray] = None) -> int:
+        """Upsert documents into the local BM25 and vector indexes.
+        
+        Each document needs `id` and `content`; `title`, `source` and
+        `metadata` are kept alongside for search results. Pass `vectors` when
+        the content has already been embedded. Returns how many documents
+        were indexed here: none with the Azure backend, whose index is fed
+        out of band, though the change still retires cached results.
+        """
+        if not documents:
+            return 0
+        if self.bm25_index is None:
+            await self.bump_index_version()
+            return 0
+        
+        if self.vector_index is not None:
+            if vectors is None:
+                vectors = await self.embed([doc["content"] for doc in documents])
+            await asyncio.to_thread(self.vector_index.add, [doc["id"] for doc in documents], vectors)
+        
+        for doc in documents:
+            self.bm25_index.add(doc["id"], f"{doc.get('title', '')}\n{doc['content']}")
+            previous = self.documents.get(doc["id"])
+            if previous is not None:
+                self._fingerprint ^= document_fingerprint(doc["id"], previous["content"])
+            self._fingerprint ^= document_fingerprint(doc["id"], doc["content"])
+            self.documents[doc["id"]] = {
+                "title": doc.get("title", ""),
+                "content": doc["content"],
+                "source": doc.get("source", ""),
+                "metadata": doc.get("metadata", {}),
+            }
+        
+        await self.bump_index_version()
+        return len(documents)
+    
+    async def delete_documents(self, document_ids: List[str]) -> int:
+        """Delete documents from the local indexes"""
+        if self.bm25_index is None:
+            if document_ids:
+                await self.bump_index_version()
+            return 0
+        
+        if self.vector_index is not None:
+            await asyncio.to_thread(self.vector_index.delete, document_ids)
+        removed = self.bm25_index.delete(document_ids)
+        for doc_id in document_ids:
+            document = self.documents.pop(doc_id, None)
+            if document is not None:
+                self._fingerprint ^= document_fingerprint(doc_id, document["content"])
+        
+        if removed:
+            await self.bump_index_version()
+        return removed
         
     async def search_documents(
         self,
         query: str,
         top_k: int = 10,
-        filter_expression: Optional[str] = None
+        filter_expression: Optional[str] = None,
+        weights: Optional[Dict[str, float]] = None
     ) -> List[Dict[str, Any]]:
-        """Search documents in Azure Cognitive Search"""
+        """Search documents in Azure Cognitive Search.
+        
+        With the local backend, `weights` tunes the reciprocal-rank fusion of
+        the "bm25" and "vector" retrievers for this request.
+        """
         try:
-            # Mock implementation for demo
-            mock_results = [
-                {
-                    "id": "doc_1",
-                    "title": "Deforestation Risk Assessment Brazil",
-                    "content": f"Analysis of {query} in Brazilian Amazon region...",
-                    "source": "Forest IQ",
-                    "score": 0.95,
-                    "metadata": {"region": "Brazil", "type": "forest_analysis"}
-                },
-                {
-                    "id": "doc_2", 
-                    "title": "ESG Portfolio Analysis",
-                    "content": f"Sustainability metrics related to {query}...",
-                    "source": "Spatial Finance",
-                    "score": 0.87,
-                    "metadata": {"type": "esg_analysis", "year": "2023"}
-                }
-            ]
+            if self.cache is None:
+                return await self._search_backend(query, top_k, filter_expression, weights)
             
-            logger.info("search_completed", query=query, results_count=len(mock_results))
-            return mock_results[:top_k]
+            cache_key = hashlib.sha256(json.dumps(
+                [query, top_k, filter_expression, weights, await self.index_version()], sort_keys=True
+            ).encode()).hexdigest()
+            return await self.cache.get_or_load(
+                cache_key,
+                lambda: self._search_backend(query, top_k, filter_expression, weights)
+            )
             
         except Exception as e:
             logger.error("search_failed", query=query, error=str(e))
             return []
+    
+    async def _search_backend(
+        self,
+        query: str,
+        top_k: int,
+        filter_expression: Optional[str] = None,
+        weights: Optional[Dict[str, float]] = None
+    ) -> List[Dict[str, Any]]:
+        """Run a search against the backend, bypassing the cache"""
+        if self.bm25_index is not None:
+            return await self._search_local(query, top_k, filter_expression, weights)
+        
+        # Mock implementation for demo
+        mock_results = [
+            {
+                "id": "doc_1",
+                "title": "Deforestation Risk Assessment Brazil",
+                "content": f"Analysis of {query} in Brazilian Amazon region...",
+                "source": "Forest IQ",
+                "score": 0.95,
+                "metadata": {"region": "Brazil", "type": "forest_analysis"}
+            },
+            {
+                "id": "doc_2", 
+                "title": "ESG Portfolio Analysis",
+                "content": f"Sustainability metrics related to {query}...",
+                "source": "Spatial Finance",
+                "score": 0.87,
+                "metadata": {"type": "esg_analysis", "year": "2023"}
+            }
+        ]
+        
+        logger.info("search_completed", query=query, results_count=len(mock_results))
+        return mock_results[:top_k]
+    
+    async def _search_local(
+        self,
+        query: str,
+        top_k: int,
+        filter_expression: Optional[str] = None,
+        weights: Optional[Dict[str, float]] = None
+    ) -> List[Dict[str, Any]]:
+        """Hybrid search: BM25 and vector retrieval merged by reciprocal-rank fusion"""
+        conditions = parse_filter_expression(filter_expression)
+        weights = {
+            "bm25": settings.HYBRID_BM25_WEIGHT,
+            "vector": settings.HYBRID_VECTOR_WEIGHT,
+            **(weights or {}),
+        }
+        fetch_k = top_k * settings.HYBRID_CANDIDATE_MULTIPLIER
+        
+        retrievers = {}
+        if weights["bm25"] > 0:
+            retrievers["bm25"] = self._bm25_candidates(query, fetch_k)
+        if self.vector_index is not None and weights["vector"] > 0:
+            retrievers["vector"] = self._vector_candidates(query, fetch_k)
+        
+        rankings = dict(zip(retrievers, await asyncio.gather(*retrievers.values())))
+        fused = reciprocal_rank_fusion(rankings, weights, k=settings.HYBRID_RRF_K)
+        
+        results = []
+        for doc_id, score in fused:
+            document = self.documents.get(doc_id)
+            if document is None:
+                continue
+            metadata = document.get("metadata", {})
+            if any(str(metadata.get(field)) != value for field, value in conditions.items()):
+                continue
+            results.append({"id": doc_id, **document, "score": score})
+            if len(results) == top_k:
+                break
+        
+        logger.info("search_completed", query=query, results_count=len(results), backend="local")
+        return results
+    
+    async def _bm25_candidates(self, query: str, fetch_k: int) -> List[str]:
+        if self.bm25_index is None:
+            return []
+        # Runs on the event loop: BM25 reads postings through views that writers may resize
+        return [doc_id for doc_id, _ in self.bm25_index.search(query, fetch_k)]
+    
+    async def _vector_candidates(self, query: str, fetch_k: int) -> List[str]:
+        if self.vector_index is None:
+            return []
+        query_vector = (await self.embed([query]))[0]
+        hits = (await asyncio.to_thread(self.vector_index.search, query_vector, fetch_k))[0]
+        return [doc_id for doc_id, _, _ in hits]
+    
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts for the local vector index"""
+        if self.embed_texts is None:
+            raise RuntimeError("Vector search needs an embed_texts function")
+        return await self.embed_texts(texts)
 
-def get_search_service() -> SearchService:
-    return SearchService()
+def get_search_service(request: Request) -> SearchService:
+    return request.app.state.services.search_service
@@ -0,0 +1,164 @@
+import hashlib
+import itertools
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import structlog
+from fastapi import Request
+
+from app.core.config import settings
+
+logger = structlog.get_logger(__name__)
+
+@dataclass
+class SemanticCacheEntry:
+    vector: np.ndarray
+    scope: str
+    content: str
+    created_at: float
+    citations: Optional[List[Dict[str, Any]]] = None
+    metadata: Optional[Dict[str, Any]] = None
+    hits: int = 0
+
+@dataclass
+class SemanticCacheHit:
+    content: str
+    similarity: float
+    citations: Optional[List[Dict[str, Any]]] = None
+    metadata: Optional[Dict[str, Any]] = None
+
+class SemanticCache:
+    """Answer cache keyed by query embedding similarity.
+
+    Entries are partitioned by scope, a hash of the retrieval context and the
+    caller's entitlements, so an answer is only reused for callers that would
+    have seen the same sources. Entries expire after `ttl_seconds`, the least
+    recently used entry is evicted beyond `max_entries`, and the whole cache is
+    invalidated when indexed documents change.
+    """
+
+    def __init__(
+        self,
+        similarity_threshold: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        ttl_seconds: Optional[int] = None
+    ):
+        self.similarity_threshold = (
+            settings.SEMANTIC_CACHE_SIMILARITY_THRESHOLD if similarity_threshold is None else similarity_threshold
+        )
+        self.max_entries = settings.SEMANTIC_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.ttl_seconds = settings.SEMANTIC_CACHE_TTL if ttl_seconds is None else ttl_seconds
+        self._entries: "OrderedDict[int, SemanticCacheEntry]" = OrderedDict()
+        self._scopes: Dict[str, Dict[int, None]] = {}
+        self._ids = itertools.count()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def scope_key(context: Optional[Dict[str, Any]], entitlements: Optional[List[str]]) -> str:
+        """Hash the retrieval context and entitlements into a cache scope"""
+        payload = json.dumps(
+            {"context": context or {}, "entitlements": sorted(entitlements or [])},
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def lookup(self, vector: np.ndarray, scope: str) -> Optional[SemanticCacheHit]:
+        """Find the most similar live answer in the scope above the threshold"""
+        entry_ids = list(self._scopes.get(scope, {}))
+        now = time.monotonic()
+
+        live_ids = []
+        for entry_id in entry_ids:
+            if now - self._entries[entry_id].created_at > self.ttl_seconds:
+                self._remove(entry_id)
+            else:
+                live_ids.append(entry_id)
+
+        if not live_ids:
+            self._stats["misses"] += 1
+            return None
+
+        query = self._normalize(vector)
+        matrix = np.stack([self._entries[entry_id].vector for entry_id in live_ids])
+        similarities = matrix @ query
+        best = int(np.argmax(similarities))
+
+        if similarities[best] < self.similarity_threshold:
+            self._stats["misses"] += 1
+            return None
+
+        entry_id = live_ids[best]
+        entry = self._entries[entry_id]
+        entry.hits += 1
+        self._entries.move_to_end(entry_id)
+        self._stats["hits"] += 1
+
+        return SemanticCacheHit(
+            content=entry.content,
+            similarity=float(similarities[best]),
+            citations=entry.citations,
+            metadata=entry.metadata
+        )
+
+    def store(
+        self,
+        vector: np.ndarray,
+        scope: str,
+        content: str,
+        citations: Optional[List[Dict[str, Any]]] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ):
+        """Cache an answer for a query embedding"""
+        entry_id = next(self._ids)
+        self._entries[entry_id] = SemanticCacheEntry(
+            vector=self._normalize(vector),
+            scope=scope,
+            content=content,
+            created_at=time.monotonic(),
+            citations=citations,
+            metadata=metadata
+        )
+        self._scopes.setdefault(scope, {})[entry_id] = None
+        self._stats["stores"] += 1
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self._stats["evictions"] += 1
+
+    def invalidate(self):
+        """Drop every cached answer, e.g. after ingested documents change"""
+        self._entries.clear()
+        self._scopes.clear()
+        self._stats["invalidations"] += 1
+        logger.info("semantic_cache_invalidated")
+
+    def stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters"""
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "entries": len(self._entries),
+            "hit_ratio": self._stats["hits"] / lookups if lookups else 0.0,
+        }
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        scope_entries = self._scopes.get(entry.scope)
+        if scope_entries is not None:
+            scope_entries.pop(entry_id, None)
+            if not scope_entries:
+                del self._scopes[entry.scope]
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+def get_semantic_cache(request: Request) -> Optional[SemanticCache]:
+    return request.app.state.services.semantic_cache
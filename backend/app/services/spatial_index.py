@@ -0,0 +1,479 @@
+import json
+import math
+import os
+import shutil
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import structlog
+from fastapi import Request
+from numpy.typing import ArrayLike
+
+from app.core.config import settings
+from app.services.company_store import (CategoricalColumn, StringColumn,
+                                        normalize_column, normalize_name,
+                                        to_float)
+
+logger = structlog.get_logger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+STRING_COLUMNS = ("id", "name", "company_id", "company")
+CATEGORICAL_COLUMNS = ("type", "country")
+# Footprint bounds; a point asset has an empty footprint at its coordinates
+BOUND_COLUMNS = ("min_lon", "min_lat", "max_lon", "max_lat")
+
+# Header spellings accepted for each known column, after normalize_column()
+COLUMN_ALIASES = {
+    "id": ("id", "asset_id", "site_id", "facility_id", "plant_id"),
+    "name": ("name", "asset_name", "site_name", "facility_name", "plant_name"),
+    "company_id": ("company_id", "isin", "lei", "owner_id", "parent_id"),
+    "company": ("company", "company_name", "owner", "owner_name", "parent", "parent_name"),
+    "type": ("type", "asset_type", "site_type", "facility_type", "category"),
+    "country": ("country", "country_code", "iso_country"),
+    "lat": ("lat", "latitude", "y"),
+    "lon": ("lon", "lng", "long", "longitude", "x"),
+    "min_lon": ("min_lon", "xmin", "west", "bbox_west"),
+    "min_lat": ("min_lat", "ymin", "south", "bbox_south"),
+    "max_lon": ("max_lon", "xmax", "east", "bbox_east"),
+    "max_lat": ("max_lat", "ymax", "north", "bbox_north"),
+}
+CANONICAL_COLUMNS = {alias: name for name, aliases in COLUMN_ALIASES.items() for alias in aliases}
+
+BBox = Tuple[float, float, float, float]
+# Polygon vertices as [lon, lat] pairs, or an (n, 2) array of them
+Vertices = Union[np.ndarray, Sequence[Sequence[float]]]
+
+def parse_bbox(text: str) -> BBox:
+    """Parse `min_lon,min_lat,max_lon,max_lat`; min_lon > max_lon crosses the antimeridian"""
+    values = [to_float(value) for value in text.split(",")]
+    numbers = [value for value in values if value is not None]
+    if len(values) != 4 or len(numbers) != 4:
+        raise ValueError(f"Invalid bbox '{text}', expected min_lon,min_lat,max_lon,max_lat")
+    min_lon, min_lat, max_lon, max_lat = numbers
+    if min_lat > max_lat:
+        raise ValueError(f"Invalid bbox '{text}', min_lat is above max_lat")
+    return min_lon, min_lat, max_lon, max_lat
+
+def to_ring(vertices: Vertices) -> np.ndarray:
+    """Validate polygon vertices as an (n, 2) array of lon, lat"""
+    try:
+        ring = np.array(vertices, dtype=np.float64)
+    except (TypeError, ValueError):
+        ring = np.zeros((0, 0))
+    if ring.ndim != 2 or ring.shape[1] != 2 or len(ring) < 3 or not np.isfinite(ring).all():
+        raise ValueError("Invalid polygon, expected at least three [lon, lat] vertices")
+    return ring
+
+def parse_polygon(text: str) -> np.ndarray:
+    """Parse a ring of `lon lat` pairs separated by commas"""
+    # An object array keeps ragged pairs for to_ring to reject
+    return to_ring(np.array([pair.split() for pair in text.split(",")], dtype=object))
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    lat1, lat2 = math.radians(lat), np.radians(lats)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(np.radians(lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def radius_bbox(lat: float, lon: float, radius_km: float) -> BBox:
+    """Bounding box of a circle; the full longitude range when it reaches a pole"""
+    dlat = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    widest = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if widest < 1e-9 or radius_km / (KM_PER_DEGREE * widest) >= 180:
+        return -180.0, min_lat, 180.0, max_lat
+    dlon = radius_km / (KM_PER_DEGREE * widest)
+    min_lon, max_lon = lon - dlon, lon + dlon
+    # Wrapped boxes are expressed with min_lon > max_lon
+    return (min_lon + 360 if min_lon < -180 else min_lon), min_lat, (max_lon - 360 if max_lon > 180 else max_lon), max_lat
+
+def points_in_polygon(ring: np.ndarray, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+    """Even-odd rule, vectorized over points and looping over the ring's edges"""
+    inside = np.zeros(len(lons), dtype=bool)
+    for (x1, y1), (x2, y2) in zip(ring, np.roll(ring, -1, axis=0)):
+        if y1 == y2:
+            continue
+        crosses = (y1 > lats) != (y2 > lats)
+        inside ^= crosses & (lons < x1 + (lats - y1) * (x2 - x1) / (y2 - y1))
+    return inside
+
+def segment_hits_boxes(start: np.ndarray, end: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    """Whether a segment intersects each box, by clipping it to the box (Liang-Barsky)"""
+    low = np.zeros(len(bounds))
+    high = np.ones(len(bounds))
+    hits = np.ones(len(bounds), dtype=bool)
+    for axis in (0, 1):
+        delta = end[axis] - start[axis]
+        lower, upper = bounds[:, axis], bounds[:, axis + 2]
+        if delta == 0:
+            hits &= (start[axis] >= lower) & (start[axis] <= upper)
+            continue
+        t1, t2 = (lower - start[axis]) / delta, (upper - start[axis]) / delta
+        low = np.maximum(low, np.minimum(t1, t2))
+        high = np.minimum(high, np.maximum(t1, t2))
+    return hits & (low <= high)
+
+class SpatialGrid:
+    """Fixed-size lon/lat cells with the rows of every footprint touching each cell.
+
+    Stored CSR-style: `rows` sorted by cell, and `starts[cell]` pointing at a
+    cell's first row. Cells are numbered row-major from the south-west
+    corner, so the cells of one grid row inside a bbox form one contiguous
+    slice of `rows`.
+    """
+
+    def __init__(self, cell_degrees: float, starts: np.ndarray, rows: np.ndarray):
+        self.cell_degrees = cell_degrees
+        self.columns = int(math.ceil(360 / cell_degrees))
+        self.grid_rows = int(math.ceil(180 / cell_degrees))
+        self.starts = starts
+        self.rows = rows
+
+    @classmethod
+    def build(cls, bounds: np.ndarray, cell_degrees: float) -> "SpatialGrid":
+        grid = cls(cell_degrees, np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32))
+        x0, y0 = grid._cell(bounds[:, 0], bounds[:, 1])
+        x1, y1 = grid._cell(bounds[:, 2], bounds[:, 3])
+        widths = x1 - x0 + 1
+        counts = widths * (y1 - y0 + 1)
+
+        # One entry per (footprint, covered cell)
+        asset_rows = np.repeat(np.arange(len(bounds), dtype=np.int32), counts)
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        offsets = np.arange(len(asset_rows), dtype=np.int64) - first
+        widths = np.repeat(widths, counts)
+        cells = (np.repeat(y0, counts) + offsets // widths) * grid.columns + np.repeat(x0, counts) + offsets % widths
+
+        order = np.argsort(cells, kind="stable")
+        grid.rows = asset_rows[order]
+        grid.starts = np.zeros(grid.columns * grid.grid_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=grid.columns * grid.grid_rows), out=grid.starts[1:])
+        return grid
+
+    def _cell(self, lons: ArrayLike, lats: ArrayLike) -> Tuple[np.ndarray, np.ndarray]:
+        x = np.clip(((np.asarray(lons) + 180) / self.cell_degrees).astype(np.int64), 0, self.columns - 1)
+        y = np.clip(((np.asarray(lats) + 90) / self.cell_degrees).astype(np.int64), 0, self.grid_rows - 1)
+        return x, y
+
+    def candidates(self, bbox: BBox) -> np.ndarray:
+        """Rows of footprints in the cells a bbox touches"""
+        min_lon, min_lat, max_lon, max_lat = bbox
+        if min_lon > max_lon:
+            return np.union1d(
+                self.candidates((min_lon, min_lat, 180.0, max_lat)),
+                self.candidates((-180.0, min_lat, max_lon, max_lat))
+            )
+        (x0, x1), (y0, y1) = self._cell([min_lon, max_lon], [min_lat, max_lat])
+        slices = [
+            self.rows[self.starts[y * self.columns + x0]:self.starts[y * self.columns + x1 + 1]]
+            for y in range(y0, y1 + 1)
+        ]
+        return np.unique(np.concatenate(slices)) if slices else np.zeros(0, dtype=np.int32)
+
+class AssetIndex:
+    """Immutable columnar snapshot of asset locations with a grid index over their footprints"""
+
+    def __init__(
+        self,
+        strings: Dict[str, StringColumn],
+        categoricals: Dict[str, CategoricalColumn],
+        bounds: np.ndarray,
+        grid: SpatialGrid
+    ):
+        self.strings = strings
+        self.categoricals = categoricals
+        self.bounds = bounds  # (n, 4) float64: min_lon, min_lat, max_lon, max_lat
+        self.grid = grid
+
+    @classmethod
+    def empty(cls, cell_degrees: Optional[float] = None) -> "AssetIndex":
+        return cls.build([], cell_degrees)
+
+    @classmethod
+    def build(cls, assets: List[Dict[str, Any]], cell_degrees: Optional[float] = None) -> "AssetIndex":
+        """Build columns and the grid from asset dicts with id, footprint bounds and attributes"""
+        bounds = np.array([[asset[name] for name in BOUND_COLUMNS] for asset in assets], dtype=np.float64).reshape(-1, 4)
+        strings = {name: StringColumn.from_strings(asset.get(name) or "" for asset in assets) for name in STRING_COLUMNS}
+        strings["name_key"] = StringColumn.from_strings(
+            normalize_name(f"{asset.get('name') or ''} {asset.get('company') or ''}") for asset in assets
+        )
+        return cls(
+            strings=strings,
+            categoricals={name: CategoricalColumn.from_values(asset.get(name) for asset in assets) for name in CATEGORICAL_COLUMNS},
+            bounds=bounds,
+            grid=SpatialGrid.build(bounds, cell_degrees or settings.ASSET_GRID_CELL_DEGREES)
+        )
+
+    def __len__(self) -> int:
+        return len(self.bounds)
+
+    def asset(self, row: int) -> Dict[str, Any]:
+        """Materialize one asset as a dict"""
+        record: Dict[str, Any] = {name: self.strings[name][row] or None for name in STRING_COLUMNS}
+        for name, column in self.categoricals.items():
+            record[name] = column[row]
+        min_lon, min_lat, max_lon, max_lat = self.bounds[row].tolist()
+        record["lat"], record["lon"] = (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+        if min_lon != max_lon or min_lat != max_lat:
+            record["bbox"] = [min_lon, min_lat, max_lon, max_lat]
+        return record
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """Decode every column, for rebuilding with changes"""
+        columns: Dict[str, List[Any]] = {name: self.strings[name].to_list() for name in STRING_COLUMNS}
+        columns.update({name: column.to_list() for name, column in self.categoricals.items()})
+        columns.update(zip(BOUND_COLUMNS, self.bounds.T.tolist()))
+        return [{name: values[row] for name, values in columns.items() if values[row] != ""} for row in range(len(self))]
+
+    def in_bbox(self, bbox: BBox, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Rows whose footprint intersects a bbox"""
+        rows = self.grid.candidates(bbox) if rows is None else rows
+        min_lon, min_lat, max_lon, max_lat = bbox
+        bounds = self.bounds[rows]
+        lat_hit = (bounds[:, 1] <= max_lat) & (bounds[:, 3] >= min_lat)
+        if min_lon > max_lon:
+            lon_hit = (bounds[:, 2] >= min_lon) | (bounds[:, 0] <= max_lon)
+        else:
+            lon_hit = (bounds[:, 0] <= max_lon) & (bounds[:, 2] >= min_lon)
+        return rows[lat_hit & lon_hit]
+
+    def within_radius(self, lat: float, lon: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows whose footprint comes within radius_km of a point, with their distances"""
+        rows = self.in_bbox(radius_bbox(lat, lon, radius_km))
+        bounds = self.bounds[rows]
+        # Distance to the footprint's closest point; exact for points
+        distances = haversine_km(
+            lat,
+            lon,
+            np.clip(lat, bounds[:, 1], bounds[:, 3]),
+            np.clip(lon, bounds[:, 0], bounds[:, 2])
+        )
+        keep = distances <= radius_km
+        return rows[keep], distances[keep]
+
+    def in_polygon(self, ring: np.ndarray) -> np.ndarray:
+        """Rows whose footprint intersects a polygon ring of (lon, lat) vertices"""
+        rows = self.in_bbox((*ring.min(axis=0), *ring.max(axis=0)))
+        bounds = self.bounds[rows]
+        # A box meets the polygon if a corner lies inside it or an edge crosses the box
+        hits = points_in_polygon(ring, bounds[:, 0], bounds[:, 1])
+        boxes = ~np.all(bounds[:, :2] == bounds[:, 2:], axis=1)
+        if boxes.any():
+            box_rows = np.flatnonzero(boxes & ~hits)
+            box_bounds = bounds[box_rows]
+            box_hits = np.zeros(len(box_rows), dtype=bool)
+            for start, end in zip(ring, np.roll(ring, -1, axis=0)):
+                box_hits |= segment_hits_boxes(start, end, box_bounds)
+            hits[box_rows] = box_hits
+        return rows[hits]
+
+    def filter_mask(self, rows: np.ndarray, query: str = "", categories: Optional[Dict[str, List[str]]] = None) -> np.ndarray:
+        """Which rows match every query word within their asset or company name, and the categories"""
+        mask = np.ones(len(rows), dtype=bool)
+        for name, values in (categories or {}).items():
+            column = self.categoricals[name]
+            mask &= np.isin(column.codes[rows], column.codes_for(values))
+
+        names = self.strings["name_key"]
+        for word in normalize_name(query).split():
+            mask &= np.isin(rows, names.rows_containing(word.encode("utf-8"), rows[mask]))
+        return mask
+
+    def nbytes(self) -> int:
+        arrays = [column.data for column in self.strings.values()] + [column.offsets for column in self.strings.values()]
+        arrays += [column.codes for column in self.categoricals.values()] + [self.bounds, self.grid.starts, self.grid.rows]
+        return sum(array.nbytes for array in arrays)
+
+    def save(self, path: str):
+        """Write every column and the grid as .npy files, replacing the directory at path"""
+        staging = f"{path}.new"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+
+        for name, strings in self.strings.items():
+            np.save(os.path.join(staging, f"{name}.data.npy"), strings.data)
+            np.save(os.path.join(staging, f"{name}.offsets.npy"), strings.offsets)
+        for name, categorical in self.categoricals.items():
+            np.save(os.path.join(staging, f"{name}.codes.npy"), categorical.codes)
+        np.save(os.path.join(staging, "bounds.npy"), self.bounds)
+        np.save(os.path.join(staging, "grid.starts.npy"), self.grid.starts)
+        np.save(os.path.join(staging, "grid.rows.npy"), self.grid.rows)
+
+        with open(os.path.join(staging, "meta.json"), "w") as meta:
+            json.dump({
+                "categories": {name: column.categories for name, column in self.categoricals.items()},
+                "cell_degrees": self.grid.cell_degrees,
+            }, meta)
+
+        # Swap directories; readers of the old files keep their mappings until released
+        retired = f"{path}.old"
+        shutil.rmtree(retired, ignore_errors=True)
+        if os.path.exists(path):
+            os.rename(path, retired)
+        os.rename(staging, path)
+        shutil.rmtree(retired, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: str) -> "AssetIndex":
+        """Open a saved snapshot with every column and the grid memory-mapped"""
+        def column(name: str) -> np.ndarray:
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        with open(os.path.join(path, "meta.json")) as meta_file:
+            meta = json.load(meta_file)
+
+        return cls(
+            strings={
+                name: StringColumn(column(f"{name}.data.npy"), column(f"{name}.offsets.npy"))
+                for name in (*STRING_COLUMNS, "name_key")
+            },
+            categoricals={
+                name: CategoricalColumn(column(f"{name}.codes.npy"), categories)
+                for name, categories in meta["categories"].items()
+            },
+            bounds=column("bounds.npy"),
+            grid=SpatialGrid(meta["cell_degrees"], column("grid.starts.npy"), column("grid.rows.npy"))
+        )
+
+def to_asset(raw: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Canonicalize an ingested row into an asset dict, or None without a valid location"""
+    fields = {CANONICAL_COLUMNS.get(normalize_column(key), normalize_column(key)): value for key, value in raw.items() if key}
+    lat, lon = to_float(fields.get("lat")), to_float(fields.get("lon"))
+    bounds = [bound for bound in (to_float(fields.get(name)) for name in BOUND_COLUMNS) if bound is not None]
+
+    if len(bounds) == 4:
+        min_lon, min_lat, max_lon, max_lat = bounds
+        if min_lon > max_lon or min_lat > max_lat:
+            return None
+    elif lat is not None and lon is not None:
+        min_lon, min_lat, max_lon, max_lat = lon, lat, lon, lat
+    else:
+        return None
+    if min_lon < -180 or max_lon > 180 or min_lat < -90 or max_lat > 90:
+        return None
+
+    asset: Dict[str, Any] = {"min_lon": min_lon, "min_lat": min_lat, "max_lon": max_lon, "max_lat": max_lat}
+    for name in (*STRING_COLUMNS, *CATEGORICAL_COLUMNS):
+        value = str(fields.get(name) or "").strip()
+        if value:
+            asset[name] = value
+    # Without an id, an asset is identified by its owner, name and location
+    asset.setdefault("id", f"{asset.get('company_id') or asset.get('company', '')}:{asset.get('name', '')}:{(min_lat + max_lat) / 2:.5f},{(min_lon + max_lon) / 2:.5f}")
+    return asset
+
+class AssetStore:
+    """Spatial index over asset coordinates and footprints loaded from ingested tables.
+
+    Footprints are indexed in a fixed lon/lat grid of
+    ASSET_GRID_CELL_DEGREES cells. Bbox, radius and polygon queries scan
+    only the cells they touch, then test the candidates exactly with
+    vectorized NumPy. With a `path`, the columns and grid are persisted as
+    .npy files and memory-mapped on start, so startup does not rebuild the
+    index. Writers build a new AssetIndex and swap it in.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.index = AssetIndex.empty()
+        self._write_lock = threading.Lock()
+        if path and os.path.exists(os.path.join(path, "meta.json")):
+            self.index = AssetIndex.load(path)
+            logger.info("asset_index_loaded", assets=len(self.index), path=path)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def upsert(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """Add or update assets by id; rows without a valid location are skipped"""
+        with self._write_lock:
+            assets = self.index.to_records()
+            row_of = {asset["id"]: row for row, asset in enumerate(assets)}
+            changed = 0
+
+            for raw in rows:
+                asset = to_asset(raw)
+                if asset is None:
+                    continue
+                row = row_of.get(asset["id"])
+                if row is None:
+                    row_of[asset["id"]] = len(assets)
+                    assets.append(asset)
+                else:
+                    assets[row] = asset
+                changed += 1
+
+            index = AssetIndex.build(assets)
+            if self.path:
+                index.save(self.path)
+                index = AssetIndex.load(self.path)
+            self.index = index
+
+        logger.info("asset_index_updated", rows=changed, assets=len(index))
+        return changed
+
+    def search(
+        self,
+        bbox: Optional[BBox] = None,
+        near: Optional[Tuple[float, float, float]] = None,
+        polygon: Optional[Vertices] = None,
+        query: str = "",
+        categories: Optional[Dict[str, List[str]]] = None,
+        limit: int = 20
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """Assets matching every given spatial filter, returning (page, total matches).
+
+        `near` is (lat, lon, radius_km); results are then ordered by distance,
+        which is included with each asset.
+        """
+        index = self.index
+        if bbox is None and near is None and polygon is None:
+            raise ValueError("A bbox, radius or polygon filter is required")
+        for name in categories or {}:
+            if name not in index.categoricals:
+                raise ValueError(f"Unknown asset attribute: {name}")
+        if not len(index):
+            return [], 0
+
+        distances: Optional[np.ndarray] = None
+        selections = []
+        if near is not None:
+            lat, lon, radius_km = near
+            rows, distances = index.within_radius(lat, lon, radius_km)
+            selections.append(rows)
+        if bbox is not None:
+            selections.append(index.in_bbox(bbox, rows=selections[0] if selections else None))
+        if polygon is not None:
+            selections.append(index.in_polygon(to_ring(polygon)))
+
+        rows = selections[0]
+        for selection in selections[1:]:
+            rows = rows[np.isin(rows, selection)]
+        if distances is not None:
+            distances = distances[np.isin(selections[0], rows)]
+
+        keep = index.filter_mask(rows, query, categories)
+        rows = rows[keep]
+        if distances is not None:
+            distances = distances[keep]
+        order = np.arange(min(limit, len(rows))) if distances is None else np.argsort(distances, kind="stable")[:limit]
+
+        results = []
+        for position in order.tolist():
+            asset = index.asset(int(rows[position]))
+            if distances is not None:
+                asset["distance_km"] = round(float(distances[position]), 3)
+            results.append(asset)
+        return results, len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        index = self.index
+        return {
+            "assets": len(index),
+            "cell_degrees": index.grid.cell_degrees,
+            "grid_entries": len(index.grid.rows),
+            "bytes": index.nbytes(),
+        }
+
+def get_asset_store(request: Request) -> AssetStore:
+    return request.app.state.services.asset_store
@@ -0,0 +1,150 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import (Any, Awaitable, Callable, Dict, Iterable, List, Optional,
+                    Tuple)
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+@dataclass
+class ToolTask:
+    """A tool call in a plan; run receives the results of the tasks it depends on, by name"""
+    name: str
+    run: Callable[[Dict[str, Any]], Awaitable[Any]]
+    depends_on: Tuple[str, ...] = ()
+    timeout: Optional[float] = None  # seconds
+    parameters: Dict[str, Any] = field(default_factory=dict)
+
+@dataclass
+class ToolOutcome:
+    name: str
+    status: str  # ok, timeout, error or skipped
+    result: Any = None
+    error: Optional[str] = None
+    started_ms: Optional[float] = None  # since the plan started
+    execution_time_ms: Optional[float] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ok"
+
+class ToolPlan:
+    """A dependency graph of tool calls, run with as much concurrency as the edges allow.
+
+    A task starts as soon as every task it depends on has succeeded, so
+    independent lookups overlap and a turn takes about as long as its
+    slowest chain rather than the sum of its tools. Each task has its own
+    timeout; a task that fails or times out skips its dependents but not
+    the rest of the plan. At the plan deadline, unfinished tasks are
+    cancelled and whatever finished is returned.
+    """
+
+    def __init__(self, tasks: Iterable[ToolTask]):
+        self.tasks: Dict[str, ToolTask] = {}
+        for task in tasks:
+            if task.name in self.tasks:
+                raise ValueError(f"Duplicate tool task: {task.name}")
+            self.tasks[task.name] = task
+        for task in self.tasks.values():
+            unknown = [name for name in task.depends_on if name not in self.tasks]
+            if unknown:
+                raise ValueError(f"Tool task {task.name} depends on unknown tasks: {', '.join(unknown)}")
+        self._check_acyclic()
+
+    def __len__(self) -> int:
+        return len(self.tasks)
+
+    def _check_acyclic(self):
+        remaining = {name: set(task.depends_on) for name, task in self.tasks.items()}
+        while remaining:
+            ready = [name for name, depends_on in remaining.items() if not depends_on]
+            if not ready:
+                raise ValueError(f"Tool tasks form a cycle: {', '.join(sorted(remaining))}")
+            for name in ready:
+                del remaining[name]
+            for depends_on in remaining.values():
+                depends_on.difference_update(ready)
+
+    async def run(self, deadline: Optional[float] = None) -> Dict[str, ToolOutcome]:
+        """Run the plan, giving up on unfinished tasks after deadline seconds"""
+        start = time.perf_counter()
+        outcomes: Dict[str, ToolOutcome] = {}
+        waiting = list(self.tasks.values())
+        running: Dict[asyncio.Task, ToolTask] = {}
+
+        def launch_ready():
+            launched = True
+            while launched:
+                launched = False
+                for task in list(waiting):
+                    if any(name not in outcomes for name in task.depends_on):
+                        continue
+                    waiting.remove(task)
+                    launched = True
+                    failed = [name for name in task.depends_on if not outcomes[name].ok]
+                    if failed:
+                        outcomes[task.name] = ToolOutcome(task.name, "skipped", error=f"Depends on failed tasks: {', '.join(failed)}")
+                        continue
+                    results = {name: outcomes[name].result for name in task.depends_on}
+                    running[asyncio.create_task(self._run_task(task, results, start))] = task
+
+        try:
+            launch_ready()
+            while running:
+                remaining = None if deadline is None else deadline - (time.perf_counter() - start)
+                if remaining is not None and remaining <= 0:
+                    break
+                done, _ = await asyncio.wait(running, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for finished in done:
+                    outcome = finished.result()
+                    outcomes[outcome.name] = outcome
+                    del running[finished]
+                launch_ready()
+        finally:
+            # Past the deadline, or when the turn itself is cancelled, stop what is still running
+            for pending, task in running.items():
+                pending.cancel()
+                outcomes[task.name] = ToolOutcome(
+                    task.name, "timeout", error="Plan deadline exceeded",
+                    execution_time_ms=round((time.perf_counter() - start) * 1000, 1)
+                )
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        for task in waiting:
+            outcomes[task.name] = ToolOutcome(task.name, "skipped", error="Plan deadline exceeded")
+        if any(not outcome.ok for outcome in outcomes.values()):
+            logger.warning(
+                "tool_plan_partial",
+                failed={name: outcome.status for name, outcome in outcomes.items() if not outcome.ok},
+                elapsed_ms=round((time.perf_counter() - start) * 1000, 1)
+            )
+        return {name: outcomes[name] for name in self.tasks}
+
+    def tools_used(self, outcomes: Dict[str, ToolOutcome]) -> List[Dict[str, Any]]:
+        """tools_used entries for a finished run"""
+        return [
+            {
+                "tool_name": name,
+                "parameters": self.tasks[name].parameters,
+                "status": outcome.status,
+                "execution_time_ms": outcome.execution_time_ms,
+                **({"error": outcome.error} if outcome.error else {}),
+            }
+            for name, outcome in outcomes.items()
+        ]
+
+    async def _run_task(self, task: ToolTask, results: Dict[str, Any], plan_start: float) -> ToolOutcome:
+        started = time.perf_counter()
+        outcome = ToolOutcome(task.name, "ok", started_ms=round((started - plan_start) * 1000, 1))
+        try:
+            outcome.result = await asyncio.wait_for(task.run(results), task.timeout)
+        except asyncio.TimeoutError:
+            outcome.status, outcome.error = "timeout", f"Timed out after {task.timeout}s"
+        except Exception as e:
+            logger.warning("tool_task_failed", tool=task.name, error=str(e))
+            outcome.status, outcome.error = "error", str(e)
+        outcome.execution_time_ms = round((time.perf_counter() - started) * 1000, 1)
+        return outcome
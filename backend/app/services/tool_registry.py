@@ -0,0 +1,159 @@
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+import structlog
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.services.cache import AsyncTTLCache
+
+logger = structlog.get_logger(__name__)
+
+# A tool returns its result for the model and the citations backing it
+ToolResult = Tuple[Dict[str, Any], List[Dict[str, Any]]]
+
+@dataclass
+class ToolDefinition:
+    """An async tool the model can call; handler receives the validated arguments model"""
+    name: str
+    description: str
+    arguments: Type[BaseModel]
+    handler: Callable[[Any], Awaitable[ToolResult]]
+    cache_ttl: Optional[int] = None  # seconds; None for AGENT_TOOL_CACHE_TTL, 0 to disable
+    available: Optional[Callable[[], bool]] = None  # offered to the model only while this holds
+
+def strip_titles(schema: Any) -> Any:
+    """Drop the titles pydantic adds to every schema node; the model only needs names and descriptions"""
+    if isinstance(schema, dict):
+        return {key: strip_titles(value) for key, value in schema.items() if key != "title"}
+    if isinstance(schema, list):
+        return [strip_titles(value) for value in schema]
+    return schema
+
+class ToolRegistry:
+    """Typed async tools for model function calling.
+
+    JSON schemas are generated from each tool's arguments model once, at
+    registration. Calls are validated against the model, run with the
+    tool's timeout, and memoized per (tool, normalized arguments) in an
+    AsyncTTLCache, so identical concurrent calls also share one run. When
+    the model asks for several tools at once they run concurrently. Per
+    tool latency, errors and cache hits are kept for /admin/metrics.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.timeout = settings.AGENT_TOOL_TIMEOUT_S if timeout is None else timeout
+        self.tools: Dict[str, ToolDefinition] = {}
+        self._schemas: Dict[str, Dict[str, Any]] = {}
+        self._caches: Dict[str, AsyncTTLCache] = {}
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def register(self, definition: ToolDefinition):
+        if definition.name in self.tools:
+            raise ValueError(f"Tool already registered: {definition.name}")
+        parameters = strip_titles(definition.arguments.schema())
+        parameters.setdefault("properties", {})
+        self.tools[definition.name] = definition
+        self._schemas[definition.name] = {
+            "type": "function",
+            "function": {"name": definition.name, "description": definition.description, "parameters": parameters},
+        }
+        ttl = settings.AGENT_TOOL_CACHE_TTL if definition.cache_ttl is None else definition.cache_ttl
+        if ttl > 0:
+            self._caches[definition.name] = AsyncTTLCache(
+                max_entries=settings.AGENT_TOOL_CACHE_MAX_ENTRIES, ttl_seconds=ttl, namespace=f"tool:{definition.name}"
+            )
+        self._stats[definition.name] = {"calls": 0, "errors": 0, "timeouts": 0, "total_ms": 0.0, "max_ms": 0.0}
+
+    def schemas(self) -> Optional[List[Dict[str, Any]]]:
+        """Tool definitions to offer the model, or None when no tool is available"""
+        if not settings.FUNCTION_CALLING_ENABLED:
+            return None
+        schemas = [
+            self._schemas[name]
+            for name, definition in self.tools.items()
+            if definition.available is None or definition.available()
+        ]
+        return schemas or None
+
+    async def call(self, name: str, arguments: Dict[str, Any]) -> ToolResult:
+        """Validate and run a tool, from its cache when the same arguments ran within the TTL.
+
+        Raises ValueError for unknown tools and invalid arguments, and
+        asyncio.TimeoutError when the tool outlives its timeout.
+        """
+        definition = self.tools.get(name)
+        if definition is None:
+            raise ValueError(f"Unknown function: {name}")
+        if not isinstance(arguments, dict):
+            raise ValueError("Function arguments must be a JSON object")
+        validated = definition.arguments.parse_obj(arguments)
+
+        stats = self._stats[name]
+        stats["calls"] += 1
+        start = time.perf_counter()
+
+        def run() -> Awaitable[ToolResult]:
+            return asyncio.wait_for(definition.handler(validated), self.timeout)
+
+        try:
+            cache = self._caches.get(name)
+            if cache is None:
+                return await run()
+            return await cache.get_or_load(json.dumps(validated.dict(), sort_keys=True, default=str), run)
+        except asyncio.TimeoutError:
+            stats["timeouts"] += 1
+            raise
+        except Exception:
+            stats["errors"] += 1
+            raise
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            stats["total_ms"] += elapsed
+            stats["max_ms"] = max(stats["max_ms"], elapsed)
+
+    async def invoke(self, name: str, raw_arguments: Optional[str]) -> Tuple[Dict[str, Any], Dict[str, Any], List[Dict[str, Any]]]:
+        """Run a call the model made, returning its result, the tools_used entry and citations"""
+        start = time.perf_counter()
+        arguments: Any = {}
+        citations: List[Dict[str, Any]] = []
+        try:
+            arguments = json.loads(raw_arguments or "{}")
+            result, citations = await self.call(name, arguments)
+        except (ValueError, TypeError, KeyError) as e:
+            # Malformed arguments go back to the model as an error it can correct
+            result = {"error": str(e)}
+        except asyncio.TimeoutError:
+            logger.warning("agent_tool_timed_out", tool=name, timeout=self.timeout)
+            result = {"error": f"{name} timed out; answer without it"}
+
+        tool = {
+            "tool_name": name,
+            "parameters": arguments if isinstance(arguments, dict) else {},
+            "execution_time_ms": round((time.perf_counter() - start) * 1000, 1)
+        }
+        return result, tool, citations
+
+    async def invoke_many(self, calls: List[Tuple[str, Optional[str]]]) -> List[Tuple[Dict[str, Any], Dict[str, Any], List[Dict[str, Any]]]]:
+        """Run the (name, arguments JSON) calls of one model response concurrently, in order"""
+        return list(await asyncio.gather(*(self.invoke(name, raw_arguments) for name, raw_arguments in calls)))
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-tool latency, failures and cache hits, and each tool's share of tool time"""
+        total_ms = sum(stats["total_ms"] for stats in self._stats.values())
+        tools = {}
+        for name, stats in self._stats.items():
+            cache = self._caches.get(name)
+            tools[name] = {
+                "calls": int(stats["calls"]),
+                "errors": int(stats["errors"]),
+                "timeouts": int(stats["timeouts"]),
+                "mean_ms": round(stats["total_ms"] / stats["calls"], 1) if stats["calls"] else None,
+                "max_ms": round(stats["max_ms"], 1),
+                "time_share": round(stats["total_ms"] / total_ms, 4) if total_ms else 0.0,
+                "cache": cache.stats() if cache is not None else None,
+            }
+        return {"tools": tools, "total_ms": round(total_ms, 1)}
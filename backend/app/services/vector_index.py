@@ -0,0 +1,300 @@
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+class VectorIndex:
+    """In-process cosine-similarity index over float32 vectors.
+
+    Small corpora are searched exactly with batched matrix products. Once the
+    index holds `ivf_threshold` vectors (or with mode="ivf") searches go
+    through an inverted-file index: vectors are clustered around k-means
+    centroids and only the `nprobe` closest clusters are scored.
+
+    Documents are added, replaced and deleted by id; deletes leave tombstones
+    that are compacted once they make up a quarter of the rows.
+
+    Every method is safe to call from any thread: reads and writes share one
+    lock. IVF clustering runs outside it, in a background thread started by
+    the first search that needs it; until it finishes, searches stay exact
+    (or use the previous clustering).
+    """
+
+    def __init__(
+        self,
+        dimension: int,
+        mode: str = "auto",
+        ivf_threshold: int = 50000,
+        nlist: Optional[int] = None,
+        nprobe: int = 8,
+        batch_size: int = 65536
+    ):
+        if mode not in ("auto", "exact", "ivf"):
+            raise ValueError(f"Unknown vector index mode: {mode}")
+
+        self.dimension = dimension
+        self.mode = mode
+        self.ivf_threshold = ivf_threshold
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.batch_size = batch_size
+
+        self._vectors = np.zeros((1024, dimension), dtype=np.float32)
+        self._alive = np.zeros(1024, dtype=bool)
+        self._size = 0
+        self._ids: List[Optional[str]] = []
+        self._payloads: List[Optional[Dict[str, Any]]] = []
+        self._id_to_row: Dict[str, int] = {}
+
+        # IVF state
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._lists: List[np.ndarray] = []
+        self._trained_size = 0
+
+        self._lock = threading.RLock()
+        self._training: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._id_to_row)
+
+    def add(
+        self,
+        ids: List[str],
+        vectors: np.ndarray,
+        payloads: Optional[Sequence[Optional[Dict[str, Any]]]] = None
+    ):
+        """Add or replace vectors by document id; a repeated id keeps its last vector"""
+        vectors = self._normalize(np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dimension))
+        payloads = payloads or [None] * len(ids)
+
+        last = {doc_id: i for i, doc_id in enumerate(ids)}
+        if len(last) < len(ids):
+            keep = sorted(last.values())
+            ids = [ids[i] for i in keep]
+            vectors = vectors[keep]
+            payloads = [payloads[i] for i in keep]
+
+        with self._lock:
+            self.delete([doc_id for doc_id in ids if doc_id in self._id_to_row])
+            self._reserve(self._size + len(ids))
+
+            start = self._size
+            end = start + len(ids)
+            self._vectors[start:end] = vectors
+            self._alive[start:end] = True
+            for offset, (doc_id, payload) in enumerate(zip(ids, payloads)):
+                self._ids.append(doc_id)
+                self._payloads.append(payload)
+                self._id_to_row[doc_id] = start + offset
+            self._size = end
+
+            if self._centroids is not None:
+                self._assign_rows(self._centroids, start, end)
+
+    def delete(self, ids: List[str]) -> int:
+        """Delete vectors by document id, returning how many were removed"""
+        removed = 0
+        with self._lock:
+            for doc_id in ids:
+                row = self._id_to_row.pop(doc_id, None)
+                if row is None:
+                    continue
+                self._alive[row] = False
+                self._ids[row] = None
+                self._payloads[row] = None
+                removed += 1
+
+            if removed and self._size - len(self._id_to_row) > max(self._size // 4, 1024):
+                self._compact()
+        return removed
+
+    def get_payload(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Get the payload stored with a document"""
+        with self._lock:
+            row = self._id_to_row.get(doc_id)
+            return self._payloads[row] if row is not None else None
+
+    def search(self, queries: np.ndarray, top_k: int = 10) -> List[List[Tuple[str, float, Optional[Dict[str, Any]]]]]:
+        """Find the top_k most similar documents for each query vector"""
+        queries = self._normalize(np.asarray(queries, dtype=np.float32).reshape(-1, self.dimension))
+        with self._lock:
+            if not self._id_to_row:
+                return [[] for _ in range(len(queries))]
+
+            if self._use_ivf() and (self._centroids is None or self._size > 4 * self._trained_size):
+                self._train_in_background()
+            if self._use_ivf() and self._centroids is not None:
+                rows, scores = self._search_ivf(queries, self._centroids, top_k)
+            else:
+                rows, scores = self._search_exact(queries, top_k)
+
+            return [
+                [
+                    (self._ids[row], float(score), self._payloads[row])
+                    for row, score in zip(query_rows, query_scores)
+                    if row >= 0
+                ]
+                for query_rows, query_scores in zip(rows, scores)
+            ]
+
+    def train(self, iterations: int = 10, seed: int = 0):
+        """Cluster the live vectors into IVF lists.
+
+        k-means runs on a copied sample without holding the lock; only
+        assigning the rows to the new lists blocks readers and writers.
+        """
+        with self._lock:
+            live_rows = np.flatnonzero(self._alive[:self._size])
+            if len(live_rows) == 0:
+                return
+            nlist = self.nlist or max(1, int(np.sqrt(len(live_rows))))
+            nlist = min(nlist, len(live_rows))
+
+            rng = np.random.default_rng(seed)
+            sample_size = min(len(live_rows), nlist * 256)
+            sample = self._vectors[rng.choice(live_rows, size=sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=nlist)
+            nonempty = counts > 0
+            centroids[nonempty] = self._normalize(sums[nonempty] / counts[nonempty, None])
+
+        with self._lock:
+            self._centroids = centroids
+            self._assignments = np.full(len(self._alive), -1, dtype=np.int32)
+            self._lists = [np.empty(0, dtype=np.int64) for _ in range(nlist)]
+            self._assign_rows(centroids, 0, self._size)
+            self._trained_size = self._size
+        logger.info("vector_index_trained", nlist=nlist, vectors=len(live_rows))
+
+    def wait_for_training(self, timeout: Optional[float] = None):
+        """Block until a background clustering, if any, has finished"""
+        training = self._training
+        if training is not None:
+            training.join(timeout)
+
+    def _train_in_background(self):
+        if self._training is not None and self._training.is_alive():
+            return
+        self._training = threading.Thread(target=self._train_logged, name="vector-index-train", daemon=True)
+        self._training.start()
+
+    def _train_logged(self):
+        try:
+            self.train()
+        except Exception as e:
+            logger.error("vector_index_training_failed", error=str(e))
+
+    def _use_ivf(self) -> bool:
+        if self.mode == "ivf":
+            return True
+        return self.mode == "auto" and len(self._id_to_row) >= self.ivf_threshold
+
+    def _search_exact(self, queries: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        best_rows = np.full((len(queries), top_k), -1, dtype=np.int64)
+        best_scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+
+        for start in range(0, self._size, self.batch_size):
+            end = min(start + self.batch_size, self._size)
+            scores = queries @ self._vectors[start:end].T
+            scores[:, ~self._alive[start:end]] = -np.inf
+            rows = np.broadcast_to(np.arange(start, end), scores.shape)
+            best_rows, best_scores = self._merge_top_k(best_rows, best_scores, rows, scores, top_k)
+
+        return best_rows, best_scores
+
+    def _search_ivf(self, queries: np.ndarray, centroids: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        nprobe = min(self.nprobe, len(centroids))
+        probe_lists = np.argpartition(-(queries @ centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+
+        best_rows = np.full((len(queries), top_k), -1, dtype=np.int64)
+        best_scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+
+        for i, query in enumerate(queries):
+            candidates = np.concatenate([self._lists[list_id] for list_id in probe_lists[i]])
+            candidates = candidates[self._alive[candidates]]
+            if len(candidates) == 0:
+                continue
+            scores = self._vectors[candidates] @ query
+            rows, row_scores = self._merge_top_k(
+                best_rows[i:i + 1], best_scores[i:i + 1], candidates[None, :], scores[None, :], top_k
+            )
+            best_rows[i], best_scores[i] = rows[0], row_scores[0]
+
+        return best_rows, best_scores
+
+    @staticmethod
+    def _merge_top_k(
+        best_rows: np.ndarray,
+        best_scores: np.ndarray,
+        rows: np.ndarray,
+        scores: np.ndarray,
+        top_k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        all_rows = np.concatenate([best_rows, rows], axis=1)
+        all_scores = np.concatenate([best_scores, scores], axis=1)
+        if all_scores.shape[1] > top_k:
+            keep = np.argpartition(-all_scores, top_k - 1, axis=1)[:, :top_k]
+            all_rows = np.take_along_axis(all_rows, keep, axis=1)
+            all_scores = np.take_along_axis(all_scores, keep, axis=1)
+        order = np.argsort(-all_scores, axis=1)
+        all_rows = np.take_along_axis(all_rows, order, axis=1)
+        all_scores = np.take_along_axis(all_scores, order, axis=1)
+        all_rows[~np.isfinite(all_scores)] = -1
+        return all_rows, all_scores
+
+    def _assign_rows(self, centroids: np.ndarray, start: int, end: int):
+        if end <= start:
+            return
+        if len(self._assignments) < len(self._alive):
+            grown = np.full(len(self._alive), -1, dtype=np.int32)
+            grown[:len(self._assignments)] = self._assignments
+            self._assignments = grown
+
+        assignments = np.argmax(self._vectors[start:end] @ centroids.T, axis=1)
+        self._assignments[start:end] = assignments
+        rows = np.arange(start, end)
+        for list_id in np.unique(assignments):
+            self._lists[list_id] = np.concatenate([self._lists[list_id], rows[assignments == list_id]])
+
+    def _reserve(self, capacity: int):
+        if capacity <= len(self._vectors):
+            return
+        new_capacity = max(capacity, 2 * len(self._vectors))
+        vectors = np.zeros((new_capacity, self.dimension), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        alive = np.zeros(new_capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        self._vectors, self._alive = vectors, alive
+
+    def _compact(self):
+        live_rows = np.flatnonzero(self._alive[:self._size])
+        count = len(live_rows)
+        self._vectors[:count] = self._vectors[live_rows]
+        self._alive[:] = False
+        self._alive[:count] = True
+        self._ids = [self._ids[row] for row in live_rows]
+        self._payloads = [self._payloads[row] for row in live_rows]
+        self._id_to_row = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        self._size = count
+
+        if self._centroids is not None:
+            assignments = self._assignments[live_rows]
+            self._assignments[:] = -1
+            self._assignments[:count] = assignments
+            self._lists = [
+                np.flatnonzero(assignments == list_id) for list_id in range(len(self._centroids))
+            ]
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
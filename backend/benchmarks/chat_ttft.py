@@ -0,0 +1,88 @@
+"""Time to first token of a streamed chat turn, with retrieval pipelined or run first.
+
+    python -m benchmarks.chat_ttft --search-ms 300 --history-ms 50 --latency-ms 150 --first-token-ms 400
+
+Each turn is a new standalone question, so it also pays the semantic
+cache's query embedding; the cache never hits. The stub OpenAI endpoint
+answers embeddings and opens streams after --latency-ms, then sends the
+first token after --first-token-ms. Document search and loading the
+conversation history sleep for their injected latencies. "sequential"
+waits for the lookups before loading history and starting the turn, the
+order chat turns ran in before retrieval was pipelined; "pipelined"
+follows the chat routes, starting the lookups with the request.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.core.config import settings
+from app.services.agents import AgentService
+from app.services.embeddings import EmbeddingService
+from app.services.openai_client import OpenAIService
+from app.services.semantic_cache import SemanticCache
+from benchmarks.stub_openai import StubOpenAI
+
+
+class DelayedSearch:
+    def __init__(self, latency_s: float):
+        self.latency_s = latency_s
+
+    async def search_documents(self, query: str, top_k: int):
+        await asyncio.sleep(self.latency_s)
+        return [{"id": "d1", "title": "Soy policy", "content": "Zero deforestation commitments. " * 10, "source": "stub", "score": 1.0}]
+
+async def turn(agent: AgentService, mode: str, message: str, history_s: float):
+    """Seconds to the thinking event, the sources event and the first token"""
+    start = time.perf_counter()
+    prefetch = agent.prefetch_context(message, None)
+    if mode == "sequential":
+        await asyncio.wait([prefetch])
+    await asyncio.sleep(history_s)
+    history = [{"role": "user", "content": message}]
+
+    times = {}
+    async for chunk in agent.process_message_stream(message, history, prefetch=prefetch):
+        key = chunk.event or ("token" if chunk.delta else None)
+        if key and key not in times:
+            times[key] = time.perf_counter() - start
+        if chunk.is_final:
+            break
+    return times["thinking"], times["sources"], times["token"]
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--search-ms", type=float, default=300)
+    parser.add_argument("--history-ms", type=float, default=50)
+    parser.add_argument("--latency-ms", type=float, default=150, help="stub latency of embeddings and stream headers")
+    parser.add_argument("--first-token-ms", type=float, default=400)
+    args = parser.parse_args()
+
+    stub = await StubOpenAI(latency_s=args.latency_ms / 1000, first_token_s=args.first_token_ms / 1000, tokens=5).start()
+    settings.AZURE_OPENAI_ENDPOINT = stub.endpoint
+    settings.OPENAI_COALESCE_ENABLED = False
+    openai_service = OpenAIService()
+    embedding_service = EmbeddingService(openai_service)
+    agent = AgentService(
+        openai_service=openai_service,
+        search_service=DelayedSearch(args.search_ms / 1000),
+        embedding_service=embedding_service,
+        # Stub embeddings are alike, so a threshold above 1 keeps every turn a miss
+        semantic_cache=SemanticCache(similarity_threshold=1.01)
+    )
+
+    print(f"{'mode':>12} {'thinking ms':>12} {'sources ms':>11} {'first token ms':>15}")
+    for mode in ("sequential", "pipelined"):
+        await turn(agent, mode, f"warm-up {mode}", args.history_ms / 1000)
+        timings = [await turn(agent, mode, f"Question {i} about {mode} soy exposure", args.history_ms / 1000)
+                   for i in range(args.turns)]
+        thinking, sources, token = (statistics.median(column) * 1000 for column in zip(*timings))
+        print(f"{mode:>12} {thinking:>12.0f} {sources:>11.0f} {token:>15.0f}")
+
+    await embedding_service.close()
+    await openai_service.close()
+    await stub.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+"""Chunker throughput per format, in MB of item text per second on one core.
+
+    python -m benchmarks.chunking --mb 50
+
+Items are built before timing, so the numbers exclude parsing; the
+`+parse` rows time the parser and chunker together from an in-memory file.
+"estimated" is the default token counting (a sample is encoded, the rest
+estimated from its characters-per-token ratio); "exact" encodes every item.
+"""
+import argparse
+import io
+import json
+import random
+import time
+from typing import Callable, Iterator, List
+
+from app.services.chunking import Chunker, TokenCounter
+from app.services.parsers import (ParsedItem, parse_csv, parse_json,
+                                  parse_text, record_to_text)
+
+WORDS = ("emissions scope supplier deforestation soy cattle biodiversity water risk portfolio exposure "
+         "company region hectares carbon intensity methane audit disclosure policy").split()
+
+def sentence(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + "."
+
+def prose(size: int, rng: random.Random) -> Iterator[ParsedItem]:
+    produced, line = 0, 1
+    while produced < size:
+        if rng.random() < 0.1:
+            text = f"## {sentence(rng)[:-1]}"
+        elif rng.random() < 0.05:
+            rows = [f"| {rng.choice(WORDS)} | {rng.randint(0, 999)} | {rng.random():.3f} |" for _ in range(rng.randint(3, 60))]
+            text = "\n".join(["| name | value | share |", "| --- | --- | --- |", *rows])
+        else:
+            text = " ".join(sentence(rng) for _ in range(rng.randint(2, 12)))
+        produced += len(text)
+        line += text.count("\n") + 2
+        yield ParsedItem(kind="text", content=text, location={"line": line})
+
+def rows(size: int, rng: random.Random) -> Iterator[dict]:
+    produced, i = 0, 0
+    while produced < size:
+        i += 1
+        row = {
+            "id": str(i), "name": f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {i}",
+            "sector": rng.choice(("Energy", "Retail", "Agriculture", "Materials")),
+            "country": rng.choice(("BR", "ID", "US", "DE", "NG")), "rating": rng.choice(("A", "BB", "CCC")),
+            "score": f"{rng.random() * 100:.2f}", "notes": sentence(rng),
+        }
+        produced += sum(len(value) for value in row.values())
+        yield row
+
+def records(size: int, rng: random.Random) -> Iterator[ParsedItem]:
+    for i, row in enumerate(rows(size, rng), start=1):
+        yield ParsedItem(kind="record", content=record_to_text(row), location={"row": i}, fields=row)
+
+def csv_file(size: int, rng: random.Random) -> io.BytesIO:
+    lines = [",".join(row.keys()) for row in rows(1, rng)]
+    lines += [",".join(row.values()) for row in rows(size, rng)]
+    return io.BytesIO("\n".join(lines).encode())
+
+def json_file(size: int, rng: random.Random) -> io.BytesIO:
+    return io.BytesIO(json.dumps(list(rows(size, rng))).encode())
+
+def text_file(size: int, rng: random.Random) -> io.BytesIO:
+    return io.BytesIO("\n\n".join(item.content for item in prose(size, rng)).encode())
+
+def measure(name: str, mode: str, items: Callable[[], Iterator[ParsedItem]], size: int):
+    chunker = Chunker(counter=TokenCounter(exact=mode == "exact"))
+    start = time.perf_counter()
+    chunks = sum(1 for _ in chunker.chunk(items()))
+    elapsed = time.perf_counter() - start
+    print(f"{name:>14} {mode:>10} {size / 1e6 / elapsed:>8.1f} {chunks:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, default=20, help="text per format")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    size = int(args.mb * 1e6)
+
+    print(f"{'format':>14} {'counting':>10} {'MB/s':>8} {'chunks':>8}")
+    for name, generate in (("prose", prose), ("records", records)):
+        items: List[ParsedItem] = list(generate(size, random.Random(args.seed)))
+        text_size = sum(len(item.content) for item in items)
+        for mode in ("estimated", "exact"):
+            measure(name, mode, lambda: iter(items), text_size)
+
+    for name, build, parse in (("txt+parse", text_file, parse_text), ("csv+parse", csv_file, parse_csv),
+                               ("json+parse", json_file, parse_json)):
+        file = build(size, random.Random(args.seed))
+        file_size = len(file.getbuffer())
+        measure(name, "estimated", lambda: parse(io.BytesIO(file.getvalue())), file_size)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Per-request OpenAI clients versus the application's shared keep-alive pool.
+
+    python -m benchmarks.connection_pool --requests 500 --concurrency 20
+
+Before the service container, each chat request built its own
+OpenAIService, and with it a fresh connection pool. The stub counts the
+TCP connections each mode opens. Client and stub share one process, so
+req/s is bounded by the openai SDK's per-call CPU rather than the stub.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.core.config import settings
+from app.core.http import create_http_client
+from app.services.openai_client import OpenAIService
+from benchmarks.stub_openai import StubOpenAI
+
+
+async def run(mode: str, stub: StubOpenAI, requests: int, concurrency: int):
+    http_client = create_http_client() if mode == "shared" else None
+    shared = OpenAIService(http_client=http_client) if http_client is not None else None
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            service = shared or OpenAIService()
+            try:
+                await service.generate_response([{"role": "user", "content": f"question {i}"}])
+            finally:
+                if shared is None:
+                    await service.close()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    connections = stub.connections
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    if http_client is not None:
+        await http_client.aclose()
+    latencies.sort()
+    print(f"{mode:>12} {requests / elapsed:>8.0f} {statistics.median(latencies):>8.2f} "
+          f"{latencies[int(len(latencies) * 0.99) - 1]:>8.2f} {stub.connections - connections:>12}")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="stub response latency")
+    args = parser.parse_args()
+
+    stub = await StubOpenAI(latency_s=args.latency_ms / 1000).start()
+    settings.AZURE_OPENAI_ENDPOINT = stub.endpoint
+    settings.OPENAI_COALESCE_ENABLED = False
+    print(f"{'mode':>12} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'connections':>12}")
+    for mode in ("per-request", "shared"):
+        await run(mode, stub, args.requests, args.concurrency)
+    await stub.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""Chat-turn store operations against store size: indexed store versus a full scan.
+
+    python -m benchmarks.conversation_store --users 100 1000 5000
+
+Each user has --conversations conversations of --messages messages. A
+turn here is what send_message does to the store: fetch the history,
+append two messages and bump the conversation. The full-scan column is
+the previous implementation: filter every message, then sort.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from app.services.conversation_store import ConversationStore
+
+
+def build(users: int, conversations: int, messages: int) -> ConversationStore:
+    store = ConversationStore()
+    start = datetime(2024, 1, 1)
+    for u in range(users):
+        for c in range(conversations):
+            conversation_id = f"u{u}-c{c}"
+            store.create_conversation({
+                "id": conversation_id, "user_id": f"u{u}", "title": "",
+                "created_at": start, "updated_at": start + timedelta(seconds=u * conversations + c),
+                "is_archived": False,
+            })
+            for m in range(messages):
+                store.add_message({
+                    "id": f"{conversation_id}-m{m}", "conversation_id": conversation_id,
+                    "timestamp": start + timedelta(seconds=m), "content": "x",
+                })
+    return store
+
+def full_scan_history(store: ConversationStore, conversation_id: str):
+    found = [m for m in store.messages.values() if m["conversation_id"] == conversation_id]
+    return sorted(found, key=lambda m: m["timestamp"])
+
+def time_per_op(operation, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        operation()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--conversations", type=int, default=5)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'messages':>10} {'turn us':>9} {'list us':>9} {'full scan us':>13}")
+    for users in args.users:
+        store = build(users, args.conversations, args.messages)
+        rng = random.Random(0)
+        counter = iter(range(10 ** 9))
+
+        def turn():
+            conversation_id = f"u{rng.randrange(users)}-c{rng.randrange(args.conversations)}"
+            store.get_messages(conversation_id)
+            for _ in range(2):
+                store.add_message({"id": f"new-{next(counter)}", "conversation_id": conversation_id,
+                                   "timestamp": datetime.utcnow(), "content": "x"})
+            store.touch(conversation_id)
+
+        def listing():
+            store.page_conversations(f"u{rng.randrange(users)}", 20)
+
+        def scan():
+            full_scan_history(store, f"u{rng.randrange(users)}-c{rng.randrange(args.conversations)}")
+
+        total = len(store.messages)
+        print(f"{total:>10} {time_per_op(turn, args.repeat):>9.1f} {time_per_op(listing, args.repeat):>9.1f} "
+              f"{time_per_op(scan, max(args.repeat // 20, 3)):>13.1f}")
+
+if __name__ == "__main__":
+    main()
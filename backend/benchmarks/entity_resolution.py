@@ -0,0 +1,83 @@
+"""Company name resolution: single-lookup latency and batch throughput.
+
+    python -m benchmarks.entity_resolution --companies 100000
+
+Company names are two or three random words plus a legal form. Each
+workload spells indexed names the way holdings files and providers do:
+different case and legal form, a dropped letter, an extra trailing word
+("Brasil"), only the two leading words, or a name that is not indexed.
+Holdings are drawn from the three-word names, whose two leading words
+identify them; a single random word is shared by several companies.
+Single lookups call resolve_many with one name; batches resolve every
+name of the workload at once, with repeats as in a holdings file.
+"correct" counts names resolved to the company they were spelled from;
+"ambiguous" counts results flagged as naming several companies.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from app.services.entity_resolution import EntityIndex
+
+LEGAL_FORMS = ("Inc.", "Ltd", "S.A.", "GmbH", "PLC", "Corp", "LLC", "Ltda", "AG", "N.V.")
+
+def generate(count: int, rng: random.Random):
+    words = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 9))) for _ in range(20000)]
+    names = [
+        " ".join(rng.choice(words).title() for _ in range(2 if i % 3 else 3)) + f" {rng.choice(LEGAL_FORMS)}"
+        for i in range(count)
+    ]
+    return names, words
+
+def dropped_letter(name: str, rng: random.Random) -> str:
+    position = rng.randrange(1, len(name) - 1)
+    return name[:position] + name[position + 1:]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--companies", type=int, default=100000)
+    parser.add_argument("--names", type=int, default=50000, help="names per batch")
+    parser.add_argument("--lookups", type=int, default=1000, help="single lookups per workload")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    names, words = generate(args.companies, rng)
+    start = time.perf_counter()
+    index = EntityIndex.build(names, [""] * len(names), [f"T{i}" for i in range(len(names))])
+    print(f"{len(names)} companies: index built in {time.perf_counter() - start:.1f}s, {index.stats()}")
+
+    spellings = {
+        "legal form": lambda name: name.rsplit(" ", 1)[0].upper() + " Limited",
+        "typo": lambda name: dropped_letter(name.rsplit(" ", 1)[0], rng),
+        "extra word": lambda name: name.rsplit(" ", 1)[0] + " Brasil",
+        "leading words": lambda name: " ".join(name.split()[:2]),
+        "unknown": lambda name: f"{rng.choice(words)}{rng.choice(words)} Zzq",
+    }
+    three_words = [row for row, name in enumerate(names) if name.count(" ") == 3]
+    print(f"{'workload':>14} {'p50 us':>8} {'p99 us':>8} {'batch names/s':>14} {'resolved':>9} {'correct':>8} {'ambiguous':>10}")
+    for label, spell in spellings.items():
+        issuers = [rng.choice(three_words) for _ in range(max(args.names // 4, 1))]
+        rows = [rng.choice(issuers) for _ in range(args.names)]
+        batch = [spell(names[row]) for row in rows]
+
+        latencies = []
+        for name in batch[:args.lookups]:
+            start = time.perf_counter()
+            index.resolve_many([name], args.threshold)
+            latencies.append((time.perf_counter() - start) * 1e6)
+        latencies.sort()
+
+        start = time.perf_counter()
+        results = index.resolve_many(batch, args.threshold)
+        elapsed = time.perf_counter() - start
+        resolved = sum(result is not None for result in results) / len(results)
+        correct = sum(result is not None and result["row"] == row for result, row in zip(results, rows)) / len(results)
+        ambiguous = sum(result is not None and result["ambiguous"] for result in results) / len(results)
+        print(f"{label:>14} {statistics.median(latencies):>8.0f} {latencies[int(len(latencies) * 0.99) - 1]:>8.0f} "
+              f"{len(batch) / elapsed:>14.0f} {resolved:>9.1%} {correct:>8.1%} {ambiguous:>10.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Windowed-read throughput of tiled rasters against a plain memory-mapped .npy grid.
+
+    python -m benchmarks.raster_store --size 8192 --reads 500
+
+The grid imitates a forest-loss layer: uint8 percentages, mostly zero,
+with patches of loss, so zlib tiles compress well and many tiles are
+empty. Windows are read at random positions; "cold" reads use a fresh
+tile cache each pass, "warm" reads repeat the same windows. MB/s counts
+the cells returned. Zonal statistics run over random polygons.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.raster_store import (NpyRaster, TileCache, TiledRaster,
+                                       write_tiled_raster)
+
+META = {"west": -75.0, "north": 5.0, "cell_degrees": 0.00025, "scale": 0.01, "name": "forest_loss"}
+
+def forest_loss(size: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    coarse = rng.random((size // 64 + 1, size // 64 + 1))
+    patches = np.kron(coarse > 0.85, np.ones((64, 64), dtype=bool))[:size, :size]
+    loss = np.zeros((size, size), dtype=np.uint8)
+    loss[patches] = rng.integers(1, 101, int(patches.sum()), dtype=np.uint8)
+    return loss
+
+def read_windows(raster, windows) -> float:
+    start = time.perf_counter()
+    cells = 0
+    for top, left, side in windows:
+        cells += raster.window(top, top + side, left, left + side).size
+    return cells * raster.dtype.itemsize / 1e6 / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=8192, help="cells per side")
+    parser.add_argument("--tile-size", type=int, default=256)
+    parser.add_argument("--reads", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    grid = forest_loss(args.size, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    with tempfile.TemporaryDirectory() as directory:
+        npy_path = os.path.join(directory, "loss.npy")
+        np.save(npy_path, grid)
+        with open(os.path.join(directory, "loss.json"), "w") as meta_file:
+            json.dump(META, meta_file)
+        rasters = {"npy": NpyRaster(npy_path)}
+        for compression in (None, "zlib"):
+            path = os.path.join(directory, f"loss.{compression or 'raw'}.tiles")
+            start = time.perf_counter()
+            write_tiled_raster(path, grid, META, tile_size=args.tile_size, compression=compression)
+            print(f"tiles {compression or 'raw'}: written in {time.perf_counter() - start:.1f}s, "
+                  f"{os.path.getsize(path) / 2 ** 20:.1f} MiB (grid {grid.nbytes / 2 ** 20:.1f} MiB)")
+            rasters[f"tiles {compression or 'raw'}"] = TiledRaster(path)
+
+        print(f"{'raster':>12} {'window':>8} {'cold MB/s':>10} {'warm MB/s':>10} {'reads/s':>9}")
+        for side in (64, 256, 1024):
+            windows = [(int(rng.integers(0, args.size - side)), int(rng.integers(0, args.size - side)), side)
+                       for _ in range(args.reads)]
+            for name, raster in rasters.items():
+                if isinstance(raster, TiledRaster):
+                    raster.cache = TileCache(raster.cache.max_bytes)
+                cold = read_windows(raster, windows)
+                warm = read_windows(raster, windows)
+                print(f"{name:>12} {side:>8} {cold:>10.0f} {warm:>10.0f} {warm * 1e6 / (side * side):>9.0f}")
+
+        extent = args.size * META["cell_degrees"]
+        polygons = []
+        for _ in range(50):
+            lon = META["west"] + rng.uniform(0.1, 0.9) * extent
+            lat = META["north"] - rng.uniform(0.1, 0.9) * extent
+            radius = extent * 0.05
+            angles = np.sort(rng.uniform(0, 2 * np.pi, 12))
+            polygons.append(np.column_stack([lon + radius * np.cos(angles), lat + radius * np.sin(angles)]))
+        for name, raster in rasters.items():
+            start = time.perf_counter()
+            cells = sum(raster.zonal_stats(ring)["cells"] for ring in polygons)
+            elapsed = time.perf_counter() - start
+            print(f"zonal {name:>12}: {elapsed / len(polygons) * 1000:.1f} ms per polygon, {cells / elapsed / 1e6:.0f}M cells/s")
+
+
+if __name__ == "__main__":
+    main()
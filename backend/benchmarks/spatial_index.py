@@ -0,0 +1,97 @@
+"""Asset index build, memory-mapped startup and query latency.
+
+    python -m benchmarks.spatial_index --assets 1000000
+
+Assets are clustered around production hubs (most sites sit in a few
+agricultural and industrial regions), and a tenth have a footprint
+rather than a point. The index is built, saved, then reopened from its
+memory-mapped snapshot the way AssetStore starts; queries run against the
+reopened store, so they include page faults on first touch.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.spatial_index import AssetIndex, AssetStore
+
+
+def generate(count: int, seed: int):
+    rng = np.random.default_rng(seed)
+    hubs = np.column_stack([rng.uniform(-170, 170, 300), rng.uniform(-55, 65, 300)])
+    centres = hubs[rng.integers(0, len(hubs), count)]
+    lons = np.clip(centres[:, 0] + rng.normal(0, 3, count), -179.9, 179.9)
+    lats = np.clip(centres[:, 1] + rng.normal(0, 2, count), -89.9, 89.9)
+    half = np.where(rng.random(count) < 0.1, rng.uniform(0.001, 0.05, count), 0.0)
+    types = np.array(["farm", "mill", "mine", "plant", "warehouse"])[rng.integers(0, 5, count)]
+    countries = np.array(["BR", "ID", "US", "AR", "CN", "IN", "NG"])[rng.integers(0, 7, count)]
+    return [
+        {
+            "id": f"A{i}", "name": f"Site {i}", "company": f"Company {i % 5000}", "company_id": f"C{i % 5000}",
+            "type": types[i], "country": countries[i],
+            "min_lon": lon - h, "min_lat": lat - h, "max_lon": lon + h, "max_lat": lat + h,
+        }
+        for i, (lon, lat, h) in enumerate(zip(lons.tolist(), lats.tolist(), half.tolist()))
+    ], hubs
+
+def timed(store: AssetStore, queries):
+    latencies, matches = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, total = store.search(**query)
+        latencies.append((time.perf_counter() - start) * 1000)
+        matches.append(total)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1], statistics.median(matches)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    assets, hubs = generate(args.assets, args.seed)
+    start = time.perf_counter()
+    index = AssetIndex.build(assets)
+    build_s = time.perf_counter() - start
+    del assets
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "assets")
+        start = time.perf_counter()
+        index.save(path)
+        save_s = time.perf_counter() - start
+        del index
+
+        start = time.perf_counter()
+        store = AssetStore(path)
+        load_ms = (time.perf_counter() - start) * 1000
+        print(f"{len(store)} assets: build {build_s:.1f}s, save {save_s:.2f}s, "
+              f"memory-mapped startup {load_ms:.1f}ms, {store.stats()['bytes'] / 2 ** 20:.0f} MiB of columns")
+
+        rng = np.random.default_rng(args.seed + 1)
+        points = hubs[rng.integers(0, len(hubs), args.queries)] + rng.normal(0, 2, (args.queries, 2))
+        polygon = lambda lon, lat, r: [[lon - r, lat - r], [lon + r, lat - r * 0.5], [lon + r * 0.5, lat + r], [lon - r, lat + r * 0.7]]
+        workloads = {
+            "bbox 0.5 deg": [{"bbox": (lon - 0.25, lat - 0.25, lon + 0.25, lat + 0.25)} for lon, lat in points],
+            "bbox 5 deg": [{"bbox": (lon - 2.5, lat - 2.5, lon + 2.5, lat + 2.5)} for lon, lat in points],
+            "radius 10 km": [{"near": (lat, lon, 10.0)} for lon, lat in points],
+            "radius 100 km": [{"near": (lat, lon, 100.0)} for lon, lat in points],
+            "polygon 1 deg": [{"polygon": polygon(lon, lat, 0.5)} for lon, lat in points],
+            "radius+filter": [{"near": (lat, lon, 100.0), "categories": {"type": ["mill"]}, "query": "company 12"}
+                              for lon, lat in points],
+        }
+
+        print(f"{'query':>16} {'p50 ms':>8} {'p99 ms':>8} {'matches':>9}")
+        for name, queries in workloads.items():
+            p50, p99, matches = timed(store, queries)
+            print(f"{name:>16} {p50:>8.3f} {p99:>8.3f} {matches:>9.0f}")
+
+        store.index = None  # release the mappings before the directory goes
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""A minimal local stand-in for the Azure OpenAI chat completions endpoint.
+
+Speaks just enough HTTP/1.1 (keep-alive, chunked SSE streams) for the
+openai SDK, counts TCP connections, and injects latency, error statuses
+and streams cut off mid-reply, so benchmarks and tests can exercise
+client behaviour without a network or quota.
+"""
+import asyncio
+import json
+import time
+from typing import List, Optional
+
+
+class StubOpenAI:
+    def __init__(self, latency_s: float = 0.0, first_token_s: float = 0.0, token_interval_s: float = 0.0,
+                 tokens: int = 20, embedding_dimension: int = 8):
+        self.latency_s = latency_s  # before any response
+        self.first_token_s = first_token_s  # streams: after the headers, before the first delta
+        self.token_interval_s = token_interval_s
+        self.tokens = tokens
+        self.embedding_dimension = embedding_dimension
+        self.fail_status: Optional[int] = None  # answer every request with this status
+        self.fail_next: List[int] = []  # statuses for the next requests, one each
+        self.retry_after_s: Optional[float] = None  # sent with error statuses
+        self.cut_after: Optional[int] = None  # streams drop the connection after this many deltas
+        self.connections = 0
+        self.requests = 0
+        self.bodies: List[dict] = []
+        self.port: Optional[int] = None
+        self._server: Optional[asyncio.base_events.Server] = None
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self) -> "StubOpenAI":
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                path = request_line.split()[1].decode()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b""):
+                        break
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = json.loads(await reader.readexactly(int(headers.get("content-length", 0))) or b"{}")
+                self.requests += 1
+                self.bodies.append(body)
+                await asyncio.sleep(self.latency_s)
+                status = self.fail_next.pop(0) if self.fail_next else self.fail_status
+                if status is not None:
+                    await self._error(writer, status)
+                elif "/embeddings" in path:
+                    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+                    await self._json(writer, {
+                        "object": "list", "model": "stub",
+                        "data": [
+                            {"object": "embedding", "index": i, "embedding": [float(len(text) % 7)] * self.embedding_dimension}
+                            for i, text in enumerate(inputs)
+                        ],
+                        "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+                    })
+                elif body.get("stream"):
+                    await self._stream(writer)
+                else:
+                    await self._json(writer, {
+                        "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": "stub",
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": "stub " * self.tokens}}],
+                        "usage": {"prompt_tokens": 10, "completion_tokens": self.tokens, "total_tokens": 10 + self.tokens},
+                    })
+        except (ConnectionError, asyncio.IncompleteReadError):
+            return
+        finally:
+            writer.close()
+
+    async def _json(self, writer: asyncio.StreamWriter, payload: dict, status: str = "200 OK", headers: str = ""):
+        data = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nConnection: keep-alive\r\n{headers}".encode()
+            + f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+        )
+        await writer.drain()
+
+    async def _error(self, writer: asyncio.StreamWriter, status: int):
+        headers = f"Retry-After-Ms: {int(self.retry_after_s * 1000)}\r\n" if self.retry_after_s is not None else ""
+        await self._json(writer, {"error": {"message": f"stub error {status}", "type": "stub", "code": str(status)}},
+                         status=f"{status} Stub Error", headers=headers)
+
+    async def _stream(self, writer: asyncio.StreamWriter):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        await writer.drain()
+
+        async def send(data: bytes):
+            writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            await writer.drain()
+
+        await asyncio.sleep(self.first_token_s)
+        for i in range(self.tokens):
+            if i:
+                await asyncio.sleep(self.token_interval_s)
+            chunk = {"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": "stub",
+                     "choices": [{"index": 0, "delta": {"content": f"t{i} "}, "finish_reason": None}]}
+            await send(f"data: {json.dumps(chunk)}\n\n".encode())
+            if self.cut_after is not None and i + 1 >= self.cut_after:
+                raise ConnectionError("stream cut")
+        await send(b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
@@ -0,0 +1,79 @@
+"""Recall@k and queries/s of the vector index, exact versus IVF.
+
+    python -m benchmarks.vector_index --sizes 100000 1000000 --dimension 128
+
+Vectors are drawn around random cluster centres, like embeddings of a
+corpus on a handful of topics, and queries are perturbed corpus vectors.
+Recall is measured against the exact search of the same index. Memory is
+sizes x dimension x 4 bytes, so 1M vectors at the production dimension
+(1536) need about 6 GB; the default dimension keeps that under 1 GB.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.services.vector_index import VectorIndex
+
+
+def corpus(size: int, dimension: int, topics: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((topics, dimension)).astype(np.float32)
+    vectors = np.empty((size, dimension), dtype=np.float32)
+    for start in range(0, size, 100000):
+        end = min(start + 100000, size)
+        vectors[start:end] = centres[rng.integers(0, topics, end - start)]
+        vectors[start:end] += 0.6 * rng.standard_normal((end - start, dimension)).astype(np.float32)
+    return vectors
+
+def timed_search(index: VectorIndex, queries: np.ndarray, top_k: int):
+    start = time.perf_counter()
+    results = [index.search(query, top_k)[0] for query in queries]
+    return results, len(queries) / (time.perf_counter() - start)
+
+def run(size: int, args):
+    vectors = corpus(size, args.dimension, args.topics, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    queries = vectors[rng.integers(0, size, args.queries)]
+    queries = queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    index = VectorIndex(dimension=args.dimension, mode="exact")
+    start = time.perf_counter()
+    for batch in range(0, size, 10000):
+        index.add([f"d{i}" for i in range(batch, min(batch + 10000, size))], vectors[batch:batch + 10000])
+    load_s = time.perf_counter() - start
+    del vectors
+
+    truth, exact_qps = timed_search(index, queries, args.top_k)
+    print(f"{size:>9} {'exact':>10} {load_s:>8.1f} {'':>8} {1.0:>10.3f} {exact_qps:>8.1f}")
+
+    index.mode = "ivf"
+    start = time.perf_counter()
+    index.train()
+    train_s = time.perf_counter() - start
+    for nprobe in args.nprobe:
+        index.nprobe = nprobe
+        results, qps = timed_search(index, queries, args.top_k)
+        recall = np.mean([
+            len({doc_id for doc_id, _, _ in found} & {doc_id for doc_id, _, _ in expected}) / max(len(expected), 1)
+            for found, expected in zip(results, truth)
+        ])
+        print(f"{size:>9} {f'ivf/{nprobe}':>10} {'':>8} {train_s:>8.1f} {recall:>10.3f} {qps:>8.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--dimension", type=int, default=128)
+    parser.add_argument("--topics", type=int, default=200, help="cluster centres the corpus is drawn around")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'vectors':>9} {'search':>10} {'load s':>8} {'train s':>8} {f'recall@{args.top_k}':>10} {'qps':>8}")
+    for size in args.sizes:
+        run(size, args)
+
+if __name__ == "__main__":
+    main()
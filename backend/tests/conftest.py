@@ -0,0 +1,15 @@
+import os
+
+# Settings that have no default; CI provides most of them, local runs need none
+for name, value in {
+    "SECRET_KEY": "test-secret-key",
+    "AZURE_CLIENT_ID": "test-client",
+    "AZURE_TENANT_ID": "test-tenant",
+    "AZURE_OPENAI_ENDPOINT": "http://127.0.0.1:9",
+    "AZURE_OPENAI_API_KEY": "test-key",
+    "AZURE_SEARCH_ENDPOINT": "http://127.0.0.1:9",
+    "AZURE_SEARCH_API_KEY": "test-key",
+    "AZURE_STORAGE_CONNECTION_STRING": "UseDevelopmentStorage=true",
+    "APPINSIGHTS_CONNECTION_STRING": "InstrumentationKey=test",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,136 @@
+import asyncio
+
+import numpy as np
+
+from app.services.agents import AgentService
+from app.services.semantic_cache import SemanticCache
+
+
+class FakeSearch:
+    """search_documents that signals when it starts and waits to be released"""
+
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def search_documents(self, query, top_k):
+        self.started.set()
+        await self.release.wait()
+        return [{"id": "d1", "title": "Soy policy", "content": "Zero deforestation.", "source": "test", "score": 1.0}]
+
+class FakeEmbeddings:
+    def __init__(self, before=None):
+        self.before = before
+
+    async def embed(self, texts):
+        if self.before is not None:
+            await self.before()
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+class FakeOpenAI:
+    deployment_name = "gpt-4"
+
+    def __init__(self):
+        self.opened = asyncio.Event()
+        self.release = asyncio.Event()
+        self.release.set()
+        self.closed = False
+
+    async def generate_response_stream(self, **kwargs):
+        self.opened.set()
+        try:
+            await self.release.wait()
+            for token in ("Exposure ", "is ", "low."):
+                yield token
+        finally:
+            self.closed = True
+
+def agent(search=None, embeddings=None, openai=None, cache=None):
+    return AgentService(
+        openai_service=openai or FakeOpenAI(),
+        search_service=search or FakeSearch(),
+        embedding_service=embeddings or FakeEmbeddings(),
+        semantic_cache=cache or SemanticCache()
+    )
+
+def stream(service, message, prefetch=None):
+    return service.process_message_stream(message, [{"role": "user", "content": message}], prefetch=prefetch)
+
+async def test_thinking_is_sent_before_the_lookups_finish():
+    search = FakeSearch()
+    service = agent(search=search)
+    prefetch = service.prefetch_context("Soy exposure?", None)
+    chunks = stream(service, "Soy exposure?", prefetch)
+
+    first = await chunks.__anext__()
+
+    assert first.event == "thinking" and not prefetch.done()
+    search.release.set()
+    assert [chunk.event async for chunk in chunks][0] == "sources"
+
+async def test_search_overlaps_the_cache_embedding():
+    search = FakeSearch()
+    overlapped = []
+
+    async def search_must_be_running():
+        # Times out if the search only starts once the embedding is done
+        try:
+            await asyncio.wait_for(search.started.wait(), timeout=1)
+            overlapped.append(True)
+        finally:
+            search.release.set()
+
+    service = agent(search=search, embeddings=FakeEmbeddings(before=search_must_be_running))
+    chunks = [chunk async for chunk in stream(service, "Soy exposure?")]
+
+    assert overlapped
+    assert "".join(chunk.delta for chunk in chunks) == "Exposure is low."
+    assert chunks[-1].citations[0]["id"] == "d1"
+
+async def test_the_model_stream_opens_before_sources_are_consumed():
+    search, openai = FakeSearch(), FakeOpenAI()
+    search.release.set()
+    openai.release.clear()
+    chunks = stream(agent(search=search, openai=openai), "Soy exposure?")
+
+    assert (await chunks.__anext__()).event == "thinking"
+    sources = await chunks.__anext__()
+    await asyncio.wait_for(openai.opened.wait(), timeout=1)
+
+    assert sources.event == "sources" and sources.citations[0]["id"] == "d1"
+    openai.release.set()
+    assert "".join([chunk.delta async for chunk in chunks]) == "Exposure is low."
+
+async def test_a_cache_hit_cancels_the_prefetched_lookups():
+    cache = SemanticCache()
+    cache.store(np.ones(4, dtype=np.float32), SemanticCache.scope_key(None, None), content="Cached answer.",
+                citations=[], metadata={})
+    service = agent(cache=cache)
+    prefetch = service.prefetch_context("Soy exposure?", None)
+
+    chunks = [chunk async for chunk in stream(service, "Soy exposure?", prefetch)]
+    await asyncio.sleep(0)
+
+    assert "".join(chunk.delta for chunk in chunks) == "Cached answer."
+    assert chunks[-1].metadata["cache_hit"] and prefetch.cancelled()
+
+async def test_closing_the_stream_early_cancels_the_lookups():
+    service = agent()
+    prefetch = service.prefetch_context("Soy exposure?", None)
+    chunks = stream(service, "Soy exposure?", prefetch)
+
+    await chunks.__anext__()
+    await chunks.aclose()
+    await asyncio.sleep(0)
+
+    assert prefetch.cancelled()
+
+async def test_closing_the_stream_mid_reply_closes_the_model_stream():
+    search, openai = FakeSearch(), FakeOpenAI()
+    search.release.set()
+    chunks = stream(agent(search=search, openai=openai), "Soy exposure?")
+
+    events = [(await chunks.__anext__()).event for _ in range(3)]
+    await chunks.aclose()
+
+    assert events == ["thinking", "sources", None] and openai.closed
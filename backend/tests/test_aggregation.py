@@ -0,0 +1,45 @@
+import random
+
+from app.services.aggregation import DIMENSIONS, PortfolioAggregator
+from app.services.company_store import CompanyStore
+
+SECTORS = ("Food", "Energy", "Mining", "Retail")
+COUNTRIES = ("BR", "US", "NO", "ID", "")
+
+def holdings(rng, ids, portfolio):
+    rows = []
+    for company in ids:
+        row = {
+            "id": f"C{company}",
+            "name": f"Company {company}",
+            "sector": rng.choice(SECTORS),
+            "country": rng.choice(COUNTRIES),
+            "rating": rng.choice("ABC"),
+            "emissions": rng.choice(["", str(rng.uniform(10, 1000))]),
+        }
+        if portfolio:
+            row.update(portfolio=portfolio, weight=rng.choice(["", str(rng.uniform(0.1, 5))]), value=str(rng.uniform(1e3, 1e6)))
+        rows.append(row)
+    return rows
+
+def rollups(aggregator):
+    return [
+        aggregator.rollup(group_by=group_by, filters=filters)
+        for group_by in ([], ["portfolio"], ["sector", "country"], list(DIMENSIONS))
+        for filters in (None, {"sector": ["food", "mining"]}, {"portfolio": ["Nordic"], "rating": ["A"]})
+    ]
+
+def test_incremental_updates_match_a_full_recompute():
+    rng = random.Random(0)
+    store = CompanyStore()
+    store.upsert(holdings(rng, range(200), "Nordic") + holdings(rng, range(100, 300), "Global"))
+    aggregator = PortfolioAggregator(store)
+
+    # Reclassified companies, reweighted and new holdings, companies without holdings and a new metric
+    store.upsert(holdings(rng, rng.sample(range(300), 60), "Nordic"))
+    store.upsert(holdings(rng, range(280, 340), "Global") + holdings(rng, range(340, 360), ""))
+    store.upsert(holdings(rng, rng.sample(range(360), 40), ""))
+    store.upsert([{"id": f"C{company}", "water_use": str(company)} for company in range(0, 360, 7)])
+
+    assert aggregator.stats()["rebuilds"] == 1 and aggregator.stats()["updates"] == 4
+    assert rollups(aggregator) == rollups(PortfolioAggregator(store))
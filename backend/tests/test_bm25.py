@@ -0,0 +1,53 @@
+from app.services.bm25 import BM25Index, tokenize
+
+
+def index(documents):
+    bm25 = BM25Index()
+    for doc_id, text in documents.items():
+        bm25.add(doc_id, text)
+    return bm25
+
+def ids(results):
+    return [doc_id for doc_id, _ in results]
+
+def test_identifiers_stay_whole_and_add_their_parts():
+    assert tokenize("Concession MT-0231 of EQNR.OL") == ["concession", "mt-0231", "mt", "0231", "of", "eqnr.ol", "eqnr", "ol"]
+
+def test_rarer_terms_and_shorter_documents_rank_higher():
+    bm25 = index({
+        "soy": "soy supply chain deforestation",
+        "cattle": "cattle supply chain",
+        "long": "soy supply chain deforestation " + "annual report filler text " * 20,
+    })
+
+    results = bm25.search("soy deforestation")
+    assert ids(results) == ["soy", "long"]
+    assert results[0][1] > results[1][1] > 0
+    assert ids(bm25.search("chain", top_k=1)) == ["cattle"]
+    assert bm25.search("palm") == []
+
+def test_an_exact_identifier_finds_its_document():
+    bm25 = index({f"d{i}": f"Concession MT-{i:04d} in Mato Grosso" for i in range(500)})
+
+    results = bm25.search("deforestation near MT-0231", top_k=3)
+    assert ids(results)[0] == "d231" and results[0][1] > 2 * results[1][1]
+
+def test_deleted_and_replaced_documents_are_not_returned():
+    bm25 = index({"a": "soy expansion", "b": "soy moratorium", "c": "cattle ranching"})
+
+    assert bm25.delete(["a", "missing"]) == 1
+    bm25.add("c", "soy traders")
+
+    assert len(bm25) == 2
+    assert sorted(ids(bm25.search("soy"))) == ["b", "c"]
+    assert bm25.search("cattle") == []
+
+def test_deletions_survive_compaction():
+    bm25 = index({f"d{i}": f"report {i} on soy" for i in range(3000)})
+    bm25.delete([f"d{i}" for i in range(2000)])
+    bm25.add("d2999", "palm oil report")
+
+    assert len(bm25) == 1000 and len(bm25._ids) < 3000
+    assert ids(bm25.search("2500")) == ["d2500"]
+    assert ids(bm25.search("palm")) == ["d2999"]
+    assert "d5" not in ids(bm25.search("soy", top_k=3000))
@@ -0,0 +1,46 @@
+from datetime import datetime
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.security import get_current_user
+from app.routers import chat
+from app.services.agents import get_agent_service
+from app.services.conversation_store import conversation_store
+from app.services.openai_client import get_openai_service
+from app.services.search_client import get_search_service
+
+
+class UnusedAgent:
+    """Fails the test if a request gets as far as the agent"""
+
+    def prefetch_context(self, message, context):
+        raise AssertionError("The agent must not run for a foreign conversation")
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(chat.router, prefix="/chat")
+    app.dependency_overrides[get_current_user] = lambda: {"id": "intruder", "roles": []}
+    app.dependency_overrides[get_agent_service] = lambda: UnusedAgent()
+    app.dependency_overrides[get_openai_service] = lambda: None
+    app.dependency_overrides[get_search_service] = lambda: None
+    now = datetime.utcnow()
+    conversation_store.create_conversation({
+        "id": "owned-elsewhere", "user_id": "owner", "title": "private",
+        "created_at": now, "updated_at": now, "is_archived": False, "summary": None,
+    })
+    yield TestClient(app)
+    conversation_store.delete_conversation("owned-elsewhere")
+
+@pytest.mark.parametrize("path", ["/chat/messages", "/chat/messages/stream"])
+def test_cannot_post_to_another_users_conversation(client, path):
+    response = client.post(path, json={"message": "hello", "conversation_id": "owned-elsewhere"})
+    assert response.status_code == 403
+    assert conversation_store.count_messages("owned-elsewhere") == 0
+
+@pytest.mark.parametrize("path", ["/chat/messages", "/chat/messages/stream"])
+def test_unknown_conversation_is_not_found(client, path):
+    response = client.post(path, json={"message": "hello", "conversation_id": "missing"})
+    assert response.status_code == 404
@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from app.routers import chat
+from app.services.conversation_store import conversation_store
+
+USER = {"id": "owner", "roles": []}
+
+class PrefetchingAgent:
+    """Hands out a pending prefetch and fails the turn with fail, when set"""
+
+    def __init__(self, fail=None):
+        self.fail = fail
+        self.prefetch = None
+
+    def prefetch_context(self, message, context):
+        self.prefetch = asyncio.ensure_future(asyncio.sleep(10))
+        return self.prefetch
+
+    async def process_message(self, **kwargs):
+        raise self.fail
+
+@pytest.fixture
+def conversation():
+    now = datetime.utcnow()
+    conversation_store.create_conversation({
+        "id": "prefetch-test", "user_id": "owner", "title": "prefetch",
+        "created_at": now, "updated_at": now, "is_archived": False, "summary": None,
+    })
+    yield "prefetch-test"
+    conversation_store.delete_conversation("prefetch-test")
+
+async def test_a_turn_that_raises_an_http_error_cancels_the_prefetch(conversation):
+    agent = PrefetchingAgent(fail=HTTPException(status_code=503))
+    request = chat.SendMessageRequest(message="Soy exposure?", conversation_id=conversation)
+
+    with pytest.raises(HTTPException):
+        await chat.send_message(request, USER, None, None, agent)
+    await asyncio.sleep(0)
+
+    assert agent.prefetch.cancelled()
+
+async def test_a_stream_response_that_is_never_iterated_cancels_the_prefetch(conversation):
+    agent = PrefetchingAgent()
+    request = chat.SendMessageRequest(message="Soy exposure?", conversation_id=conversation)
+
+    response = await chat.send_message_stream(request, USER, agent)
+    assert not agent.prefetch.done()
+    # Starlette runs the background task when the client disconnects before the stream starts
+    await response.background()
+    await asyncio.sleep(0)
+
+    assert agent.prefetch.cancelled()
@@ -0,0 +1,107 @@
+import io
+import json
+
+from app.services.chunking import Chunker, TokenCounter
+from app.services.parsers import ParsedItem, parse_csv, parse_json, parse_text
+
+
+def exact_chunker(max_tokens=64, overlap_tokens=0, boundary_modulus=1000003):
+    return Chunker(max_tokens, overlap_tokens, boundary_modulus, counter=TokenCounter(exact=True))
+
+def tokens(chunker, text):
+    return len(chunker.counter.encoding.encode_ordinary(text))
+
+def text(content, line=1):
+    return ParsedItem(kind="text", content=content, location={"line": line})
+
+def sentences(count, start=0):
+    return " ".join(f"Sentence number {i} describes soy supply risk in the Cerrado." for i in range(start, start + count))
+
+def test_text_chunks_stay_under_budget_and_overlap():
+    chunker = exact_chunker(max_tokens=90, overlap_tokens=30)
+    paragraphs = [text(sentences(2, i * 2), line=i * 2) for i in range(10)]
+    chunks = list(chunker.chunk(iter(paragraphs)))
+
+    assert len(chunks) > 1
+    assert all(tokens(chunker, chunk.content) <= 90 for chunk in chunks)
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current.content.split("\n\n")[0] in previous.content
+
+def test_headings_start_chunks_and_label_their_section():
+    chunker = exact_chunker(max_tokens=200)
+    chunks = list(chunker.chunk(iter([
+        text("# Deforestation"), text(sentences(2)), text("## Water risk"), text(sentences(2, 5)),
+    ])))
+
+    assert [chunk.location["section"] for chunk in chunks] == ["Deforestation", "Water risk"]
+    assert chunks[1].content.startswith("## Water risk")
+
+def test_an_oversized_table_is_split_by_row_repeating_its_header():
+    chunker = exact_chunker(max_tokens=60)
+    rows = [f"| supplier {i} | {i * 10} ha |" for i in range(40)]
+    table = "\n".join(["| name | area |", "| --- | --- |", *rows])
+    chunks = list(chunker.chunk(iter([text(table)])))
+
+    assert len(chunks) > 1
+    assert all(chunk.content.startswith("| name | area |\n| --- | --- |") for chunk in chunks)
+    assert [row for chunk in chunks for row in chunk.content.split("\n")[2:]] == rows
+
+def test_an_unbroken_item_is_split_into_token_windows():
+    chunker = exact_chunker(max_tokens=32)
+    word = "deforestation" * 200
+    chunks = list(chunker.chunk(iter([text(word)])))
+
+    assert all(tokens(chunker, chunk.content) <= 32 for chunk in chunks)
+    assert "".join(chunk.content for chunk in chunks) == word
+
+def test_text_files_chunk_with_line_locations():
+    chunker = exact_chunker(max_tokens=80)
+    document = "Scope 3\n\n" + "\n\n".join(sentences(3, i * 3) for i in range(6))
+    chunks = list(chunker.chunk(parse_text(io.BytesIO(document.encode()))))
+
+    assert chunks[0].location["line"] == 1 and chunks[0].location["section"] == "Scope 3"
+    assert all(tokens(chunker, chunk.content) <= 80 for chunk in chunks)
+
+def test_csv_records_are_grouped_whole_under_budget():
+    chunker = exact_chunker(max_tokens=100)
+    rows = "\n".join(f"{i},Company {i},Energy,BR" for i in range(200))
+    chunks = list(chunker.chunk(parse_csv(io.BytesIO(f"id,name,sector,country\n{rows}\n".encode()))))
+
+    assert all(tokens(chunker, chunk.content) <= 100 for chunk in chunks)
+    records = [record for chunk in chunks for record in chunk.content.split("\n\n")]
+    assert records == [f"id: {i}\nname: Company {i}\nsector: Energy\ncountry: BR" for i in range(200)]
+    assert chunks[0].location == {"row": 1, "row_end": chunks[0].content.count("\n\n") + 1}
+
+def test_record_groups_resynchronise_after_an_inserted_row():
+    def groups(rows):
+        chunker = Chunker(max_tokens=400, overlap_tokens=0, boundary_modulus=8, counter=TokenCounter(exact=True))
+        items = [ParsedItem(kind="record", content=row, location={"row": i}) for i, row in enumerate(rows)]
+        return [chunk.content for chunk in chunker.chunk(iter(items))]
+
+    rows = [f"id: {i}\nname: Holding {i}" for i in range(300)]
+    before = groups(rows)
+    after = groups(rows[:150] + ["id: new\nname: Inserted holding"] + rows[150:])
+
+    assert len(set(before) - set(after)) <= 2
+
+def test_json_records_and_worksheets_do_not_share_chunks():
+    chunker = exact_chunker(max_tokens=500)
+    data = json.dumps([{"id": i, "sector": "Retail"} for i in range(5)])
+    sheets = [
+        ParsedItem(kind="record", content=f"id: {i}", location={"sheet": sheet, "row": i}, fields={"id": i})
+        for sheet in ("Holdings", "Assets") for i in range(3)
+    ]
+    json_chunks = list(chunker.chunk(parse_json(io.BytesIO(data.encode()))))
+    sheet_chunks = list(chunker.chunk(iter(sheets)))
+
+    assert len(json_chunks) == 1 and json_chunks[0].location == {"index": 1, "index_end": 5}
+    assert [chunk.location["sheet"] for chunk in sheet_chunks] == ["Holdings", "Assets"]
+
+def test_estimated_counts_come_from_the_sampled_ratio():
+    counter = TokenCounter(exact=False, sample_every=4)
+    sample = "Methane intensity of cattle ranching in Pará."
+    exact = len(counter.encoding.encode_ordinary(sample))
+    counts = [counter.count(sample) for _ in range(40)]
+
+    assert counts[:32] == [exact] * 32
+    assert all(abs(count - exact) <= 1 for count in counts)
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from app.services.company_store import CategoricalColumn, CompanyStore
+
+ROWS = [
+    {"ISIN": "BR0001", "Company Name": "Marfrig Global Foods S.A.", "Sector": "Food", "Country": "BR",
+     "Rating": "B", "Emissions": "1,250.5", "Portfolio": "Nordic", "Weight": "2%"},
+    {"ISIN": "BR0002", "Company Name": "Minerva Foods", "Sector": "food", "Country": "BR", "Rating": "C",
+     "Emissions": "800"},
+    {"ISIN": "US0003", "Company Name": "Cargill, Incorporated", "Sector": "Agriculture", "Country": "US",
+     "Aliases": "Cargill Agricola", "Emissions": "3000", "Portfolio": "Nordic", "Weight": "1.5"},
+    {"ISIN": "NO0004", "Company Name": "Equinor ASA", "Sector": "Energy", "Country": "NO", "Ticker": "EQNR"},
+]
+
+def store(path=None):
+    company_store = CompanyStore(path=path)
+    company_store.upsert(ROWS)
+    return company_store
+
+def names(results):
+    return [company["name"] for company in results[0]]
+
+def test_repeated_strings_share_one_dictionary_entry():
+    column = CategoricalColumn.from_values(["BR", "BR", None, "US", "BR", ""])
+
+    assert column.categories == ["BR", "US"] and column.codes.dtype == np.int16
+    assert column.codes.tolist() == [0, 0, -1, 1, 0, -1]
+    assert column.to_list() == ["BR", "BR", None, "US", "BR", None]
+    assert column.codes_for(["br", "FR"]) == [0]
+
+    sectors = store().table.categoricals["sector"]
+    assert sectors.categories == ["Food", "food", "Agriculture", "Energy"]
+
+def test_columns_persist_and_reload_memory_mapped(tmp_path):
+    path = str(tmp_path / "companies")
+    saved = store(path)
+
+    reloaded = CompanyStore(path=path)
+
+    assert isinstance(reloaded.table.categoricals["country"].codes, np.memmap)
+    assert isinstance(reloaded.table.strings["name"].data, np.memmap)
+    assert reloaded.get("BR0001") == saved.get("BR0001") == {
+        "id": "BR0001", "name": "Marfrig Global Foods S.A.", "ticker": None, "parent_id": None, "aliases": None,
+        "sector": "Food", "country": "BR", "region": None, "rating": "B", "emissions": 1250.5,
+    }
+    assert reloaded.stats() == saved.stats()
+    assert names(reloaded.search(portfolio="nordic", sort_by="emissions")) == ["Cargill, Incorporated", "Marfrig Global Foods S.A."]
+
+def test_an_update_is_visible_after_reloading(tmp_path):
+    path = str(tmp_path / "companies")
+    store(path).upsert([{"ISIN": "NO0004", "Rating": "A"}, {"ISIN": "DK0005", "Company Name": "Orsted"}])
+
+    reloaded = CompanyStore(path=path)
+
+    assert len(reloaded) == 5 and reloaded.get("NO0004")["rating"] == "A"
+    assert sorted(child.name for child in tmp_path.iterdir()) == ["companies"]
+
+def test_names_are_found_by_word_prefix():
+    results, total = store().search("marf glob")
+
+    assert total == 1 and results[0]["id"] == "BR0001"
+    assert names(store().search("foods")) == ["Minerva Foods", "Marfrig Global Foods S.A."]
+
+def test_misspelled_names_are_found_by_close_spellings():
+    results, _ = store().search("Minervo Fods")
+
+    assert results[0]["id"] == "BR0002"
+
+def test_aliases_and_tickers_rank_first():
+    assert store().search("Cargill Agricola")[0][0]["id"] == "US0003"
+    assert store().search("eqnr")[0][0]["id"] == "NO0004"
+
+def test_filters_combine_categories_ranges_and_portfolios():
+    company_store = store()
+
+    assert names(company_store.search(categories={"sector": ["FOOD"]}, sort_by="emissions")) == [
+        "Marfrig Global Foods S.A.", "Minerva Foods",
+    ]
+    assert names(company_store.search(categories={"country": ["BR", "US"]}, ranges={"emissions": (1000, None)})) == [
+        "Marfrig Global Foods S.A.", "Cargill, Incorporated",
+    ]
+    assert names(company_store.search("foods", portfolio="Nordic")) == ["Marfrig Global Foods S.A."]
+    assert company_store.search(ranges={"emissions": (None, 100)}) == ([], 0)
+    with pytest.raises(ValueError):
+        company_store.search(categories={"ceo": ["x"]})
@@ -0,0 +1,29 @@
+from types import SimpleNamespace
+
+from app.services.agents import get_agent_service
+from app.services.container import ServiceContainer
+from app.services.openai_client import get_openai_service
+from app.services.search_client import get_search_service
+
+
+async def test_services_share_one_connection_pool_and_close_it():
+    container = ServiceContainer()
+    http_client = container.http_client
+    assert container.search_service.http_client is http_client
+    for deployment in container.openai_service.pool.deployments:
+        assert deployment.client._client is http_client
+    assert container.agent_service.openai_service is container.openai_service
+    assert container.agent_service.search_service is container.search_service
+
+    await container.close()
+    assert http_client.is_closed
+
+async def test_dependencies_return_the_application_instances():
+    container = ServiceContainer()
+    request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(services=container)))
+    try:
+        assert get_openai_service(request) is container.openai_service
+        assert get_search_service(request) is container.search_service
+        assert get_agent_service(request) is container.agent_service
+    finally:
+        await container.close()
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+from app.services.conversation_store import ConversationStore
+
+START = datetime(2024, 1, 1)
+
+def make_store(users=2, conversations=3, messages=4):
+    store = ConversationStore()
+    for u in range(users):
+        for c in range(conversations):
+            conversation_id = f"u{u}-c{c}"
+            store.create_conversation({
+                "id": conversation_id,
+                "user_id": f"u{u}",
+                "title": conversation_id,
+                "created_at": START,
+                "updated_at": START + timedelta(minutes=c),
+                "is_archived": False,
+            })
+            for m in range(messages):
+                store.add_message({"id": f"{conversation_id}-m{m}", "conversation_id": conversation_id, "content": str(m)})
+    return store
+
+def test_messages_come_back_in_append_order():
+    store = make_store()
+    assert [m["content"] for m in store.get_messages("u0-c1")] == ["0", "1", "2", "3"]
+    assert [m["content"] for m in store.get_message_range("u0-c1", 1, 3)] == ["1", "2"]
+    assert store.count_messages("u0-c1") == 4
+    assert store.get_messages("missing") == []
+
+def test_listing_is_per_user_and_most_recent_first():
+    store = make_store()
+    assert [c["id"] for c in store.list_conversations("u1")] == ["u1-c2", "u1-c1", "u1-c0"]
+
+    store.touch("u1-c0", START + timedelta(hours=1))
+    assert [c["id"] for c in store.list_conversations("u1")] == ["u1-c0", "u1-c2", "u1-c1"]
+    assert [c["id"] for c in store.list_conversations("u0")] == ["u0-c2", "u0-c1", "u0-c0"]
+
+def test_archived_conversations_are_listed_only_on_request():
+    store = make_store()
+    store.get_conversation("u0-c2")["is_archived"] = True
+    assert "u0-c2" not in [c["id"] for c in store.list_conversations("u0")]
+    assert "u0-c2" in [c["id"] for c in store.list_conversations("u0", include_archived=True)]
+
+def test_pages_cover_the_listing_once():
+    store = make_store(users=1, conversations=7, messages=0)
+    seen, before = [], None
+    while True:
+        page, before = store.page_conversations("u0", 3, before=before)
+        seen.extend(c["id"] for c in page)
+        if before is None:
+            break
+    assert seen == [f"u0-c{c}" for c in reversed(range(7))]
+
+def test_delete_removes_messages_and_index_entries():
+    store = make_store(users=1, conversations=1)
+    assert store.delete_conversation("u0-c0")
+    assert store.messages == {}
+    assert store.list_conversations("u0") == []
+    assert store.get_messages("u0-c0") == []
+    assert not store.delete_conversation("u0-c0")
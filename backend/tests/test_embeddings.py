@@ -0,0 +1,76 @@
+import asyncio
+import gc
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services.embeddings import EmbeddingService
+
+
+class FakeOpenAI:
+    """create_embeddings that records batches and can be held open"""
+
+    def __init__(self, dimension=4):
+        self.dimension = dimension
+        self.batches = []
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def create_embeddings(self, texts):
+        self.batches.append(list(texts))
+        await self.release.wait()
+        return [np.full(self.dimension, len(text), dtype=np.float32) for text in texts]
+
+async def test_concurrent_embeds_share_one_deduplicated_batch():
+    openai = FakeOpenAI()
+    service = EmbeddingService(openai, max_batch_size=16, max_wait_ms=100, memory_cache_size=100)
+
+    first, second = await asyncio.gather(service.embed(["a", "bb"]), service.embed(["bb", "ccc"]))
+
+    assert openai.batches == [["a", "bb", "ccc"]]
+    assert first[:, 0].tolist() == [1, 2] and second[:, 0].tolist() == [2, 3]
+    await service.close()
+
+async def test_batch_tasks_are_held_until_they_finish():
+    openai = FakeOpenAI()
+    openai.release.clear()
+    service = EmbeddingService(openai, max_batch_size=2, max_wait_ms=1, memory_cache_size=100)
+
+    embedding = asyncio.ensure_future(service.embed(["a", "b", "c"]))
+    while len(openai.batches) < 2:
+        await asyncio.sleep(0.001)
+    gc.collect()
+    assert len(service._batches) == 2
+
+    openai.release.set()
+    assert (await embedding)[:, 0].tolist() == [1, 1, 1]
+    await asyncio.sleep(0)
+    assert service._batches == set()
+    await service.close()
+
+async def test_close_fails_embeds_that_are_still_waiting():
+    openai = FakeOpenAI()
+    openai.release.clear()
+    service = EmbeddingService(openai, max_batch_size=1, max_wait_ms=1, max_concurrent_batches=1, memory_cache_size=100)
+
+    in_flight = asyncio.ensure_future(service.embed(["a"]))
+    queued = asyncio.ensure_future(service.embed(["b"]))
+    while not openai.batches:
+        await asyncio.sleep(0.001)
+
+    await service.close()
+    for embedding in (in_flight, queued):
+        with pytest.raises(RuntimeError, match="closed"):
+            await asyncio.wait_for(embedding, 1)
+
+async def test_stored_vectors_are_not_reused_by_another_embedding_deployment(tmp_path, monkeypatch):
+    cache_path = str(tmp_path / "embeddings.db")
+    openai = FakeOpenAI()
+    for deployment in ("text-embedding-ada-002", "text-embedding-ada-002", "text-embedding-3-large"):
+        monkeypatch.setattr(settings, "AZURE_OPENAI_EMBEDDING_DEPLOYMENT", deployment)
+        service = EmbeddingService(openai, max_wait_ms=1, cache_path=cache_path, memory_cache_size=100)
+        await service.embed(["soy"])
+        await service.close()
+
+    assert openai.batches == [["soy"], ["soy"]]
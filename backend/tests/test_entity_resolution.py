@@ -0,0 +1,53 @@
+from app.services.entity_resolution import EntityIndex, core_name
+
+COMPANIES = [
+    ("Marfrig Global Foods S.A.", "", "MRFG3"),
+    ("Cargill, Incorporated", "Cargill Agricola; Cargill Brasil Comercio", "CARG"),
+    ("JBS S.A.", "", "JBSS3"),
+    ("Bunge Limited", "", "BG"),
+    ("Minerva Foods Holdings", "", ""),
+    ("Minerva Beef Exports", "", ""),
+]
+
+def index():
+    names, aliases, tickers = zip(*COMPANIES)
+    return EntityIndex.build(names, aliases, tickers)
+
+def test_core_names_drop_legal_forms_case_and_accents():
+    assert core_name("The Coca-Cola Company") == "coca cola"
+    assert core_name("Marfrig Global Foods S.A. de C.V.") == "marfrig global foods"
+    assert core_name("Cargill Agrícola Ltda.") == "cargill agricola"
+    assert core_name("Inc") == "inc"
+
+def test_exact_keys_resolve_names_aliases_and_tickers():
+    results = index().resolve_many(["CARGILL INC", "Cargill Agricola S.A.", "jbss3", "", None], threshold=0.5)
+
+    assert [(result["row"], result["match"]) for result in results[:3]] == [(1, "name"), (1, "alias"), (2, "ticker")]
+    assert results[3:] == [None, None]
+
+def test_misspelled_names_resolve_by_trigrams():
+    result, = index().resolve_many(["Marfrig Globl Foods SA"], threshold=0.5)
+
+    assert result["row"] == 0 and result["match"] == "fuzzy" and 0.5 <= result["score"] < 1
+
+def test_names_with_extra_words_resolve_to_their_leading_words():
+    result, = index().resolve_many(["Bunge Asia Pacific Pte"], threshold=0.5)
+
+    assert result == {"row": 3, "match": "partial", "matched": "bunge", "score": 0.2778, "ambiguous": False}
+
+def test_a_leading_word_resolves_to_the_names_it_starts():
+    entities = index()
+    marfrig, minerva, short = entities.resolve_many(["Marfrig", "Minerva", "JB"], threshold=0.5)
+
+    assert marfrig == {"row": 0, "match": "partial", "matched": "marfrig global foods", "score": 0.35, "ambiguous": False}
+    assert minerva["match"] == "partial" and minerva["ambiguous"]
+    assert short is None
+    assert [(row, kind) for row, _, kind in entities.candidates("Minerva", threshold=0.5)] == [(5, "partial"), (4, "partial")]
+
+def test_a_ticker_is_not_extended_to_a_name():
+    assert index().resolve_many(["MRFG"], threshold=0.9) == [None]
+
+def test_repeated_names_share_one_result():
+    results = index().resolve_many(["Marfrig"] * 3 + ["Marfrig Globl Foods"] * 2, threshold=0.5)
+
+    assert results[0] is results[1] is results[2] and results[3] is results[4]
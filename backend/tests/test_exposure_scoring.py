@@ -0,0 +1,79 @@
+import json
+
+import numpy as np
+
+from app.services.company_store import CompanyStore
+from app.services.exposure_scoring import (ExposureEngine, asset_windows,
+                                           zonal_exposure)
+from app.services.raster_store import NpyRaster
+from app.services.spatial_index import AssetStore
+
+META = {"west": -60.0, "north": -10.0, "cell_degrees": 0.05, "scale": 0.01, "nodata": 255,
+        "name": "forest-loss", "version": "2023", "source": "test"}
+
+def raster(tmp_path, seed=0):
+    values = np.random.default_rng(seed).integers(0, 101, (200, 300), dtype=np.uint8)
+    values[50:80, 100:160] = 255  # no coverage
+    np.save(tmp_path / "loss.npy", values)
+    (tmp_path / "loss.json").write_text(json.dumps(META))
+    return NpyRaster(str(tmp_path / "loss.npy"))
+
+def assets(count=300, seed=1):
+    rng = np.random.default_rng(seed)
+    return [
+        {"id": f"A{i}", "lat": lat, "lon": lon, "company_id": f"C{i % 3}", "company": f"Company {i % 3}"}
+        for i, (lat, lon) in enumerate(zip(rng.uniform(-21, -9, count).tolist(), rng.uniform(-61, -44, count).tolist()))
+    ]
+
+def test_vectorized_zonal_scores_match_a_cell_by_cell_sum(tmp_path):
+    grid = raster(tmp_path)
+    points = assets()
+    bounds = np.array([[point["lon"], point["lat"], point["lon"], point["lat"]] for point in points])
+
+    lost, covered = zonal_exposure(grid, bounds, buffer_km=8.0, tile_cells=16, workers=2)
+
+    values = np.asarray(grid.data)
+    row_km2 = grid.row_km2(0, values.shape[0])
+    top, bottom, left, right, overlaps = asset_windows(grid, bounds, 8.0)
+    for row in range(len(points)):
+        if not overlaps[row]:
+            assert lost[row] == covered[row] == 0
+            continue
+        window = values[top[row]:bottom[row] + 1, left[row]:right[row] + 1]
+        areas = np.broadcast_to(row_km2[top[row]:bottom[row] + 1, None], window.shape)
+        present = window != 255
+        assert np.isclose(lost[row], (window[present] * 0.01 * areas[present]).sum())
+        assert np.isclose(covered[row], areas[present].sum())
+    assert overlaps.sum() < len(points) and (covered > 0).sum() > len(points) // 2
+
+async def test_scores_are_cached_until_an_input_changes(tmp_path):
+    asset_store = AssetStore()
+    asset_store.upsert(assets())
+    raster(tmp_path)
+    engine = ExposureEngine(asset_store, CompanyStore(), raster_path=str(tmp_path / "loss.npy"))
+
+    first = await engine.snapshot()
+    assert await engine.snapshot() is first and engine.stats()["cached"]
+
+    asset_store.upsert([{"id": "A0", "lat": -15.0, "lon": -55.0, "company_id": "C0", "company": "Company 0"}])
+    assert not engine.stats()["cached"]
+    second = await engine.snapshot()
+    assert second is not first and second.lineage["assets"] == len(asset_store.index)
+
+async def test_companies_aggregate_their_assets_by_area_and_report_lineage(tmp_path):
+    asset_store = AssetStore()
+    asset_store.upsert(assets())
+    raster(tmp_path)
+    engine = ExposureEngine(asset_store, CompanyStore(), raster_path=str(tmp_path / "loss.npy"), buffer_km=8.0)
+
+    snapshot = await engine.snapshot()
+    owned = snapshot.asset_companies == snapshot.company_codes["C1"]
+    company = await engine.company_exposure("Company 1")
+
+    assert company["company_id"] == "C1" and company["assets"] == int(owned.sum())
+    expected = snapshot.asset_lost_km2[owned].sum() / snapshot.asset_covered_km2[owned].sum()
+    assert company["exposure"] == round(expected, 6)
+    assert {key: snapshot.lineage[key] for key in ("dataset", "version", "source", "assets")} == {
+        "dataset": "forest-loss", "version": "2023", "source": "test", "assets": 300
+    }
+    assert "8.0 km" in snapshot.lineage["method"]
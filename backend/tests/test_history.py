@@ -0,0 +1,69 @@
+import asyncio
+
+from app.core.config import settings
+from app.services.history import HistoryManager
+
+
+def turns(count, words=40):
+    return [
+        {"id": f"m{i}", "role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " + "word " * words}
+        for i in range(count)
+    ]
+
+class FakeOpenAI:
+    def __init__(self):
+        self.calls = []
+        self.release = asyncio.Event()
+
+    async def generate_response(self, messages, **kwargs):
+        self.calls.append(messages)
+        await self.release.wait()
+        return {"content": "summary of the early turns"}
+
+def test_recent_turns_fit_the_budget_and_messages_are_not_modified():
+    manager = HistoryManager(token_budget=200)
+    history = turns(20)
+    messages, summary, window_start = manager.build_window("next question", history, {"id": "c"})
+    assert summary is None
+    assert 0 < window_start < 20
+    assert messages[-1] == {"role": "user", "content": "next question"}
+    assert all("token_count" not in message for message in history)
+
+def test_unsummarized_turns_are_sent_until_a_fold_covers_them():
+    manager = HistoryManager(token_budget=200)
+    history = turns(20)
+    conversation = {"id": "c", "summary": None, "summary_message_count": 0}
+    messages, _, window_start = manager.build_window("next question", history, conversation)
+    # The turns that fell out of the budget have no summary yet, so they stay in the prompt
+    assert window_start > 0
+    assert len(messages) == 21
+
+    conversation.update(summary="summary", summary_message_count=window_start)
+    messages, summary, _ = manager.build_window("next question", history, conversation)
+    assert summary == "summary"
+    assert len(messages) == 20 - window_start + 1
+
+def test_unsummarized_turns_stay_within_the_request_limit(monkeypatch):
+    monkeypatch.setattr(settings, "MAX_TOKENS_PER_REQUEST", 400)
+    manager = HistoryManager(token_budget=200)
+    messages, _, _ = manager.build_window("next question", turns(100), {"id": "c", "summary_message_count": 0})
+    assert sum(manager.count_tokens(message["content"]) for message in messages) <= 400
+
+async def test_fold_runs_once_per_conversation_and_updates_the_summary():
+    manager = HistoryManager(token_budget=200)
+    openai_service = FakeOpenAI()
+    history = turns(20)
+    conversation = {"id": "c", "summary": None, "summary_message_count": 0}
+    _, _, window_start = manager.build_window("next", history, conversation)
+
+    manager.schedule_fold(conversation, history, window_start, openai_service)
+    manager.schedule_fold(conversation, history, window_start, openai_service)
+    task = manager._folding["c"]
+    await asyncio.sleep(0)
+    assert len(openai_service.calls) == 1
+
+    openai_service.release.set()
+    await task
+    assert conversation["summary"] == "summary of the early turns"
+    assert conversation["summary_message_count"] == window_start
+    assert "c" not in manager._folding
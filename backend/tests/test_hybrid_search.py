@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services.search_client import SearchService, reciprocal_rank_fusion
+
+DOCUMENTS = [{"id": f"soy{i}", "content": f"Soy deforestation in the Cerrado, field report {i}"} for i in range(3)] + [
+    {"id": "bond", "content": "Green bond ISIN BR1234567890 issued to refinance debt"},
+]
+
+async def embed(texts):
+    # Soy texts point one way and everything else another, the way a model groups topics
+    return np.array([
+        [1.0, 0.1 * i, 0.0, 0.0] if "soy" in text.lower() else [0.0, 0.0, 1.0, 0.0]
+        for i, text in enumerate(texts)
+    ], dtype=np.float32)
+
+@pytest.fixture
+def hybrid_backend(monkeypatch):
+    monkeypatch.setattr(settings, "SEARCH_BACKEND", "local")
+    monkeypatch.setattr(settings, "VECTOR_SEARCH_ENABLED", True)
+    monkeypatch.setattr(settings, "VECTOR_INDEX_DIMENSION", 4)
+
+def test_fusion_adds_weighted_reciprocal_ranks():
+    fused = dict(reciprocal_rank_fusion({"bm25": ["a", "b"], "vector": ["b", "c"]}, {"bm25": 2.0}, k=10))
+
+    assert fused == pytest.approx({"a": 2 / 11, "b": 2 / 12 + 1 / 11, "c": 1 / 12})
+
+def test_weights_decide_which_retriever_wins_a_disagreement():
+    rankings = {"bm25": ["a", "b"], "vector": ["b", "a"]}
+
+    assert reciprocal_rank_fusion(rankings, {"bm25": 2.0, "vector": 1.0})[0][0] == "a"
+    assert reciprocal_rank_fusion(rankings, {"bm25": 1.0, "vector": 2.0})[0][0] == "b"
+
+async def test_an_exact_identifier_is_recalled_that_vectors_alone_miss(hybrid_backend):
+    service = SearchService(embed_texts=embed)
+    await service.index_documents(DOCUMENTS)
+    query = "soy deforestation BR1234567890"
+
+    vector_only = await service.search_documents(query, top_k=3, weights={"bm25": 0.0})
+    hybrid = await service.search_documents(query, top_k=3)
+
+    assert "bond" not in [result["id"] for result in vector_only]
+    assert "bond" in [result["id"] for result in hybrid]
+
+async def test_deleted_documents_leave_both_retrievers(hybrid_backend):
+    service = SearchService(embed_texts=embed)
+    await service.index_documents(DOCUMENTS)
+
+    assert await service.delete_documents(["bond", "soy0"]) == 2
+
+    results = await service.search_documents("soy deforestation BR1234567890", top_k=10)
+    assert sorted(result["id"] for result in results) == ["soy1", "soy2"]
@@ -0,0 +1,39 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.security import get_current_user
+from app.routers import ingest
+from app.services.jobs import get_ingestion_engine
+
+
+class UnusedEngine:
+    """Fails the test if an oversized upload reaches the route"""
+
+    async def submit(self, upload, **kwargs):
+        raise AssertionError("An oversized upload must be rejected before the route runs")
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(settings, "MAX_FILE_SIZE", 1024)
+    app = FastAPI()
+    app.include_router(ingest.router, prefix="/ingest")
+    app.dependency_overrides[get_current_user] = lambda: {"id": "analyst", "roles": []}
+    app.dependency_overrides[get_ingestion_engine] = lambda: UnusedEngine()
+    return TestClient(app)
+
+def test_an_oversized_upload_is_rejected_by_its_declared_length(client):
+    response = client.post("/ingest/upload", files={"file": ("big.csv", b"1\n" * 50000)})
+    assert response.status_code == 413
+
+def test_an_oversized_upload_without_a_length_is_rejected_as_it_arrives(client):
+    def chunks():
+        yield b"--x\r\nContent-Disposition: form-data; name=\"file\"; filename=\"big.csv\"\r\n\r\n"
+        for _ in range(100):
+            yield b"1\n" * 1000
+
+    response = client.post(
+        "/ingest/upload", content=chunks(), headers={"Content-Type": "multipart/form-data; boundary=x"}
+    )
+    assert response.status_code == 413
@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services.company_store import CompanyStore
+from app.services.ingestion import SpooledUpload
+from app.services.jobs import (TABLE_MESSAGE_ROWS, IngestionJob,
+                               IngestionJobEngine, JobStore)
+from app.services.search_client import SearchService
+from app.services.semantic_cache import SemanticCache
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "holdings.csv"
+    rows = [f"{i},Company {i},{'Energy' if i % 2 else 'Retail'},Emissions note {i} " + "x" * 200 for i in range(400)]
+    path.write_text("id,name,sector,notes\n" + "\n".join(rows) + "\n")
+    return path
+
+@pytest.fixture
+def local_backend(monkeypatch):
+    monkeypatch.setattr(settings, "SEARCH_BACKEND", "local")
+    monkeypatch.setattr(settings, "VECTOR_SEARCH_ENABLED", False)
+    monkeypatch.setattr(settings, "INGEST_INDEX_BATCH_SIZE", 8)
+
+async def finished(engine, job_id):
+    for _ in range(600):
+        job = await engine.get_job(job_id)
+        if job.status not in ("queued", "running"):
+            return job
+        await asyncio.sleep(0.05)
+    raise AssertionError("job did not finish")
+
+async def ingest(job_dir, csv_path, search_service, **kwargs):
+    engine = IngestionJobEngine(search_service, job_dir=str(job_dir), workers=1, **kwargs)
+    await engine.start()
+    try:
+        with open(csv_path, "rb") as file:
+            data = file.read()
+            file.seek(0)
+            upload = SpooledUpload(file, "holdings.csv", ".csv", len(data), hashlib.sha256(data).hexdigest())
+            job = await engine.submit(upload, source="holdings")
+        return await finished(engine, job.job_id)
+    finally:
+        await engine.close()
+
+async def test_a_resumed_job_reindexes_batches_lost_with_the_local_index(tmp_path, csv_path, local_backend):
+    reference = SearchService()
+    complete = await ingest(tmp_path / "reference", csv_path, reference)
+    assert complete.status == "completed" and complete.total_batches > 3
+
+    # A worker committed two batches into its in-memory index, then restarted
+    job_dir = tmp_path / "restarted"
+    job_dir.mkdir()
+    upload_path = job_dir / "interrupted.csv"
+    upload_path.write_bytes(csv_path.read_bytes())
+    store = JobStore(str(job_dir / "jobs.sqlite3"))
+    store.save(IngestionJob(
+        job_id="interrupted", user_id=None, filename="holdings.csv", extension=".csv", source="holdings",
+        path=str(upload_path), size=upload_path.stat().st_size, sha256="", status="running",
+        committed_batches=2, documents=16
+    ))
+    store.close()
+
+    restarted = SearchService()
+    engine = IngestionJobEngine(restarted, job_dir=str(job_dir), workers=1)
+    await engine.start()
+    try:
+        job = await finished(engine, "interrupted")
+    finally:
+        await engine.close()
+
+    assert job.status == "completed"
+    assert set(restarted.documents) == set(reference.documents)
+    assert job.documents == complete.documents == len(reference.documents)
+
+async def test_documents_not_indexed_here_are_neither_counted_nor_recorded(tmp_path, csv_path, monkeypatch):
+    monkeypatch.setattr(settings, "SEARCH_BACKEND", "azure")
+    search_service = SearchService()
+    job = await ingest(tmp_path, csv_path, search_service)
+
+    assert job.status == "completed"
+    assert job.documents == 0 and job.stages["index"].items == 0
+    assert job.committed_batches == job.total_batches
+
+    # The persistent manifest did not record them, so the same upload is not skipped as unchanged
+    again = await ingest(tmp_path, csv_path, search_service)
+    assert again.skipped == 0
+
+class RecordingCompanyStore(CompanyStore):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def upsert(self, rows):
+        self.calls.append(len(rows))
+        return super().upsert(rows)
+
+async def test_table_rows_are_upserted_batch_by_batch(tmp_path, local_backend):
+    path = tmp_path / "companies.csv"
+    count = 2 * TABLE_MESSAGE_ROWS + 100
+    path.write_text("id,name,sector\n" + "\n".join(f"C{i},Company {i},Energy" for i in range(count)) + "\n")
+    company_store = RecordingCompanyStore()
+    engine = IngestionJobEngine(SearchService(), company_store=company_store, job_dir=str(tmp_path / "jobs"), workers=1)
+    await engine.start()
+    try:
+        with open(path, "rb") as file:
+            upload = SpooledUpload(file, "companies.csv", ".csv", path.stat().st_size, "")
+            job = await engine.submit(upload, source="companies", dataset_type="companies")
+        job = await finished(engine, job.job_id)
+    finally:
+        await engine.close()
+
+    assert job.status == "completed"
+    # Rows go out a parsed batch at a time, in messages of about TABLE_MESSAGE_ROWS
+    assert len(company_store.calls) >= 2 and max(company_store.calls) < 1.5 * TABLE_MESSAGE_ROWS
+    assert job.records == len(company_store) == count
+
+async def test_ingesting_documents_invalidates_cached_answers(tmp_path, csv_path, local_backend):
+    cache = SemanticCache()
+    cache.store(np.ones(4, dtype=np.float32), SemanticCache.scope_key(None, None), content="Stale answer.")
+
+    job = await ingest(tmp_path, csv_path, SearchService(), semantic_cache=cache)
+
+    assert job.status == "completed" and cache.stats()["entries"] == 0 and cache.stats()["invalidations"] == 1
@@ -0,0 +1,143 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from app.core.config import settings
+from app.core.exceptions import RateLimitError
+from app.services.deployment_pool import Deployment, DeploymentPool
+from app.services.openai_client import RESUME_PROMPT, OpenAIService
+from benchmarks.stub_openai import StubOpenAI
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(settings, "OPENAI_MAX_RETRIES", 2)
+    monkeypatch.setattr(settings, "OPENAI_BACKOFF_BASE_S", 0.01)
+
+@asynccontextmanager
+async def running(*stubs):
+    """An OpenAIService with one deployment per stub, all started and closed around the block"""
+    for stub in stubs:
+        await stub.start()
+    pool = DeploymentPool(Deployment(f"d{i}", stub.endpoint, "test-key", "gpt-4") for i, stub in enumerate(stubs))
+    openai_service = OpenAIService(pool=pool)
+    try:
+        yield openai_service
+    finally:
+        await openai_service.close()
+        for stub in stubs:
+            await stub.close()
+
+def stub(**kwargs):
+    return StubOpenAI(**{"latency_s": 0, "first_token_s": 0, "token_interval_s": 0, "tokens": 3, **kwargs})
+
+def ask():
+    return [{"role": "user", "content": "Soy exposure?"}]
+
+async def test_throttling_that_outlasts_the_retries_raises_the_apps_rate_limit_error():
+    throttled = stub()
+    throttled.fail_status, throttled.retry_after_s = 429, 0.05
+    async with running(throttled) as openai_service:
+        with pytest.raises(RateLimitError) as raised:
+            await openai_service.generate_response(ask())
+
+    assert throttled.requests == 3
+    assert raised.value.status_code == 429 and raised.value.metadata == {"retry_after": 1.0}
+
+async def test_embeddings_are_governed_and_retried():
+    flaky = stub()
+    flaky.fail_next = [429, 500]
+    async with running(flaky) as openai_service:
+        vectors = await openai_service.create_embeddings(["soy", "cattle"])
+
+    assert vectors.shape[0] == 2 and flaky.requests == 3
+    assert openai_service.stats()["embedding_governor"]["throttled"] == 1
+
+async def test_embeddings_still_throttled_after_the_retries_raise_the_apps_rate_limit_error():
+    throttled = stub()
+    throttled.fail_status = 429
+    async with running(throttled) as openai_service:
+        with pytest.raises(RateLimitError):
+            await openai_service.create_embeddings(["soy"])
+
+async def test_a_failing_deployment_leaves_the_rotation_and_is_probed_back(monkeypatch):
+    monkeypatch.setattr(settings, "OPENAI_FAILURE_THRESHOLD", 2)
+    monkeypatch.setattr(settings, "OPENAI_HEALTH_PROBE_INTERVAL_S", 0.02)
+    failing, healthy = stub(), stub()
+    failing.fail_status = 500
+    async with running(failing, healthy) as openai_service:
+        failing_deployment = openai_service.pool.deployments[0]
+        for i in range(4):
+            # Each call fails over to the healthy deployment
+            assert (await openai_service.generate_response(ask() + [{"role": "user", "content": str(i)}]))["content"]
+        assert not failing_deployment.healthy
+        served = failing.requests
+
+        failing.fail_status = None
+        for _ in range(100):
+            if failing_deployment.healthy:
+                break
+            await asyncio.sleep(0.01)
+
+        assert failing_deployment.healthy and failing.requests > served
+        assert openai_service.stats()["failovers"] == 2
+
+async def test_the_faster_deployment_is_preferred():
+    slow, fast = stub(latency_s=0.05), stub()
+    async with running(slow, fast) as openai_service:
+        for i in range(10):
+            await openai_service.generate_response(ask() + [{"role": "user", "content": str(i)}])
+        deployments = openai_service.pool.stats()
+
+    assert slow.requests == 1 and fast.requests == 9
+    assert deployments["d0"]["ewma_ms"]["response"] > deployments["d1"]["ewma_ms"]["response"]
+
+async def test_a_stream_cut_mid_reply_is_continued_on_another_deployment():
+    cut, whole = stub(), stub()
+    cut.cut_after = 2
+    async with running(cut, whole) as openai_service:
+        reply = "".join([delta async for delta in openai_service.generate_response_stream(ask())])
+        stats = openai_service.stats()
+
+    assert reply == "t0 t1 t0 t1 t2 "
+    assert stats["stream_resumes"] == 1 and cut.requests == whole.requests == 1
+    assert whole.bodies[0]["messages"][-2:] == [
+        {"role": "assistant", "content": "t0 t1 "}, {"role": "user", "content": RESUME_PROMPT}
+    ]
+
+async def test_identical_requests_in_flight_share_one_upstream_call():
+    slow = stub(latency_s=0.05)
+    async with running(slow) as openai_service:
+        first, second = await asyncio.gather(
+            openai_service.generate_response(ask()), openai_service.generate_response(ask())
+        )
+        stats = openai_service.stats()
+
+    assert slow.requests == 1 and first["content"] == second["content"]
+    assert (first["coalesced"], second["coalesced"]) == (False, True)
+    assert stats["coalesced"] == 1 and stats["inflight"] == 0
+
+async def test_identical_streams_fan_out_from_one_upstream_stream():
+    slow = stub(first_token_s=0.05)
+
+    async def reply(openai_service):
+        return "".join([delta async for delta in openai_service.generate_response_stream(ask())])
+
+    async with running(slow) as openai_service:
+        replies = await asyncio.gather(reply(openai_service), reply(openai_service))
+        stats = openai_service.stats()
+
+    assert replies == ["t0 t1 t2 ", "t0 t1 t2 "] and slow.requests == 1
+    assert stats["stream_coalesced"] == 1 and stats["inflight_streams"] == 0
+
+async def test_a_stream_left_by_its_last_subscriber_is_cancelled_and_not_joined():
+    slow = stub(token_interval_s=0.02, tokens=5)
+    async with running(slow) as openai_service:
+        abandoned = openai_service.generate_response_stream(ask())
+        await abandoned.__anext__()
+        await abandoned.aclose()
+        # Joins before the cancelled pump has finished
+        reply = "".join([delta async for delta in openai_service.generate_response_stream(ask())])
+
+    assert reply == "t0 t1 t2 t3 t4 " and slow.requests == 2
@@ -0,0 +1,93 @@
+import io
+import json
+import resource
+import sys
+import time
+
+import pytest
+from fastapi import UploadFile
+
+from app.core.config import settings
+from app.core.exceptions import PayloadTooLargeError
+from app.services import parsers
+from app.services.ingestion import parse_upload, spool_upload
+
+
+def generated_upload(path, header, row, size):
+    """An UploadFile of header and repeated rows up to size bytes, written without holding it; and its row count"""
+    rows = (size - len(header)) // len(row)
+    with open(path, "w") as file:
+        file.write(header)
+        for start in range(0, rows, 10000):
+            file.write(row * min(10000, rows - start))
+    return UploadFile(open(path, "rb"), filename=path.name), rows
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+def records(text, chunk_size=None, monkeypatch=None):
+    if chunk_size is not None:
+        monkeypatch.setattr(parsers, "READ_CHUNK_SIZE", chunk_size)
+    return [item.fields for item in parsers.parse_json(io.BytesIO(text.encode()))]
+
+@pytest.mark.parametrize("chunk_size", [None, 1, 7])
+def test_json_arrays_lines_and_values_stream_as_records(chunk_size, monkeypatch):
+    assert records('[{"a": 1}, {"b": "x\\"]}"}, 3.25, [1, 2]]', chunk_size, monkeypatch) == [
+        {"a": 1}, {"b": 'x"]}'}, {"value": 3.25}, {"value": [1, 2]}
+    ]
+    assert records('{"a": 1}\n{"b": {"c": [true, null]}}\n', chunk_size, monkeypatch) == [
+        {"a": 1}, {"b": {"c": [True, None]}}
+    ]
+
+@pytest.mark.parametrize("chunk_size", [None, 5])
+def test_a_feature_collection_streams_its_features(chunk_size, monkeypatch):
+    collection = {
+        "type": "FeatureCollection",
+        "name": "assets",
+        "features": [{"type": "Feature", "properties": {"id": i}} for i in range(3)],
+    }
+    assert records(json.dumps(collection), chunk_size, monkeypatch) == collection["features"]
+
+def test_malformed_json_is_rejected():
+    for text in ('[{"a": 1}', '{"a": ', '[1, tru]'):
+        with pytest.raises(json.JSONDecodeError):
+            records(text)
+
+def test_one_large_object_parses_in_linear_time():
+    def seconds(count):
+        text = json.dumps({"type": "FeatureCollection", "features": [
+            {"type": "Feature", "properties": {"name": f"asset {i}", "notes": "x" * 200}} for i in range(count)
+        ]})
+        start = time.perf_counter()
+        assert sum(1 for _ in parsers.parse_json(io.BytesIO(text.encode()))) == count
+        return time.perf_counter() - start
+
+    # Quadratic parsing took 4x as long at twice the size
+    assert seconds(40000) < 3 * seconds(20000) + 0.05
+
+async def test_a_100mb_csv_streams_in_flat_memory(tmp_path):
+    row = "1042,Company,Energy,BR,AA,12.5,Scope 1 and 2 emissions reported for the fiscal year\n"
+    upload, count = generated_upload(tmp_path / "holdings.csv", "id,name,sector,country,rating,score,notes\n", row,
+                                     settings.MAX_FILE_SIZE)
+
+    peak_before = peak_rss_mb()
+    spooled = await spool_upload(upload)
+    try:
+        rows = 0
+        for item in parse_upload(spooled):
+            rows += 1
+            assert item.fields["sector"] == "Energy"
+    finally:
+        spooled.close()
+
+    assert spooled.size > 99 * 1024 * 1024
+    assert rows == count
+    # Holding the rows would take several times the file size
+    assert peak_rss_mb() - peak_before < 40
+
+async def test_an_upload_over_the_size_limit_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "MAX_FILE_SIZE", 1024)
+    upload, _ = generated_upload(tmp_path / "big.csv", "a\n", "1\n", 2048)
+    with pytest.raises(PayloadTooLargeError):
+        await spool_upload(upload)
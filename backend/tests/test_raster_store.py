@@ -0,0 +1,88 @@
+import json
+
+import numpy as np
+import pytest
+
+from app.services.raster_store import (NpyRaster, TiledRaster, open_raster,
+                                       write_tiled_raster)
+from app.services.spatial_index import KM_PER_DEGREE
+
+META = {"west": 10.0, "north": 2.0, "cell_degrees": 0.01, "scale": 0.01, "nodata": 255}
+
+def grid(height=100, width=130, seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.integers(0, 101, (height, width), dtype=np.uint8)
+    values[:32, 32:64] = 255  # a whole tile of nodata
+    values[64:, :32] = 0
+    return values
+
+@pytest.fixture
+def rasters(tmp_path):
+    values = grid()
+    np.save(tmp_path / "loss.npy", values)
+    (tmp_path / "loss.json").write_text(json.dumps(META))
+    opened = {"npy": NpyRaster(str(tmp_path / "loss.npy"))}
+    for compression in (None, "zlib"):
+        path = str(tmp_path / f"loss.{compression or 'raw'}.tiles")
+        write_tiled_raster(path, values, META, tile_size=32, compression=compression)
+        opened[compression or "raw"] = open_raster(path)
+    return values, opened
+
+def test_windows_match_the_grid_inside_and_across_tiles(rasters):
+    values, opened = rasters
+    windows = [(0, 100, 0, 130), (3, 17, 5, 30), (20, 70, 25, 100), (96, 100, 120, 130), (40, 40, 5, 9)]
+    for raster in opened.values():
+        for top, bottom, left, right in windows:
+            np.testing.assert_array_equal(raster.window(top, bottom, left, right), values[top:bottom, left:right])
+
+def test_tiles_are_stored_by_content(rasters):
+    _, opened = rasters
+    raw, compressed = opened["raw"].stats()["tiles"], opened["zlib"].stats()["tiles"]
+
+    assert raw["empty"] == compressed["empty"] == 1
+    assert raw["zlib"] == 0 and compressed["zlib"] > 0
+    assert isinstance(opened["raw"], TiledRaster)
+
+def test_raw_windows_inside_one_tile_are_views_of_the_file(rasters):
+    _, opened = rasters
+    raster = opened["raw"]
+
+    assert np.shares_memory(raster.window(33, 60, 70, 90), raster.buffer)
+    assert not np.shares_memory(raster.window(30, 40, 70, 90), raster.buffer)
+
+def test_decoded_tiles_are_cached(rasters):
+    _, opened = rasters
+    raster = opened["zlib"]
+    raster.window(0, 64, 64, 128)
+    raster.window(10, 50, 70, 120)
+    cache = raster.stats()["cache"]
+
+    assert cache["misses"] == 4 and cache["hits"] == 4
+
+def test_windows_outside_the_raster_are_rejected(rasters):
+    _, opened = rasters
+    with pytest.raises(ValueError):
+        opened["raw"].window(90, 101, 0, 10)
+
+def test_zonal_stats_match_a_brute_force_over_cell_centers(rasters):
+    values, opened = rasters
+    ring = np.array([[10.0513, 1.9537], [11.1071, 1.7129], [10.9093, 1.1041], [10.3027, 1.3019]])
+
+    rows, cols = np.mgrid[0:values.shape[0], 0:values.shape[1]]
+    lons = META["west"] + (cols + 0.5) * META["cell_degrees"]
+    lats = META["north"] - (rows + 0.5) * META["cell_degrees"]
+    inside = np.zeros(values.shape, dtype=bool)
+    for (x1, y1), (x2, y2) in zip(ring, np.roll(ring, -1, axis=0)):
+        crosses = (y1 > lats) != (y2 > lats)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            inside ^= crosses & (lons < x1 + (lats - y1) * (x2 - x1) / (y2 - y1))
+    covered = inside & (values != META["nodata"])
+    km2 = (META["cell_degrees"] * KM_PER_DEGREE) ** 2 * np.cos(np.radians(lats))
+    scaled = values * META["scale"]
+
+    for raster in opened.values():
+        stats = raster.zonal_stats(ring)
+        assert stats["cells"] == inside.sum()
+        assert stats["cells_covered"] == covered.sum()
+        assert stats["sum_km2"] == pytest.approx((scaled * km2)[covered].sum(), rel=1e-3)
+        assert stats["max"] == pytest.approx(scaled[covered].max())
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from app.services.rate_governor import RateGovernor, Slot
+
+
+def governor(limit=1.0):
+    rate_governor = RateGovernor(rpm_limit=600, tpm_limit=60000, max_concurrency=4, min_concurrency=1)
+    rate_governor.limit = limit
+    return rate_governor
+
+async def test_users_are_admitted_round_robin():
+    rate_governor = governor()
+    await rate_governor.acquire("a", 10)
+    admitted = []
+
+    async def call(user):
+        await rate_governor.acquire(user, 10)
+        admitted.append(user)
+
+    waiters = [asyncio.ensure_future(call(user)) for user in ("a", "a", "a", "b")]
+    await asyncio.sleep(0)
+    for _ in waiters:
+        rate_governor.limit = 1.0
+        rate_governor.release(Slot(10))
+    await asyncio.gather(*waiters)
+
+    assert admitted == ["a", "b", "a", "a"]
+
+async def test_throttling_halves_the_limit_and_pauses_admission():
+    rate_governor = governor(limit=4.0)
+    async with rate_governor.slot("a", 10) as slot:
+        slot.throttle(retry_after=30)
+
+    assert rate_governor.limit == 2.0
+    assert rate_governor.admission_delay(10, 0) > 0
+    assert rate_governor.stats()["throttled"] == 1
+
+async def test_an_admission_the_caller_abandoned_returns_its_quota_without_raising_the_limit():
+    rate_governor = governor()
+    await rate_governor.acquire("a", 10)
+    tokens, requests = rate_governor.tokens.level, rate_governor.requests.level
+    waiter = asyncio.ensure_future(rate_governor.acquire("b", 500))
+    await asyncio.sleep(0)
+
+    # b is cancelled, then admitted before it resumes to see the cancellation
+    waiter.cancel()
+    rate_governor.release(Slot(10))
+    limit = rate_governor.limit
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    assert rate_governor.limit == limit
+    assert rate_governor.inflight == 0
+    assert rate_governor.tokens.level == pytest.approx(tokens, abs=1)
+    assert rate_governor.requests.level == pytest.approx(requests, abs=0.1)
+
+async def test_only_completed_calls_raise_the_limit():
+    rate_governor = governor(limit=2.0)
+    async with rate_governor.slot("a", 10):
+        pass  # a connection error or server error reports no usage
+    async with rate_governor.slot("a", 10) as slot:
+        slot.used(8)
+        slot.fail()
+    assert rate_governor.limit == 2.0
+
+    async with rate_governor.slot("a", 10) as slot:
+        slot.used(8)
+    assert rate_governor.limit == 2.5
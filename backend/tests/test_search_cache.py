@@ -0,0 +1,81 @@
+import pytest
+
+from app.core.config import settings
+from app.services.search_client import SearchService
+
+
+class FakeRedis:
+    """The slice of redis.asyncio.Redis the cache uses, shared like a real server"""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return False
+        self.data[key] = value.encode() if isinstance(value, str) else value
+        return True
+
+    async def close(self):
+        pass
+
+def counting(service):
+    calls = []
+
+    async def backend(query, top_k, filter_expression=None, weights=None):
+        calls.append(query)
+        return [{"id": f"{query}-{len(calls)}"}]
+
+    service._search_backend = backend
+    return calls
+
+async def test_an_index_change_on_one_worker_retires_every_workers_cache():
+    redis = FakeRedis()
+    worker_a, worker_b = SearchService(cache_remote=redis), SearchService(cache_remote=redis)
+    calls_a, calls_b = counting(worker_a), counting(worker_b)
+
+    first = await worker_a.search_documents("soy")
+    assert await worker_b.search_documents("soy") == first  # served from the shared tier
+    assert calls_b == []
+
+    await worker_b.index_documents([{"id": "d1", "content": "new soy report"}])
+    assert await worker_a.search_documents("soy") != first
+    assert len(calls_a) == 2
+
+async def test_a_restarted_worker_does_not_reuse_an_old_version():
+    redis = FakeRedis()
+    worker = SearchService(cache_remote=redis)
+    counting(worker)
+    await worker.search_documents("soy")
+    version = await worker.index_version()
+    await worker.bump_index_version()
+
+    restarted = SearchService(cache_remote=redis)
+    calls = counting(restarted)
+    assert await restarted.index_version() not in (version, None)
+    await restarted.search_documents("soy")
+    assert calls == ["soy"]
+
+@pytest.fixture
+def local_backend(monkeypatch):
+    monkeypatch.setattr(settings, "SEARCH_BACKEND", "local")
+    monkeypatch.setattr(settings, "VECTOR_SEARCH_ENABLED", False)
+
+async def test_local_version_follows_index_contents(local_backend):
+    a, b = SearchService(), SearchService()
+    docs = [{"id": "d1", "content": "cattle"}, {"id": "d2", "content": "soy"}]
+    await a.index_documents(docs)
+    await b.index_documents(docs[::-1])
+    assert await a.index_version() == await b.index_version()
+
+    before = await a.index_version()
+    await a.index_documents([{"id": "d1", "content": "cattle, updated"}])
+    assert await a.index_version() != before
+    await a.index_documents([{"id": "d1", "content": "cattle"}])
+    assert await a.index_version() == before
+
+    assert await a.delete_documents(["d2"]) == 1
+    assert await a.index_version() != before
@@ -0,0 +1,30 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.security import get_current_user
+from app.routers import search
+from app.services.search_client import get_search_service
+from app.services.spatial_index import AssetStore, get_asset_store
+
+
+@pytest.fixture
+def client():
+    store = AssetStore()
+    store.upsert([{"id": "mill", "lat": -15.0, "lon": -52.0}, {"id": "farm", "lat": 10.0, "lon": 10.0}])
+    app = FastAPI()
+    app.include_router(search.router, prefix="/search")
+    app.dependency_overrides[get_current_user] = lambda: {"id": "analyst", "roles": []}
+    app.dependency_overrides[get_search_service] = lambda: None
+    app.dependency_overrides[get_asset_store] = lambda: store
+    return TestClient(app)
+
+@pytest.mark.parametrize("params", [{"lat": -15.0, "radius_km": 50}, {"lon": -52.0}, {"radius_km": 50}])
+def test_lat_and_lon_are_required_together(client, params):
+    assert client.get("/search/assets", params=params).status_code == 422
+
+def test_radius_and_polygon_filters(client):
+    near = client.get("/search/assets", params={"lat": -15.0, "lon": -52.0, "radius_km": 50}).json()
+    inside = client.get("/search/assets", params={"polygon": "-53 -16,-51 -16,-51 -14,-53 -14"}).json()
+
+    assert [asset["id"] for asset in near["results"]] == [asset["id"] for asset in inside["results"]] == ["mill"]
@@ -0,0 +1,70 @@
+import numpy as np
+
+from app.services import semantic_cache
+from app.services.semantic_cache import SemanticCache
+
+SCOPE = SemanticCache.scope_key({"portfolio": "nordic"}, ["analyst"])
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+def vector(*values):
+    return np.array(values, dtype=np.float32)
+
+def test_only_answers_above_the_similarity_threshold_are_reused():
+    cache = SemanticCache(similarity_threshold=0.95)
+    cache.store(vector(1, 0, 0), SCOPE, content="Soy answer.")
+
+    hit = cache.lookup(vector(2, 0.1, 0), SCOPE)
+    assert hit.content == "Soy answer." and hit.similarity > 0.99
+    assert cache.lookup(vector(1, 1, 0), SCOPE) is None
+    assert cache.stats()["hits"] == cache.stats()["misses"] == 1
+
+def test_an_explicit_zero_threshold_is_kept():
+    assert SemanticCache(similarity_threshold=0.0).lookup(vector(1, 0), SCOPE) is None
+    cache = SemanticCache(similarity_threshold=0.0)
+    cache.store(vector(1, 0), SCOPE, content="Any answer.")
+    assert cache.similarity_threshold == 0.0 and cache.lookup(vector(0.1, 1), SCOPE) is not None
+
+def test_answers_are_not_shared_across_contexts_or_entitlements():
+    cache = SemanticCache()
+    cache.store(vector(1, 0), SCOPE, content="Nordic answer.")
+
+    assert SemanticCache.scope_key({"portfolio": "nordic"}, ["analyst"]) == SCOPE
+    assert cache.lookup(vector(1, 0), SemanticCache.scope_key({"portfolio": "global"}, ["analyst"])) is None
+    assert cache.lookup(vector(1, 0), SemanticCache.scope_key({"portfolio": "nordic"}, ["admin"])) is None
+
+def test_answers_expire_after_the_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(semantic_cache, "time", clock)
+    cache = SemanticCache(ttl_seconds=60)
+    cache.store(vector(1, 0), SCOPE, content="Soy answer.")
+
+    clock.now += 59
+    assert cache.lookup(vector(1, 0), SCOPE) is not None
+    clock.now += 2
+    assert cache.lookup(vector(1, 0), SCOPE) is None and cache.stats()["entries"] == 0
+
+def test_the_least_recently_used_answer_is_evicted():
+    cache = SemanticCache(max_entries=2)
+    cache.store(vector(1, 0, 0), SCOPE, content="first")
+    cache.store(vector(0, 1, 0), SCOPE, content="second")
+    cache.lookup(vector(1, 0, 0), SCOPE)
+
+    cache.store(vector(0, 0, 1), SCOPE, content="third")
+
+    assert cache.lookup(vector(0, 1, 0), SCOPE) is None
+    assert [cache.lookup(v, SCOPE).content for v in (vector(1, 0, 0), vector(0, 0, 1))] == ["first", "third"]
+    assert cache.stats()["evictions"] == 1
+
+def test_invalidation_drops_every_answer():
+    cache = SemanticCache()
+    cache.store(vector(1, 0), SCOPE, content="Soy answer.")
+
+    cache.invalidate()
+
+    assert cache.lookup(vector(1, 0), SCOPE) is None and cache.stats()["entries"] == 0
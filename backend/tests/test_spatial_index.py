@@ -0,0 +1,70 @@
+import numpy as np
+
+from app.services.spatial_index import AssetIndex, AssetStore, haversine_km
+
+
+def store_with(rows, path=None):
+    store = AssetStore(str(path) if path else None)
+    store.upsert(rows)
+    return store
+
+def ids(results):
+    return sorted(asset["id"] for asset in results[0])
+
+def random_points(count=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        {"id": f"A{i}", "lat": lat, "lon": lon, "type": "mill" if i % 3 == 0 else "farm"}
+        for i, (lat, lon) in enumerate(zip(rng.uniform(-20, -10, count).tolist(), rng.uniform(-60, -45, count).tolist()))
+    ]
+
+def test_bbox_and_radius_match_a_brute_force_scan():
+    points = random_points()
+    store = store_with(points)
+    lats = np.array([point["lat"] for point in points])
+    lons = np.array([point["lon"] for point in points])
+
+    bbox = (-55.0, -16.0, -52.0, -14.0)
+    expected = [p["id"] for p in points if bbox[0] <= p["lon"] <= bbox[2] and bbox[1] <= p["lat"] <= bbox[3]]
+    assert ids(store.search(bbox=bbox, limit=10000)) == sorted(expected)
+
+    results, total = store.search(near=(-15.0, -52.0, 150.0), limit=10000)
+    distances = haversine_km(-15.0, -52.0, lats, lons)
+    assert total == int((distances <= 150.0).sum())
+    assert [asset["distance_km"] for asset in results] == sorted(asset["distance_km"] for asset in results)
+
+def test_a_bbox_across_the_antimeridian():
+    store = store_with([
+        {"id": "fiji", "lat": -17.7, "lon": 178.0},
+        {"id": "samoa", "lat": -13.8, "lon": -172.1},
+        {"id": "perth", "lat": -31.9, "lon": 115.9},
+    ])
+    assert ids(store.search(bbox=(170.0, -20.0, -170.0, -10.0))) == ["fiji", "samoa"]
+
+def test_polygons_match_points_inside_and_footprints_they_cross():
+    store = store_with([
+        {"id": "inside", "lat": 1.0, "lon": 1.0},
+        {"id": "outside", "lat": 3.5, "lon": 3.5},
+        # A concession whose corners are all outside the triangle, but which it crosses
+        {"id": "crossed", "min_lon": 1.5, "min_lat": -1.0, "max_lon": 2.5, "max_lat": 0.2},
+    ])
+    triangle = [[0.0, 0.0], [4.0, 0.0], [0.0, 4.0]]
+    assert ids(store.search(polygon=triangle)) == ["crossed", "inside"]
+
+def test_filters_combine_with_spatial_queries():
+    store = store_with(random_points())
+    results, _ = store.search(bbox=(-60.0, -20.0, -45.0, -10.0), categories={"type": ["mill"]}, limit=10000)
+    assert results and all(asset["type"] == "mill" for asset in results)
+
+def test_snapshots_reopen_memory_mapped_and_upserts_replace_by_id(tmp_path):
+    path = tmp_path / "assets"
+    store_with(random_points(200), path)
+
+    reopened = AssetStore(str(path))
+    assert len(reopened) == 200
+    assert isinstance(reopened.index.bounds, np.memmap)
+
+    reopened.upsert([{"id": "A0", "lat": 40.0, "lon": 10.0}])
+    assert len(reopened) == 200
+    assert ids(reopened.search(near=(40.0, 10.0, 1.0))) == ["A0"]
+    assert isinstance(AssetIndex.load(str(path)).grid.rows, np.memmap)
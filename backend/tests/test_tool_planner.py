@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from app.services.tool_planner import ToolPlan, ToolTask
+
+
+def task(name, seconds=0.0, result=None, depends_on=(), timeout=None, log=None, error=None):
+    async def run(results):
+        if log is not None:
+            log.append((name, dict(results)))
+        await asyncio.sleep(seconds)
+        if error is not None:
+            raise error
+        return result if result is not None else name
+
+    return ToolTask(name, run, depends_on=depends_on, timeout=timeout)
+
+async def test_tasks_start_once_their_dependencies_succeed_and_independent_ones_overlap():
+    log = []
+    plan = ToolPlan([
+        task("resolve", 0.05, result="C1", log=log),
+        task("search", 0.2, log=log),
+        task("exposure", 0.05, depends_on=("resolve",), log=log),
+    ])
+
+    outcomes = await plan.run()
+
+    assert log == [("resolve", {}), ("search", {}), ("exposure", {"resolve": "C1"})]
+    assert all(outcome.ok for outcome in outcomes.values())
+    # exposure ran after resolve, alongside search
+    assert outcomes["exposure"].started_ms >= 50 and outcomes["exposure"].started_ms < 150
+
+async def test_a_task_that_times_out_skips_its_dependents_but_not_the_rest():
+    plan = ToolPlan([
+        task("resolve", 1.0, timeout=0.05),
+        task("exposure", depends_on=("resolve",)),
+        task("search", 0.01),
+        task("broken", error=RuntimeError("index offline")),
+    ])
+
+    outcomes = await plan.run()
+
+    assert {name: outcome.status for name, outcome in outcomes.items()} == {
+        "resolve": "timeout", "exposure": "skipped", "search": "ok", "broken": "error"
+    }
+    assert "resolve" in outcomes["exposure"].error and outcomes["broken"].error == "index offline"
+
+async def test_the_plan_deadline_cancels_unfinished_tasks_and_keeps_finished_ones():
+    cancelled = []
+
+    async def slow(results):
+        try:
+            await asyncio.sleep(1.0)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    plan = ToolPlan([
+        task("search", 0.01),
+        ToolTask("exposure", slow),
+        task("summary", depends_on=("exposure",)),
+    ])
+
+    outcomes = await plan.run(deadline=0.1)
+
+    assert outcomes["search"].ok and outcomes["search"].result == "search"
+    assert outcomes["exposure"].status == "timeout" and cancelled
+    assert outcomes["summary"].status == "skipped"
+    assert [tool["status"] for tool in plan.tools_used(outcomes)] == ["ok", "timeout", "skipped"]
+
+def test_cycles_and_unknown_dependencies_are_rejected():
+    with pytest.raises(ValueError, match="cycle"):
+        ToolPlan([task("a", depends_on=("b",)), task("b", depends_on=("a",))])
+    with pytest.raises(ValueError, match="unknown"):
+        ToolPlan([task("a", depends_on=("missing",))])
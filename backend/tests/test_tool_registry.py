@@ -0,0 +1,85 @@
+import asyncio
+import json
+from typing import List, Literal
+
+from pydantic import BaseModel, Field
+
+from app.services.tool_registry import ToolDefinition, ToolRegistry
+
+
+class LookupArguments(BaseModel):
+    company: str = Field(..., description="Company name")
+    fields: List[Literal["sector", "country"]] = Field([], description="Columns to return")
+
+class Handler:
+    """A tool handler that records its runs and takes delay seconds each"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.runs = []
+
+    async def __call__(self, arguments):
+        self.runs.append(arguments.company)
+        await asyncio.sleep(self.delay)
+        return {"company": arguments.company}, [{"id": arguments.company}]
+
+def registry(handler, name="lookup", **kwargs):
+    tools = ToolRegistry(timeout=kwargs.pop("timeout", 1.0))
+    tools.register(ToolDefinition(name=name, description="Look up a company", arguments=LookupArguments,
+                                  handler=handler, **kwargs))
+    return tools
+
+def test_schemas_are_generated_from_the_arguments_model():
+    available = [True]
+    tools = registry(Handler(), available=lambda: available[0])
+
+    schema, = tools.schemas()
+
+    assert schema["function"]["name"] == "lookup"
+    parameters = schema["function"]["parameters"]
+    assert parameters["required"] == ["company"] and "title" not in json.dumps(parameters)
+    assert parameters["properties"]["fields"]["items"]["enum"] == ["sector", "country"]
+    available[0] = False
+    assert tools.schemas() is None
+
+async def test_the_calls_of_one_response_run_concurrently_in_order():
+    handler = Handler(delay=0.2)
+    tools = registry(handler, cache_ttl=0)
+    calls = [("lookup", json.dumps({"company": name})) for name in ("JBS", "Cargill", "Bunge")]
+
+    start = asyncio.get_running_loop().time()
+    results = await tools.invoke_many(calls)
+    elapsed = asyncio.get_running_loop().time() - start
+
+    assert [result["company"] for result, _, _ in results] == ["JBS", "Cargill", "Bunge"]
+    assert elapsed < 0.4
+
+async def test_results_are_memoized_by_normalized_arguments_until_the_ttl_passes():
+    handler = Handler()
+    tools = registry(handler, cache_ttl=1)
+
+    await tools.call("lookup", {"company": "JBS", "fields": ["sector"]})
+    await asyncio.gather(
+        tools.call("lookup", {"fields": ["sector"], "company": "JBS"}),
+        tools.call("lookup", {"company": "JBS", "fields": ["sector"]}),
+    )
+    assert handler.runs == ["JBS"]
+
+    await asyncio.sleep(1.05)
+    await tools.call("lookup", {"company": "JBS", "fields": ["sector"]})
+    assert handler.runs == ["JBS", "JBS"]
+
+async def test_bad_arguments_and_timeouts_go_back_to_the_model_and_are_counted():
+    tools = registry(Handler(delay=0.5), timeout=0.05, cache_ttl=0)
+
+    (invalid, _, _), (timed_out, tool, _) = await tools.invoke_many([
+        ("lookup", json.dumps({"fields": ["sector"]})),
+        ("lookup", json.dumps({"company": "JBS"})),
+    ])
+    unknown, _, _ = await tools.invoke("missing", "{}")
+
+    assert "company" in invalid["error"] and "timed out" in timed_out["error"] and "Unknown" in unknown["error"]
+    assert tool["parameters"] == {"company": "JBS"}
+    stats = tools.stats()["tools"]["lookup"]
+    assert (stats["calls"], stats["errors"], stats["timeouts"]) == (1, 0, 1)
+    assert stats["time_share"] == 1.0 and stats["max_ms"] >= 50
@@ -0,0 +1,78 @@
+import threading
+
+import numpy as np
+
+from app.services.vector_index import VectorIndex
+
+
+def random_vectors(count, dimension=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dimension)).astype(np.float32)
+
+def ids_found(index, query, top_k=10):
+    return [doc_id for doc_id, _, _ in index.search(query, top_k)[0]]
+
+def test_a_repeated_id_in_one_add_keeps_only_the_last_vector():
+    index = VectorIndex(dimension=16)
+    vectors = random_vectors(3)
+    index.add(["a", "a", "b"], vectors)
+    assert len(index) == 2
+    assert ids_found(index, vectors[1], top_k=1) == ["a"]
+
+    index.delete(["a"])
+    assert ids_found(index, vectors[0]) == ["b"]
+    assert ids_found(index, vectors[1]) == ["b"]
+
+def test_replacing_and_deleting_survive_compaction():
+    index = VectorIndex(dimension=16)
+    vectors = random_vectors(3000)
+    ids = [f"d{i}" for i in range(3000)]
+    index.add(ids, vectors)
+    index.delete(ids[:2000])
+    index.add(["d2999"], vectors[:1])
+
+    assert len(index) == 1000
+    assert ids_found(index, vectors[0], top_k=1) == ["d2999"]
+    assert all(doc_id not in ids[:2000] for doc_id in ids_found(index, vectors[5]))
+
+def test_ivf_trains_in_the_background_and_serves_exact_results_meanwhile():
+    index = VectorIndex(dimension=16, mode="ivf", nlist=8, nprobe=8)
+    vectors = random_vectors(2000)
+    index.add([f"d{i}" for i in range(2000)], vectors)
+
+    assert ids_found(index, vectors[7], top_k=1) == ["d7"]
+    index.wait_for_training(timeout=10)
+    assert index._centroids is not None
+    assert ids_found(index, vectors[7], top_k=1) == ["d7"]  # nprobe covers every list
+
+def test_searches_and_writes_from_many_threads_stay_consistent():
+    index = VectorIndex(dimension=16, mode="ivf", nlist=16, nprobe=4)
+    vectors = random_vectors(4000)
+    index.add([f"d{i}" for i in range(2000)], vectors[:2000])
+    errors = []
+
+    def writer():
+        try:
+            for start in range(2000, 4000, 100):
+                index.add([f"d{i}" for i in range(start, start + 100)], vectors[start:start + 100])
+                index.delete([f"d{i}" for i in range(start - 2000, start - 1900)])
+                index.train()
+        except Exception as e:
+            errors.append(e)
+
+    def reader():
+        try:
+            for i in range(200):
+                for doc_id, _, _ in index.search(vectors[i * 20], 5)[0]:
+                    assert doc_id is not None
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(index) == 2000
+    index.wait_for_training(timeout=10)
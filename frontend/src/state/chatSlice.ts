@@ -166,6 +166,10 @@ export const useChatStore = create<ChatStore>()(
 
             const response: StreamResponse = value;
             assistantMessage.content += response.delta;
+            if (response.citations) {
+              // Sources arrive before the answer text
+              assistantMessage.citations = response.citations;
+            }
 
             set(state => ({
               conversations: state.conversations.map(conv =>
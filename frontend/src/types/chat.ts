@@ -89,4 +89,6 @@ export interface StreamResponse {
   message_id: string;
   is_final: boolean;
   metadata?: ChatMessageMetadata;
+  event?: 'thinking' | 'sources';
+  citations?: Citation[];
 }